@@ -9,21 +9,33 @@
 # pylance: disable=reportMissingImports, reportMissingModuleSource
 # type: ignore
 
+import contextlib
+import hashlib
 import json
 import logging
 import math
+import multiprocessing
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from solver_classic import find_multiple_solutions, calculate_recipe_composition
-from solver_iterative import DROPPED_TARGET_OXIDES_LOG, find_best_recipe, usable_target
-from common import (weights_to_umf, umf_to_weights, load_materials, make_json_safe,
+from solver_classic import find_multiple_solutions, calculate_recipe_composition, material_index
+from solver_iterative import DROPPED_TARGET_OXIDES_LOG, MAX_WORKERS, find_best_recipe, usable_target
+from common import (SearchCancelled, weights_to_umf, umf_to_weights, material_records, make_json_safe,
                     resolve_inventory, filter_materials_by_inventory,
                     load_oxide_classification)
 from feasibility import (DEFAULT_FEASIBILITY_TOL, achievable_ranges, check_feasibility,
-                         matrix_diagnostics, projected_range_lps)
+                         check_session, iter_feasibility_batch, matrix_diagnostics,
+                         open_feasibility_session, projected_range_lps, reachable_region,
+                         session_stats)
 from glazy_import import GlazyImportError, parse_recipe_id, fetch_recipe, build_import_result
-from sensitivity import recipe_sensitivity
+from sensitivity import MODE_LINEAR, MONTE_CARLO_SAMPLES, recipe_sensitivity
 
 # Logging setup
 logging.basicConfig(
@@ -62,8 +74,8 @@ except Exception as e:
 # The classic engine stays available through an explicit "solver" parameter.
 #
 # Two corrections from the merge, neither of which overturns the choice. The
-# classic engine is no longer non deterministic: it draws its subsets from a
-# private seeded generator, so two identical requests give the same answer. And
+# classic engine is no longer non deterministic: it enumerates its subsets in a
+# fixed order, so two identical requests give the same answer. And
 # the ordering is inventory dependent - on the Glazy corpus, where the inventory
 # is the two to twelve materials of the recipe itself, the classic engine passes
 # the chemistry gate on 100% of targets against 94.67% and runs about thirty
@@ -105,6 +117,475 @@ DEFAULT_PENALIZE_UNLISTED = 1.0
 # verdict about it, whichever endpoint is asked.
 TARGET_OXIDES_DROPPED_WARNING = "оксиды цели не распознаны и не учтены: {oxides}"
 
+# An answer of the iterative engine cut short by "time_budget_ms". The
+# solutions carry "truncated" themselves; this is the sentence for the reader
+# of "warnings", who should not have to know which field to look at to learn
+# that the answer is not the one an unhurried search gives.
+TIME_BUDGET_TRUNCATED_WARNING = ("поиск остановлен по time_budget_ms после {levels} шагов: "
+                                 "показаны лучшие рецепты, найденные к этому моменту")
+
+
+# Ceiling of the "workers" field of /api/solve: the size of the one worker pool
+# of solver_iterative, so a request asking for more would only cut its steps
+# into chunks that queue. What a client can leave behind is bounded by that
+# pool, not by this cap. The "workers" of /api/feasibility is capped by the
+# same number, the size of the one thread pool of feasibility's range LPs.
+MAX_SOLVE_WORKERS = MAX_WORKERS
+
+# "workers" of /api/solve while the solver pool runs, which is how the server
+# normally runs: every job of the pool solves in one process (see
+# SOLVER_POOL_PROCESSES), so the field changes nothing, and a caller who asked
+# for it is told so rather than left to time the difference
+WORKERS_IGNORED_WARNING = ("workers={workers} не использован: сервер решает каждый запрос "
+                           "в одном процессе своего пула, ответ тот же")
+
+
+def _capped_workers(workers):
+    """
+    The "workers" field with MAX_SOLVE_WORKERS applied. Anything that is not a
+    positive whole number is passed through untouched, so that find_best_recipe
+    refuses it in its own words and the request gets invalid_parameter.
+    """
+    if isinstance(workers, int) and not isinstance(workers, bool) and workers > MAX_SOLVE_WORKERS:
+        return MAX_SOLVE_WORKERS
+    return workers
+
+
+def _note_truncation(solutions, request_warnings):
+    """
+    Whether "time_budget_ms" cut short the search these solutions came from,
+    with TIME_BUDGET_TRUNCATED_WARNING appended to request_warnings when it did.
+
+    A truncated answer is never stored in the solve cache: it depends on how
+    busy the machine was, and the same request a moment later may well get the
+    whole search.
+    """
+    if not solutions or not solutions[0].get('truncated'):
+        return False
+    request_warnings.append(TIME_BUDGET_TRUNCATED_WARNING.format(
+        levels=solutions[0]['levels_completed']))
+    return True
+
+
+# THE HEAVY ENDPOINTS - /api/solve (and its stream), /api/feasibility and
+# /api/sensitivity - are admitted through a cap per endpoint and run their
+# engine in a process pool, so that a burst of them cannot hold every request
+# thread and the CPU of the server while /api/molar_masses waits behind them.
+#
+# The cap: at most "concurrency" requests of one endpoint compute at once and
+# at most "queue" more wait for a slot; the next one is answered 429 at once,
+# with a Retry-After computed from how long that endpoint's requests have been
+# taking (see _retry_after). Refusing early is the point - a client told to come
+# back in two seconds does better than one whose request sits in an unbounded
+# queue until its own timeout fires. Each endpoint gets one slot less than the
+# pool has processes, so that one endpoint at its cap still leaves a process to
+# the others; on a single core machine that is the one process for everybody.
+# Eight waiting is about four seconds behind one slot at the half second an
+# exhaustive solve over the whole catalogue takes, the longest a request of the
+# UI should wait before being told to retry.
+#
+# The pool: 'spawn', for the reason _worker_pool of solver_iterative gives, and
+# as many processes as the machine has cores. It is started by the server entry
+# point (start_solver_pool) and not at import: imported as a library - by the
+# tests, or by a WSGI host that does not start it - the engines run on the
+# request thread as they always did, still behind the caps. A job in the pool
+# solves with workers=1: a search pool nested inside a pool process does not
+# shut down with it, and the answer is the same bit for bit anyway.
+SOLVER_POOL_PROCESSES = MAX_SOLVE_WORKERS
+HEAVY_ENDPOINT_LIMITS = {
+    'solve': {'concurrency': max(1, SOLVER_POOL_PROCESSES - 1), 'queue': 8},
+    'feasibility': {'concurrency': max(1, SOLVER_POOL_PROCESSES - 1), 'queue': 8},
+    'sensitivity': {'concurrency': max(1, SOLVER_POOL_PROCESSES - 1), 'queue': 8},
+}
+# Retry-After of a 429 is never below this, in seconds: the header is whole
+# seconds, and zero would invite the client straight back into the full queue
+MIN_RETRY_AFTER_SECONDS = 1
+
+_SOLVER_POOL = {'executor': None, 'processes': 0}
+_SOLVER_POOL_LOCK = threading.Lock()
+# Per endpoint: requests computing, requests waiting, requests refused with 429,
+# requests done and the moving average of their duration in seconds
+_HEAVY_STATE = {endpoint: {'running': 0, 'waiting': 0, 'rejected': 0, 'completed': 0,
+                           'mean_seconds': None}
+                for endpoint in HEAVY_ENDPOINT_LIMITS}
+_HEAVY_CONDITION = threading.Condition()
+
+
+class _Overloaded(Exception):
+    """A heavy endpoint is at its cap with a full queue; answered 429"""
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"{endpoint} is at its cap of {HEAVY_ENDPOINT_LIMITS[endpoint]['concurrency']} "
+                         f"running and {HEAVY_ENDPOINT_LIMITS[endpoint]['queue']} waiting")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def start_solver_pool(processes=None):
+    """
+    Start the process pool the heavy endpoints compute in, SOLVER_POOL_PROCESSES
+    processes by default; 0 keeps them on the request thread. Idempotent.
+    """
+    processes = SOLVER_POOL_PROCESSES if processes is None else processes
+    with _SOLVER_POOL_LOCK:
+        if _SOLVER_POOL['executor'] is None and processes > 0:
+            _SOLVER_POOL['executor'] = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+            _SOLVER_POOL['processes'] = processes
+            logger.info(f"solver pool started with {processes} processes")
+
+
+def stop_solver_pool():
+    """Shut the pool down; the heavy endpoints compute on the request thread again"""
+    with _SOLVER_POOL_LOCK:
+        executor = _SOLVER_POOL['executor']
+        _SOLVER_POOL['executor'], _SOLVER_POOL['processes'] = None, 0
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _pool_call(function, *args, **kwargs):
+    """
+    function(*args, **kwargs) in the solver pool when it runs, here when it does
+    not. A pool one of whose processes died - killed for its memory, say - refuses
+    every later job, so it is replaced on the spot; the request that found it
+    broken is answered 500, the next one is served.
+    """
+    executor = _SOLVER_POOL['executor']
+    if executor is None:
+        return function(*args, **kwargs)
+    try:
+        return executor.submit(function, *args, **kwargs).result()
+    except BrokenProcessPool:
+        with _SOLVER_POOL_LOCK:
+            if _SOLVER_POOL['executor'] is executor:
+                logger.error(f"solver pool broken, starting {_SOLVER_POOL['processes']} fresh processes")
+                _SOLVER_POOL['executor'] = ProcessPoolExecutor(
+                    max_workers=_SOLVER_POOL['processes'],
+                    mp_context=multiprocessing.get_context('spawn'))
+        executor.shutdown(wait=False)
+        raise
+
+
+def _job_workers(workers, request_warnings):
+    """
+    The "workers" a job of /api/solve is handed: _capped_workers on the request
+    thread, 1 in the pool, with WORKERS_IGNORED_WARNING appended to
+    request_warnings when that drops a count above 1. A value that is not a
+    positive whole number is passed through either way, so that the engine
+    still refuses it in its own words.
+    """
+    if _SOLVER_POOL['executor'] is None:
+        return _capped_workers(workers)
+    if isinstance(workers, int) and not isinstance(workers, bool) and workers >= 1:
+        if workers > 1:
+            request_warnings.append(WORKERS_IGNORED_WARNING.format(workers=workers))
+        return 1
+    return workers
+
+
+def _retry_after(endpoint):
+    """
+    Seconds until a slot of the endpoint is likely free: the queue ahead of the
+    caller, spread over the slots, at the average duration so far. Called with
+    _HEAVY_CONDITION held.
+    """
+    state, limits = _HEAVY_STATE[endpoint], HEAVY_ENDPOINT_LIMITS[endpoint]
+    if state['mean_seconds'] is None:
+        return MIN_RETRY_AFTER_SECONDS
+    ahead = state['waiting'] + state['running']
+    return max(MIN_RETRY_AFTER_SECONDS,
+               math.ceil(state['mean_seconds'] * ahead / limits['concurrency']))
+
+
+def _heavy_acquire(endpoint):
+    """Take a slot of the endpoint, waiting in its queue; _Overloaded when that is full"""
+    state, limits = _HEAVY_STATE[endpoint], HEAVY_ENDPOINT_LIMITS[endpoint]
+    with _HEAVY_CONDITION:
+        if state['running'] >= limits['concurrency']:
+            if state['waiting'] >= limits['queue']:
+                state['rejected'] += 1
+                raise _Overloaded(endpoint, _retry_after(endpoint))
+            state['waiting'] += 1
+            try:
+                while state['running'] >= limits['concurrency']:
+                    _HEAVY_CONDITION.wait()
+            finally:
+                state['waiting'] -= 1
+        state['running'] += 1
+
+
+def _heavy_release(endpoint, seconds):
+    """Give the slot back and fold its duration into the endpoint's average"""
+    state = _HEAVY_STATE[endpoint]
+    with _HEAVY_CONDITION:
+        state['running'] -= 1
+        state['completed'] += 1
+        state['mean_seconds'] = (seconds if state['mean_seconds'] is None
+                                 else 0.8 * state['mean_seconds'] + 0.2 * seconds)
+        _HEAVY_CONDITION.notify_all()
+
+
+@contextlib.contextmanager
+def _heavy_slot(endpoint):
+    """A slot of the endpoint for the duration of the block; see HEAVY_ENDPOINT_LIMITS"""
+    _heavy_acquire(endpoint)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _heavy_release(endpoint, time.perf_counter() - started)
+
+
+def _overloaded_response(exc, warnings=None):
+    """The 429 of a heavy endpoint at its cap, with its Retry-After"""
+    logger.warning(f"overloaded: {exc}, retry after {exc.retry_after} s")
+    body = {"error": "overloaded",
+            "message": f"{exc}; retry in {exc.retry_after} s",
+            "retry_after": exc.retry_after}
+    if warnings is not None:
+        body["warnings"] = warnings
+    response = jsonify(body)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+def heavy_endpoints_stats():
+    """The caps and counters of the heavy endpoints, and the size of the pool"""
+    with _HEAVY_CONDITION:
+        endpoints = {endpoint: {'running': state['running'], 'waiting': state['waiting'],
+                                'rejected': state['rejected'], 'completed': state['completed'],
+                                **HEAVY_ENDPOINT_LIMITS[endpoint]}
+                     for endpoint, state in _HEAVY_STATE.items()}
+    return {'pool_processes': _SOLVER_POOL['processes'], 'endpoints': endpoints}
+
+
+# The answers of /api/solve, kept for the request that comes again. The UI
+# re-posts the very same target and inventory every time the user switches
+# between result tabs, and each of those posts used to pay for a whole beam
+# search - 20 ms on the real inventory, a quarter of a second on the whole
+# database - to hand back a list it had already handed back.
+#
+# LRU with a time to live, both bounds deliberately small: the cache exists for
+# the tab toggling of one user, which repeats a request within seconds, not to
+# serve a corpus. An entry is a few kilobytes of JSON, so the size bounds memory
+# rather than anything a caller could notice.
+#
+# The key is everything the engine is handed (see _solve_cache_key), plus a
+# fingerprint of the two database files the answer is computed from, so an edit
+# of materials.json or priorities.json retires every entry at once without
+# anybody having to restart the server. Errors are never stored: a hit is
+# always an answer the same request has already received as a 200.
+SOLVE_CACHE_SIZE = 64
+SOLVE_CACHE_TTL_SECONDS = 600.0
+
+# The database files a solve reads, in the order they are fingerprinted
+SOLVE_CACHE_DATABASE_FILES = ('materials.json', 'priorities.json')
+
+_SOLVE_CACHE = OrderedDict()
+_SOLVE_CACHE_STATS = {'hits': 0, 'misses': 0}
+# Flask serves requests on threads; an OrderedDict reordered by two of them at
+# once is not an LRU any more
+_SOLVE_CACHE_LOCK = threading.Lock()
+# (os.stat signature of the files, sha256 of their content): the files are
+# hashed again only when the signature moves, not on every request
+_DATABASE_FINGERPRINT = {'signature': None, 'digest': None}
+
+
+def _database_fingerprint():
+    """
+    The sha256 of materials.json and priorities.json, recomputed only when the
+    size or the modification time of one of them changes
+
+    A signature of stat() alone would do nearly as well, but an editor that
+    saves twice within the resolution of the file system clock would then leave
+    the old answers in place; hashing the content on a change of signature costs
+    one read per edit and closes that.
+    """
+    paths = [os.path.join(DATABASE_DIR, name) for name in SOLVE_CACHE_DATABASE_FILES]
+    stats = [os.stat(path) for path in paths]
+    signature = tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+    with _SOLVE_CACHE_LOCK:
+        if _DATABASE_FINGERPRINT['signature'] == signature:
+            return _DATABASE_FINGERPRINT['digest']
+
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        # A separator, so that moving bytes from the end of one file to the
+        # start of the next is not the same fingerprint
+        digest.update(b'\0')
+
+    with _SOLVE_CACHE_LOCK:
+        _DATABASE_FINGERPRINT['signature'] = signature
+        _DATABASE_FINGERPRINT['digest'] = digest.hexdigest()
+        return _DATABASE_FINGERPRINT['digest']
+
+
+def _solve_cache_key(umf, inventory_data, solver_name, options):
+    """
+    The cache key of one /api/solve request: a canonical JSON string
+
+    Args:
+        umf: the CLEANED target, as usable_target returned it - so two requests
+            that differ only by an oxide the solver refuses anyway share an
+            entry, and the warning about it is still built per request
+        inventory_data: the "inventory" field; a list is sorted, because the
+            engines only ever ask whether a name is in it
+        solver_name: the engine
+        options: every other field the engine is handed, {name: value}. The
+            classic engine's fields are part of it on the iterative engine too
+            and the other way round; splitting an entry over a value the engine
+            ignores costs one miss, sharing one over a value it reads would
+            cost a wrong answer
+
+    Returns:
+        the key, or None when the request cannot be keyed - the answer is then
+        computed and not stored
+    """
+    if isinstance(inventory_data, list):
+        try:
+            inventory_data = sorted(inventory_data, key=lambda name: json.dumps(name, sort_keys=True))
+        except TypeError:
+            return None
+
+    try:
+        return json.dumps({
+            'umf': sorted((oxide, float(value)) for oxide, value in umf.items()),
+            'inventory': inventory_data,
+            'solver': solver_name,
+            'options': options,
+            'database': _database_fingerprint(),
+        }, sort_keys=True)
+    except (TypeError, ValueError, OSError):
+        return None
+
+
+def _solve_cache_get(key):
+    """The stored solutions of key, or None; counts the hit or the miss"""
+    now = time.monotonic()
+    with _SOLVE_CACHE_LOCK:
+        entry = _SOLVE_CACHE.get(key) if key is not None else None
+        if entry is not None and now - entry['stored_at'] > SOLVE_CACHE_TTL_SECONDS:
+            del _SOLVE_CACHE[key]
+            entry = None
+
+        if entry is None:
+            _SOLVE_CACHE_STATS['misses'] += 1
+            return None
+
+        _SOLVE_CACHE.move_to_end(key)
+        _SOLVE_CACHE_STATS['hits'] += 1
+        return entry['solutions']
+
+
+def _solve_cache_put(key, solutions):
+    """Store the solutions of key, evicting the least recently used beyond the size"""
+    if key is None:
+        return
+    with _SOLVE_CACHE_LOCK:
+        _SOLVE_CACHE[key] = {'solutions': solutions, 'stored_at': time.monotonic()}
+        _SOLVE_CACHE.move_to_end(key)
+        while len(_SOLVE_CACHE) > SOLVE_CACHE_SIZE:
+            _SOLVE_CACHE.popitem(last=False)
+
+
+def solve_cache_stats():
+    """Hit and miss counts of the solve cache since the start, and its occupancy"""
+    with _SOLVE_CACHE_LOCK:
+        return {'hits': _SOLVE_CACHE_STATS['hits'], 'misses': _SOLVE_CACHE_STATS['misses'],
+                'entries': len(_SOLVE_CACHE), 'capacity': SOLVE_CACHE_SIZE,
+                'ttl_seconds': SOLVE_CACHE_TTL_SECONDS}
+
+
+def solve_cache_clear():
+    """Drop every stored answer and reset the counts"""
+    with _SOLVE_CACHE_LOCK:
+        _SOLVE_CACHE.clear()
+        _SOLVE_CACHE_STATS['hits'] = 0
+        _SOLVE_CACHE_STATS['misses'] = 0
+
+
+# Conditioning of an inventory (feasibility.matrix_diagnostics) for the answers
+# of /api/feasibility and of an opened feasibility session. It is an SVD of the
+# "oxides x materials" weight matrix and depends on the shelf alone - not on the
+# target, the tolerance or the passengers - so a user checking one target after
+# another against the same inventory was paying for the same decomposition on
+# every request. Little at the shipped 19 materials (0.2 ms of an 8 ms answer),
+# but the matrix is built oxide by oxide in Python and decomposed whole, so the
+# 216 materials of the database as one shelf cost 3.9 ms next to a 17 ms verdict.
+#
+# The key is the sorted names of the materials plus the fingerprint of the
+# database files, the same one the solve cache uses: the records come from
+# material_records() by name, so a name and a database pin the formula, and an
+# edit of materials.json retires every entry without a TTL. Sorted, because the
+# condition number and the rank do not depend on the order of the columns. The
+# size is the number of shelves one server sees, which is a handful.
+DIAGNOSTICS_CACHE_SIZE = 32
+
+_DIAGNOSTICS_CACHE = OrderedDict()
+_DIAGNOSTICS_CACHE_STATS = {'hits': 0, 'misses': 0}
+_DIAGNOSTICS_CACHE_LOCK = threading.Lock()
+
+
+def inventory_diagnostics(materials):
+    """
+    matrix_diagnostics of a set of database materials over the oxides they
+    carry, computed once per inventory and database
+
+    Args:
+        materials: material records as material_records() returns them
+
+    Returns:
+        a fresh copy of the diagnostics dictionary, so that a caller may attach
+        it to an answer and change it without touching the cached one
+    """
+    try:
+        key = (tuple(sorted(str(material.get('name')) for material in materials)),
+               _database_fingerprint())
+    except OSError:
+        key = None
+
+    if key is not None:
+        with _DIAGNOSTICS_CACHE_LOCK:
+            diagnostics = _DIAGNOSTICS_CACHE.get(key)
+            if diagnostics is not None:
+                _DIAGNOSTICS_CACHE.move_to_end(key)
+                _DIAGNOSTICS_CACHE_STATS['hits'] += 1
+                return dict(diagnostics)
+            _DIAGNOSTICS_CACHE_STATS['misses'] += 1
+
+    diagnostics = matrix_diagnostics(
+        materials, sorted({oxide for material in materials
+                           for oxide in (material.get('formula') or {})}))
+
+    if key is not None:
+        with _DIAGNOSTICS_CACHE_LOCK:
+            _DIAGNOSTICS_CACHE[key] = diagnostics
+            _DIAGNOSTICS_CACHE.move_to_end(key)
+            while len(_DIAGNOSTICS_CACHE) > DIAGNOSTICS_CACHE_SIZE:
+                _DIAGNOSTICS_CACHE.popitem(last=False)
+    return dict(diagnostics)
+
+
+def diagnostics_cache_stats():
+    """Hit and miss counts of the inventory diagnostics cache, and its occupancy"""
+    with _DIAGNOSTICS_CACHE_LOCK:
+        return {'hits': _DIAGNOSTICS_CACHE_STATS['hits'],
+                'misses': _DIAGNOSTICS_CACHE_STATS['misses'],
+                'entries': len(_DIAGNOSTICS_CACHE), 'capacity': DIAGNOSTICS_CACHE_SIZE}
+
+
+def diagnostics_cache_clear():
+    """Drop every stored diagnostics and reset the counts"""
+    with _DIAGNOSTICS_CACHE_LOCK:
+        _DIAGNOSTICS_CACHE.clear()
+        _DIAGNOSTICS_CACHE_STATS['hits'] = 0
+        _DIAGNOSTICS_CACHE_STATS['misses'] = 0
+
 
 def iterative_solutions_to_classic_format(solutions, inventory_data):
     """
@@ -131,7 +612,7 @@ def iterative_solutions_to_classic_format(solutions, inventory_data):
     target_composition" is documented for the endpoint, not for one engine of
     it, and it used to be false on the other one.
 
-    Three fields of the iterative solver are passed through as well, because
+    Five fields of the iterative solver are passed through as well, because
     without them the answer cannot be interpreted: 'objective_error' (what the
     search actually minimized, and NOT the same quantity as 'error' - it is the
     L2 of the per-oxide RELATIVE deviations with a deadband, plus the damped
@@ -140,7 +621,9 @@ def iterative_solutions_to_classic_format(solutions, inventory_data):
     was applied, whether it came
     from the request or from the default) and 'unity_scale' (whether the UMF of
     the recipe had to be rescaled onto the basis of the target, and by how
-    much). They are additions - every key the classic format has is still there.
+    much), 'truncated' and 'levels_completed' (whether "time_budget_ms" cut the
+    search short, and after how many levels of it). They are additions - every
+    key the classic format has is still there.
 
     Args:
         solutions: list of solutions returned by find_best_recipe
@@ -149,12 +632,15 @@ def iterative_solutions_to_classic_format(solutions, inventory_data):
     Returns:
         list of solutions with the keys of the classic solver
     """
-    materials = load_materials(only_inventory=False, priority=True)
+    materials = material_records(only_inventory=False, priority=True)
     available_materials = filter_materials_by_inventory(materials, resolve_inventory(inventory_data))
 
+    # One index for all of them instead of a name scan per recipe entry
+    index = material_index(available_materials)
+
     converted = []
     for solution in solutions:
-        composition = calculate_recipe_composition(available_materials, solution['recipe'])
+        composition = calculate_recipe_composition(available_materials, solution['recipe'], index=index)
         converted.append({
             'recipe': solution['recipe'],
             'error': round(float(solution['error']), 4),
@@ -165,11 +651,121 @@ def iterative_solutions_to_classic_format(solutions, inventory_data):
             'objective_error': round(float(solution['objective_error']), 4),
             'unlisted_weight': float(solution['unlisted_weight']),
             'unity_scale': round(float(solution['unity_scale']), 6),
+            'truncated': bool(solution['truncated']),
+            'levels_completed': int(solution['levels_completed']),
         })
 
     return converted
 
 
+def _solve_request(data, request_warnings):
+    """
+    Read and check the body of /api/solve and /api/solve/stream: the fields with
+    their defaults and the target cleaned, or the refusal to answer with.
+
+    The dropped oxides of the target are appended to request_warnings, which
+    every answer of both endpoints carries, refusals included.
+
+    Returns:
+        (params, None), params {"umf", "max_solutions", "min_materials",
+        "error_tolerance", "inventory", "solver", "penalize_unlisted",
+        "workers", "time_budget_ms"}; or (None, (response, status))
+    """
+    # The shape of "umf" is checked BEFORE anything reads it, in the one
+    # test /api/feasibility already uses, word for word. Three inputs used
+    # to get past here - no "umf" key, "umf" that is not an object, and an
+    # empty object - and the last two then walked into the engines, which do
+    # not refuse them in words: the classic one died on
+    # `'list' object has no attribute 'keys'` (500) and the iterative one
+    # answered 200 with an empty list. Neither is "the caller was told what
+    # was wrong with the request".
+    umf = data.get('umf') if isinstance(data, dict) else None
+    if not isinstance(umf, dict) or not umf:
+        logger.warning("missing_umf parameter in request")
+        return None, (jsonify({"error": "missing_umf",
+                                  "message": "umf parameter is required and must be a non-empty object",
+                                  "warnings": request_warnings}), 400)
+
+    max_solutions = data.get('max_solutions', 3)
+    min_materials = data.get('min_materials', True)
+    error_tolerance = data.get('error_tolerance', 0.01)
+    inventory_data = data.get('inventory', None)
+    solver_name = data.get('solver', DEFAULT_SOLVER)
+    penalize_unlisted = data.get('penalize_unlisted', DEFAULT_PENALIZE_UNLISTED)
+    workers = data.get('workers', 1)
+    time_budget_ms = data.get('time_budget_ms', None)
+
+    # ONCE PER REQUEST AND ABOVE THE FORK: both engines are handed the same
+    # cleaned target, so neither can be fitting something the answer does
+    # not describe. It is a non-empty dictionary by now - the guard above is
+    # what makes that true, so nothing here has to probe for the shape.
+    umf, dropped_oxides = usable_target(umf)
+
+    if dropped_oxides:
+        # The solver's wording, not a second one of ours: one request, one
+        # line, the same line whichever engine is about to run
+        logger.warning(DROPPED_TARGET_OXIDES_LOG.format(oxides=', '.join(dropped_oxides)))
+        request_warnings.append(TARGET_OXIDES_DROPPED_WARNING.format(
+            oxides=', '.join(dropped_oxides)))
+
+    # The solver name is validated first, so that which error a bad request
+    # gets back does not depend on what its target happened to contain
+    if solver_name not in AVAILABLE_SOLVERS:
+        logger.warning(f"unknown_solver requested: {solver_name}")
+        return None, (jsonify({
+            "error": "unknown_solver",
+            "message": f"unknown solver '{solver_name}', expected one of: {', '.join(AVAILABLE_SOLVERS)}",
+            "warnings": request_warnings
+        }), 400)
+
+    # THERE IS NOTHING TO SOLVE FOR, in one of two ways, and the endpoint
+    # answers both because the engines answer them differently and one of
+    # them badly: find_best_recipe returns 200 and an empty list, while
+    # find_multiple_solutions dies - on an empty oxide set inside
+    # numpy.matrix_rank ("zero-size array to reduction operation maximum"),
+    # on an all-zero target inside common.umf_to_weights, which divides by
+    # the total molar weight. Either way a client mistake used to arrive as
+    # a 500 with a stack trace in the log and a 5xx in the monitoring.
+    #
+    # TWO REASONS, TWO SENTENCES, because the reader has to do two different
+    # things about them: fix the oxide names, or ask for some oxide at all.
+    # The codes are separate for the same reason.
+    #
+    # ORDER IS LOAD BEARING: `not any(...)` below is vacuously true of an
+    # empty dictionary, so the emptier reason has to be tested first or it
+    # would never be reported. What arrives empty here is only ever a target
+    # the CLEANING emptied - a request that sent {} was refused above.
+    if not umf:
+        logger.warning(f"empty_target: nothing left to solve, dropped {dropped_oxides}")
+        return None, (jsonify({"error": "empty_target",
+                                  # The code and the sentence /api/feasibility answers
+                                  # for this very target
+                                  "message": "target UMF has no usable oxide",
+                                  "warnings": request_warnings}), 422)
+
+    # A ZERO IS A CONSTRAINT ("none of this") and is honoured everywhere
+    # else, so this rejects the target only when there is nothing BUT
+    # zeros - the mixed case is an ordinary request and still solved. A
+    # formula of nothing but zeros is not a UMF at all: the unity it is
+    # normalized by is the sum of its own oxides, which is zero here, so
+    # there is no basis to state the answer on and nothing to fit.
+    # /api/feasibility already refuses it (as no_target_fluxes, its own
+    # reason), so the verdict layer and the recipe layer now agree that this
+    # target is unanswerable instead of one of them returning a quiet 200
+    # with an empty list, which does not answer the question either.
+    if not any(value > 0.0 for value in umf.values()):
+        logger.warning("zero_target: every requested oxide is 0, nothing to solve for")
+        return None, (jsonify({"error": "zero_target",
+                                  "message": "target UMF asks for zero of every oxide, so it has no "
+                                             "unity to be normalized by and nothing to fit",
+                                  "warnings": request_warnings}), 422)
+
+    return {'umf': umf, 'max_solutions': max_solutions, 'min_materials': min_materials,
+            'error_tolerance': error_tolerance, 'inventory': inventory_data,
+            'solver': solver_name, 'penalize_unlisted': penalize_unlisted,
+            'workers': workers, 'time_budget_ms': time_budget_ms}, None
+
+
 @app.route('/api/solve', methods=['POST'])
 def solve_recipe():
     """
@@ -193,6 +789,13 @@ def solve_recipe():
                                   // means "do not care", in between is a soft weight.
                                   // An oxide listed in "umf" as an explicit 0 is a
                                   // constraint and is never treated as unlisted.
+        "workers": 4,  // optional, 1 by default, iterative solver only: processes the
+                       // candidate solves of one search step are spread over, capped at
+                       // MAX_SOLVE_WORKERS. Same answer as 1, bit for bit; it only pays
+                       // on a large inventory
+        "time_budget_ms": 500  // optional, no budget by default, iterative solver only:
+                               // when it runs out the best recipes found so far are
+                               // answered, with "truncated": true and a warning
     }
 
     Returns:
@@ -214,7 +817,9 @@ def solve_recipe():
                 // trace oxides far above it
                 "objective_error": 0.0047,
                 "unlisted_weight": 1.0,
-                "unity_scale": 1.0
+                "unity_scale": 1.0,
+                "truncated": false,  // "time_budget_ms" cut the search short
+                "levels_completed": 4
             },
             ...
         ],
@@ -290,6 +895,12 @@ def solve_recipe():
     disagree about a target of nothing - one returns an empty list, the other
     dies inside numpy - so somebody above them has to say which it is, and a 200
     carrying an empty list is not an answer to the question either.
+
+    A REQUEST THAT COMES AGAIN IS ANSWERED FROM MEMORY: the solutions of every
+    200 are kept, keyed on the cleaned target and every field the engine reads,
+    for SOLVE_CACHE_TTL_SECONDS or until materials.json or priorities.json
+    changes - see SOLVE_CACHE_SIZE. "warnings" is never cached; it is built
+    from the request that is being answered.
     """
     # Before the try: the handler's own except must be able to report it, and an
     # exception can be raised by the very first line below
@@ -303,120 +914,64 @@ def solve_recipe():
         # and it gets the same 400 as an absent body
         data = request.get_json(silent=True)
 
-        # The shape of "umf" is checked BEFORE anything reads it, in the one
-        # test /api/feasibility already uses, word for word. Three inputs used
-        # to get past here - no "umf" key, "umf" that is not an object, and an
-        # empty object - and the last two then walked into the engines, which do
-        # not refuse them in words: the classic one died on
-        # `'list' object has no attribute 'keys'` (500) and the iterative one
-        # answered 200 with an empty list. Neither is "the caller was told what
-        # was wrong with the request".
-        umf = data.get('umf') if isinstance(data, dict) else None
-        if not isinstance(umf, dict) or not umf:
-            logger.warning("missing_umf parameter in request")
-            return jsonify({"error": "missing_umf",
-                            "message": "umf parameter is required and must be a non-empty object",
-                            "warnings": request_warnings}), 400
-
-        max_solutions = data.get('max_solutions', 3)
-        min_materials = data.get('min_materials', True)
-        error_tolerance = data.get('error_tolerance', 0.01)
-        inventory_data = data.get('inventory', None)
-        solver_name = data.get('solver', DEFAULT_SOLVER)
-        penalize_unlisted = data.get('penalize_unlisted', DEFAULT_PENALIZE_UNLISTED)
-
-        # ONCE PER REQUEST AND ABOVE THE FORK: both engines are handed the same
-        # cleaned target, so neither can be fitting something the answer does
-        # not describe. It is a non-empty dictionary by now - the guard above is
-        # what makes that true, so nothing here has to probe for the shape.
-        umf, dropped_oxides = usable_target(umf)
-
-        if dropped_oxides:
-            # The solver's wording, not a second one of ours: one request, one
-            # line, the same line whichever engine is about to run
-            logger.warning(DROPPED_TARGET_OXIDES_LOG.format(oxides=', '.join(dropped_oxides)))
-            request_warnings.append(TARGET_OXIDES_DROPPED_WARNING.format(
-                oxides=', '.join(dropped_oxides)))
-
-        # The solver name is validated first, so that which error a bad request
-        # gets back does not depend on what its target happened to contain
-        if solver_name not in AVAILABLE_SOLVERS:
-            logger.warning(f"unknown_solver requested: {solver_name}")
-            return jsonify({
-                "error": "unknown_solver",
-                "message": f"unknown solver '{solver_name}', expected one of: {', '.join(AVAILABLE_SOLVERS)}",
-                "warnings": request_warnings
-            }), 400
-
-        # THERE IS NOTHING TO SOLVE FOR, in one of two ways, and the endpoint
-        # answers both because the engines answer them differently and one of
-        # them badly: find_best_recipe returns 200 and an empty list, while
-        # find_multiple_solutions dies - on an empty oxide set inside
-        # numpy.matrix_rank ("zero-size array to reduction operation maximum"),
-        # on an all-zero target inside common.umf_to_weights, which divides by
-        # the total molar weight. Either way a client mistake used to arrive as
-        # a 500 with a stack trace in the log and a 5xx in the monitoring.
-        #
-        # TWO REASONS, TWO SENTENCES, because the reader has to do two different
-        # things about them: fix the oxide names, or ask for some oxide at all.
-        # The codes are separate for the same reason.
-        #
-        # ORDER IS LOAD BEARING: `not any(...)` below is vacuously true of an
-        # empty dictionary, so the emptier reason has to be tested first or it
-        # would never be reported. What arrives empty here is only ever a target
-        # the CLEANING emptied - a request that sent {} was refused above.
-        if not umf:
-            logger.warning(f"empty_target: nothing left to solve, dropped {dropped_oxides}")
-            return jsonify({"error": "empty_target",
-                            # The code and the sentence /api/feasibility answers
-                            # for this very target
-                            "message": "target UMF has no usable oxide",
-                            "warnings": request_warnings}), 422
-
-        # A ZERO IS A CONSTRAINT ("none of this") and is honoured everywhere
-        # else, so this rejects the target only when there is nothing BUT
-        # zeros - the mixed case is an ordinary request and still solved. A
-        # formula of nothing but zeros is not a UMF at all: the unity it is
-        # normalized by is the sum of its own oxides, which is zero here, so
-        # there is no basis to state the answer on and nothing to fit.
-        # /api/feasibility already refuses it (as no_target_fluxes, its own
-        # reason), so the verdict layer and the recipe layer now agree that this
-        # target is unanswerable instead of one of them returning a quiet 200
-        # with an empty list, which does not answer the question either.
-        if not any(value > 0.0 for value in umf.values()):
-            logger.warning("zero_target: every requested oxide is 0, nothing to solve for")
-            return jsonify({"error": "zero_target",
-                            "message": "target UMF asks for zero of every oxide, so it has no "
-                                       "unity to be normalized by and nothing to fit",
-                            "warnings": request_warnings}), 422
+        params, refusal = _solve_request(data, request_warnings)
+        if refusal is not None:
+            return refusal
+        umf, inventory_data, solver_name = params['umf'], params['inventory'], params['solver']
+        max_solutions, min_materials = params['max_solutions'], params['min_materials']
+        error_tolerance, workers = params['error_tolerance'], params['workers']
+        penalize_unlisted, time_budget_ms = params['penalize_unlisted'], params['time_budget_ms']
+
+        # "workers" and "time_budget_ms" are in the key although an answer that
+        # is stored does not depend on them: an invalid value is refused by the
+        # engine, and a hit must not be the way a request that would have been
+        # a 400 gets a 200
+        cache_key = _solve_cache_key(umf, inventory_data, solver_name, {
+            'max_solutions': max_solutions, 'min_materials': min_materials,
+            'error_tolerance': error_tolerance, 'penalize_unlisted': penalize_unlisted,
+            'workers': workers, 'time_budget_ms': time_budget_ms})
+        # Before the cache: the field is ignored just the same on a hit
+        if solver_name == SOLVER_ITERATIVE:
+            workers = _job_workers(workers, request_warnings)
+        cached_solutions = _solve_cache_get(cache_key)
+        if cached_solutions is not None:
+            logger.info(f"solve_cache_hit: {len(cached_solutions)} solutions, warnings={len(request_warnings)}")
+            return jsonify({"solutions": cached_solutions, "warnings": request_warnings})
 
         logger.info(f"solving recipe for umf: {umf}, max_solutions: {max_solutions}, min_materials: {min_materials}, solver: {solver_name}, penalize_unlisted: {penalize_unlisted}")
 
-        if solver_name == SOLVER_ITERATIVE:
-            try:
-                iterative_solutions = find_best_recipe(
-                    inventory_data,
+        # A cache hit above does not queue for a slot: answering it costs
+        # nothing, and refusing it because others are computing would be odd
+        with _heavy_slot('solve'):
+            if solver_name == SOLVER_ITERATIVE:
+                try:
+                    iterative_solutions = _pool_call(
+                        find_best_recipe,
+                        inventory_data,
+                        umf,
+                        max_solutions=max_solutions,
+                        verbose=False,
+                        penalize_unlisted=penalize_unlisted,
+                        workers=workers,
+                        time_budget_ms=time_budget_ms
+                    )
+                except ValueError as exc:
+                    # The solver validates its own arguments and says what is wrong
+                    # with them; that is a bad request, not a server failure
+                    logger.warning(f"invalid_parameter: {exc}")
+                    return jsonify({"error": "invalid_parameter", "message": str(exc),
+                                    "warnings": request_warnings}), 400
+
+                solutions = iterative_solutions_to_classic_format(iterative_solutions, inventory_data)
+            else:
+                solutions = _pool_call(
+                    find_multiple_solutions,
                     umf,
                     max_solutions=max_solutions,
-                    verbose=False,
-                    penalize_unlisted=penalize_unlisted
+                    min_materials=min_materials,
+                    error_tolerance=error_tolerance,
+                    inventory_data=inventory_data
                 )
-            except ValueError as exc:
-                # The solver validates its own arguments and says what is wrong
-                # with them; that is a bad request, not a server failure
-                logger.warning(f"invalid_parameter: {exc}")
-                return jsonify({"error": "invalid_parameter", "message": str(exc),
-                                "warnings": request_warnings}), 400
-
-            solutions = iterative_solutions_to_classic_format(iterative_solutions, inventory_data)
-        else:
-            solutions = find_multiple_solutions(
-                umf,
-                max_solutions=max_solutions,
-                min_materials=min_materials,
-                error_tolerance=error_tolerance,
-                inventory_data=inventory_data
-            )
 
         if isinstance(solutions, dict) and 'error' in solutions:
             logger.error(f"calculation_error: {solutions['error']}")
@@ -431,15 +986,482 @@ def solve_recipe():
 
         # Prepare the results for safe JSON serialization
         safe_solutions = make_json_safe(solutions)
+        # Stored as served and never touched again: jsonify only reads it
+        if not _note_truncation(solutions, request_warnings):
+            _solve_cache_put(cache_key, safe_solutions)
 
         logger.info(f"found {len(solutions)} solutions, warnings={len(request_warnings)}")
         return jsonify({"solutions": safe_solutions, "warnings": request_warnings})
 
+    except _Overloaded as exc:
+        return _overloaded_response(exc, request_warnings)
+    except Exception as e:
+        logger.exception(f"server_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e),
+                        "warnings": request_warnings}), 500
+
+class _StreamAbandoned(Exception):
+    """Raised from the progress callback of a streamed search whose client is gone"""
+
+
+def _streamed_solution(solution, inventory_data):
+    """One solution of find_best_recipe in the shape /api/solve answers it"""
+    converted = iterative_solutions_to_classic_format([solution], inventory_data)[0]
+    converted['recipe_umf'] = converted['actual_composition']
+    return converted
+
+
+@app.route('/api/solve/stream', methods=['POST'])
+def solve_recipe_stream():
+    """
+    API endpoint that runs the /api/solve search of the iterative engine and
+    shows it while it runs, for a client that would rather draw the first
+    acceptable recipe than wait for the final sort
+
+    POST JSON parameters: those of /api/solve. "solver" may only be "iterative"
+    (the default): the classic engine has no steps to report.
+
+    Answers application/x-ndjson, one JSON object per line:
+        {"type": "start", "warnings": [...]}
+        {"type": "iteration", "iteration": 1, "beam": [{"materials_count",
+         "objective_error", "added"}, ...], "pool": 12, "acceptable": 0,
+         "best_objective_error": 0.41, "nnls_solves": {...}}   // one a step
+        {"type": "recipe", "iteration": 4, "solution": {...}}  // one a new
+                                             // acceptable recipe, pruned
+        {"type": "done", "solutions": [...], "warnings": [...], "elapsed_ms": ...}
+
+    A "solution" is shaped like one entry of the /api/solve answer, and "done"
+    carries exactly the list /api/solve would have answered: the recipes of
+    the "recipe" lines are candidates, the last line is the answer. The two
+    endpoints share the solve cache, both ways; a request answered from it
+    streams "start" and "done" only.
+
+    Every refusal /api/solve makes before its engine starts is made here with
+    the same status and body, and so is a parameter the engine refuses -
+    the search runs until its first event before the answer is committed to
+    200. A failure after that is a last {"type": "error"} line. A client that
+    goes away stops the search at its next event instead of leaving it to run
+    to the end for nobody.
+    """
+    request_warnings = []
+
+    try:
+        data = request.get_json(silent=True)
+
+        params, refusal = _solve_request(data, request_warnings)
+        if refusal is not None:
+            return refusal
+        if params['solver'] != SOLVER_ITERATIVE:
+            logger.warning(f"invalid_parameter: solver {params['solver']} cannot stream")
+            return jsonify({"error": "invalid_parameter",
+                            "message": f"only the '{SOLVER_ITERATIVE}' solver reports its "
+                                       f"progress; use /api/solve for '{params['solver']}'",
+                            "warnings": request_warnings}), 400
+
+        umf, inventory_data = params['umf'], params['inventory']
+        max_solutions, penalize_unlisted = params['max_solutions'], params['penalize_unlisted']
+        workers, time_budget_ms = params['workers'], params['time_budget_ms']
+        # The key /api/solve stores under, field for field
+        cache_key = _solve_cache_key(umf, inventory_data, SOLVER_ITERATIVE, {
+            'max_solutions': max_solutions, 'min_materials': params['min_materials'],
+            'error_tolerance': params['error_tolerance'], 'penalize_unlisted': penalize_unlisted,
+            'workers': workers, 'time_budget_ms': time_budget_ms})
+        cached_solutions = _solve_cache_get(cache_key)
     except Exception as e:
         logger.exception(f"server_error: {str(e)}")
         return jsonify({"error": "server_error", "message": str(e),
                         "warnings": request_warnings}), 500
 
+    if cached_solutions is not None:
+        logger.info(f"solve_cache_hit (stream): {len(cached_solutions)} solutions")
+
+        def replay():
+            yield _ndjson_line({"type": "start", "warnings": request_warnings})
+            yield _ndjson_line({"type": "done", "solutions": cached_solutions,
+                                "warnings": request_warnings, "elapsed_ms": 0.0})
+
+        return Response(stream_with_context(replay()), mimetype='application/x-ndjson')
+
+    logger.info(f"streaming a solve for umf: {umf}, max_solutions: {max_solutions}, "
+                f"penalize_unlisted: {penalize_unlisted}")
+
+    # The search runs on its own thread and hands its events over through the
+    # queue: ('event', e), then ('result', solutions) or ('error', exception)
+    events = queue.Queue()
+    abandoned = threading.Event()
+    started = time.perf_counter()
+
+    def progress(event):
+        if abandoned.is_set():
+            raise _StreamAbandoned()
+        events.put(('event', event))
+
+    def search():
+        computing = time.perf_counter()
+        try:
+            events.put(('result', find_best_recipe(
+                inventory_data, umf, max_solutions=max_solutions, verbose=False,
+                penalize_unlisted=penalize_unlisted, workers=_capped_workers(workers),
+                progress=progress, time_budget_ms=time_budget_ms)))
+        except _StreamAbandoned:
+            logger.info("solve stream abandoned by the client, search stopped")
+        except Exception as exc:
+            events.put(('error', exc))
+        finally:
+            _heavy_release('solve', time.perf_counter() - computing)
+
+    # A slot of /api/solve, held by the search thread for as long as the search
+    # runs rather than by this handler, which returns at the first event. The
+    # search itself stays in this process: its events cannot cross into the pool
+    try:
+        _heavy_acquire('solve')
+    except _Overloaded as exc:
+        return _overloaded_response(exc, request_warnings)
+    threading.Thread(target=search, name='solve-stream', daemon=True).start()
+
+    # The engine checks its arguments before its first event, so the first item
+    # decides between a refusal with a status and a stream
+    first = events.get()
+    if first[0] == 'error':
+        abandoned.set()
+        if isinstance(first[1], ValueError):
+            logger.warning(f"invalid_parameter: {first[1]}")
+            return jsonify({"error": "invalid_parameter", "message": str(first[1]),
+                            "warnings": request_warnings}), 400
+        logger.error(f"server_error: {first[1]}")
+        return jsonify({"error": "server_error", "message": str(first[1]),
+                        "warnings": request_warnings}), 500
+
+    def generate():
+        item = first
+        try:
+            yield _ndjson_line({"type": "start", "warnings": request_warnings})
+            while item[0] == 'event':
+                event = dict(item[1])
+                kind = event.pop('event')
+                if kind == 'recipe':
+                    event['solution'] = _streamed_solution(event['solution'], inventory_data)
+                yield _ndjson_line(dict(event, type=kind))
+                item = events.get()
+
+            if item[0] == 'error':
+                logger.error(f"server_error: {item[1]}")
+                yield _ndjson_line({"type": "error", "error": "server_error",
+                                    "message": str(item[1])})
+                return
+
+            solutions = iterative_solutions_to_classic_format(item[1], inventory_data)
+            for solution in solutions:
+                solution['recipe_umf'] = solution['actual_composition']
+            safe_solutions = make_json_safe(solutions)
+            if not _note_truncation(solutions, request_warnings):
+                _solve_cache_put(cache_key, safe_solutions)
+            elapsed = time.perf_counter() - started
+            logger.info(f"streamed {len(solutions)} solutions in {elapsed * 1e3:.0f} ms, "
+                        f"warnings={len(request_warnings)}")
+            yield _ndjson_line({"type": "done", "solutions": safe_solutions,
+                                "warnings": request_warnings, "elapsed_ms": elapsed * 1e3})
+        except Exception as e:
+            logger.exception(f"server_error: {str(e)}")
+            yield _ndjson_line({"type": "error", "error": "server_error", "message": str(e)})
+        finally:
+            # Also reached when the client disconnects and the generator is closed
+            abandoned.set()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Solve jobs (POST /api/jobs): an /api/solve request that is answered with an
+# id at once and computed in the background, for a batch client that would
+# rather poll than hold a connection open through every search of its corpus.
+#
+# The jobs run on JOB_WORKERS threads of their own, one by default - a lane
+# beside the caps of the heavy endpoints rather than inside them: a client that
+# submits a hundred jobs wants them done in order, not refused, and one lane
+# keeps that client off the CPU the interactive requests are computing on. At
+# most MAX_PENDING_JOBS are queued or running; the next submission is answered
+# 429 with a Retry-After. A finished job - done, failed or cancelled - is kept
+# for JOB_TTL_SECONDS for its result to be collected, and beyond MAX_JOBS the
+# oldest finished one goes first; a pending job is never evicted.
+JOB_WORKERS = 1
+MAX_PENDING_JOBS = 16
+MAX_JOBS = 64
+JOB_TTL_SECONDS = 600.0
+
+JOB_QUEUED, JOB_RUNNING, JOB_CANCELLING = 'queued', 'running', 'cancelling'
+JOB_DONE, JOB_FAILED, JOB_CANCELLED = 'done', 'failed', 'cancelled'
+JOB_PENDING_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_CANCELLING)
+
+_JOBS = OrderedDict()
+_JOBS_LOCK = threading.Lock()
+_JOB_QUEUE = queue.Queue()
+_JOB_THREADS = []
+
+
+def _evict_jobs(now):
+    """Drop the expired finished jobs, then the oldest beyond MAX_JOBS; the caller holds _JOBS_LOCK"""
+    finished = [(job_id, entry) for job_id, entry in _JOBS.items()
+                if entry['status'] not in JOB_PENDING_STATUSES]
+    excess = len(_JOBS) - MAX_JOBS
+    for job_id, entry in finished:
+        if now - entry['finished'] > JOB_TTL_SECONDS or excess > 0:
+            del _JOBS[job_id]
+            excess -= 1
+
+
+def _job_finish(entry, status, **fields):
+    """Record the outcome of a job"""
+    with _JOBS_LOCK:
+        entry.update(fields, status=status, finished=time.monotonic())
+
+
+def _run_job(entry):
+    """Compute one job on a job thread; every outcome is recorded on the entry"""
+    params = entry['params']
+    inventory_data = params['inventory']
+
+    def progress(event):
+        with _JOBS_LOCK:
+            if event['event'] == 'iteration':
+                entry['progress'] = {key: value for key, value in event.items() if key != 'event'}
+            else:
+                entry['partial'].append(_streamed_solution(event['solution'], inventory_data))
+
+    try:
+        if params['solver'] == SOLVER_ITERATIVE:
+            solutions = iterative_solutions_to_classic_format(find_best_recipe(
+                inventory_data, params['umf'], max_solutions=params['max_solutions'],
+                verbose=False, penalize_unlisted=params['penalize_unlisted'],
+                workers=_capped_workers(params['workers']), progress=progress,
+                time_budget_ms=params['time_budget_ms'], cancel=entry['cancel']), inventory_data)
+        else:
+            solutions = find_multiple_solutions(
+                params['umf'], max_solutions=params['max_solutions'],
+                min_materials=params['min_materials'], error_tolerance=params['error_tolerance'],
+                logging=False, inventory_data=inventory_data, cancel=entry['cancel'])
+            if isinstance(solutions, dict) and 'error' in solutions:
+                _job_finish(entry, JOB_FAILED, error={"error": "calculation_error",
+                                                      "message": solutions['error']})
+                return
+    except SearchCancelled as exc:
+        logger.info(f"job {entry['id']} cancelled: {exc}")
+        _job_finish(entry, JOB_CANCELLED)
+        return
+    except ValueError as exc:
+        logger.warning(f"job {entry['id']} invalid_parameter: {exc}")
+        _job_finish(entry, JOB_FAILED, error={"error": "invalid_parameter", "message": str(exc)})
+        return
+    except Exception as exc:
+        logger.exception(f"job {entry['id']} server_error: {exc}")
+        _job_finish(entry, JOB_FAILED, error={"error": "server_error", "message": str(exc)})
+        return
+
+    for solution in solutions:
+        solution['recipe_umf'] = solution['actual_composition']
+    safe_solutions = make_json_safe(solutions)
+    # The same entry /api/solve would have stored, so either answers the other
+    if not _note_truncation(solutions, entry['warnings']):
+        _solve_cache_put(entry['cache_key'], safe_solutions)
+    _job_finish(entry, JOB_DONE, solutions=safe_solutions)
+    logger.info(f"job {entry['id']} done: {len(safe_solutions)} solutions")
+
+
+def _job_worker():
+    """Body of a job thread: take the next job id, run it unless it was cancelled meanwhile"""
+    while True:
+        job_id = _JOB_QUEUE.get()
+        with _JOBS_LOCK:
+            entry = _JOBS.get(job_id)
+            if entry is None or entry['status'] != JOB_QUEUED:
+                continue
+            entry['status'] = JOB_RUNNING
+            entry['started'] = time.monotonic()
+        _run_job(entry)
+
+
+def _start_job_workers():
+    """Start the job threads on the first submission; the caller holds _JOBS_LOCK"""
+    while len(_JOB_THREADS) < JOB_WORKERS:
+        thread = threading.Thread(target=_job_worker, name=f'solve-job-{len(_JOB_THREADS)}', daemon=True)
+        thread.start()
+        _JOB_THREADS.append(thread)
+
+
+def _job_view(entry):
+    """What GET /api/jobs/<id> answers about a job; the caller holds _JOBS_LOCK"""
+    started, finished = entry['started'], entry['finished']
+    end = finished if finished is not None else time.monotonic()
+    queued_until = started if started is not None else end
+    view = {"job_id": entry['id'], "status": entry['status'], "solver": entry['params']['solver'],
+            "queued_ms": (queued_until - entry['created']) * 1e3,
+            "elapsed_ms": 0.0 if started is None else (end - started) * 1e3,
+            "progress": entry['progress'],
+            "partial_solutions": list(entry['partial']),
+            "warnings": list(entry['warnings'])}
+    if entry['status'] == JOB_DONE:
+        view['solutions'] = entry['solutions']
+    if entry['status'] == JOB_FAILED:
+        view.update(entry['error'])
+    return view
+
+
+def _jobs_retry_after():
+    """Seconds until a pending slot is likely free, from the finished jobs in the store"""
+    durations = [entry['finished'] - entry['started'] for entry in _JOBS.values()
+                 if entry['status'] == JOB_DONE and entry['started'] is not None]
+    pending = sum(1 for entry in _JOBS.values() if entry['status'] in JOB_PENDING_STATUSES)
+    if not durations:
+        return MIN_RETRY_AFTER_SECONDS
+    return max(MIN_RETRY_AFTER_SECONDS,
+               math.ceil(sum(durations) / len(durations) * pending / JOB_WORKERS))
+
+
+def jobs_stats():
+    """How many jobs are queued, running and finished, and the limits they live under"""
+    with _JOBS_LOCK:
+        _evict_jobs(time.monotonic())
+        statuses = [entry['status'] for entry in _JOBS.values()]
+    return {'queued': statuses.count(JOB_QUEUED),
+            'running': statuses.count(JOB_RUNNING) + statuses.count(JOB_CANCELLING),
+            'finished': len(statuses) - sum(statuses.count(s) for s in JOB_PENDING_STATUSES),
+            'pending_capacity': MAX_PENDING_JOBS, 'capacity': MAX_JOBS,
+            'ttl_seconds': JOB_TTL_SECONDS}
+
+
+def jobs_clear():
+    """Cancel every pending job and forget every job"""
+    with _JOBS_LOCK:
+        for entry in _JOBS.values():
+            entry['cancel'].set()
+        _JOBS.clear()
+
+
+@app.route('/api/jobs', methods=['POST'])
+def job_submit():
+    """
+    API endpoint that takes an /api/solve request as a background job
+
+    POST JSON parameters: those of /api/solve, both engines.
+
+    Returns 202 with {"job_id", "status": "queued", "poll": "/api/jobs/<id>",
+    "warnings"} and a Location header; a request /api/solve would refuse is
+    refused here with the same status and body. A request the solve cache
+    already holds the answer to is a job born "done". 429 too_many_jobs, with
+    Retry-After, when MAX_PENDING_JOBS are queued or running.
+    """
+    request_warnings = []
+
+    try:
+        data = request.get_json(silent=True)
+        params, refusal = _solve_request(data, request_warnings)
+        if refusal is not None:
+            return refusal
+
+        cache_key = _solve_cache_key(params['umf'], params['inventory'], params['solver'], {
+            'max_solutions': params['max_solutions'], 'min_materials': params['min_materials'],
+            'error_tolerance': params['error_tolerance'],
+            'penalize_unlisted': params['penalize_unlisted'],
+            'workers': params['workers'], 'time_budget_ms': params['time_budget_ms']})
+        cached_solutions = _solve_cache_get(cache_key)
+
+        now = time.monotonic()
+        entry = {'id': secrets.token_urlsafe(12), 'params': params, 'cache_key': cache_key,
+                 'status': JOB_QUEUED, 'created': now, 'started': None, 'finished': None,
+                 'cancel': threading.Event(), 'progress': None, 'partial': [],
+                 'warnings': request_warnings, 'solutions': None, 'error': None}
+        if cached_solutions is not None:
+            entry.update(status=JOB_DONE, started=now, finished=now, solutions=cached_solutions)
+
+        with _JOBS_LOCK:
+            _evict_jobs(now)
+            pending = sum(1 for job in _JOBS.values() if job['status'] in JOB_PENDING_STATUSES)
+            if entry['status'] == JOB_QUEUED and pending >= MAX_PENDING_JOBS:
+                retry_after = _jobs_retry_after()
+                logger.warning(f"too_many_jobs: {pending} pending, retry after {retry_after} s")
+                response = jsonify({"error": "too_many_jobs",
+                                    "message": f"{pending} jobs are queued or running, the cap is "
+                                               f"{MAX_PENDING_JOBS}; retry in {retry_after} s",
+                                    "retry_after": retry_after, "warnings": request_warnings})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            _JOBS[entry['id']] = entry
+            if entry['status'] == JOB_QUEUED:
+                _start_job_workers()
+                _JOB_QUEUE.put(entry['id'])
+
+        logger.info(f"job {entry['id']} {entry['status']}: solver {params['solver']}, "
+                    f"{len(params['umf'])} oxides")
+        poll = f"/api/jobs/{entry['id']}"
+        response = jsonify({"job_id": entry['id'], "status": entry['status'], "poll": poll,
+                            "warnings": request_warnings})
+        response.status_code = 202
+        response.headers['Location'] = poll
+        return response
+
+    except Exception as e:
+        logger.exception(f"server_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e),
+                        "warnings": request_warnings}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    API endpoint that reports a job: its status - queued, running, cancelling,
+    done, failed or cancelled - and what it has so far
+
+    Returns {"job_id", "status", "solver", "queued_ms", "elapsed_ms",
+    "progress", "partial_solutions", "warnings"}, plus "solutions" when it is
+    done and "error" / "message" when it failed. "progress" is the last step of
+    the iterative search and "partial_solutions" the acceptable recipes found so
+    far - the "iteration" and "recipe" lines of /api/solve/stream; the classic
+    engine has neither. 404 unknown_job for a job that never existed or was
+    evicted.
+    """
+    with _JOBS_LOCK:
+        _evict_jobs(time.monotonic())
+        entry = _JOBS.get(job_id)
+        if entry is None:
+            return jsonify({"error": "unknown_job",
+                            "message": "no job with this id; a finished job is kept for "
+                                       f"{JOB_TTL_SECONDS:.0f} s"}), 404
+        view = _job_view(entry)
+    return jsonify(make_json_safe(view))
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def job_cancel(job_id):
+    """
+    API endpoint that cancels a job, or forgets a finished one
+
+    A queued job is cancelled at once (200). A running one is asked to stop and
+    answers 202 "cancelling": the search notices at its next step - between two
+    beam states of the iterative engine, between two material subsets of the
+    classic one - and the job then reads "cancelled". A finished job is removed
+    from the store (200 {"deleted": id}).
+    """
+    with _JOBS_LOCK:
+        entry = _JOBS.get(job_id)
+        if entry is None:
+            return jsonify({"error": "unknown_job", "message": "no job with this id"}), 404
+        if entry['status'] == JOB_QUEUED:
+            entry.update(status=JOB_CANCELLED, finished=time.monotonic())
+            entry['cancel'].set()
+            status = 200
+        elif entry['status'] in (JOB_RUNNING, JOB_CANCELLING):
+            entry['status'] = JOB_CANCELLING
+            entry['cancel'].set()
+            status = 202
+        else:
+            del _JOBS[job_id]
+            logger.info(f"job {job_id} deleted")
+            return jsonify({"deleted": job_id})
+        view = _job_view(entry)
+    logger.info(f"job {job_id} {view['status']}")
+    return jsonify(make_json_safe(view)), status
+
+
 # A feasibility request that is syntactically fine but has nothing to compute
 # from: no usable oxide in the target, a target with no flux at all (there is no
 # unity to normalize by), or an inventory in which no material carries an oxide
@@ -456,6 +1478,11 @@ FEASIBILITY_UNPROCESSABLE_ERRORS = ('empty_target', 'no_target_fluxes', 'degener
 # The per-LP cost itself grows with the problem (0.75 ms at inventory size, 10.8
 # ms at database size), so this cap is set by measured latency and not by
 # arithmetic: 180 LPs lands around 350 ms.
+# Those figures are cold starts, one linprog per LP. The ranges now re-optimize
+# a model built once per normalization from the previous basis, which cut the
+# inventory case by a factor of ten (183 -> 18 ms, measured on a box four times
+# slower than the figures above) and the 60 material one by nine. The cap is left where it was: it bounds the
+# worst request, and the worst request still grows with the LP count.
 # A caller who wants the verdict over a big inventory asks for "ranges": false
 # and pays 27 ms for the whole database.
 MAX_RANGE_LPS = 180
@@ -492,13 +1519,16 @@ def feasibility():
         "passengers": {"Fe2O3": 0.03},     // optional, {oxide: upper bound}
         "material_constraints": {"Улексит (Химпэк)": [0, 20]},  // optional, weight %
         "tol": 0.05,                       // optional, the verdict line
-        "ranges": true                     // optional, true by default
+        "ranges": true,                    // optional, true by default
+        "workers": 2                       // optional, 1 by default: threads the
+                                           // range LPs are spread over
     }
 
-    "ranges": false returns the verdict alone. That is the difference between
-    about 2 ms and about 47 ms on the real inventory, and it is what an
-    interface calling this on every keystroke should send: the ranges are worth
-    2 x (oxides + materials) LPs and the verdict is worth two.
+    "ranges": false returns the verdict alone. That was the difference between
+    about 2 ms and about 47 ms on the real inventory while every range LP was a
+    cold start. The warm started range model costs a tenth of that, so an
+    interface may now keep the ranges on while the user types.
+    The verdict is still two LPs and the ranges 2 x (oxides + materials).
 
     "inventory": null means the DEFAULT INVENTORY (the materials flagged
     inInventory), exactly as in /api/solve, and deliberately not what the same
@@ -515,7 +1545,8 @@ def feasibility():
         "achievable_ranges": {"feasible": true,
                               "oxide_ranges": {"SiO2": [2.99, 3.31], ...},
                               "material_ranges": {"Каолин КЖФ-1": [0, 27.96], ...},
-                              "example_recipe": {...}, "lp_count": 63}
+                              "example_recipe": {...}, "lp_count": 63,
+                              "pivots": 457}
     }
 
     An unbounded end of a range is null ("as much as you like"), which is a real
@@ -536,6 +1567,7 @@ def feasibility():
         material_constraints = data.get('material_constraints', None)
         tol = data.get('tol', DEFAULT_FEASIBILITY_TOL)
         want_ranges = data.get('ranges', True)
+        workers = data.get('workers', 1)
 
         if passengers is not None and not isinstance(passengers, dict):
             return jsonify({"error": "invalid_parameter",
@@ -544,17 +1576,19 @@ def feasibility():
             return jsonify({"error": "invalid_parameter",
                             "message": "material_constraints must be an object {material: [min, max]}"}), 400
 
-        try:
-            tol = float(tol)
-        except (TypeError, ValueError):
-            tol = float('nan')
-        if not math.isfinite(tol) or tol < 0:
+        tol = _read_tol(tol)
+        if tol is None:
             return jsonify({"error": "invalid_parameter",
                             "message": "tol must be a finite non-negative number"}), 400
+        # Refused here rather than left to achievable_ranges, which answers a
+        # bad count serially with a warning: a client sending one has a bug
+        if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+            return jsonify({"error": "invalid_parameter",
+                            "message": "workers must be an integer of at least 1"}), 400
 
         inventory = resolve_inventory(inventory_data)
         materials = filter_materials_by_inventory(
-            load_materials(only_inventory=False, priority=False), inventory)
+            material_records(only_inventory=False, priority=False), inventory)
 
         if want_ranges:
             projected = projected_range_lps(umf, materials)
@@ -572,45 +1606,447 @@ def feasibility():
         logger.info(f"feasibility requested for {len(umf)} oxides over {len(materials)} materials, "
                     f"tol={tol}, passengers={len(passengers or {})}, ranges={bool(want_ranges)}")
 
-        result = check_feasibility(umf, materials, tol=tol, passengers=passengers)
-
-        if result.get('error'):
-            status = 422 if result['error'] in FEASIBILITY_UNPROCESSABLE_ERRORS else 500
-            logger.warning(f"feasibility_failed: {result['error']}: {result.get('message')}")
-            return jsonify({"error": result['error'], "message": result.get('message', ''),
-                            "warnings": result.get('warnings', [])}), status
-
-        result['diagnostics'] = matrix_diagnostics(
-            materials, sorted({oxide for material in materials
-                               for oxide in (material.get('formula') or {})}))
-
-        if want_ranges:
-            # A passenger is a one sided ceiling in the range problem too, which
-            # is the same statement it makes in the verdict: "keep it under
-            # this", not "aim for this".
-            #
-            # The ceilings come from the ANSWER and not from the request:
-            # check_feasibility cleans them (unknown oxide, negative, NaN) and
-            # says so in "warnings", and feeding the raw dictionary here meant a
-            # passenger of -1.0 was dropped by the verdict with a warning and
-            # obeyed by the ranges without one - so the same response carried
-            # "feasible": true next to "achievable_ranges": {"feasible": false}.
-            oxide_constraints = {row['oxide']: [None, row['limit']]
-                                 for row in result.get('passengers', [])}
-            result['achievable_ranges'] = achievable_ranges(
-                umf, materials, oxide_constraints=oxide_constraints,
-                material_constraints=material_constraints, tol=tol)
+        with _heavy_slot('feasibility'):
+            result = _pool_call(check_feasibility, umf, materials, tol=tol, passengers=passengers)
+
+            if result.get('error'):
+                status = 422 if result['error'] in FEASIBILITY_UNPROCESSABLE_ERRORS else 500
+                logger.warning(f"feasibility_failed: {result['error']}: {result.get('message')}")
+                return jsonify({"error": result['error'], "message": result.get('message', ''),
+                                "warnings": result.get('warnings', [])}), status
+
+            result['diagnostics'] = inventory_diagnostics(materials)
+
+            if want_ranges:
+                # A passenger is a one sided ceiling in the range problem too, which
+                # is the same statement it makes in the verdict: "keep it under
+                # this", not "aim for this".
+                #
+                # The ceilings come from the ANSWER and not from the request:
+                # check_feasibility cleans them (unknown oxide, negative, NaN) and
+                # says so in "warnings", and feeding the raw dictionary here meant a
+                # passenger of -1.0 was dropped by the verdict with a warning and
+                # obeyed by the ranges without one - so the same response carried
+                # "feasible": true next to "achievable_ranges": {"feasible": false}.
+                oxide_constraints = {row['oxide']: [None, row['limit']]
+                                     for row in result.get('passengers', [])}
+                result['achievable_ranges'] = _pool_call(
+                    achievable_ranges, umf, materials, oxide_constraints=oxide_constraints,
+                    material_constraints=material_constraints, tol=tol,
+                    workers=_capped_workers(workers))
 
         logger.info(f"feasibility: {result['feasible']}, deviation "
                     f"{result.get('max_relative_deviation')}, "
                     f"unreachable {result.get('unreachable_oxides')}")
         return jsonify(make_json_safe(result))
 
+    except _Overloaded as exc:
+        return _overloaded_response(exc)
     except Exception as e:
         logger.exception(f"feasibility_error: {str(e)}")
         return jsonify({"error": "server_error", "message": str(e)}), 500
 
 
+# Feasibility sessions (POST /api/feasibility/sessions): the resident problem of
+# feasibility.open_feasibility_session, one per inventory an interface is
+# editing a target against. A session holds two HiGHS models and the molar
+# matrix, a few hundred kilobytes at inventory size, so they are not kept for
+# ever: one unused for FEASIBILITY_SESSION_IDLE_SECONDS is dropped on the next
+# request that touches the store, and beyond MAX_FEASIBILITY_SESSIONS the least
+# recently used goes first. Ten minutes is longer than anyone pauses while
+# typing a formula and shorter than a forgotten browser tab.
+FEASIBILITY_SESSION_IDLE_SECONDS = 600.0
+MAX_FEASIBILITY_SESSIONS = 32
+
+_FEASIBILITY_SESSIONS = OrderedDict()
+_FEASIBILITY_SESSIONS_LOCK = threading.Lock()
+
+
+def _evict_feasibility_sessions(now):
+    """Drop the idle sessions; the caller holds _FEASIBILITY_SESSIONS_LOCK"""
+    while _FEASIBILITY_SESSIONS:
+        session_id, entry = next(iter(_FEASIBILITY_SESSIONS.items()))
+        if now - entry['last_used'] <= FEASIBILITY_SESSION_IDLE_SECONDS:
+            break
+        del _FEASIBILITY_SESSIONS[session_id]
+        logger.info(f"feasibility session {session_id} evicted after "
+                    f"{now - entry['last_used']:.0f} s idle")
+
+
+def _feasibility_session_get(session_id):
+    """The entry of an open session, marked as used, or None for an unknown or evicted one"""
+    now = time.monotonic()
+    with _FEASIBILITY_SESSIONS_LOCK:
+        _evict_feasibility_sessions(now)
+        entry = _FEASIBILITY_SESSIONS.get(session_id)
+        if entry is not None:
+            entry['last_used'] = now
+            _FEASIBILITY_SESSIONS.move_to_end(session_id)
+        return entry
+
+
+def _feasibility_session_put(entry):
+    """Store a new session entry and return its id"""
+    session_id = secrets.token_urlsafe(12)
+    now = time.monotonic()
+    with _FEASIBILITY_SESSIONS_LOCK:
+        _evict_feasibility_sessions(now)
+        entry['last_used'] = now
+        _FEASIBILITY_SESSIONS[session_id] = entry
+        while len(_FEASIBILITY_SESSIONS) > MAX_FEASIBILITY_SESSIONS:
+            _FEASIBILITY_SESSIONS.popitem(last=False)
+    return session_id
+
+
+def feasibility_sessions_stats():
+    """How many feasibility sessions are open, and the limits they live under"""
+    with _FEASIBILITY_SESSIONS_LOCK:
+        _evict_feasibility_sessions(time.monotonic())
+        return {'open': len(_FEASIBILITY_SESSIONS), 'capacity': MAX_FEASIBILITY_SESSIONS,
+                'idle_seconds': FEASIBILITY_SESSION_IDLE_SECONDS}
+
+
+def feasibility_sessions_clear():
+    """Close every feasibility session"""
+    with _FEASIBILITY_SESSIONS_LOCK:
+        _FEASIBILITY_SESSIONS.clear()
+
+
+def _read_tol(value):
+    """The "tol" field as a finite non-negative float, or None when it is not one"""
+    try:
+        tol = float(value)
+    except (TypeError, ValueError):
+        return None
+    return tol if math.isfinite(tol) and tol >= 0 else None
+
+
+def _session_check_response(session_id, entry, umf, tol):
+    """One verdict on an open session, answered like /api/feasibility with "ranges": false"""
+    result = check_session(entry['session'], umf, tol=tol)
+    if result.get('error'):
+        status = 422 if result['error'] in FEASIBILITY_UNPROCESSABLE_ERRORS else 500
+        logger.warning(f"feasibility_session_failed: {result['error']}: {result.get('message')}")
+        return jsonify({"error": result['error'], "message": result.get('message', ''),
+                        "warnings": result.get('warnings', []),
+                        "session_id": session_id}), status
+
+    result['diagnostics'] = entry['diagnostics']
+    result['session'] = dict(session_stats(entry['session']), session_id=session_id)
+    return jsonify(make_json_safe(result))
+
+
+@app.route('/api/feasibility/sessions', methods=['POST'])
+def feasibility_session_open():
+    """
+    API endpoint that opens a feasibility session: the verdict of
+    /api/feasibility for one inventory and one set of passengers, kept resident
+    on the server so that a target edited keystroke by keystroke is re-checked
+    without rebuilding the problem each time
+
+    POST JSON parameters:
+    {
+        "inventory": ["Material1", ...],   // optional, null = the default stock
+        "passengers": {"Fe2O3": 0.03},     // optional, fixed for the session
+        "umf": {...},                      // optional, a first target to check
+        "tol": 0.05                        // optional, with "umf" only
+    }
+
+    Returns 201 with
+    {
+        "session_id": "...",
+        "idle_timeout_seconds": 600,
+        "materials": 19,
+        "diagnostics": {...}
+    }
+    and, when "umf" was sent, the verdict on it as well, in the shape
+    PATCH /api/feasibility/sessions/<id> answers with.
+
+    The session is checked against with PATCH, closed with DELETE, and dropped
+    by the server after FEASIBILITY_SESSION_IDLE_SECONDS without a request. A
+    PATCH on a dropped session answers 404 unknown_session, and the client
+    opens a new one. There are no ranges here: a session is for the verdict
+    that is re-asked on every keystroke, the ranges are /api/feasibility's.
+    """
+    try:
+        data = request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+
+        passengers = data.get('passengers', None)
+        umf = data.get('umf', None)
+        tol = _read_tol(data.get('tol', DEFAULT_FEASIBILITY_TOL))
+
+        if passengers is not None and not isinstance(passengers, dict):
+            return jsonify({"error": "invalid_parameter",
+                            "message": "passengers must be an object {oxide: upper_bound}"}), 400
+        if umf is not None and (not isinstance(umf, dict) or not umf):
+            return jsonify({"error": "missing_umf",
+                            "message": "umf must be a non-empty object when it is sent"}), 400
+        if tol is None:
+            return jsonify({"error": "invalid_parameter",
+                            "message": "tol must be a finite non-negative number"}), 400
+
+        inventory = resolve_inventory(data.get('inventory', None))
+        materials = filter_materials_by_inventory(
+            material_records(only_inventory=False, priority=False), inventory)
+
+        session = open_feasibility_session(materials, passengers)
+        if session.get('error'):
+            status = 422 if session['error'] in FEASIBILITY_UNPROCESSABLE_ERRORS else 500
+            logger.warning(f"feasibility_session_refused: {session['error']}: {session['message']}")
+            return jsonify({"error": session['error'], "message": session['message']}), status
+
+        entry = {'session': session,
+                 'diagnostics': inventory_diagnostics(materials)}
+        session_id = _feasibility_session_put(entry)
+        logger.info(f"feasibility session {session_id} opened over {len(materials)} materials, "
+                    f"passengers={len(passengers or {})}")
+
+        body = {"session_id": session_id,
+                "idle_timeout_seconds": FEASIBILITY_SESSION_IDLE_SECONDS,
+                "materials": len(session['material_names']),
+                "diagnostics": entry['diagnostics']}
+        if umf is None:
+            return jsonify(make_json_safe(body)), 201
+
+        response = _session_check_response(session_id, entry, umf, tol)
+        if response.status_code != 200:
+            return response
+        return jsonify(dict(response.get_json(), **body)), 201
+
+    except Exception as e:
+        logger.exception(f"feasibility_session_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e)}), 500
+
+
+@app.route('/api/feasibility/sessions/<session_id>', methods=['PATCH'])
+def feasibility_session_check(session_id):
+    """
+    API endpoint that re-checks an open feasibility session against a new target
+
+    PATCH JSON parameters:
+    {
+        "umf": {"SiO2": 3.15, ...},   // required, the target as it stands now
+        "tol": 0.05                   // optional
+    }
+
+    Returns what /api/feasibility returns with "ranges": false - the verdict,
+    the rows, the reasons, the closest recipe and the diagnostics - plus
+    "session": {"session_id", "checks", "rebuilds", "pivots"}. 404
+    unknown_session for a session that was closed, evicted or never opened.
+    """
+    try:
+        entry = _feasibility_session_get(session_id)
+        if entry is None:
+            return jsonify({"error": "unknown_session",
+                            "message": "no open feasibility session with this id; "
+                                       "it may have been idle for too long - open a new one"}), 404
+
+        data = request.get_json(silent=True)
+        umf = data.get('umf') if isinstance(data, dict) else None
+        if not isinstance(umf, dict) or not umf:
+            return jsonify({"error": "missing_umf",
+                            "message": "umf parameter is required and must be a non-empty object"}), 400
+        tol = _read_tol(data.get('tol', DEFAULT_FEASIBILITY_TOL))
+        if tol is None:
+            return jsonify({"error": "invalid_parameter",
+                            "message": "tol must be a finite non-negative number"}), 400
+
+        return _session_check_response(session_id, entry, umf, tol)
+
+    except Exception as e:
+        logger.exception(f"feasibility_session_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e)}), 500
+
+
+@app.route('/api/feasibility/sessions/<session_id>', methods=['DELETE'])
+def feasibility_session_close(session_id):
+    """API endpoint that closes a feasibility session before it would be evicted"""
+    with _FEASIBILITY_SESSIONS_LOCK:
+        entry = _FEASIBILITY_SESSIONS.pop(session_id, None)
+    if entry is None:
+        return jsonify({"error": "unknown_session",
+                        "message": "no open feasibility session with this id"}), 404
+    logger.info(f"feasibility session {session_id} closed after "
+                f"{session_stats(entry['session'])['checks']} checks")
+    return jsonify({"closed": session_id})
+
+
+# The largest batch /api/feasibility/batch takes in one request. The region
+# decides most targets for a fraction of a millisecond each, but a shelf it
+# cannot be built for sends every target to the LP, at about 4 ms a target on a
+# session on this machine: 2000 targets is then some 8 s of one thread, which
+# is the longest a screening request should hold one. A corpus bigger than that
+# is sent in several batches, and the region of the same shelf is built again
+# for each - 5 ms on the shipped inventory.
+MAX_FEASIBILITY_BATCH_TARGETS = 2000
+
+
+def _batch_targets(items):
+    """
+    The targets of a batch request and the ids to echo back with them
+
+    A target is either a UMF object or {"id": ..., "umf": {...}}; "umf" is not
+    an oxide name, so the two cannot be mistaken for each other.
+
+    Returns:
+        (targets, ids, bad_position): bad_position is the index of the first
+        item that is neither, and None when there is none
+    """
+    targets, ids = [], []
+    for position, item in enumerate(items):
+        if isinstance(item, dict) and isinstance(item.get('umf'), dict):
+            targets.append(item['umf'])
+            ids.append(item.get('id', position))
+        elif isinstance(item, dict) and 'umf' not in item:
+            targets.append(item)
+            ids.append(position)
+        else:
+            return None, None, position
+    return targets, ids, None
+
+
+def _ndjson_line(obj):
+    """One line of an NDJSON stream"""
+    return json.dumps(make_json_safe(obj), ensure_ascii=False) + '\n'
+
+
+@app.route('/api/feasibility/batch', methods=['POST'])
+def feasibility_batch():
+    """
+    API endpoint that screens many targets against one inventory, for a corpus
+    to be sorted into "worth solving" and "not reachable from this shelf"
+    before any solver runs
+
+    POST JSON parameters:
+    {
+        "targets": [{"SiO2": 3.0, ...}, {"id": "glazy-123", "umf": {...}}, ...],
+        "inventory": ["Material1", ...],   // optional, null = the default stock
+        "passengers": {"Fe2O3": 0.03},     // optional, the same for every target
+        "tol": 0.05                        // optional
+    }
+
+    Answers application/x-ndjson, one JSON object per line, written as the
+    verdicts are decided:
+        {"type": "start", "targets": N, "materials": 19, "diagnostics": {...},
+         "region": {"dimension": 11, "facets": 153} or {"error": ...}}
+        {"type": "verdict", "index": 0, "id": ..., "lp_ms": 0.0,
+         <the answer of feasibility.iter_feasibility_batch>}   // N of these
+        {"type": "done", "targets": N, "decided_by_hull": ..., "decided_by_lp": ...,
+         "errors": ..., "lp_ms": ..., "elapsed_ms": ...}
+
+    The verdicts the reachable region decides come first, in target order,
+    and the ones that needed an LP follow as each is solved - so "index" and
+    not the position of a line says which target a verdict belongs to. The
+    matrix, the region, the LP models and the diagnostics are built once for
+    the whole batch. A failure after the first line cannot change the status
+    any more and is reported as a last {"type": "error"} line instead of "done".
+    """
+    try:
+        data = request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+
+        items = data.get('targets', None)
+        passengers = data.get('passengers', None)
+        tol = _read_tol(data.get('tol', DEFAULT_FEASIBILITY_TOL))
+
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "missing_targets",
+                            "message": "targets must be a non-empty list of UMF objects"}), 400
+        if len(items) > MAX_FEASIBILITY_BATCH_TARGETS:
+            return jsonify({"error": "too_many_targets",
+                            "message": f"{len(items)} targets in one batch, above the cap of "
+                                       f"{MAX_FEASIBILITY_BATCH_TARGETS}; split the corpus"}), 413
+        targets, ids, bad_position = _batch_targets(items)
+        if bad_position is not None:
+            return jsonify({"error": "invalid_target",
+                            "message": f"targets[{bad_position}] is neither a UMF object "
+                                       f"nor {{\"id\": ..., \"umf\": {{...}}}}"}), 400
+        if passengers is not None and not isinstance(passengers, dict):
+            return jsonify({"error": "invalid_parameter",
+                            "message": "passengers must be an object {oxide: upper_bound}"}), 400
+        if tol is None:
+            return jsonify({"error": "invalid_parameter",
+                            "message": "tol must be a finite non-negative number"}), 400
+
+        inventory = resolve_inventory(data.get('inventory', None))
+        materials = filter_materials_by_inventory(
+            material_records(only_inventory=False, priority=False), inventory)
+    except Exception as e:
+        logger.exception(f"feasibility_batch_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e)}), 500
+
+    # A slot of /api/feasibility, held from the region on to the last verdict:
+    # a batch over the catalogue, where the region refuses and every target
+    # goes to the LP, is some 0.3 s per 100 targets and so seconds per request,
+    # and without the cap any number of them could run on request threads at
+    # once. It is released by the generator's finally, or by the close of a
+    # response whose generator never started - whichever comes first
+    try:
+        _heavy_acquire('feasibility')
+    except _Overloaded as exc:
+        return _overloaded_response(exc)
+    holding = time.perf_counter()
+    held = [True]
+
+    def release():
+        if held[0]:
+            held[0] = False
+            _heavy_release('feasibility', time.perf_counter() - holding)
+
+    try:
+        region = reachable_region(materials)
+        diagnostics = inventory_diagnostics(materials)
+    except Exception as e:
+        release()
+        logger.exception(f"feasibility_batch_error: {str(e)}")
+        return jsonify({"error": "server_error", "message": str(e)}), 500
+
+    logger.info(f"feasibility batch of {len(targets)} targets over {len(materials)} materials, "
+                f"tol={tol}, passengers={len(passengers or {})}, "
+                f"region={region.get('error') or region['facet_count']}")
+
+    def generate():
+        try:
+            started = time.perf_counter()
+            counts = {'hull': 0, 'lp': 0, 'errors': 0}
+            lp_seconds = 0.0
+            yield _ndjson_line({
+                "type": "start", "targets": len(targets), "materials": len(materials),
+                "diagnostics": diagnostics,
+                "region": ({"error": region['error']} if region.get('error') else
+                           {"dimension": region['dimension'], "facets": region['facet_count']})})
+            try:
+                for position, answer, seconds in iter_feasibility_batch(
+                        targets, materials, tol=tol, passengers=passengers, region=region):
+                    lp_seconds += seconds
+                    if answer.get('error'):
+                        counts['errors'] += 1
+                    else:
+                        counts[answer['decided_by']] += 1
+                    yield _ndjson_line(dict(answer, type="verdict", index=position,
+                                            id=ids[position], lp_ms=seconds * 1e3))
+            except Exception as e:
+                logger.exception(f"feasibility_batch_error: {str(e)}")
+                yield _ndjson_line({"type": "error", "error": "server_error", "message": str(e)})
+                return
+
+            elapsed = time.perf_counter() - started
+            logger.info(f"feasibility batch: {counts['hull']} by the region, {counts['lp']} by LP "
+                        f"({lp_seconds * 1e3:.0f} ms), {counts['errors']} refused, "
+                        f"{elapsed * 1e3:.0f} ms")
+            yield _ndjson_line({"type": "done", "targets": len(targets),
+                                "decided_by_hull": counts['hull'], "decided_by_lp": counts['lp'],
+                                "errors": counts['errors'], "lp_ms": lp_seconds * 1e3,
+                                "elapsed_ms": elapsed * 1e3})
+        finally:
+            release()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(release)
+    return response
+
+
 # HTTP status for a recipe that is syntactically fine but cannot be analysed -
 # the same code /api/glazy_import already uses for a recipe without an analysis.
 # 'empty_recipe' and 'empty_umf' are guards of sensitivity.py that no request can
@@ -620,6 +2056,13 @@ def feasibility():
 SENSITIVITY_UNPROCESSABLE_ERRORS = ('no_fluxes', 'no_known_materials', 'empty_composition',
                                     'empty_recipe', 'empty_umf', 'nonfinite_result')
 
+# Ceiling of the "samples" field of /api/sensitivity. The draws cost about 10 us
+# each on a 10 material recipe (materials + 2 UMF evaluations per draw, all in
+# numpy), so 20000 of them is about 200 ms - the most a single request of a
+# single threaded server is allowed to take here, as MAX_RANGE_LPS is for
+# /api/feasibility.
+MAX_SENSITIVITY_SAMPLES = 20000
+
 # The endpoint used to accept an "inventory" and the parameter was removed, not
 # renamed: the request that carries it is now answered with different numbers
 # than before. Ignoring it without a word is the one outcome an old client cannot
@@ -641,9 +2084,16 @@ def sensitivity():
 
     POST JSON parameters:
     {
-        "recipe": {"Нефелин-сиенит VR13": 30.2, ...}  // required, weight percent
+        "recipe": {"Нефелин-сиенит VR13": 30.2, ...},  // required, weight percent
+        "mode": "linear",    // optional, "linear" (default) or "monte_carlo"
+        "samples": 2000,     // optional, monte_carlo only, at most MAX_SENSITIVITY_SAMPLES
+        "seed": 0            // optional, monte_carlo only, null for a fresh draw
     }
 
+    "mode": "monte_carlo" answers everything "linear" does plus a "monte_carlo"
+    block - percentile bands per oxide and Sobol indices per material, drawn
+    from the same sigmas; see sensitivity._monte_carlo.
+
     There is no "inventory" parameter here, unlike /api/solve: the names are
     always resolved against the WHOLE database. A recipe names its own materials
     exactly, so there is nothing to search for, and dropping one of them for
@@ -684,11 +2134,21 @@ def sensitivity():
             logger.warning("sensitivity_inventory_ignored: the parameter was removed")
             request_warnings.append(IGNORED_INVENTORY_WARNING)
 
-        materials = load_materials(only_inventory=False, priority=True)
+        mode = data.get('mode', MODE_LINEAR)
+        samples = data.get('samples', MONTE_CARLO_SAMPLES)
+        seed = data.get('seed', 0)
+        if isinstance(samples, int) and not isinstance(samples, bool) and samples > MAX_SENSITIVITY_SAMPLES:
+            return jsonify({"error": "invalid_parameter",
+                            "message": f"samples must be at most {MAX_SENSITIVITY_SAMPLES}, got {samples}",
+                            "warnings": request_warnings}), 400
+
+        materials = material_records(only_inventory=False, priority=True)
 
-        logger.info(f"sensitivity requested for {len(recipe)} materials")
+        logger.info(f"sensitivity requested for {len(recipe)} materials, mode={mode!r}")
 
-        result = recipe_sensitivity(recipe, materials)
+        with _heavy_slot('sensitivity'):
+            result = _pool_call(recipe_sensitivity, recipe, materials, mode=mode,
+                                samples=samples, seed=seed)
         result['warnings'] = request_warnings + result.get('warnings', [])
 
         if result.get('error'):
@@ -700,6 +2160,8 @@ def sensitivity():
         logger.info(f"sensitivity done: {len(result['by_material'])} materials, {len(result['per_oxide'])} oxides, warnings={len(result['warnings'])}")
         return jsonify(make_json_safe(result))
 
+    except _Overloaded as exc:
+        return _overloaded_response(exc, request_warnings)
     except Exception as e:
         logger.exception(f"sensitivity_error: {str(e)}")
         return jsonify({"error": "server_error", "message": str(e)}), 500
@@ -850,10 +2312,19 @@ def convert_weights_to_umf():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """
-    API endpoint that reports whether the server is alive
+    API endpoint that reports whether the server is alive, with the counts of
+    the /api/solve answer cache (see SOLVE_CACHE_SIZE), of the inventory
+    diagnostics cache (see DIAGNOSTICS_CACHE_SIZE) and of the open feasibility
+    sessions (see MAX_FEASIBILITY_SESSIONS), with the load of the heavy
+    endpoints (see HEAVY_ENDPOINT_LIMITS) and with the solve jobs (see
+    MAX_PENDING_JOBS)
     """
     logger.debug("health check requested")
-    return jsonify({"status": "ok"})
+    return jsonify({"status": "ok", "solve_cache": solve_cache_stats(),
+                    "diagnostics_cache": diagnostics_cache_stats(),
+                    "feasibility_sessions": feasibility_sessions_stats(),
+                    "heavy_endpoints": heavy_endpoints_stats(),
+                    "jobs": jobs_stats()})
 
 @app.route('/api/materials', methods=['GET'])
 def get_materials():
@@ -881,7 +2352,7 @@ def get_materials():
         inventory_only = request.args.get('inventory_only', 'false').lower() == 'true'
         
         # Load every known material
-        materials = load_materials(only_inventory=False, priority=True)
+        materials = material_records(only_inventory=False, priority=True)
         
         if inventory_only:
             # Keep only the materials flagged as inInventory
@@ -993,4 +2464,5 @@ def serve_ui(path):
 
 if __name__ == '__main__':
     logger.info("starting glaze recipe api server on 0.0.0.0:5000")
+    start_solver_pool()
     app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
@@ -1,4 +1,7 @@
 # Benchmark package: the Glazy corpus loader, the quality baseline snapshot, the
-# regression diff and the append only history of the runs worth keeping. Nothing
-# here is imported by the runtime - only by tests/test_inverse_corpus.py,
-# tests/test_bench_history.py and the scripts of this directory.
+# regression diff, the append only history of the runs worth keeping, the
+# serial against parallel timing of the achievable ranges and the calls per
+# second of the batched NNLS. Nothing here is imported by the runtime - only by
+# tests/test_inverse_corpus.py, tests/test_bench_corpus.py,
+# tests/test_bench_history.py, tests/test_bench_ranges.py,
+# tests/test_bench_nnls.py and the scripts of this directory.
@@ -77,11 +77,13 @@ import gzip
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import random
 import subprocess
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
@@ -164,6 +166,10 @@ FEASIBILITY_TOL = feasibility.DEFAULT_FEASIBILITY_TOL
 # max_solutions=1 do not carry over: the beam width and the number of children
 # are both 1 there, which is a different search (TZ_SOLVER_V2.md 10.8).
 MAX_SOLUTIONS = 5
+# Passed to the classic engine, which enumerates its subsets instead of drawing
+# them now and ignores it. Still recorded in solver_config, next to the
+# 'classic_subsets' entry that tells a snapshot of the enumerating engine apart
+# from the older ones
 CLASSIC_SEED = 42
 
 # Level 1 of the two-level criterion of 7.1: the chemistry has to match. It is
@@ -246,10 +252,61 @@ METRICS: Tuple[Tuple[str, str], ...] = (
     ('cond', 'lower'),
 )
 
+# What a case COST, as opposed to what it is worth, per case of run_case():
+#
+#     seconds       wall clock of the feasibility gate and the solve
+#     cpu_seconds   CPU time of the same stretch, in the process that ran it
+#     nnls_calls    the NNLS runs of the search, one per fit that had one of
+#                   its own: the warm and cold fits of the iterative engine's
+#                   nnls_solves, the solved subsets of the classic one's - the
+#                   same thing counted on both sides, so the two compare
+#     nnls_spared   the fits answered without a run of their own: the
+#                   iterative engine's batched ones (one common.nnls_batch
+#                   call for a whole step), the subsets the classic engine's
+#                   lattice answered
+#     lp_calls      the LPs of the case: scenario B's feasibility verdict, none
+#                   in scenario A, where no engine runs an LP
+#     beam_levels   levels of the beam completed (levels_completed); None for
+#                   the classic engine, which has no beam
+#     prune_rounds  rounds of backward elimination (prune_rounds); None for the
+#                   classic engine, which does not prune
+#
+# None of them is a quality and none has a direction the quality gates could
+# read, so they are a list of their own. The counts are what the measured claims
+# in the solver comments ("exhaustive 1680 runs, heuristic 624") were counted
+# by hand from; only the latency is gated, see LATENCY_METRIC.
+COST_METRICS: Tuple[str, ...] = (
+    'seconds', 'cpu_seconds', 'nnls_calls', 'nnls_spared', 'lp_calls', 'beam_levels', 'prune_rounds',
+)
+
+# The latency gate of both bench/diff_baseline.py --check and bench/history.py
+# --check, defined once here for the reason METRICS is: the two must not be able
+# to disagree about what a slower run is.
+#
+# The wall clock and not the CPU time, because it is what a caller waits for;
+# a run whose processes fight over the cores is not compared with one whose
+# did not (latency_regressions refuses two runs of different "jobs"). Gated on
+# the median and the p95 - p50 and p95 in the words of a latency budget - and
+# not on the p99, which on 50 classic cases is one case.
+#
+# The band is wide on purpose. Wall clock on one machine moves some 10% from
+# run to run with nothing changed (measured on bench/nnls.py and on the searches
+# of the reference recipes), so a band of REGRESSION_TOLERANCE's 5% would be red
+# on every other run. 25% is that noise twice over with room to spare; a smaller
+# slowdown is still printed in the cost block of both reports, it just does not
+# fail --check. Below LATENCY_FLOOR_SECONDS a change is noise whatever its
+# ratio: a 2 ms median growing to 3 ms is +50% and nothing.
+LATENCY_METRIC = 'seconds'
+LATENCY_AGGREGATES = ('median', 'p95')
+LATENCY_TOLERANCE = 0.25
+LATENCY_FLOOR_SECONDS = 0.005
+LATENCY_MIN_CASES = 10
+
 # The aggregates of a distribution profile, in the order they are printed. The
 # whole distribution rather than a mean: a change can improve the median while
-# wrecking a handful of cases, and only p90 / p99 / max show it.
-PROFILE_KEYS = ('min', 'p10', 'median', 'mean', 'p90', 'p99', 'max')
+# wrecking a handful of cases, and only p90 / p99 / max show it. p95 is there for
+# the latency gate; the quality gates do not read it.
+PROFILE_KEYS = ('min', 'p10', 'median', 'mean', 'p90', 'p95', 'p99', 'max')
 
 # Data files whose content decides what the solver can answer. Their hashes go
 # into the baseline so that "the solver changed" can be told apart from "the
@@ -826,10 +883,27 @@ def quality_materials(case: Dict[str, Any], scenario: str) -> List[Dict[str, Any
                          if record.get('name') not in known]
 
 
+def _search_counts(solution: Dict[str, Any], engine: str) -> Dict[str, Optional[int]]:
+    """
+    nnls_calls, nnls_spared, beam_levels and prune_rounds of a search, out of
+    one of its solutions - the engines put the totals of the whole call on
+    every one
+    """
+    fits = solution.get('nnls_solves') or {}
+    if engine == ENGINE_ITERATIVE:
+        return {'nnls_calls': fits['warm'] + fits['cold'] if fits else None,
+                'nnls_spared': fits.get('batched'),
+                'beam_levels': solution.get('levels_completed'),
+                'prune_rounds': solution.get('prune_rounds')}
+    return {'nnls_calls': fits.get('solved'), 'nnls_spared': fits.get('avoided'),
+            'beam_levels': None, 'prune_rounds': None}
+
+
 def _solve(case: Dict[str, Any], engine: str,
-           scenario: str = SCENARIO_A) -> Tuple[Optional[Dict[str, float]], str]:
+           scenario: str = SCENARIO_A) -> Tuple[Optional[Dict[str, float]], str, Dict[str, Optional[int]]]:
     """
-    Run one engine over one case and return (recipe, status)
+    Run one engine over one case and return (recipe, status, counts), counts
+    being _search_counts() of the search or {} when it returned no solution
 
     Scenario A injects the recipe's OWN materials through the materials= seam of
     both engines, so the target is reachable by construction and what is
@@ -862,18 +936,19 @@ def _solve(case: Dict[str, Any], engine: str,
                 materials=materials,
             )
     except Exception as exc:
-        return None, f'failed: {type(exc).__name__}: {exc}'
+        return None, f'failed: {type(exc).__name__}: {exc}', {}
 
     if isinstance(solutions, dict):
-        return None, f"failed: {solutions.get('error', 'unknown error')}"
+        return None, f"failed: {solutions.get('error', 'unknown error')}", {}
     if not solutions:
-        return None, 'failed: no solutions'
+        return None, 'failed: no solutions', {}
 
+    counts = _search_counts(solutions[0], engine)
     recipe = solutions[0].get('recipe') or {}
     if not recipe:
-        return None, 'failed: empty recipe'
+        return None, 'failed: empty recipe', counts
 
-    return recipe, 'solved'
+    return recipe, 'solved', counts
 
 
 def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
@@ -913,6 +988,14 @@ def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
     it says. Running the solver on a target the LP called unreachable is not
     wasted work: it is the only way to catch the LP being wrong about it, and
     the disagreements in both directions are what the scenario is really for.
+
+    TWO CLOCKS cover the same stretch, the feasibility gate and the solve:
+    'seconds' is the wall clock and 'cpu_seconds' the CPU time of this process.
+    Under run_cases(jobs=N) the cases share the machine, so the wall clock of a
+    case also measures its neighbours; the CPU time does not, and is the number
+    to compare between a serial run and a parallel one. The counts of the
+    search and of the LPs go next to them - see COST_METRICS for what each one
+    counts.
     """
     if scenario not in SCENARIOS:
         raise ValueError(f'unknown scenario {scenario!r}, expected one of {SCENARIOS}')
@@ -926,6 +1009,14 @@ def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
         'size': case['size'],
         'status': 'failed: not run',
         'seconds': 0.0,
+        'cpu_seconds': 0.0,
+        # See COST_METRICS. None where the search returned nothing to read
+        # them from; lp_calls is always counted
+        'nnls_calls': None,
+        'nnls_spared': None,
+        'lp_calls': 0,
+        'beam_levels': None,
+        'prune_rounds': None,
         'umf_error': None,
         'max_relative': None,
         'worst_oxide': None,
@@ -948,10 +1039,13 @@ def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
     }
 
     start = time.perf_counter()
+    cpu_start = time.process_time()
 
     if scenario == SCENARIO_B:
+        lp_start = feasibility.lp_calls()
         verdict = feasibility.check_feasibility(
             case['target_umf'], inventory_materials(), tol=FEASIBILITY_TOL)
+        result['lp_calls'] = feasibility.lp_calls() - lp_start
         result.update({
             'feasible': verdict.get('feasible'),
             'max_relative_deviation': verdict.get('max_relative_deviation'),
@@ -959,9 +1053,11 @@ def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
             'feasibility_error': verdict.get('error'),
         })
 
-    recipe, status = _solve(case, engine, scenario)
+    recipe, status, counts = _solve(case, engine, scenario)
+    result.update(counts)
     result['status'] = status
     result['seconds'] = time.perf_counter() - start
+    result['cpu_seconds'] = time.process_time() - cpu_start
 
     if recipe is None:
         return result
@@ -1015,16 +1111,55 @@ def run_case(case: Dict[str, Any], engine: str = ENGINE_ITERATIVE,
     return result
 
 
+def run_cases(tasks: Sequence[Tuple[Dict[str, Any], str, str]], jobs: int = 1,
+              progress: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """
+    run_case() over (case, engine, scenario) tasks, one row per task IN TASK
+    ORDER whatever the number of processes, optionally reporting progress
+    through a callable every 25 rows
+
+    jobs=1 is the serial loop in this process. Above that the tasks are spread
+    over a pool of `jobs` processes, handed out one at a time: a classic case can
+    take a hundred times as long as an iterative one, and a bigger chunk would
+    leave one process working through the tail while the others wait. The pool
+    lives for the call only - starting a process means importing numpy and scipy,
+    about a second, so a caller with several passes hands them all over in ONE
+    call (diff_baseline.run_corpus does), and the tail of one pass overlaps the
+    start of the next. 'spawn' for the reason solver_iterative._worker_pool gives.
+
+    Every process loads the inventory of scenario B once for itself
+    (inventory_materials), and the rows are the same in every field but the two
+    clocks as those of a serial run: run_case depends on nothing but its
+    arguments.
+    """
+    results: List[Dict[str, Any]] = []
+    if jobs <= 1 or len(tasks) <= 1:
+        rows = (run_case(case, engine, scenario) for case, engine, scenario in tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(jobs, len(tasks)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+        cases, engines, scenarios = zip(*tasks)
+        # map() yields in submission order, which is what keeps the rows of a
+        # snapshot in the order of its sample
+        rows = executor.map(run_case, cases, engines, scenarios, chunksize=1)
+
+    try:
+        for index, row in enumerate(rows, start=1):
+            results.append(row)
+            if progress is not None and index % 25 == 0:
+                progress(index, len(tasks))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
 def run_sample(sample: Sequence[Dict[str, Any]], engine: str = ENGINE_ITERATIVE,
                progress: Optional[Any] = None,
-               scenario: str = SCENARIO_A) -> List[Dict[str, Any]]:
-    """Run a whole sample, optionally reporting progress through a callable"""
-    results = []
-    for index, case in enumerate(sample, start=1):
-        results.append(run_case(case, engine, scenario))
-        if progress is not None and index % 25 == 0:
-            progress(index, len(sample))
-    return results
+               scenario: str = SCENARIO_A, jobs: int = 1) -> List[Dict[str, Any]]:
+    """Run a whole sample, in `jobs` processes (see run_cases), optionally reporting progress through a callable"""
+    return run_cases([(case, engine, scenario) for case in sample], jobs=jobs, progress=progress)
 
 
 # --------------------------------------------------------------------------
@@ -1033,7 +1168,7 @@ def run_sample(sample: Sequence[Dict[str, Any]], engine: str = ENGINE_ITERATIVE,
 
 def profile(values: Sequence[float]) -> Optional[Dict[str, float]]:
     """
-    min / p10 / median / mean / p90 / p99 / max of a sample, plus its size
+    min / p10 / median / mean / p90 / p95 / p99 / max of a sample, plus its size
 
     None for an empty sample - a metric that is defined on no case has no
     distribution, and returning zeros would invent one.
@@ -1048,11 +1183,61 @@ def profile(values: Sequence[float]) -> Optional[Dict[str, float]]:
         'median': float(np.percentile(array, 50)),
         'mean': float(array.mean()),
         'p90': float(np.percentile(array, 90)),
+        'p95': float(np.percentile(array, 95)),
         'p99': float(np.percentile(array, 99)),
         'max': float(array.max()),
     }
 
 
+def cost_profiles(rows: Sequence[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, float]]]:
+    """
+    The profile of every COST_METRICS entry over the rows that define it
+
+    Over every row, solved or not: a case that failed still took its time and
+    its fits, and leaving it out would make a search that gives up early look
+    fast.
+    """
+    return {name: profile([float(row[name]) for row in rows if row.get(name) is not None])
+            for name in COST_METRICS}
+
+
+def latency_regressions(before: Optional[Dict[str, float]], after: Optional[Dict[str, float]],
+                        before_jobs: Optional[int] = None,
+                        after_jobs: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+    """
+    The latency gate over two profiles of LATENCY_METRIC, as (problems, skipped)
+
+    problems names every LATENCY_AGGREGATES entry that grew by more than
+    LATENCY_TOLERANCE and LATENCY_FLOOR_SECONDS both. skipped is None when the
+    gate ran and says why when it could not: a side without timings - every
+    snapshot written before run_case kept them - fewer than LATENCY_MIN_CASES
+    cases, or two runs made with a different number of processes. A gate that
+    quietly does not run reads exactly like one that passed, so the caller
+    reports the reason rather than dropping it.
+
+    A run that does not say how many processes it used ran serially: "jobs"
+    came in with the parallel runner, and everything before it was one loop.
+    """
+    if not before or not after:
+        return [], 'no per-case timings on ' + ('either side' if not before and not after
+                                                 else 'the earlier side' if not before
+                                                 else 'the later side')
+    if min(before['n'], after['n']) < LATENCY_MIN_CASES:
+        return [], f"timed on {min(before['n'], after['n'])} cases, fewer than {LATENCY_MIN_CASES}"
+    if (before_jobs or 1) != (after_jobs or 1):
+        return [], (f'run with {before_jobs or 1} and {after_jobs or 1} processes, so the '
+                    f'cases waited on different neighbours')
+
+    problems = []
+    for aggregate in LATENCY_AGGREGATES:
+        old, new = before[aggregate], after[aggregate]
+        if new - old > LATENCY_FLOOR_SECONDS and new > old * (1.0 + LATENCY_TOLERANCE):
+            problems.append(f"latency {aggregate} grew by {new / old - 1.0:.1%} "
+                            f"({old * 1000:.1f} ms -> {new * 1000:.1f} ms), "
+                            f"the limit is {LATENCY_TOLERANCE:.0%}")
+    return problems, None
+
+
 def chemistry_ok(row: Dict[str, Any]) -> bool:
     """
     Whether one snapshot row passed level 1 of the two-level criterion
@@ -1230,6 +1415,10 @@ def engine_profile(cases: Sequence[Dict[str, Any]], engine: str,
     share otherwise. "priced" is filled in for both, and for scenario A it is
     honestly zero: no Glazy material has a price.
 
+    "costs" is the profile of every COST_METRICS entry (cost_profiles), over
+    all the rows rather than the solved ones; a metric no row carries - all of
+    them, on a snapshot older than the per-case timings - is None.
+
     Args:
         scenario: keep only the rows of this scenario. None means every row of
             the engine, which is what a snapshot holding one scenario wants and
@@ -1264,6 +1453,7 @@ def engine_profile(cases: Sequence[Dict[str, Any]], engine: str,
         'priced': len(priced),
         'priced_share': (len(priced) / len(solved)) if solved else None,
         'metrics': metrics,
+        'costs': cost_profiles(rows),
     }
 
 
@@ -21,6 +21,7 @@ is measured as a diff against that snapshot.
     python bench/diff_baseline.py --check         # ... and exit 1 on a regression
     python bench/diff_baseline.py --rebaseline    # overwrite the snapshot
     python bench/diff_baseline.py --record "note" # log the run without moving it
+    python bench/diff_baseline.py --jobs 4        # the cases in four processes
 
 The snapshot stores RAW COMPONENTS per case - max_relative, umf_error, count,
 cost_abs, assembly_score, min_portion, junk_count, rounding_drift,
@@ -55,6 +56,12 @@ improve the median while wrecking a handful of cases, and only p90 / p99 / max
 show it. --check gates the tail alongside the centre, on the p90 as well as on
 the median.
 
+Every case also carries what it cost - its wall clock and CPU time, its NNLS
+runs and the fits that were spared one, its LPs, the beam levels and the pruning rounds of its search
+(bench_corpus.COST_METRICS) - and the report prints their profiles under each
+series. --check gates the wall clock, on the median and the p95, with the wide
+band of bench_corpus.LATENCY_TOLERANCE: a clock is noisier than a score.
+
 The snapshot is a single point, and moving it is a deliberate act, so it can
 never answer "was the solver getting better or worse over the last month". That
 question belongs to bench/history.jsonl, the append only log described in
@@ -166,12 +173,17 @@ METRICS: Tuple[Tuple[str, str], ...] = bench_corpus.METRICS
 # rule is AMENDED to: bump when a field changes meaning AND the old file cannot
 # be salvaged; when it can be salvaged by a marker, write the marker instead.
 # This is a new clause, not a reading of the old one.
+# seconds and cpu_seconds, the two clocks of bench_corpus.run_case, go in on the
+# additive terms once more, with the counts of the search next to them - all of
+# bench_corpus.COST_METRICS. The latency gate reads the wall clock; the rest say
+# where the time went, and a snapshot before them simply cannot.
 CASE_FIELDS = (
     'glazy_id', 'scenario', 'engine', 'status', 'bucket', 'size',
     'umf_error', 'max_relative', 'worst_oxide', 'dropped_oxides',
     'count', 'cost_abs', 'assembly_score', 'min_portion',
     'junk_count', 'rounding_drift', 'cond', 'chemistry_ok', 'quality_ok',
     'feasible', 'max_relative_deviation', 'unreachable_oxides',
+    'seconds', 'cpu_seconds', 'nnls_calls', 'nnls_spared', 'lp_calls', 'beam_levels', 'prune_rounds',
 )
 
 # Below this the two values are the same number and the case is "unchanged".
@@ -184,7 +196,7 @@ EQUAL_EPSILON = 1e-9
 
 def run_corpus(seed: int, sample_size: int, classic_size: int,
                scenario_b_size: Optional[int] = None,
-               verbose: bool = True) -> Dict[str, Any]:
+               verbose: bool = True, jobs: int = 1) -> Dict[str, Any]:
     """
     Run both scenarios over the sample and return a snapshot-shaped dictionary
 
@@ -200,6 +212,14 @@ def run_corpus(seed: int, sample_size: int, classic_size: int,
     spec asks for one B run rather than an engine comparison; adding a classic
     B pass would double the block count of every report to say something nobody
     asked.
+
+    jobs > 1 runs the three passes in that many processes, as ONE list of cases
+    (bench_corpus.run_cases), so the slow classic cases are spread over the
+    pool rather than run after each other. The rows come back in the order of
+    the passes and of their samples either way. run.seconds is the wall clock of
+    the whole run and run.cpu_seconds the CPU time of its cases, which is what
+    the same run would have cost serially; every row carries its own two clocks
+    (see bench_corpus.run_case).
     """
     scenario_b_size = (bench_corpus.DEFAULT_SCENARIO_B_SUBSAMPLE
                        if scenario_b_size is None else scenario_b_size)
@@ -218,7 +238,6 @@ def run_corpus(seed: int, sample_size: int, classic_size: int,
               f"{len(cases)} usable cases, sample {len(sample)}, classic subsample "
               f"{len(classic_sample)}, scenario B subsample {len(scenario_b_sample)}")
 
-    rows: List[Dict[str, Any]] = []
     started = time.perf_counter()
 
     passes = (
@@ -227,14 +246,21 @@ def run_corpus(seed: int, sample_size: int, classic_size: int,
         (bench_corpus.SCENARIO_B, bench_corpus.ENGINE_ITERATIVE, scenario_b_sample),
     )
 
-    for scenario, engine, subset in passes:
-        pass_started = time.perf_counter()
-        for case in subset:
-            result = bench_corpus.run_case(case, engine, scenario)
-            rows.append({field: result.get(field) for field in CASE_FIELDS})
-        if verbose:
-            print(f"  {bench_corpus.group_key(scenario, engine)}: {len(subset)} cases "
-                  f"in {time.perf_counter() - pass_started:.1f}s")
+    tasks = [(case, engine, scenario) for scenario, engine, subset in passes for case in subset]
+    results = bench_corpus.run_cases(tasks, jobs=jobs)
+    rows = [{field: result.get(field) for field in CASE_FIELDS} for result in results]
+    seconds = time.perf_counter() - started
+
+    if verbose:
+        # Per pass the CPU time of its cases: with several processes the passes
+        # overlap and have no wall clock of their own
+        offset = 0
+        for scenario, engine, subset in passes:
+            cpu_seconds = sum(row['cpu_seconds'] for row in rows[offset:offset + len(subset)])
+            offset += len(subset)
+            print(f"  {bench_corpus.group_key(scenario, engine)}: {len(subset)} cases, "
+                  f"{cpu_seconds:.1f}s of CPU")
+        print(f"  {len(rows)} cases in {seconds:.1f}s with {jobs} process(es)")
 
     return {
         'format_version': BASELINE_FORMAT_VERSION,
@@ -262,6 +288,7 @@ def run_corpus(seed: int, sample_size: int, classic_size: int,
             'solver_config': {
                 'max_solutions': bench_corpus.MAX_SOLUTIONS,
                 'classic_seed': bench_corpus.CLASSIC_SEED,
+                'classic_subsets': 'enumerated',
                 'candidate_search': 'exhaustive',
                 'feasibility_tol': bench_corpus.FEASIBILITY_TOL,
             },
@@ -274,7 +301,9 @@ def run_corpus(seed: int, sample_size: int, classic_size: int,
             # as one measurement. bench/history.py carries the same block for
             # the same reason.
             'chemistry_gate': dict(bench_corpus.CHEMISTRY_GATE),
-            'seconds': time.perf_counter() - started,
+            'seconds': seconds,
+            'cpu_seconds': sum(row['cpu_seconds'] for row in rows),
+            'jobs': jobs,
         },
         'cases': rows,
     }
@@ -422,6 +451,17 @@ def compare_engine(baseline_index: Dict[int, Dict[str, Any]],
             )[:10],
         }
 
+    # What the cases cost, over every case of both runs, solved or not - a
+    # failure took its time as well - and defined on both sides
+    costs: Dict[str, Any] = {}
+    for name in bench_corpus.COST_METRICS:
+        pairs = [(float(baseline_index[glazy_id][name]), float(current_index[glazy_id][name]))
+                 for glazy_id in shared_ids
+                 if baseline_index[glazy_id].get(name) is not None
+                 and current_index[glazy_id].get(name) is not None]
+        costs[name] = {'before': _profile([p[0] for p in pairs]),
+                       'after': _profile([p[1] for p in pairs])}
+
     # Cases whose formula could not be compared in full, because an oxide
     # carried a non-finite value. They are a hard failure of the chemistry gate
     # (bench/corpus.chemistry_ok) and their metrics are None, so they leave no
@@ -447,6 +487,7 @@ def compare_engine(baseline_index: Dict[int, Dict[str, Any]],
         'gained': gained,
         'intersection': intersection,
         'metrics': metrics,
+        'costs': costs,
         'baseline_reachability': _reachability(baseline_index),
         'current_reachability': _reachability(current_index),
     }
@@ -515,6 +556,26 @@ def _profile_lines(name: str, entry: Dict[str, Any]) -> List[str]:
     return lines
 
 
+def _cost_lines(result: Dict[str, Any]) -> List[str]:
+    """
+    The cost block: the median, p95 and max of every cost metric before and
+    after, one line each, over the cases both runs ran
+    """
+    costs = result.get('costs') or {}
+    lines = [f"  costs over the {len(result['shared'])} cases of both runs, solved or not "
+             f"(median / p95 / max)"]
+    for name in bench_corpus.COST_METRICS:
+        entry = costs.get(name) or {}
+        before, after = entry.get('before'), entry.get('after')
+        if before is None or after is None:
+            lines.append(f'    {name:<14} not recorded on both sides')
+            continue
+        cells = '   '.join(f'{_format_number(before[key])} -> {_format_number(after[key])}'
+                           for key in ('median', 'p95', 'max'))
+        lines.append(f"    {name:<14} n={before['n']:<4} {cells}")
+    return lines
+
+
 def _reachability_lines(result: Dict[str, Any]) -> List[str]:
     """
     The scenario B block: the verdict split, the gated share, the disputes
@@ -679,6 +740,9 @@ def build_report(baseline: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Lis
     if findings:
         lines.append('')
     comparison['provenance']['findings'] = findings
+    # For the latency gate, which compares the clocks of two runs only when
+    # they were made with the same number of processes
+    comparison['provenance']['jobs'] = [baseline['run'].get('jobs'), current['run'].get('jobs')]
 
     # --- per (scenario, engine) -------------------------------------------
     # One block per series, never a merged one: scenario A's population is
@@ -722,6 +786,9 @@ def build_report(baseline: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Lis
             lines.extend(_profile_lines(name, result['metrics'][name]))
             lines.append('')
 
+        lines.extend(_cost_lines(result))
+        lines.append('')
+
         chosen = tracked_scores(result['metrics'])
         if chosen == [PRIMARY_TRACKED_SCORE]:
             reason = 'the prices define it'
@@ -755,7 +822,7 @@ def check_regressions(comparison: Dict[str, Any]) -> List[str]:
     """
     Everything --check considers a regression
 
-    Five gates, per series:
+    Six gates, per series:
       * the median OR the p90 of a tracked score worsens by more than
         REGRESSION_TOLERANCE - the tail is gated alongside the centre, because a
         tweak that improves the median while wrecking ten cases is not an
@@ -776,7 +843,12 @@ def check_regressions(comparison: Dict[str, Any]) -> List[str]:
         CHEMISTRY GATES. The share is derived from chemistry_ok, so across 10.18
         it compares two different questions and moves with no solver change at
         all; firing there would train the reader to ignore the one gate that
-        catches a real loss of coverage.
+        catches a real loss of coverage;
+      * the median or the p95 of the wall clock per case grows by more than
+        bench_corpus.LATENCY_TOLERANCE, over the cases both runs ran
+        (bench_corpus.latency_regressions, the rule bench/history.py --check
+        applies too). Skipped, and said so, against a baseline without per-case
+        timings or made with a different --jobs.
 
     THE ACCOUNTED SHARE IS NOT GATED HERE, although it is printed on every
     scenario B block and used to be this gate. "Solved OR honestly unreachable"
@@ -816,10 +888,18 @@ def check_regressions(comparison: Dict[str, Any]) -> List[str]:
     # as much.
     skipped: List[str] = []
     provenance['ungated'] = skipped
+    before_jobs, after_jobs = provenance.get('jobs') or (None, None)
 
     for engine, result in sorted(comparison['engines'].items()):
         metrics = result['metrics']
 
+        latency = (result.get('costs') or {}).get(bench_corpus.LATENCY_METRIC) or {}
+        slower, not_gated = bench_corpus.latency_regressions(
+            latency.get('before'), latency.get('after'), before_jobs, after_jobs)
+        problems.extend(f'{engine}: {problem}' for problem in slower)
+        if not_gated:
+            skipped.append(f'{engine}: the latency was not gated - {not_gated}')
+
         if result['current_solved_share'] < result['baseline_solved_share'] - EQUAL_EPSILON:
             problems.append(f"{engine}: the solved share dropped "
                             f"{result['baseline_solved_share']:.2%} -> {result['current_solved_share']:.2%} "
@@ -1036,7 +1116,8 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
                         help='path of the baseline snapshot (default: bench/quality_baseline.json)')
     parser.add_argument('--check', action='store_true',
                         help='exit 1 when the tracked score, the solved share, the maximum '
-                             'chemistry error or the scenario B accounted share regressed')
+                             'chemistry error, the scenario B accounted share or the latency '
+                             'per case regressed')
     parser.add_argument('--rebaseline', action='store_true',
                         help='overwrite the snapshot with the current run; the only way to move it')
     parser.add_argument('--record', nargs='?', const='', default=None, metavar='NOTE',
@@ -1056,6 +1137,11 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
                         help='scenario B subsample size; defaults to the one recorded in the '
                              'baseline, or to bench/corpus.DEFAULT_SCENARIO_B_SUBSAMPLE for a '
                              'baseline written before scenario B existed')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='processes to run the cases in, 0 for one per CPU (default: 1). '
+                             'Same rows in the same order; with the classic pass no longer '
+                             'the slow one, --rebaseline --classic-subsample with the sample '
+                             'size records the full classic pass for every later check')
     parser.add_argument('--save-current', default=None,
                         help='also write the current run to this path, for offline comparison')
     parser.add_argument('--current', default=None,
@@ -1085,12 +1171,14 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
                        else recorded.get('scenario_b_subsample',
                                          bench_corpus.DEFAULT_SCENARIO_B_SUBSAMPLE))
 
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
     if args.current:
         with open(args.current, 'r', encoding='utf-8') as f:
             current = json.load(f)
     else:
         try:
-            current = run_corpus(seed, sample_size, classic_size, scenario_b_size)
+            current = run_corpus(seed, sample_size, classic_size, scenario_b_size, jobs=jobs)
         except bench_corpus.CorpusUnavailable as exc:
             print(f'Glazy corpus unavailable: {exc}')
             return 2
@@ -32,6 +32,8 @@ note saying what the run was testing.
                                                 # is the scenario B one)
     python bench/history.py --last 5            # the tail, deltas still vs the
                                                 # previous line of the log
+    python bench/history.py --check             # ... and exit 1 when the last run
+                                                # of a series got slower
 
 Lines are written by bench/diff_baseline.py, on --rebaseline (always: a new
 reference point is by definition worth keeping) and on --record [note] (a run to
@@ -65,9 +67,11 @@ WHAT A LINE HOLDS
                     classification, so "the data changed" is distinguishable
                     from "the solver changed"
     engines         per series: case count, the pass shares, the reachability
-                    verdict counts of scenario B and the min / p10 / median /
-                    mean / p90 / p99 / max profile of every metric, computed by
-                    bench/corpus.engine_profile()
+                    verdict counts of scenario B, the min / p10 / median /
+                    mean / p90 / p95 / p99 / max profile of every metric and,
+                    under "costs", of the wall clock, CPU time, NNLS runs,
+                    spared fits, LPs, beam levels and pruning rounds per
+                    case, all computed by bench/corpus.engine_profile()
 
 ONE SERIES PER SCENARIO AND ENGINE
 
@@ -314,6 +318,8 @@ def build_record(snapshot: Dict[str, Any], recorded_at: str, kind: str = KIND_RE
             'dump_size': run.get('dump_size'),
             'solver_config': run.get('solver_config'),
             'seconds': run.get('seconds'),
+            'cpu_seconds': run.get('cpu_seconds'),
+            'jobs': run.get('jobs'),
         },
         'sampled_ids': sampled,
         'data_hashes': run.get('data_hashes') or {},
@@ -533,6 +539,51 @@ def changed_run(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
     return differences
 
 
+def latency_check(previous: Dict[str, Any], current: Dict[str, Any],
+                  engine: str) -> Tuple[List[str], Optional[str]]:
+    """
+    The latency gate between two runs of one series, as (problems, skipped)
+
+    The rule is bench_corpus.latency_regressions(), the one diff_baseline.py
+    --check applies, over each run's own profile of the wall clock rather than
+    over shared cases: a line holds no cases to intersect. That is sound only
+    when the two runs drew the same sample, so a run that changed (changed_run)
+    is not gated at all, and neither is one whose input data changed.
+    """
+    moved = changed_run(previous, current) + changed_data(previous, current)
+    if moved:
+        return [], f"the two runs are not the same measurement ({', '.join(moved)})"
+
+    def _latency(record):
+        costs = (record.get('engines') or {}).get(engine, {}).get('costs') or {}
+        return costs.get(bench_corpus.LATENCY_METRIC)
+
+    return bench_corpus.latency_regressions(
+        _latency(previous), _latency(current),
+        (previous.get('run') or {}).get('jobs'), (current.get('run') or {}).get('jobs'))
+
+
+def check_latency(records: Sequence[Dict[str, Any]],
+                  engines: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    What --check fails on: the LAST run of every series against the run of the
+    same series before it, by latency_check(). Earlier steps of the series are
+    history and are only printed; a gate on them would stay red forever.
+    """
+    problems: List[str] = []
+    present = sorted({engine for record in records for engine in (record.get('engines') or {})})
+    for engine in present:
+        if engines is not None and engine not in engines:
+            continue
+        series = [record for record in records if engine in (record.get('engines') or {})]
+        if len(series) < 2:
+            continue
+        slower, _skipped = latency_check(series[-2], series[-1], engine)
+        problems.extend(f'{engine}: {problem} (run #{len(series)} against #{len(series) - 1})'
+                        for problem in slower)
+    return problems
+
+
 def _ran_at(record: Dict[str, Any]) -> str:
     """The run's own timestamp, trimmed to the minute for the table"""
     value = record.get('ran_at') or record.get('recorded_at') or '?'
@@ -661,6 +712,20 @@ def _annotation_lines(entry: Dict[str, Any]) -> List[str]:
             f"the gated column is sar and not this - see MIN_SOLVED_AMONG_REACHABLE in "
             f"tests/test_inverse_corpus.py")
 
+    costs = entry.get('costs') or {}
+    latency = costs.get(bench_corpus.LATENCY_METRIC)
+    if latency:
+        def _median(name):
+            block = costs.get(name)
+            return '-' if not block else _format_number(block['median'])
+
+        lines.append(
+            f"      cost per case: wall p50 {latency['median'] * 1000:.1f} ms, "
+            f"p95 {latency['p95'] * 1000:.1f} ms; median NNLS runs {_median('nnls_calls')} "
+            f"(+{_median('nnls_spared')} spared), "
+            f"LPs {_median('lp_calls')}, beam levels {_median('beam_levels')}, "
+            f"prune rounds {_median('prune_rounds')}")
+
     if entry.get('priced'):
         lines.append(
             f"      fully priced {entry.get('priced')}/{entry.get('solved')} solved "
@@ -774,6 +839,9 @@ def render(records: Sequence[Dict[str, Any]], problems: Sequence[str],
                                  f'metric columns are')
                 lines.append(_delta_row(f'delta vs #{index - 1}',
                                         previous['engines'][engine], entry))
+                slower, _skipped = latency_check(previous, record, engine)
+                for problem in slower:
+                    lines.append(f'      !! SLOWER vs #{index - 1}: {problem}')
 
             lines.extend(_note_lines(record))
 
@@ -812,6 +880,10 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
     parser.add_argument('--last', type=int, default=None,
                         help='show only the last N runs of each series; deltas are '
                              'still measured against the previous run of the log')
+    parser.add_argument('--check', action='store_true',
+                        help='exit 1 when the last run of a series is slower than the run '
+                             'before it by the latency gate of bench/corpus.py (p50 or p95 '
+                             'of the wall clock per case)')
     args = parser.parse_args(argv)
 
     records, problems = read_log(args.log)
@@ -819,7 +891,16 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
                            engines=args.engine, last=args.last)))
 
     # A log nobody can read is worth saying out loud, but it is not a failure of
-    # this script: the readable runs were printed and are still true.
+    # this script: the readable runs were printed and are still true. A slower
+    # last run is, when asked
+    if args.check:
+        slower = check_latency(records, args.engine)
+        if slower:
+            print('LATENCY REGRESSIONS')
+            for problem in slower:
+                print(f'  - {problem}')
+            return 1
+        print('no latency regression of the last runs')
     return 0
 
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylint: disable=too-many-positional-arguments, too-many-locals, too-many-branches, too-many-statements
+# pylint: disable=multiple-statements, logging-fstring-interpolation, trailing-whitespace, line-too-long
+# pylint: disable=broad-exception-caught, missing-function-docstring, missing-class-docstring
+# pylint: disable=f-string-without-interpolation
+# pylance: disable=reportMissingImports, reportMissingModuleSource
+
+"""
+NNLS calls per second: one scipy.optimize.nnls call per problem against one
+common.nnls_batch call per stack
+
+    python bench/nnls.py                          # the inventory, 6 materials a problem
+    python bench/nnls.py --database               # the whole database
+    python bench/nnls.py --batch 10 100 1000 5000 --size 4
+    python bench/nnls.py --repeats 50
+
+The problems are the ones the engines solve: the oxide matrix of the
+reference "Прозрачная глазурь △6" of the test fixtures over a material set
+drawn at random (a fixed seed) from the pool, against that target's weight
+composition. Every stack size is timed --repeats times both ways after one
+warm-up, and the report gives the median calls per second of each, the
+speedup of the batch, and the largest difference from scipy's answer - of the
+weights where the problem has full column rank, of the residual norm where a
+face of weights fits equally well (see _largest_difference). That last column
+is the check that the batch answers the same question; a difference above
+MAX_RELATIVE_DIFFERENCE fails the run.
+
+What the numbers say, on the one CPU this was written on: scipy's compiled
+solver does about 60 thousand of these problems a second whatever the stack,
+the batch pays a fixed Python cost per lockstep pass and catches up only
+around a thousand problems a stack. The engines' switches
+(solver_classic.NNLS_BATCHED, solver_iterative.NNLS_BATCHED) record what that
+means for a whole search.
+
+Like diff_baseline.py this is a manual measurement, not part of the suite.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy.optimize import nnls
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.ranges import reference_target
+from common import load_materials, nnls_batch, umf_to_weights
+from solver_classic import create_oxide_matrix, full_column_ranks
+
+DEFAULT_BATCHES = (10, 50, 200, 1000)
+DEFAULT_SIZE = 6
+DEFAULT_REPEATS = 20
+SEED = 0
+
+# Largest difference from scipy's answer, relative to the largest weight of the
+# problem (or to |b|, see _largest_difference), that still counts as the same
+# answer. The normal
+# equations of the batch square the condition number, so agreement is expected
+# to about 1e-10, not to the last digit; 1e-6 is where solver_classic.nnls_recipe
+# starts reading a weight as a material at all
+MAX_RELATIVE_DIFFERENCE = 1e-6
+
+
+def problems(target: Dict[str, float], materials: Sequence[Dict[str, Any]],
+             count: int, size: int, seed: int = SEED):
+    """
+    (stack, b): `count` (oxides x size) matrices of random material sets of the
+    pool and the target's weight composition they are fitted to
+    """
+    target_weights = umf_to_weights(target)
+    oxides = list(target)
+    matrix, _names = create_oxide_matrix(materials, oxides)
+    b = np.array([target_weights.get(oxide, 0.0) for oxide in oxides])
+
+    size = min(size, matrix.shape[1])
+    rng = np.random.default_rng(seed)
+    columns = np.array([rng.choice(matrix.shape[1], size, replace=False) for _ in range(count)])
+    return matrix[:, columns].transpose(1, 0, 2), b
+
+
+def _largest_difference(stack: np.ndarray, b: np.ndarray, x: np.ndarray) -> float:
+    """
+    The largest difference from scipy's answer over the problems of a stack.
+    A problem of full column rank has one optimum, and its weights are compared,
+    over the largest weight of it; below full rank a whole face of weights fits
+    equally well and either solver may return any vertex of it, so only the
+    residual norms are, over the norm of b.
+    """
+    worst = 0.0
+    for matrix, weights, unique in zip(stack, x, full_column_ranks(stack)):
+        expected, residual = nnls(matrix, b)
+        if unique:
+            difference = np.abs(weights - expected).max() / max(np.abs(expected).max(), 1.0)
+        else:
+            difference = abs(np.linalg.norm(matrix @ weights - b) - residual) / max(np.linalg.norm(b), 1.0)
+        worst = max(worst, float(difference))
+    return worst
+
+
+def measure(target: Dict[str, float], materials: Sequence[Dict[str, Any]],
+            batches: Sequence[int] = DEFAULT_BATCHES, size: int = DEFAULT_SIZE,
+            repeats: int = DEFAULT_REPEATS) -> List[Dict[str, Any]]:
+    """
+    One row per stack size: scipy_per_second and batch_per_second (medians),
+    speedup of the batch and max_difference from scipy's answer
+    """
+    rows = []
+    for count in batches:
+        stack, b = problems(target, materials, count, size)
+        x, _residuals = nnls_batch(stack, b)
+
+        scipy_times = []
+        batch_times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for matrix in stack:
+                nnls(matrix, b)
+            scipy_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            nnls_batch(stack, b)
+            batch_times.append(time.perf_counter() - started)
+
+        scipy_rate = count / statistics.median(scipy_times)
+        batch_rate = count / statistics.median(batch_times)
+        rows.append({
+            'batch': count,
+            'scipy_per_second': scipy_rate,
+            'batch_per_second': batch_rate,
+            'speedup': batch_rate / scipy_rate,
+            'max_difference': _largest_difference(stack, b, x),
+        })
+    return rows
+
+
+def format_rows(rows: Sequence[Dict[str, Any]]) -> List[str]:
+    lines = [f"{'batch':>6} {'scipy/s':>9} {'batch/s':>9} {'speedup':>8} {'max diff':>9}"]
+    for row in rows:
+        lines.append(f"{row['batch']:>6} {row['scipy_per_second']:>9.0f} {row['batch_per_second']:>9.0f} "
+                     f"{row['speedup']:>7.2f}x {row['max_difference']:>9.1e}")
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Calls per second of scipy NNLS against the batched kernel')
+    parser.add_argument('--batch', type=int, nargs='+', default=list(DEFAULT_BATCHES),
+                        help='problems per stack to time (default: 10 50 200 1000)')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE,
+                        help=f'materials per problem (default: {DEFAULT_SIZE})')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help=f'timed runs per stack size (default: {DEFAULT_REPEATS})')
+    parser.add_argument('--database', action='store_true',
+                        help='draw the material sets from the whole database instead of the inventory')
+    args = parser.parse_args(argv)
+
+    materials = load_materials(only_inventory=not args.database, priority=False)
+    label = f"the {'database' if args.database else 'inventory'}, {len(materials)} materials"
+
+    rows = measure(reference_target(), materials, args.batch, args.size, args.repeats)
+    print(f'{args.size} materials a problem from {label}, {args.repeats} runs per stack, '
+          f'{os.cpu_count()} CPU(s) seen')
+    print('\n'.join(format_rows(rows)))
+    return 0 if all(row['max_difference'] <= MAX_RELATIVE_DIFFERENCE for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylint: disable=too-many-positional-arguments, too-many-locals, too-many-branches, too-many-statements
+# pylint: disable=multiple-statements, logging-fstring-interpolation, trailing-whitespace, line-too-long
+# pylint: disable=broad-exception-caught, missing-function-docstring, missing-class-docstring
+# pylint: disable=f-string-without-interpolation
+# pylance: disable=reportMissingImports, reportMissingModuleSource
+
+"""
+Serial against parallel wall time of feasibility.achievable_ranges
+
+    python bench/ranges.py                       # the real inventory, 1 2 4 threads
+    python bench/ranges.py --workers 1 2 3 4 8   # other pool widths
+    python bench/ranges.py --database 60         # the first 60 database records
+    python bench/ranges.py --repeats 50
+
+The target is the reference "Прозрачная глазурь △6" of the test fixtures, the
+same one the API docstrings quote their figures on. Every width is run
+--repeats times after one warm-up call - the warm-up pays for the thread pool
+and for scipy's first HiGHS model, neither of which a serving process pays
+twice - and the report gives the median and the best wall time, the speedup of
+the median against one thread, lp_count and pivots, and the largest difference
+of any bound from the serial answer. That last column is the check that the
+parallel path answers the same question: it is expected in the last digits,
+never in the ones anyone reads.
+
+A speedup needs cores. On a one CPU machine the widths can only cost - the LPs
+take turns on the same core and each chunk builds its own models - and the
+report says how many CPUs it saw so the numbers are read accordingly.
+
+Like diff_baseline.py this is a manual measurement, not part of the suite.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import load_materials
+from feasibility import achievable_ranges
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'tests', 'fixtures', 'reference_recipes.json')
+REFERENCE_RECIPE_ID = 'recipe_01_transparent_glaze'
+
+DEFAULT_WORKERS = (1, 2, 4)
+DEFAULT_REPEATS = 20
+
+
+def reference_target() -> Dict[str, float]:
+    with open(FIXTURES, 'r', encoding='utf-8') as f:
+        for recipe in json.load(f):
+            if recipe['id'] == REFERENCE_RECIPE_ID:
+                return recipe['umf']
+    raise KeyError(f"{REFERENCE_RECIPE_ID} is missing from {FIXTURES}")
+
+
+def _largest_difference(serial: Dict[str, Any], other: Dict[str, Any]) -> Optional[float]:
+    """The largest |bound - serial bound| over every range, None when the answers
+    do not even have the same shape (one feasible and one not, an end None in one)"""
+    worst = 0.0
+    for key in ('oxide_ranges', 'material_ranges'):
+        if set(serial.get(key, {})) != set(other.get(key, {})):
+            return None
+        for name, bounds in serial[key].items():
+            for expected, got in zip(bounds, other[key][name]):
+                if (expected is None) != (got is None):
+                    return None
+                if expected is not None:
+                    worst = max(worst, abs(expected - got))
+    return worst
+
+
+def measure(target: Dict[str, float], materials: Sequence[Dict[str, Any]],
+            workers: Sequence[int] = DEFAULT_WORKERS,
+            repeats: int = DEFAULT_REPEATS) -> List[Dict[str, Any]]:
+    """
+    One row per pool width: median_ms, best_ms, speedup (of the median, against
+    one thread), lp_count, pivots and max_difference from the serial answer
+    """
+    serial = achievable_ranges(target, materials)
+    rows = []
+    for width in workers:
+        achievable_ranges(target, materials, workers=width)
+        times = []
+        result = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            result = achievable_ranges(target, materials, workers=width)
+            times.append((time.perf_counter() - started) * 1000.0)
+        rows.append({
+            'workers': width,
+            'median_ms': statistics.median(times),
+            'best_ms': min(times),
+            'lp_count': result.get('lp_count'),
+            'pivots': result.get('pivots'),
+            'max_difference': _largest_difference(serial, result),
+        })
+
+    baseline = next((row['median_ms'] for row in rows if row['workers'] == 1), None)
+    for row in rows:
+        row['speedup'] = baseline / row['median_ms'] if baseline else None
+    return rows
+
+
+def format_rows(rows: Sequence[Dict[str, Any]]) -> List[str]:
+    lines = [f"{'workers':>7} {'median ms':>10} {'best ms':>9} {'speedup':>8} "
+             f"{'LPs':>5} {'pivots':>7} {'max diff':>9}"]
+    for row in rows:
+        speedup = f"{row['speedup']:.2f}x" if row['speedup'] else '-'
+        difference = ('shape!' if row['max_difference'] is None
+                      else f"{row['max_difference']:.1e}")
+        lines.append(f"{row['workers']:>7} {row['median_ms']:>10.1f} {row['best_ms']:>9.1f} "
+                     f"{speedup:>8} {row['lp_count']:>5} {row['pivots']:>7} {difference:>9}")
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Serial against parallel wall time of the achievable ranges')
+    parser.add_argument('--workers', type=int, nargs='+', default=list(DEFAULT_WORKERS),
+                        help='pool widths to time (default: 1 2 4); 1 is the serial path')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help=f'timed calls per width (default: {DEFAULT_REPEATS})')
+    parser.add_argument('--database', type=int, default=None, metavar='N',
+                        help='use the first N records of the whole database instead of the '
+                             'inventory - a bigger problem, where a pool has more to share')
+    args = parser.parse_args(argv)
+
+    if args.database:
+        materials = load_materials(only_inventory=False, priority=False)[:args.database]
+        label = f'first {len(materials)} database materials'
+    else:
+        materials = load_materials(only_inventory=True, priority=False)
+        label = f'the inventory, {len(materials)} materials'
+
+    rows = measure(reference_target(), materials, args.workers, args.repeats)
+    print(f'achievable_ranges on {label}, {args.repeats} runs per width, '
+          f'{os.cpu_count()} CPU(s) seen')
+    print('\n'.join(format_rows(rows)))
+    return 0 if all(row['max_difference'] is not None for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,7 @@ import argparse
 import logging
 import os
 import numpy as np
+from scipy.linalg import qr_delete, qr_insert
 from scipy.optimize import nnls
 import math
 
@@ -65,6 +66,16 @@ class ClassificationError(Exception):
     """
 
 
+class SearchCancelled(Exception):
+    """
+    A solver search was cancelled by its caller through its "cancel" argument
+
+    Raised between steps of the search, never from inside a fit, and off the
+    ValueError branch for the reason ClassificationError gives: the solvers turn
+    ValueError into "no solution", and a cancelled search has no answer at all.
+    """
+
+
 def _validate_oxide_classification(classification, source):
     """
     Check that a parsed classification file can actually be used
@@ -685,34 +696,256 @@ def umf_to_weights(umf):
     return weight_percentages
 
 
+def _oxide_vectors(oxides, convention=None):
+    """
+    The per-column constants of the batch conversions, cached per column order
+
+    Returns:
+        dictionary of read-only arrays over the columns: 'molar_masses' (1.0
+        where there is none, so that dividing by it is harmless) and 'known'
+        (there is a molar mass); 'flux_columns', the known columns of the unity
+        basis in the order of flux_oxides(convention); 'unknown', the names to
+        warn about
+    """
+    key = (tuple(oxides), convention)
+    vectors = _OXIDE_VECTORS_CACHE.get(key)
+    if vectors is None:
+        molar_masses = _molar_masses()
+        columns = {oxide: column for column, oxide in reversed(list(enumerate(key[0])))}
+        known = np.array([oxide in molar_masses for oxide in key[0]], dtype=bool)
+        vectors = {
+            'molar_masses': np.array([float(molar_masses.get(oxide, 1.0)) for oxide in key[0]]),
+            'known': known,
+            'flux_columns': tuple(columns[oxide] for oxide in flux_oxides(convention)
+                                  if oxide in columns and oxide in molar_masses),
+            'unknown': [oxide for oxide, is_known in zip(key[0], known)
+                        if not is_known and oxide not in NON_OXIDE_KEYS],
+        }
+        for array in ('molar_masses', 'known'):
+            vectors[array].flags.writeable = False
+        if len(_OXIDE_VECTORS_CACHE) >= OXIDE_VECTORS_CACHE_SIZE:
+            _OXIDE_VECTORS_CACHE.clear()
+        _OXIDE_VECTORS_CACHE[key] = vectors
+    return vectors
+
+
+def weights_to_umf_batch(weights, oxides, *, convention=None, round_digits=3):
+    """
+    weights_to_umf over many weight compositions at once
+
+    Args:
+        weights: array (N x len(oxides)), one composition per row, or a single
+            row as a 1-d array
+        oxides: the column names
+        convention, round_digits: as in weights_to_umf; rounding is numpy's,
+            which can differ from round() in the last kept digit on a value
+            sitting exactly on a half
+
+    Returns:
+        array of the shape of weights. An oxide with no molar mass is 0 in every
+        row - weights_to_umf leaves it out of the dictionary, and the warning is
+        the same one. A row with no flux is normalized on its smallest positive
+        molar amount, as weights_to_umf does, and a row with nothing at all to
+        normalize on is NaN where weights_to_umf would raise. Unrounded, every
+        value is bit for bit the one weights_to_umf computes: the unity sum is
+        accumulated column by column in the order of the basis, as sum() does
+        there, rather than in whatever order a numpy reduction picks
+    """
+    vectors = _oxide_vectors(oxides, convention)
+    _warn_about_unknown_oxides(vectors['unknown'], 'weights_to_umf_batch')
+
+    weights = np.asarray(weights, dtype=float)
+    rows = np.atleast_2d(weights)
+
+    # A non-finite weight is carried through to the rows it touches, as the
+    # float arithmetic of weights_to_umf carries it, without a RuntimeWarning
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        moles = np.where(vectors['known'], rows / vectors['molar_masses'], 0.0)
+        unity = np.zeros(len(rows))
+        for column in vectors['flux_columns']:
+            unity += moles[:, column]
+
+        no_flux = unity == 0
+        if no_flux.any():
+            smallest = np.where(moles[no_flux] > 0, moles[no_flux], np.inf).min(axis=1)
+            unity[no_flux] = np.where(np.isfinite(smallest), smallest, np.nan)
+
+        umf = moles * (1 / unity)[:, None]
+    if round_digits is not None:
+        umf = np.round(umf, round_digits)
+
+    return umf.reshape(weights.shape)
+
+
+def umf_to_weights_batch(umf, oxides, *, round_digits=2):
+    """
+    umf_to_weights over many formulas at once
+
+    Args:
+        umf: array (N x len(oxides)), one formula per row, or a single row as a
+            1-d array
+        oxides: the column names
+        round_digits: decimals of the weight percentages, 2 as in
+            umf_to_weights; None for the raw values
+
+    Returns:
+        array of weight percentages of the shape of umf. An oxide with no molar
+        mass is 0, and a row of zero total weight is NaN where umf_to_weights
+        would raise ZeroDivisionError
+    """
+    vectors = _oxide_vectors(oxides)
+    _warn_about_unknown_oxides(vectors['unknown'], 'umf_to_weights_batch')
+
+    umf = np.asarray(umf, dtype=float)
+    rows = np.atleast_2d(umf)
+
+    molar_weights = np.where(vectors['known'], rows * vectors['molar_masses'], 0.0)
+    total = molar_weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        percentages = np.where(total[:, None] != 0, molar_weights / total[:, None] * 100, np.nan)
+    if round_digits is not None:
+        percentages = np.round(percentages, round_digits)
+
+    return percentages.reshape(umf.shape)
+
+
 # Priority semantics: lower number = higher priority. Materials missing from
 # priorities.json get the lowest possible priority, so that explicitly listed
 # base materials always win over unlisted ones.
 DEFAULT_PRIORITY = 100
 
 
-def load_materials(only_inventory=True, priority=True):
+class ReadOnlyRecord(dict):
+    """
+    A dictionary that refuses to be changed
+
+    The records of the material store are shared by every caller of the process,
+    so one handler writing into one would hand its edit to every request after
+    it. A dict subclass rather than a MappingProxyType, because the records have
+    to stay what they were to everything that only reads them: json serializes
+    them as objects, pickle ships them to the solver workers, isinstance(record,
+    dict) holds. copy() and dict(record) give a plain, mutable dictionary.
+    """
+
+    def _refuse(self, *args, **kwargs):
+        raise TypeError("material records of the store are read-only; copy it with dict() first")
+
+    __setitem__ = __delitem__ = __ior__ = _refuse
+    clear = pop = popitem = setdefault = update = _refuse
+
+    def __reduce__(self):
+        return (ReadOnlyRecord, (dict(self),))
+
+
+# The material database as parsed, shared by the whole process. Every endpoint
+# of the API reads it on every request, and reading it used to mean parsing
+# materials.json and priorities.json from disk each time - 1.1 ms and 216 fresh
+# dictionaries per call on this machine, for a file that changes a few times a
+# year. The files are parsed once and again only when the size or the
+# modification time of one of them moves, so an edit of the database is still
+# picked up by a running server without a restart.
+_MATERIAL_STORE = {'signature': None, 'plain': (), 'prioritized': (),
+                   'by_name': {}, 'plain_by_name': {}}
+
+
+def _frozen_record(record, priority=None):
+    frozen = dict(record)
+    frozen['formula'] = ReadOnlyRecord(record.get('formula') or {})
+    if priority is not None:
+        frozen['priority'] = priority
+    return ReadOnlyRecord(frozen)
+
+
+def _material_store():
+    """
+    Return the material store, reloading it when the database files changed
+
+    The returned dictionary is the store itself; its records are ReadOnlyRecord
+    and its sequences tuples, so it cannot be changed through it by accident.
+    """
+    global _MATERIAL_STORE
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     materials_file = os.path.join(script_dir, 'database', 'materials.json')
+    priorities_file = os.path.join(script_dir, 'database', 'priorities.json')
+
+    stats = [os.stat(path) for path in (materials_file, priorities_file)]
+    signature = tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+    if _MATERIAL_STORE['signature'] == signature:
+        return _MATERIAL_STORE
 
     with open(materials_file, 'r', encoding='utf-8') as f:
         materials = json.load(f)
+    with open(priorities_file, 'r', encoding='utf-8') as f:
+        priorities = json.load(f)
+
+    plain = tuple(_frozen_record(material) for material in materials)
+    prioritized = tuple(_frozen_record(material, priorities.get(material['name'], DEFAULT_PRIORITY))
+                        for material in materials)
+
+    def index(records):
+        by_name = {}
+        for record in records:
+            # The first record of a name wins, which is the one a scan of the
+            # list would have found first
+            by_name.setdefault(record['name'], record)
+        return by_name
+
+    # Replaced in one assignment, so that a request reading the store while
+    # another reloads it sees either the old database or the new one
+    _MATERIAL_STORE = {'signature': signature, 'plain': plain, 'prioritized': prioritized,
+                       'by_name': index(prioritized), 'plain_by_name': index(plain)}
+    logger.debug(f"material store loaded: {len(materials)} materials")
+    return _MATERIAL_STORE
+
+
+def material_records(only_inventory=False, priority=True):
+    """
+    The material records of the database, as shared read-only views
+
+    What load_materials() returns, without the copy: for the callers that only
+    read the records, which is every endpoint of the API. A caller that needs to
+    change one copies it first - ReadOnlyRecord refuses the write with a
+    TypeError rather than letting it reach the next request.
 
-    if priority is True:
-        priorities_file = os.path.join(script_dir, 'database', 'priorities.json')
-        with open(priorities_file, 'r', encoding='utf-8') as f:
-            priorities = json.load(f)
-        for material in materials:
-            material['priority'] = priorities.get(material['name'], DEFAULT_PRIORITY)
+    Args:
+        only_inventory: keep only the materials flagged inInventory
+        priority: carry the "priority" key from priorities.json, as
+            load_materials(priority=True) does
 
+    Returns:
+        tuple of ReadOnlyRecord, in the order of materials.json
+    """
+    records = _material_store()['prioritized' if priority is True else 'plain']
     if only_inventory is True:
-        filtered_materials = []
-        for material in materials:
-            if material.get('inInventory') is True:
-                filtered_materials.append(material)
-        return filtered_materials
-    else:
-        return materials
+        return tuple(record for record in records if record.get('inInventory') is True)
+    return records
+
+
+def material_by_name(name, priority=True):
+    """
+    One material record of the database by name, or None when there is none
+
+    Args:
+        name: the material name, exactly as in materials.json
+        priority: as in material_records()
+
+    Returns:
+        ReadOnlyRecord or None
+    """
+    return _material_store()['by_name' if priority is True else 'plain_by_name'].get(name)
+
+
+def load_materials(only_inventory=True, priority=True):
+    """
+    Load the material database
+
+    Served from the process-wide store (see material_records), so the files are
+    parsed once rather than on every call; what is returned is still a fresh
+    list of fresh, mutable dictionaries, formula included, as it always was.
+    """
+    return [dict(record, formula=dict(record['formula']))
+            for record in material_records(only_inventory=only_inventory, priority=priority)]
 
 def resolve_inventory(inventory_data=None):
     """
@@ -728,8 +961,7 @@ def resolve_inventory(inventory_data=None):
     if inventory_data is not None:
         return inventory_data
 
-    materials = load_materials(only_inventory=True, priority=False)
-    return [material['name'] for material in materials]
+    return [material['name'] for material in material_records(only_inventory=True, priority=False)]
 
 
 def resolve_material_pool(materials=None, inventory_data=None):
@@ -762,7 +994,8 @@ def resolve_material_pool(materials=None, inventory_data=None):
         an injected material with an empty formula is dropped like any other
     """
     if materials is None:
-        return load_materials(only_inventory=False, priority=True), resolve_inventory(inventory_data)
+        # The shared read-only records: no solver writes into a material
+        return list(material_records(only_inventory=False, priority=True)), resolve_inventory(inventory_data)
 
     records = list(materials)
     if inventory_data is not None:
@@ -856,6 +1089,13 @@ def load_recipes():
 # most of the request latency.
 _MOLAR_MASSES_CACHE = None
 
+# Molar mass vector and flux mask of the batch conversions, per column order
+# and convention. Both tables above are fixed for the life of the process, so
+# an entry never goes stale; the bound only stops a caller converting over ever
+# new column orders from growing it without end.
+OXIDE_VECTORS_CACHE_SIZE = 256
+_OXIDE_VECTORS_CACHE = {}
+
 
 def _molar_masses():
     """
@@ -963,4 +1203,344 @@ def calculate_umf_from_recipe(weight_composition, convention=None):
     # Round values for readability
     umf = {oxide: round(value, 3) for oxide, value in umf.items()}
     
-    return umf, raw_umf
\ No newline at end of file
+    return umf, raw_umf
+
+# Relative tolerance of nnls_active_set: a dual variable below this share of the
+# problem's scale is zero, and so is a pivot of the QR factorization below it.
+# Chosen as scipy's own nnls does, a small multiple of the machine epsilon times
+# the dimension, so that the warm engine stops exactly where the cold one would
+# rather than a few rounding steps earlier or later.
+NNLS_TOLERANCE_FACTOR = 10.0
+
+
+def _qr_solve(q_matrix, r_matrix, b, count):
+    """Least squares solution over the first `count` columns of a full QR"""
+    rhs = (q_matrix.T @ b)[:count]
+    return np.linalg.solve(r_matrix[:count, :count], rhs)
+
+
+def nnls_active_set(a_matrix, b, passive=(), max_iterations=None):
+    """
+    Lawson-Hanson NNLS that can start from a guessed set of positive columns
+
+    scipy.optimize.nnls always starts from x = 0 and pulls columns into the
+    positive (passive) set one at a time. The iterative solver calls it on
+    material sets that differ from an already solved one by exactly one column,
+    so the answer's support is almost always known in advance: the parent's
+    recipe, plus or minus the column that changed. Starting from it skips the
+    column-by-column build-up, and the factorization of the passive columns is
+    kept as a QR that is UPDATED when a column joins or leaves
+    (scipy.linalg.qr_insert / qr_delete) instead of being refactored.
+
+    The warm start is a starting point, never an assumption. The seed is first
+    reduced to a set whose unconstrained least squares solution is strictly
+    positive (non-positive columns are dropped and the rest re-solved), which
+    is a feasible point of the Lawson-Hanson main loop; the main loop then runs
+    unchanged to the KKT conditions. A bad seed therefore costs iterations, not
+    correctness, and an empty seed is the textbook cold algorithm.
+
+    Args:
+        a_matrix: (m, n) matrix
+        b: (m,) right hand side
+        passive: column indices expected to be positive in the solution
+        max_iterations: bound of the main loop, 3 * n by default as in scipy
+
+    Returns:
+        (x, residual_norm, pivots): the solution, ||A x - b|| and the number of
+        columns inserted into or deleted from the factorization on the way
+
+    Raises:
+        RuntimeError: the iteration bound was reached, as scipy.optimize.nnls
+            raises it
+    """
+    a_matrix = np.asarray(a_matrix, dtype=float)
+    b = np.asarray(b, dtype=float)
+    m, n = a_matrix.shape
+    if max_iterations is None:
+        max_iterations = 3 * n
+
+    # Three different quantities are compared with zero below, in three
+    # different units, so each gets its own threshold: the dual A^T (b - A x)
+    # scales with |A| |b|, a pivot of the factorization with its own column,
+    # and a component of the solution is positive or it is not
+    relative = NNLS_TOLERANCE_FACTOR * np.finfo(float).eps * max(m, n)
+    dual_tolerance = relative * np.abs(a_matrix).sum(axis=0).max(initial=0.0) * max(np.linalg.norm(b), 1.0)
+    column_norms = np.linalg.norm(a_matrix, axis=0)
+
+    x = np.zeros(n)
+    order = []
+    q_matrix = np.eye(m)
+    r_matrix = np.zeros((m, 0))
+    pivots = 0
+    # Columns that turned out linearly dependent on the passive set, or that
+    # could not be made positive the moment they joined: not offered again
+    # until the passive set loses a column
+    excluded = set()
+
+    def insert(column):
+        nonlocal q_matrix, r_matrix, pivots
+        count = len(order)
+        if count >= m:
+            return False
+        new_q, new_r = qr_insert(q_matrix, r_matrix, a_matrix[:, column], count, which='col',
+                                 check_finite=False)
+        if abs(new_r[count, count]) <= relative * column_norms[column]:
+            return False
+        q_matrix, r_matrix = new_q, new_r
+        order.append(column)
+        pivots += 1
+        return True
+
+    def delete(position):
+        nonlocal q_matrix, r_matrix, pivots
+        q_matrix, r_matrix = qr_delete(q_matrix, r_matrix, position, which='col', check_finite=False)
+        del order[position]
+        pivots += 1
+
+    # The seed is factorized in one go rather than column by column - at these
+    # sizes a factorization costs about as much as a single update. A seed
+    # column that is dependent on the ones before it is simply not seeded; the
+    # main loop is free to bring it in once the set has changed
+    seed = [column for column in dict.fromkeys(int(index) for index in passive) if 0 <= column < n]
+    if seed:
+        q_matrix, r_matrix = np.linalg.qr(a_matrix[:, seed], mode='complete')
+        diagonal = np.abs(np.diagonal(r_matrix))
+        independent = (len(seed) <= m
+                       and np.all(diagonal > relative * column_norms[seed[:len(diagonal)]]))
+        if independent:
+            order.extend(seed)
+            pivots += len(seed)
+        else:
+            q_matrix, r_matrix = np.eye(m), np.zeros((m, 0))
+            for column in seed:
+                insert(column)
+
+    # Feasible starting point: the least squares solution of the seed with
+    # every non-positive column dropped, until what is left is strictly positive
+    while order:
+        z = _qr_solve(q_matrix, r_matrix, b, len(order))
+        nonpositive = [position for position, value in enumerate(z) if value <= 0.0]
+        if not nonpositive:
+            x[order] = z
+            break
+        for position in reversed(nonpositive):
+            delete(position)
+
+    for _ in range(max_iterations):
+        dual = a_matrix.T @ (b - a_matrix @ x)
+        dual[order] = -np.inf
+        if excluded:
+            dual[list(excluded)] = -np.inf
+        column = int(np.argmax(dual))
+        if dual[column] <= dual_tolerance:
+            break
+
+        if not insert(column):
+            excluded.add(column)
+            continue
+
+        joined = True
+        while True:
+            z = _qr_solve(q_matrix, r_matrix, b, len(order))
+            if joined and z[-1] <= 0.0:
+                # The column that just joined cannot be made positive: the dual
+                # said otherwise only by rounding. Dropping it for good is what
+                # keeps the loop from pulling it straight back in
+                delete(len(order) - 1)
+                excluded.add(column)
+                break
+            joined = False
+            if np.all(z > 0.0):
+                x[:] = 0.0
+                x[order] = z
+                break
+
+            # Step from x towards z until the first passive column reaches zero,
+            # and take that column out; the one that hit zero is zeroed exactly,
+            # so that the loop cannot spin on a rounding remainder
+            current = x[order]
+            blocking = np.flatnonzero(z <= 0.0)
+            ratios = current[blocking] / (current[blocking] - z[blocking])
+            alpha = ratios.min()
+            x[order] = current + alpha * (z - current)
+            x[order[blocking[int(np.argmin(ratios))]]] = 0.0
+            for position in reversed(range(len(order))):
+                if x[order[position]] <= 0.0:
+                    x[order[position]] = 0.0
+                    delete(position)
+            # The set the exclusions were judged against is gone
+            excluded.clear()
+            if not order:
+                break
+    else:
+        raise RuntimeError("Maximum number of iterations reached.")
+
+    return x, float(np.linalg.norm(a_matrix @ x - b)), pivots
+
+
+def _passive_solve(gram, rhs, passive, probe=None):
+    """
+    Normal equations of a stack of problems restricted to their passive columns
+
+    The inactive columns get an identity row and a zero right hand side, so
+    every system keeps the full size and the whole stack is one LAPACK call;
+    their entries of the answer come out exactly zero. probe, one column per
+    problem, adds a second right hand side e_probe whose answer is that
+    column of the inverse: 1 / G^-1[probe, probe] is the squared pivot the
+    column would get at the end of a factorization of the passive set, which
+    is how nnls_batch tells a dependent column from an independent one.
+
+    Returns (z, inverse_diagonal), the second None without a probe and NaN
+    where a system is singular
+    """
+    count, n = passive.shape
+    both = passive[:, :, None] & passive[:, None, :]
+    system = np.where(both, gram, 0.0)
+    system[:, np.arange(n), np.arange(n)] += ~passive
+    rhs = np.where(passive, rhs, 0.0)[:, :, None]
+    if probe is not None:
+        unit = np.zeros((count, n, 1))
+        unit[np.arange(count), probe, 0] = 1.0
+        rhs = np.concatenate((rhs, unit), axis=2)
+
+    try:
+        answer = np.linalg.solve(system, rhs)
+    except np.linalg.LinAlgError:
+        # One singular system fails the whole stack; solve them one by one and
+        # give the singular ones NaN, which every caller reads as "dependent"
+        answer = np.full(rhs.shape, np.nan)
+        for index in range(count):
+            try:
+                answer[index] = np.linalg.solve(system[index], rhs[index])
+            except np.linalg.LinAlgError:
+                pass
+
+    z = np.where(passive, answer[:, :, 0], 0.0)
+    if probe is None:
+        return z, None
+    return z, answer[np.arange(count), probe, 1]
+
+
+def nnls_batch(matrices, b, max_iterations=None):
+    """
+    Lawson-Hanson NNLS over a stack of problems sharing one right hand side
+
+    The problems are solved in lockstep: every pass of the main loop pulls one
+    column into the passive set of every problem still running, and the inner
+    loop steps back all of them that went infeasible at once. What makes the
+    stack one vectorised call instead of k scipy calls is working on the
+    normal equations - the Gram matrices A^T A and the vectors A^T b are formed
+    once for the whole stack, and the least squares solution of a passive set
+    is one batched np.linalg.solve over all of them (the fast NNLS of Bro and
+    de Jong). Problems with fewer columns are padded with zero columns, which
+    never join the passive set and come back as zero weights.
+
+    The normal equations square the condition number, which the QR of scipy
+    and of nnls_active_set does not. At the size of a glaze problem and with
+    the row weights of the solvers the answers agree with scipy's to about
+    1e-10 of the weights (tests/test_common.py), far below the 1e-6 that
+    solver_classic.nnls_recipe reads as zero; a column dependent on the
+    passive set is recognized by its pivot, as in nnls_active_set, and left
+    out rather than solved into noise. A column only NEARLY dependent is not:
+    squared, its pivot is below what the solve can resolve and above what
+    the test catches, and the answer drifts. The engines therefore batch only
+    matrices clear of solver_classic.BATCH_RANK_PIVOT.
+
+    Args:
+        matrices: (k, m, n) stack of matrices, or a sequence of (m, n_i)
+            matrices with n_i <= n that is padded here
+        b: (m,) right hand side shared by all of them
+        max_iterations: bound of the main loop, 3 * n by default as in scipy
+
+    Returns:
+        (x, residual_norms): the (k, n) solutions, a padded problem's extra
+        entries zero, and the (k,) norms ||A_i x_i - b||
+
+    Raises:
+        RuntimeError: the iteration bound was reached, as scipy.optimize.nnls
+            raises it
+    """
+    b = np.asarray(b, dtype=float)
+    if isinstance(matrices, np.ndarray) and matrices.ndim == 3:
+        stack = np.asarray(matrices, dtype=float)
+    else:
+        matrices = [np.asarray(matrix, dtype=float) for matrix in matrices]
+        width = max((matrix.shape[1] for matrix in matrices), default=0)
+        stack = np.zeros((len(matrices), b.shape[0], width))
+        for index, matrix in enumerate(matrices):
+            stack[index, :, :matrix.shape[1]] = matrix
+    k, m, n = stack.shape
+    if max_iterations is None:
+        max_iterations = 3 * n
+
+    transposed = stack.transpose(0, 2, 1)
+    gram = transposed @ stack
+    rhs = transposed @ b
+
+    # The thresholds of nnls_active_set, per problem
+    relative = NNLS_TOLERANCE_FACTOR * np.finfo(float).eps * max(m, n)
+    dual_tolerance = relative * np.abs(stack).sum(axis=1).max(axis=1, initial=0.0) * max(np.linalg.norm(b), 1.0)
+    pivot_tolerance = (relative ** 2) * np.diagonal(gram, axis1=1, axis2=2)
+
+    x = np.zeros((k, n))
+    passive = np.zeros((k, n), dtype=bool)
+    # As in nnls_active_set: dependent columns and columns that could not be
+    # made positive the moment they joined, until the passive set loses one
+    excluded = np.zeros((k, n), dtype=bool)
+    running = np.arange(k)
+
+    for _ in range(max_iterations):
+        dual = rhs[running] - (gram[running] @ x[running][:, :, None])[:, :, 0]
+        dual[passive[running] | excluded[running]] = -np.inf
+        column = np.argmax(dual, axis=1) if n else np.zeros(len(running), dtype=int)
+        best = dual[np.arange(len(running)), column] if n else np.full(len(running), -np.inf)
+        keep = best > dual_tolerance[running]
+        running, column = running[keep], column[keep]
+        if not running.size:
+            break
+
+        passive[running, column] = True
+        rows, joined = running, column
+        while rows.size:
+            if joined is not None:
+                z, inverse = _passive_solve(gram[rows], rhs[rows], passive[rows], joined)
+                # 1 / G^-1_jj is the squared pivot of the joined column: a
+                # dependent column is excluded, as is one the solve cannot make
+                # positive - the dual said otherwise only by rounding
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    dependent = ~(1.0 / inverse > pivot_tolerance[rows, joined])
+                stuck = dependent | ~(z[np.arange(rows.size), joined] > 0.0)
+                passive[rows[stuck], joined[stuck]] = False
+                excluded[rows[stuck], joined[stuck]] = True
+                rows, z = rows[~stuck], z[~stuck]
+                joined = None
+            else:
+                z, _ = _passive_solve(gram[rows], rhs[rows], passive[rows])
+
+            current_passive = passive[rows]
+            feasible = np.all((z > 0.0) | ~current_passive, axis=1)
+            x[rows[feasible]] = z[feasible]
+            rows, z, current_passive = rows[~feasible], z[~feasible], current_passive[~feasible]
+            if not rows.size:
+                break
+
+            # Step from x towards z until the first passive column reaches zero,
+            # and take that column out, zeroed exactly as in nnls_active_set
+            current = x[rows]
+            blocking = current_passive & (z <= 0.0)
+            denominator = np.where(blocking, current - z, 1.0)
+            denominator[denominator == 0.0] = 1.0
+            ratios = np.where(blocking, current / denominator, np.inf)
+            alpha = ratios.min(axis=1)
+            stepped = current + alpha[:, None] * (z - current)
+            stepped[np.arange(rows.size), np.argmin(ratios, axis=1)] = 0.0
+            current_passive &= stepped > 0.0
+            x[rows] = np.where(current_passive, stepped, 0.0)
+            passive[rows] = current_passive
+            excluded[rows] = False
+            rows = rows[current_passive.any(axis=1)]
+    else:
+        raise RuntimeError("Maximum number of iterations reached.")
+
+    residual_norms = np.linalg.norm((stack @ x[:, :, None])[:, :, 0] - b, axis=1)
+    return x, residual_norms
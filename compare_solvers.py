@@ -13,9 +13,8 @@
 """
 Compare the two glaze solvers on the reference recipes.
 
-    classic   -> solver_classic.find_multiple_solutions (NNLS over random
-                 subsets of the inventory, drawn from a seeded generator, so
-                 the run is reproducible for a given --seed)
+    classic   -> solver_classic.find_multiple_solutions (NNLS over subsets of
+                 the inventory, enumerated in a fixed order, deterministic)
     iterative -> solver_iterative.find_best_recipe (priority driven, adds one
                  material at a time, deterministic)
 
@@ -67,8 +66,9 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 FIXTURES_PATH = os.path.join(SCRIPT_DIR, 'tests', 'fixtures', 'reference_recipes.json')
 DEFAULT_OUTPUT = os.path.join(SCRIPT_DIR, 'comparison_results.md')
 
-# The classic solver draws random material subsets, so the seed has to be
-# passed to it to make the whole comparison reproducible
+# The classic solver used to draw random material subsets and took this seed.
+# It enumerates them now and ignores it; the seed is still passed and printed so
+# that reports stay comparable with the ones generated before
 DEFAULT_SEED = 42
 
 # Both engines are asked for the same number of solutions; only the best one
@@ -203,11 +203,11 @@ def run_classic(target_umf: Dict[str, float], inventory: Sequence[str],
     """
     Run the classic solver and return (best solution, seconds, status).
 
-    The seed is handed to the solver itself - it draws its material subsets from
-    its own generator, so pinning the global numpy one would do nothing - which
-    is what makes a single recipe run and a full run produce the same classic
-    result.  Its stdout is captured on top of logging=False, just in case the
-    engine prints anything else.
+    The seed is handed to the solver, which no longer uses it: the material
+    subsets are enumerated in a fixed order, so a single recipe run and a full
+    run produce the same classic result whatever the seed.  Its stdout is
+    captured on top of logging=False, just in case the engine prints anything
+    else.
     """
     sink = io.StringIO()
     start = time.perf_counter()
@@ -623,8 +623,8 @@ def build_conclusions(summaries: Sequence[Dict[str, Any]],
                      f'classic {item["classic"]:.4f} vs iterative {item["iterative"]:.4f}, '
                      f'delta {item["delta"]:.4f} in favour of {item["better"]}')
 
-    lines.append('- classic draws random material subsets from a seeded generator, so it is reproducible '
-                 'but its numbers only hold for the seed printed above; iterative does not depend on a seed')
+    lines.append('- neither engine depends on the seed printed above: classic enumerates its material subsets '
+                 'in a fixed order and iterative is deterministic by construction')
 
     return lines
 
@@ -734,7 +734,7 @@ def compare(recipes: Sequence[Dict[str, Any]], inventory: Sequence[str],
 def main() -> None:
     parser = argparse.ArgumentParser(description='Compare the classic and the iterative glaze solvers')
     parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
-                        help=f'random seed pinned for the classic solver (default: {DEFAULT_SEED})')
+                        help=f'seed passed to the classic solver, which no longer uses it (default: {DEFAULT_SEED})')
     parser.add_argument('--recipe', type=str, default=None,
                         help='run a single reference recipe (fixture id, part of it, or its number)')
     parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT,
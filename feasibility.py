@@ -49,9 +49,25 @@
 
 import logging
 import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-from scipy.optimize import linprog
+from scipy.optimize import OptimizeResult, linprog
+from scipy.spatial import ConvexHull, QhullError
+
+# The HiGHS model object behind linprog. scipy has shipped it since 1.15 and
+# only as a private module, so it is optional: without it the range LPs fall
+# back to one cold linprog call each and answer the same numbers, slower.
+# Importing it is not enough - a release may keep the module and rename what
+# this file reads of it - so it is also made to solve one LP at import, see
+# _highs_works()
+try:
+    from scipy.optimize._highspy import _core as _highs_core
+except ImportError:
+    _highs_core = None
 
 from common import (NON_OXIDE_KEYS, OXIDE_SCALE_FLOOR,
                     filter_materials_with_formula, flux_oxides,
@@ -121,6 +137,52 @@ LP_OPTIMAL = 0
 LP_INFEASIBLE = 2
 LP_UNBOUNDED = 3
 
+# The two kinds of range LP, by the normalization they are solved on: an oxide
+# on S_flux(x) = 1, a material on sum(x) = 100
+RANGE_OXIDE = 'oxide'
+RANGE_MATERIAL = 'material'
+
+# The reachable region (reachable_region) is a convex hull whose facet count
+# grows with the points beyond its dimension, and qhull cannot be stopped once
+# started. Measured over random shelves of the database: 25 materials over 16
+# to 20 dimensions took 5-80 ms, 40 materials over 21 took 10 s. The shipped
+# inventory is 19 materials over 11 dimensions; the caps leave room for a
+# somewhat larger shelf and refuse the ones whose cost nobody can predict.
+HULL_MAX_DIMENSION = 16
+HULL_MAX_GENERATORS = 32
+
+# Singular values below this fraction of the largest count as zero when the
+# span of the columns and the dimension of their hull are read off an SVD.
+# The molar columns are built from two decimal analyses, so a true dependency
+# sits at 1e-16 and an independent direction well above 1e-6.
+HULL_RANK_RTOL = 1e-10
+
+# How far a lower bound must clear tol before screen_targets calls a target
+# unreachable without an LP, and how far outside a facet a target may sit and
+# still count as inside. qhull places a facet to about 1e-13 on these points;
+# both margins are orders above that and orders below anything the verdict
+# could notice (BOUND_EPS is 1e-7 and tol is 5e-2).
+HULL_MARGIN = 1e-6
+HULL_INSIDE_EPS = 1e-10
+
+# The one thread pool of achievable_ranges(workers=...), kept for the life of
+# the process and started by the first call that needs it. Threads and not
+# processes: HiGHS releases the GIL for the whole of a solve, and a range LP is
+# a millisecond of work on a model that would cost more to pickle than to solve.
+# One pool of MAX_RANGE_WORKERS threads whatever the calls ask for, as for the
+# processes of solver_iterative: a call cuts its LPs into as many chunks as it
+# asked workers for, and chunks beyond the pool queue. A pool per worker count
+# left every width a client had ever asked for idling behind it. The same
+# number as api_server's MAX_SOLVE_WORKERS, which caps the requests' "workers"
+MAX_RANGE_WORKERS = os.cpu_count() or 1
+_RANGE_POOL = {'executor': None}
+_RANGE_POOL_LOCK = threading.Lock()
+
+# The LPs _linprog() has solved on each thread, read through lp_calls(). Per
+# thread, because the API answers requests on threads and one request must not
+# count another's LPs
+_LP_CALLS = threading.local()
+
 
 def usable_oxides(oxides):
     """
@@ -465,6 +527,7 @@ def _linprog(c, A_ub, b_ub, A_eq, b_eq, bounds):
     Returns the OptimizeResult; the callers read .status themselves because
     "infeasible" and "unbounded" are answers here, not errors.
     """
+    _LP_CALLS.count = getattr(_LP_CALLS, 'count', 0) + 1
     return linprog(
         c=c,
         A_ub=np.array(A_ub) if len(A_ub) else None,
@@ -476,6 +539,236 @@ def _linprog(c, A_ub, b_ub, A_eq, b_eq, bounds):
     )
 
 
+def lp_calls():
+    """
+    How many LPs _linprog() has solved on the calling thread, ever
+
+    The difference of two readings around a check_feasibility() call is the
+    number of LPs that answer took - the minimax, the polish, one per oxide
+    that misses and whatever _explain_unreachable asked - which is how
+    bench/corpus.py counts them without the answer carrying a field for it.
+    The warm models of achievable_ranges and of a session solve through HiGHS
+    directly and are not counted here; they report their own lp_count and
+    pivots.
+    """
+    return getattr(_LP_CALLS, 'count', 0)
+
+
+def _range_model(A_ub, b_ub, A_eq, b_eq, n):
+    """
+    One constraint system, built once, for a run of LPs that differ only in the objective
+
+    achievable_ranges asks 2 x (oxides + materials) questions of the same
+    polytope, and a cold linprog per question rebuilds the model, presolves it
+    and starts the simplex from the slack basis every time - about 2.7 ms per
+    LP on the real inventory, all of it for a vertex the previous question
+    usually ended one or two pivots away from. Here the model is handed to
+    HiGHS once and each objective is re-optimized from the last optimal basis:
+    changing the costs leaves that basis primal feasible, so the primal simplex
+    picks up where it stopped.
+
+    Returns a plain dictionary that _range_solve() and _range_add_row() work
+    on. "pivots" accumulates the simplex iterations of every solve on it.
+    """
+    model = {"A_ub": list(A_ub), "b_ub": list(b_ub), "A_eq": list(A_eq), "b_eq": list(b_eq),
+             "n": n, "highs": None, "pivots": 0}
+    if _highs_core is None:
+        return model
+
+    rows = np.array(list(A_ub) + list(A_eq), dtype=float).reshape(-1, n)
+    columns = [np.flatnonzero(rows[:, j]) for j in range(n)]
+
+    lp = _highs_core.HighsLp()
+    lp.num_col_ = n
+    lp.num_row_ = rows.shape[0]
+    lp.col_cost_ = np.zeros(n)
+    lp.col_lower_ = np.zeros(n)
+    lp.col_upper_ = np.full(n, np.inf)
+    lp.row_lower_ = np.array([-np.inf] * len(b_ub) + list(b_eq), dtype=float)
+    lp.row_upper_ = np.array(list(b_ub) + list(b_eq), dtype=float)
+    lp.a_matrix_.num_col_ = n
+    lp.a_matrix_.num_row_ = rows.shape[0]
+    lp.a_matrix_.format_ = _highs_core.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = np.cumsum([0] + [len(nonzero) for nonzero in columns]).astype(np.int32)
+    lp.a_matrix_.index_ = np.concatenate(columns + [np.zeros(0, dtype=np.int64)]).astype(np.int32)
+    lp.a_matrix_.value_ = np.concatenate([rows[nonzero, j] for j, nonzero in enumerate(columns)]
+                                         + [np.zeros(0)])
+
+    highs = _highs_core._Highs()
+    highs.setOptionValue('output_flag', False)
+    # Presolve rewrites the model and throws the basis away with it; on a few
+    # dozen rows it saves nothing the warm start does not save better
+    highs.setOptionValue('presolve', 'off')
+    highs.passModel(lp)
+    model["highs"] = highs
+    return model
+
+
+def _range_add_row(model, coefficients, upper):
+    """
+    Append the inequality coefficients . x <= upper to a model already solved on
+
+    The new row's slack enters the basis, so the last optimal basis stays valid
+    and the next solve still starts from it.
+    """
+    model["A_ub"].append(coefficients)
+    model["b_ub"].append(upper)
+    if model["highs"] is not None:
+        nonzero = np.flatnonzero(coefficients).astype(np.int32)
+        model["highs"].addRow(-np.inf, float(upper), len(nonzero), nonzero,
+                              np.asarray(coefficients, dtype=float)[nonzero])
+
+
+def _run_model(model):
+    """
+    Solve a HiGHS model as it stands, from whatever basis its last solve left
+
+    Returns an OptimizeResult in the linprog numbering, or None for a status
+    this module does not read - "unbounded or infeasible" among them - after
+    clearing the solver, because whatever state such a solve left behind is not
+    a basis to start the next one from. The caller settles those cold.
+    """
+    highs = model["highs"]
+    highs.run()
+    status = highs.getModelStatus()
+    info = highs.getInfo()
+    model["pivots"] += int(info.simplex_iteration_count)
+    message = highs.modelStatusToString(status)
+    if status == _highs_core.HighsModelStatus.kOptimal:
+        return OptimizeResult(status=LP_OPTIMAL, fun=float(info.objective_function_value),
+                              x=np.array(highs.getSolution().col_value), message=message)
+    if status == _highs_core.HighsModelStatus.kInfeasible:
+        return OptimizeResult(status=LP_INFEASIBLE, fun=None, x=None, message=message)
+    if status == _highs_core.HighsModelStatus.kUnbounded:
+        return OptimizeResult(status=LP_UNBOUNDED, fun=None, x=None, message=message)
+    logger.info(f"feasibility: warm LP ended as {message}, to be solved cold")
+    highs.clearSolver()
+    return None
+
+
+def _range_solve(model, c):
+    """
+    Minimize c . x over the model, warm started from the previous optimum
+
+    Returns an OptimizeResult read exactly like the one of _linprog(): .status
+    in the linprog numbering, .fun, .x and .message. A status HiGHS leaves
+    ambiguous - "unbounded or infeasible" - is settled by one cold linprog on
+    the same system rather than guessed at, and so is every status this module
+    does not read.
+    """
+    highs = model["highs"]
+    if highs is not None:
+        n = model["n"]
+        highs.changeColsCost(n, np.arange(n, dtype=np.int32), np.asarray(c, dtype=float))
+        result = _run_model(model)
+        if result is not None:
+            return result
+
+    result = _linprog(c, model["A_ub"], model["b_ub"], model["A_eq"], model["b_eq"],
+                      [(0.0, None)] * model["n"])
+    model["pivots"] += int(getattr(result, 'nit', 0) or 0)
+    return result
+
+
+def _highs_works():
+    """
+    Whether the HiGHS model object does what the range LPs ask of it: a model
+    built, a row added, the costs changed and the result read, every private
+    name of it this module touches, on an LP whose answer is known
+    """
+    # min -2 x0 - x1 over x0 + x1 <= 1, then with x0 <= 0.5: (0.5, 0.5), -1.5
+    model = _range_model([[1.0, 1.0]], [1.0], [], [], 2)
+    _range_add_row(model, [1.0, 0.0], 0.5)
+    model["highs"].changeColsCost(2, np.arange(2, dtype=np.int32), np.array([-2.0, -1.0]))
+    result = _run_model(model)
+    return result is not None and result.status == LP_OPTIMAL and abs(result.fun + 1.5) < 1e-9
+
+
+# Settled once, at import: a scipy whose private HiGHS has moved on falls back
+# to linprog here rather than failing achievable_ranges on a request
+if _highs_core is not None:
+    try:
+        if not _highs_works():
+            raise RuntimeError("wrong answer to the probe LP")
+    except Exception as exc:
+        logger.warning(f"feasibility: scipy's HiGHS model object is not usable ({exc!r}), "
+                       f"the range LPs are solved cold by linprog")
+        _highs_core = None
+
+
+def _range_failed(kind, result):
+    """
+    True when a range LP ends the whole answer: anything but an optimum, except
+    an unbounded oxide - that one is the real answer "there is no largest"
+    """
+    if result.status == LP_OPTIMAL:
+        return False
+    return not (kind == RANGE_OXIDE and result.status == LP_UNBOUNDED)
+
+
+def _solve_range_chunk(tasks, models, systems, stop):
+    """
+    Solve a run of range LPs in their order, each warm started from the last
+
+    models maps a kind to the model its LPs are solved on; a kind it lacks gets
+    a model built from systems on first use. The chunk stops after its first
+    failed LP, and before its next one once stop - shared by all the chunks of
+    a parallel run - is set, because one failure is already the whole answer.
+
+    Returns (outcomes, pivots): the OptimizeResult of every LP solved, in task
+    order and possibly fewer than the tasks, and the simplex iterations they
+    took.
+    """
+    before = {kind: model["pivots"] for kind, model in models.items()}
+    outcomes = []
+    for kind, _, _, c in tasks:
+        if stop is not None and stop.is_set():
+            break
+        if kind not in models:
+            models[kind] = _range_model(*systems[kind])
+            before[kind] = 0
+        result = _range_solve(models[kind], c)
+        outcomes.append(result)
+        if _range_failed(kind, result):
+            if stop is not None:
+                stop.set()
+            break
+    return outcomes, sum(models[kind]["pivots"] - before[kind] for kind in models)
+
+
+def _range_pool():
+    with _RANGE_POOL_LOCK:
+        if _RANGE_POOL['executor'] is None:
+            _RANGE_POOL['executor'] = ThreadPoolExecutor(max_workers=MAX_RANGE_WORKERS,
+                                                         thread_name_prefix='ranges')
+    return _RANGE_POOL['executor']
+
+
+def _solve_ranges_parallel(tasks, systems, workers):
+    """
+    The range LPs cut into one contiguous chunk per worker and solved on the
+    shared pool
+
+    Contiguous, so that each chunk still warm starts LP after LP on models of
+    its own. Returns (outcomes, pivots) with outcomes aligned to tasks: None
+    for an LP that was never solved because another chunk failed first.
+    """
+    stop = threading.Event()
+    chunk = -(-len(tasks) // workers)
+    starts = range(0, len(tasks), chunk)
+    pool = _range_pool()
+    futures = [pool.submit(_solve_range_chunk, tasks[start:start + chunk], {}, systems, stop)
+               for start in starts]
+
+    outcomes = [None] * len(tasks)
+    total = 0
+    for start, future in zip(starts, futures):
+        chunk_outcomes, chunk_pivots = future.result()
+        outcomes[start:start + len(chunk_outcomes)] = chunk_outcomes
+        total += chunk_pivots
+    return outcomes, total
+
+
 def check_feasibility(target_umf, materials, tol=DEFAULT_FEASIBILITY_TOL, passengers=None):
     """
     Can this target be reached from these materials, and if not, which oxide fails
@@ -678,29 +971,7 @@ def _check_feasibility(target_umf, materials, tol, passengers):
     result = _linprog(c, A_ub, b_ub, A_eq, b_eq, [(0.0, None)] * (n + 1))
 
     if result.status == LP_INFEASIBLE:
-        # A passenger ceiling is the only way to ASK for something that makes
-        # this LP infeasible: the two sided rows always admit a big enough t,
-        # and the normalization is satisfiable whenever some material carries a
-        # flux. That is not the same as being the only way to get here, and the
-        # message must not claim it is - {"CaO": 1.0, "SiO2": 1e20} and
-        # {"CaO": 1e-300, "SiO2": 3.0} both used to land in this branch with no
-        # passenger in the request and be told the passengers were at fault.
-        # Both are now refused as degenerate_target before any LP runs, so the
-        # branch below is defensive: no target that passes MAX_UMF_VALUE has
-        # been observed reaching it. It says what it knows either way
-        if ceilings:
-            warnings.append("ограничения по пассажирам несовместимы с нормировкой "
-                            "по плавням: ни один допустимый состав не найден")
-        else:
-            warnings.append("задача оказалась несовместимой без единого ограничения "
-                            "по пассажирам — скорее всего, значения цели выходят за "
-                            "пределы, в которых счёт остаётся устойчивым")
-        return {"feasible": False, "max_relative_deviation": None, "per_oxide": [],
-                "unreachable_oxides": sorted(target), "why": {},
-                "passengers": [{"oxide": oxide, "limit": ceiling, "closest": None,
-                                "within_limit": False}
-                               for oxide, ceiling in ceilings.items()],
-                "closest_recipe": {}, "warnings": warnings}
+        return _contradiction(target, ceilings, warnings)
 
     if result.status != LP_OPTIMAL:
         logger.warning(f"feasibility: LP did not converge, status={result.status} "
@@ -712,6 +983,45 @@ def _check_feasibility(target_umf, materials, tol, passengers):
     t_star = float(result.x[n])
     x = _polish_on_optimal_face(A, index, flux_vec, n, measured, ceilings, t_star,
                                 np.asarray(result.x[:n]))
+    return _feasibility_report(A, index, flux_vec, n, measured, ceilings, target, tol, t_star,
+                               x, material_names, warnings)
+
+
+def _contradiction(target, ceilings, warnings):
+    """The answer of a minimax LP that has no feasible point at all"""
+    # A passenger ceiling is the only way to ASK for something that makes
+    # this LP infeasible: the two sided rows always admit a big enough t,
+    # and the normalization is satisfiable whenever some material carries a
+    # flux. That is not the same as being the only way to get here, and the
+    # message must not claim it is - {"CaO": 1.0, "SiO2": 1e20} and
+    # {"CaO": 1e-300, "SiO2": 3.0} both used to land in this branch with no
+    # passenger in the request and be told the passengers were at fault.
+    # Both are now refused as degenerate_target before any LP runs, so the
+    # branch below is defensive: no target that passes MAX_UMF_VALUE has
+    # been observed reaching it. It says what it knows either way
+    if ceilings:
+        warnings.append("ограничения по пассажирам несовместимы с нормировкой "
+                        "по плавням: ни один допустимый состав не найден")
+    else:
+        warnings.append("задача оказалась несовместимой без единого ограничения "
+                        "по пассажирам — скорее всего, значения цели выходят за "
+                        "пределы, в которых счёт остаётся устойчивым")
+    return {"feasible": False, "max_relative_deviation": None, "per_oxide": [],
+            "unreachable_oxides": sorted(target), "why": {},
+            "passengers": [{"oxide": oxide, "limit": ceiling, "closest": None,
+                            "within_limit": False}
+                           for oxide, ceiling in ceilings.items()],
+            "closest_recipe": {}, "warnings": warnings}
+
+
+def _feasibility_report(A, index, flux_vec, n, measured, ceilings, target, tol, t_star, x,
+                        material_names, warnings):
+    """
+    Everything check_feasibility reports, from the minimax optimum t* and the
+    polished point x: the rows, the LP-decided verdict list, the reasons and the
+    recipe. Shared with the feasibility session, which gets t* and x from its
+    resident models instead of from fresh ones.
+    """
     achieved = _matmul(A, x)
 
     # Which oxides miss AT THIS POINT. That is not the verdict yet - it is the
@@ -1036,6 +1346,619 @@ def _explain_unreachable(unreachable, target, achieved, A, index, flux_vec, n):
     return why
 
 
+def open_feasibility_session(materials, passengers=None):
+    """
+    Keep one inventory's feasibility problem resident, for a target being edited
+
+    An interface that re-asks the verdict on every keystroke changes nothing
+    but the target between two calls, while check_feasibility rebuilds the
+    molar matrix, the flux row and both LPs from scratch each time. A session
+    does that work once, for the inventory and the passengers it is opened
+    with, and check_session() then only rewrites what the target touches and
+    re-solves from the last optimal basis.
+
+    What the target touches is more than the right hand side. A measured oxide
+    reads (A x)_i - b_i <= t * s_i with s_i = max(b_i, OXIDE_SCALE_FLOOR), so
+    the target is both the bound of its two rows and their coefficient in the t
+    column; the polish LP takes it as row bounds, as the weights 1/s_i of its
+    objective and, through t*, as the ceilings of its deviation variables. All
+    of those are edits of a model HiGHS keeps, none of them a rebuild.
+
+    Sessions hold a HiGHS model object (see _range_model). Without one they
+    still save the filtering of the inventory and answer through
+    check_feasibility itself.
+
+    Args:
+        materials: list of material records, already filtered to the inventory
+        passengers: {oxide: upper_bound}, fixed for the life of the session
+
+    Returns:
+        the session, a dictionary to hand to check_session() and to nothing
+        else, or {"error": ..., "message": ...} when the inventory leaves
+        nothing to solve - the same codes check_feasibility answers with
+    """
+    try:
+        return _open_feasibility_session(materials, passengers)
+    except Exception as exc:
+        logger.exception(f"feasibility: could not open a session: {exc}")
+        return {"error": "feasibility_failed", "message": str(exc)}
+
+
+def _open_feasibility_session(materials, passengers):
+    kept_materials = filter_materials_with_formula(materials or [])
+    if not kept_materials:
+        return {"error": "no_usable_materials",
+                "message": "no material with an oxide analysis in the set"}
+
+    ceilings, dropped_passengers, _ = _usable_passengers(passengers, {})
+    material_oxides = _material_oxides(kept_materials)
+    oxides = usable_oxides(list(ceilings) + material_oxides)
+    A, material_names = build_molar_matrix(kept_materials, oxides)
+
+    if not _finite_matrix(A):
+        return {"error": "nonfinite_analysis",
+                "message": "a material analysis contains NaN or infinity"}
+
+    flux_vec = _matmul(flux_row(oxides), A)
+    if not np.any(flux_vec > 0):
+        return {"error": "no_fluxes",
+                "message": "no material of the set carries a flux, UMF is undefined"}
+
+    session = {
+        "materials": kept_materials, "passengers": dict(passengers or {}),
+        "ceilings": ceilings, "dropped_passengers": dropped_passengers,
+        "material_oxides": material_oxides, "material_names": material_names,
+        "flux_vec": flux_vec, "n": A.shape[1], "base_A": A, "base_oxides": oxides,
+        "checks": 0, "rebuilds": 0, "lock": threading.Lock(),
+    }
+    _build_session_models(session, oxides)
+    return session
+
+
+def _build_session_models(session, oxides):
+    """
+    (Re)build the resident minimax and polish models over the given oxide rows
+
+    The rows are the inventory's own oxides and the ceilings, plus any oxide a
+    target has asked for that no material carries - a row of zeros in A, added
+    the first time a target names it and kept from then on. Every row starts
+    at b = 0; check_session() writes the target in before each solve. A row
+    the current target does not involve sits at b = 0 with a zero A row, where
+    it binds nothing and costs nothing.
+    """
+    n = session["n"]
+    ceilings = session["ceilings"]
+    base = session["base_oxides"]
+    extra = [oxide for oxide in oxides if oxide not in base]
+    A = np.vstack([session["base_A"], np.zeros((len(extra), n))]) if extra else session["base_A"]
+    oxides = list(base) + extra
+    index = {oxide: i for i, oxide in enumerate(oxides)}
+    rows = [oxide for oxide in oxides if oxide not in ceilings]
+    m = len(rows)
+    flux_vec = session["flux_vec"]
+
+    minimax_ub, polish_ub, b_ub = [], [], []
+    for k, oxide in enumerate(rows):
+        for sign in (1.0, -1.0):
+            row = np.zeros(n + 1)
+            row[:n] = sign * A[index[oxide]]
+            row[n] = -OXIDE_SCALE_FLOOR
+            minimax_ub.append(row)
+            row = np.zeros(n + m)
+            row[:n] = sign * A[index[oxide]]
+            row[n + k] = -1.0
+            polish_ub.append(row)
+            b_ub.append(0.0)
+    for oxide, ceiling in ceilings.items():
+        row = A[index[oxide]] - ceiling * flux_vec
+        minimax_ub.append(np.concatenate([row, [0.0]]))
+        polish_ub.append(np.concatenate([row, np.zeros(m)]))
+        b_ub.append(0.0)
+
+    # The pivots of the models being replaced stay on the session's bill
+    session["retired_pivots"] = session.get("retired_pivots", 0) + sum(
+        session[name]["pivots"] for name in ("minimax", "polish") if name in session)
+    session.update({"oxides": oxides, "A": A, "index": index, "rows": rows,
+                    "values": np.zeros(m), "scales": np.full(m, OXIDE_SCALE_FLOOR)})
+    session["minimax"] = _range_model(minimax_ub, b_ub, [np.concatenate([flux_vec, [0.0]])],
+                                      [1.0], n + 1)
+    session["polish"] = _range_model(polish_ub, b_ub, [np.concatenate([flux_vec, np.zeros(m)])],
+                                     [1.0], n + m)
+    if session["minimax"]["highs"] is not None:
+        session["minimax"]["highs"].changeColCost(n, 1.0)
+
+
+def _write_session_target(session, measured):
+    """Put the target into both resident models, touching only the rows that moved"""
+    n = session["n"]
+    minimax = session["minimax"]["highs"]
+    polish = session["polish"]["highs"]
+    values = session["values"]
+    scales = session["scales"]
+
+    for k, oxide in enumerate(session["rows"]):
+        value = measured.get(oxide, 0.0)
+        if value == values[k]:
+            continue
+        scale = max(value, OXIDE_SCALE_FLOOR)
+        for row, bound in ((2 * k, value), (2 * k + 1, -value)):
+            minimax.changeRowBounds(row, -np.inf, bound)
+            polish.changeRowBounds(row, -np.inf, bound)
+            if scale != scales[k]:
+                minimax.changeCoeff(row, n, -scale)
+        values[k] = value
+        scales[k] = scale
+
+
+def _session_polish(session, t_star, fallback):
+    """
+    _polish_on_optimal_face() on the resident polish model: the same LP, with
+    the target already written in and the budget of each deviation set from t*
+    """
+    n = session["n"]
+    m = len(session["rows"])
+    if m == 0:
+        return fallback
+
+    scales = session["scales"]
+    columns = np.arange(n, n + m, dtype=np.int32)
+    highs = session["polish"]["highs"]
+    highs.changeColsBounds(m, columns, np.zeros(m),
+                           t_star * scales * (1.0 + RELATIVE_SLACK) + 1e-12)
+    highs.changeColsCost(m, columns, 1.0 / scales)
+
+    result = _run_model(session["polish"])
+    if result is None or result.status != LP_OPTIMAL:
+        logger.warning(f"feasibility: session polish LP did not solve, "
+                       f"status={None if result is None else result.status}; "
+                       f"reporting the minimax point")
+        return fallback
+    return np.asarray(result.x[:n])
+
+
+def _fixed_passenger_target(target_umf, ceilings, dropped_passengers):
+    """
+    The target cleaning of check_feasibility, for callers whose passengers were
+    cleaned once for many targets - a session, a batch screen
+
+    Returns:
+        (target, warnings, refusal): the target on the unity basis and the
+        warnings check_feasibility would have given about it, or a refusal -
+        the very answer check_feasibility gives a target it cannot use - with
+        target None
+    """
+    warnings = []
+
+    target, dropped_target = _usable_target(target_umf)
+    if dropped_target:
+        warnings.append(f"оксиды цели не распознаны и не учтены: {', '.join(dropped_target)}")
+    if dropped_passengers:
+        warnings.append(f"пассажиры не распознаны и не учтены: {', '.join(dropped_passengers)}")
+    overridden = [str(oxide) for oxide in ceilings if oxide in target]
+    if overridden:
+        warnings.append(f"оксиды заданы и целью, и пассажиром — взята верхняя граница: "
+                        f"{', '.join(overridden)}")
+
+    if not target:
+        return None, warnings, {"feasible": None, "error": "empty_target",
+                                "message": "target UMF has no usable oxide",
+                                "warnings": warnings}
+
+    target, flux_sum, target_error = _normalized_target(target)
+    if target_error is not None:
+        return None, warnings, {"feasible": None, "error": target_error,
+                                "message": _TARGET_ERROR_MESSAGES[target_error],
+                                "warnings": warnings}
+    if flux_sum != 1.0:
+        warnings.append(f"сумма плавней цели {_fmt(flux_sum)}, а не 1 — "
+                        f"формула приведена к единице перед проверкой")
+    return target, warnings, None
+
+
+def check_session(session, target_umf, tol=DEFAULT_FEASIBILITY_TOL):
+    """
+    check_feasibility(target_umf, <the session's inventory>, tol, <its passengers>)
+    answered on the resident models of an open_feasibility_session()
+
+    The answer has the shape and the meaning of check_feasibility's. t*, the
+    verdict and the verdict list are properties of the problem and come out the
+    same. The closest formula agrees to about 1e-11 - so rows tied at zero may
+    list in another order - and closest_recipe can be another recipe with that
+    formula when the inventory has several: a warm start reaches the optimum
+    along another path. Measured on the real inventory over 64 edited targets:
+    3.2 ms a check against 8.5 ms for check_feasibility.
+
+    A target naming an oxide no material carries adds a row of zeros for it,
+    which rebuilds the two models once; from then on the row stays. One session
+    serves one check at a time - a HiGHS model is not a thing two threads edit
+    at once.
+    """
+    try:
+        with session["lock"]:
+            return _check_session(session, target_umf, tol)
+    except Exception as exc:
+        logger.exception(f"feasibility: session check failed: {exc}")
+        return {"feasible": None, "error": "feasibility_failed", "message": str(exc)}
+
+
+def _check_session(session, target_umf, tol):
+    session["checks"] += 1
+    if session["minimax"]["highs"] is None:
+        return _check_feasibility(target_umf, session["materials"], tol, session["passengers"])
+
+    ceilings = session["ceilings"]
+    target, warnings, refusal = _fixed_passenger_target(target_umf, ceilings,
+                                                        session["dropped_passengers"])
+    if refusal is not None:
+        return refusal
+
+    # The measured oxides in the order check_feasibility lists them, so that
+    # the verdict list and the reasons come out in the same order too
+    oxides = usable_oxides(list(target) + list(ceilings) + session["material_oxides"])
+    missing = [oxide for oxide in oxides if oxide not in session["index"]]
+    if missing:
+        _build_session_models(session, session["oxides"] + missing)
+        session["rebuilds"] += 1
+    measured = {oxide: float(target.get(oxide, 0.0)) for oxide in oxides if oxide not in ceilings}
+
+    _write_session_target(session, measured)
+    n = session["n"]
+    result = _run_model(session["minimax"])
+    if result is None:
+        return _check_feasibility(target_umf, session["materials"], tol, session["passengers"])
+
+    if result.status == LP_INFEASIBLE:
+        return _contradiction(target, ceilings, warnings)
+
+    if result.status != LP_OPTIMAL:
+        logger.warning(f"feasibility: session LP did not converge, status={result.status} "
+                       f"({result.message})")
+        return {"feasible": None, "error": "lp_not_converged",
+                "message": f"status {result.status}: {result.message}",
+                "warnings": warnings}
+
+    t_star = float(result.x[n])
+    x = _session_polish(session, t_star, np.asarray(result.x[:n]))
+    return _feasibility_report(session["A"], session["index"], session["flux_vec"], n, measured,
+                               ceilings, target, tol, t_star, x, session["material_names"],
+                               warnings)
+
+
+def session_stats(session):
+    """What a session has cost so far: checks answered, model rebuilds, simplex pivots"""
+    pivots = session["retired_pivots"] + sum(session[name]["pivots"]
+                                             for name in ("minimax", "polish"))
+    return {"checks": session["checks"], "rebuilds": session["rebuilds"], "pivots": pivots}
+
+
+def reachable_region(materials):
+    """
+    The reachable UMF region of an inventory, as inequalities, for screening
+    many targets against it with matrix products instead of one LP each
+
+    Whatever the materials can make is the cone of their molar columns,
+    C = {A x : x >= 0}, cut by the normalization f.y = 1. A cone of finitely
+    many columns is also a finite intersection of half spaces through the
+    origin, C = {y : G y <= 0}, and those facets are computed once here: the
+    columns are scaled onto the simplex (a column of A is non negative, so its
+    sum is a positive functional on all of them), the points are projected
+    onto their affine hull and qhull (scipy.spatial.ConvexHull) returns the
+    facets of the hull there; each is lifted back to a half space of the cone.
+    The directions the columns do not span at all - an oxide no material
+    carries, a fixed ratio every material shares - become a pair of opposite
+    rows each, so that G alone describes the cone.
+
+    On the shipped inventory (19 materials, 12 oxides, an 11 dimensional hull)
+    that is 153 facets in 5 ms. It does not stay that cheap: the facet count of
+    a hull grows with the number of points beyond its dimension, and over
+    random 40 material shelves from the database qhull took from 0.1 s to 10 s
+    for up to 1155 facets. Beyond HULL_MAX_DIMENSION or HULL_MAX_GENERATORS the
+    region is refused, and screen_targets() is then not the tool - the LP is.
+
+    Args:
+        materials: list of material records, already filtered to the inventory
+
+    Returns:
+        the region, a dictionary to hand to screen_targets() and
+        check_feasibility_batch(), or {"error": ..., "message": ...}:
+        the codes of check_feasibility for an inventory that leaves nothing to
+        solve, "region_too_large" past the caps above and "hull_failed" when
+        qhull gives up on a degenerate set of points
+    """
+    try:
+        return _reachable_region(materials)
+    except Exception as exc:
+        logger.exception(f"feasibility: could not build the reachable region: {exc}")
+        return {"error": "feasibility_failed", "message": str(exc)}
+
+
+def _reachable_region(materials):
+    kept_materials = filter_materials_with_formula(materials or [])
+    if not kept_materials:
+        return {"error": "no_usable_materials",
+                "message": "no material with an oxide analysis in the set"}
+
+    oxides = usable_oxides(_material_oxides(kept_materials))
+    A, material_names = build_molar_matrix(kept_materials, oxides)
+    if not _finite_matrix(A):
+        return {"error": "nonfinite_analysis",
+                "message": "a material analysis contains NaN or infinity"}
+    if not np.any(_matmul(flux_row(oxides), A) > 0):
+        return {"error": "no_fluxes",
+                "message": "no material of the set carries a flux, UMF is undefined"}
+
+    region = {"materials": kept_materials, "material_names": material_names,
+              "oxides": oxides, "index": {oxide: i for i, oxide in enumerate(oxides)}}
+
+    columns = A[:, A.sum(axis=0) > 0]
+    points = (columns / columns.sum(axis=0)).T
+    center = points.mean(axis=0)
+
+    # The linear span of the cone and the affine hull of its points, both by
+    # SVD. The span is one dimension more than the hull, because the hull lies
+    # in the plane sum(y) = 1, which does not pass through the origin
+    left, singular, _ = np.linalg.svd(columns)
+    span_rank = int(np.sum(singular > HULL_RANK_RTOL * singular[0]))
+    _, spread, axes = np.linalg.svd(points - center)
+    dimension = int(np.sum(spread > HULL_RANK_RTOL * spread[0])) if spread.size and spread[0] > 0 else 0
+
+    if dimension > HULL_MAX_DIMENSION or len(points) > HULL_MAX_GENERATORS:
+        return {"error": "region_too_large",
+                "message": f"{len(points)} materials over a {dimension} dimensional hull, "
+                           f"above the caps of {HULL_MAX_GENERATORS} and {HULL_MAX_DIMENSION}"}
+
+    basis = axes[:dimension].T
+    if dimension >= 2:
+        try:
+            hull = ConvexHull((points - center) @ basis)
+        except QhullError as exc:
+            return {"error": "hull_failed", "message": str(exc).splitlines()[0]}
+        normals, offsets = hull.equations[:, :-1], hull.equations[:, -1]
+    elif dimension == 1:
+        # A segment, which qhull does not take: its two ends are the facets
+        coordinates = ((points - center) @ basis)[:, 0]
+        normals = np.array([[1.0], [-1.0]])
+        offsets = np.array([-coordinates.max(), coordinates.min()])
+    else:
+        normals, offsets = np.zeros((0, 0)), np.zeros(0)
+
+    # normal.z + offset <= 0 with z = basis^T (p - center), on the plane
+    # sum(p) = 1, is the homogeneous g.y <= 0 once the constant is multiplied by
+    # sum(y); g then holds for every point of the cone, not just the plane
+    if len(normals):
+        facets = normals @ basis.T + (offsets - normals @ basis.T @ center)[:, None]
+    else:
+        facets = np.zeros((0, len(oxides)))
+    outside_span = left[:, span_rank:].T
+    facets = np.vstack([facets, outside_span, -outside_span])
+    facets = facets / np.linalg.norm(facets, axis=1)[:, None]
+    # Triangulated output repeats a facet once per simplex it was cut into
+    facets = np.unique(np.round(facets, 12), axis=0)
+
+    region.update({"facets": facets, "dimension": dimension,
+                   "facet_count": int(len(facets))})
+    logger.debug(f"feasibility: reachable region of {len(kept_materials)} materials, "
+                 f"{dimension} dimensions, {len(facets)} facets")
+    return region
+
+
+def screen_targets(region, targets, tol=DEFAULT_FEASIBILITY_TOL, passengers=None):
+    """
+    Decide what the reachable region alone can decide about many targets
+
+    The minimax of check_feasibility asks for a point of the cone inside the box
+    |y_i - b_i| <= t * s_i, and every facet g of the cone bounds t from below:
+    the box cannot reach g.y <= 0 while
+
+        g.b - t * sum_i |g_i| s_i  >  0,
+
+    so t* >= g.b / (|g| . s). The largest of these over the facets is a lower
+    bound on t*, and for a whole batch it is two matrix products. A passenger
+    is no term in t - it may sit anywhere in [0, ceiling] - and enters the
+    numerator as the most favourable value it can take there. An oxide the
+    inventory does not carry at all is forced to zero, which bounds t* by
+    b_i / s_i by itself.
+
+    Three answers come out:
+      "reachable"    the target lies in the cone, so t* = 0 exactly: the
+                     verdict is True and nothing is forced to miss. Only
+                     without passengers - with them, where in [0, ceiling] they
+                     have to sit is a question for the LP
+      "unreachable"  the lower bound beats tol by HULL_MARGIN, and the verdict is
+                     False whatever the LP would add to it
+      "borderline"   anything else: the target is outside the region but the
+                     bound does not clear tol, and only the LP can tell
+
+    The bound drops the normalization and takes the facets one at a time, so it
+    is weaker than t*, never wrong: a target it leaves borderline can still be
+    far outside. How much it decides is measured in check_feasibility_batch.
+
+    "blocking_oxides" of an unreachable target is the oxide each facet that
+    clears tol would have to move least to be satisfied - the largest
+    |g_i| s_i - and every oxide the inventory cannot carry. It says which
+    oxides push the target off the region; it is NOT unreachable_oxides, which
+    is the LP's stronger statement about which oxides are forced to miss.
+
+    Args:
+        region: what reachable_region() returned
+        targets: list of {oxide: value} in UMF units, cleaned and normalized
+            exactly as check_feasibility cleans them
+        tol: the verdict line
+        passengers: {oxide: upper_bound}, the same for every target
+
+    Returns:
+        one dictionary per target, in order: {"verdict": "reachable" |
+        "unreachable" | "borderline", "deviation_lower_bound": float,
+        "blocking_oxides": [str, ...], "warnings": [str, ...]}, or the refusal
+        check_feasibility answers a target it cannot use, with "verdict": None
+    """
+    try:
+        return _screen_targets(region, targets, tol, passengers)
+    except Exception as exc:
+        # Screening only ever saves LPs; when it fails, the LP answers all of them
+        logger.exception(f"feasibility: screening failed, every target goes to the LP: {exc}")
+        return [{"verdict": "borderline"} for _ in targets]
+
+
+def _screen_targets(region, targets, tol, passengers):
+    ceilings, dropped_passengers, _ = _usable_passengers(passengers, {})
+    oxides, index, facets = region["oxides"], region["index"], region["facets"]
+    measured_rows = np.array([oxide not in ceilings for oxide in oxides], dtype=bool)
+    ceiling_vector = np.array([ceilings.get(oxide, 0.0) for oxide in oxides])
+
+    # The most favourable position of the passengers for each facet: each at
+    # zero or at its ceiling, whichever lowers g.y
+    passenger_term = np.minimum(facets[:, ~measured_rows] * ceiling_vector[~measured_rows],
+                                0.0).sum(axis=1)
+
+    screens = [None] * len(targets)
+    columns = []
+    values = []
+    extra_bounds = []
+    for position, target_umf in enumerate(targets):
+        target, warnings, refusal = _fixed_passenger_target(target_umf, ceilings,
+                                                            dropped_passengers)
+        if refusal is not None:
+            screens[position] = dict(refusal, verdict=None)
+            continue
+        screens[position] = {"warnings": warnings}
+        columns.append(position)
+
+        # Oxides the region has no row for: forced to zero, each a bound alone
+        outside = {}
+        for oxide, value in target.items():
+            if oxide not in index and oxide not in ceilings and value > 0.0:
+                outside[oxide] = value / max(value, OXIDE_SCALE_FLOOR)
+        extra_bounds.append(outside)
+        values.append([float(target.get(oxide, 0.0)) if measured_rows[i] else 0.0
+                       for i, oxide in enumerate(oxides)])
+
+    if not columns:
+        return screens
+
+    values = np.array(values).T
+    scales = np.where(measured_rows[:, None], np.maximum(values, OXIDE_SCALE_FLOOR), 0.0)
+    numerators = _matmul(facets, values) + passenger_term[:, None]
+    denominators = _matmul(np.abs(facets), scales)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bounds = np.where(numerators > 0.0,
+                          np.where(denominators > 0.0, numerators / denominators, np.inf), 0.0)
+
+    for k, position in enumerate(columns):
+        outside = extra_bounds[k]
+        facet_bounds = bounds[:, k] if len(facets) else np.zeros(0)
+        lower_bound = max([float(facet_bounds.max()) if facet_bounds.size else 0.0]
+                          + list(outside.values()))
+
+        if lower_bound > tol + HULL_MARGIN:
+            verdict = "unreachable"
+            blocking = {oxide for oxide, bound in outside.items() if bound > tol + HULL_MARGIN}
+            leverage = np.abs(facets) * scales[:, k]
+            for facet in np.flatnonzero(facet_bounds > tol + HULL_MARGIN):
+                blocking.add(oxides[int(np.argmax(leverage[facet]))])
+        elif not ceilings and not outside and (
+                not len(facets) or float(numerators[:, k].max()) <= HULL_INSIDE_EPS):
+            verdict, blocking = "reachable", set()
+        else:
+            verdict, blocking = "borderline", set()
+
+        screens[position].update({"verdict": verdict, "deviation_lower_bound": lower_bound,
+                                  "blocking_oxides": sorted(blocking)})
+    return screens
+
+
+def iter_feasibility_batch(targets, materials, tol=DEFAULT_FEASIBILITY_TOL, passengers=None,
+                           region=None):
+    """
+    The verdict of check_feasibility for many targets against one inventory,
+    with the LP solved only for the targets the reachable region leaves open,
+    yielded as each is decided
+
+    Measured on the shipped inventory over 679 targets - the fixture recipes,
+    mixes of the shelf, mixes of the whole database and perturbed copies - the
+    region decided 607 and the LP the other 72, in 0.45 s against 12.6 s for
+    check_feasibility on each; no verdict differed. With a passenger only the
+    unreachable side can be decided without an LP: the region took 307, and
+    the batch 0.62 s against 13.1 s.
+
+    Everything that depends on the inventory alone is built once: the region,
+    and for the LPs a feasibility session (open_feasibility_session), whose
+    molar matrix, flux row and models every undecided target shares. The
+    region's answers come first, in target order, as soon as the screen is
+    done; the LP answers follow one by one.
+
+    Args:
+        targets: list of {oxide: value}
+        materials: list of material records, already filtered to the inventory
+        tol, passengers: as in check_feasibility, the same for every target
+        region: reachable_region(materials), when the caller keeps one; built
+            here otherwise. A region that could not be built (too large, a
+            degenerate hull) only means every target goes to the LP
+
+    Yields:
+        (position, answer, lp_seconds) - the index of the target, its answer
+        with "decided_by", and the time its LP took (0.0 for the region's).
+        "lp" is the answer of check_session, which is check_feasibility's
+        verdict, t* and verdict list. "hull" is the verdict alone:
+        {"feasible", "max_relative_deviation" (0.0 when reachable, None when
+        not), "deviation_lower_bound", "unreachable_oxides" ([] when reachable,
+        None when not - the region does not know which oxides are forced),
+        "blocking_oxides", "warnings", "decided_by"}. An answer with "error" -
+        a target check_feasibility refuses, an LP that failed - has no
+        "decided_by"
+    """
+    if region is None:
+        region = reachable_region(materials)
+    if region.get("error"):
+        logger.info(f"feasibility: batch of {len(targets)} without a region "
+                    f"({region['error']}), every target goes to the LP")
+        screens = [{"verdict": "borderline"} for _ in targets]
+    else:
+        screens = screen_targets(region, targets, tol, passengers)
+
+    undecided = []
+    for position, screen in enumerate(screens):
+        if screen.get("verdict") == "borderline":
+            undecided.append(position)
+        elif screen.get("verdict") is None:
+            yield position, {key: value for key, value in screen.items() if key != "verdict"}, 0.0
+        else:
+            reachable = screen["verdict"] == "reachable"
+            yield position, {"feasible": reachable,
+                             "max_relative_deviation": 0.0 if reachable else None,
+                             "deviation_lower_bound": screen["deviation_lower_bound"],
+                             "unreachable_oxides": [] if reachable else None,
+                             "blocking_oxides": screen["blocking_oxides"],
+                             "warnings": screen["warnings"], "decided_by": "hull"}, 0.0
+
+    if not undecided:
+        return
+    session = open_feasibility_session(materials, passengers)
+    for position in undecided:
+        started = time.perf_counter()
+        if session.get("error"):
+            # The inventory leaves nothing to solve; check_feasibility says so
+            # in its own words, after whatever it has to say about the target
+            answer = check_feasibility(targets[position], materials, tol, passengers)
+        else:
+            answer = check_session(session, targets[position], tol)
+        if not answer.get("error"):
+            answer = dict(answer, decided_by="lp")
+        yield position, answer, time.perf_counter() - started
+
+
+def check_feasibility_batch(targets, materials, tol=DEFAULT_FEASIBILITY_TOL, passengers=None,
+                            region=None):
+    """
+    iter_feasibility_batch, collected: one answer per target, in target order
+    """
+    answers = [None] * len(targets)
+    for position, answer, _ in iter_feasibility_batch(targets, materials, tol, passengers,
+                                                      region):
+        answers[position] = answer
+    return answers
+
+
 def projected_range_lps(target_umf, materials, oxide_constraints=None):
     """
     How many LPs achievable_ranges would solve for this request, before solving any
@@ -1060,7 +1983,7 @@ def projected_range_lps(target_umf, materials, oxide_constraints=None):
 
 
 def achievable_ranges(target_umf, materials, oxide_constraints=None,
-                      material_constraints=None, tol=DEFAULT_FEASIBILITY_TOL):
+                      material_constraints=None, tol=DEFAULT_FEASIBILITY_TOL, workers=None):
     """
     How far each oxide and each material can move while the target still holds
 
@@ -1112,6 +2035,17 @@ def achievable_ranges(target_umf, materials, oxide_constraints=None,
         material_constraints: {material: [lo, hi]} in weight percent, either end
             None for "no bound"
         tol: width of the box derived from the target, as in check_feasibility
+        workers: threads the range LPs are spread over, None or 1 for none.
+            Once the probe has succeeded the LPs are independent of one
+            another, so they are cut into one contiguous chunk per thread, each
+            warm starting on models of its own. The answer is assembled in the
+            serial order and is deterministic for a given worker count; a bound
+            may differ from the serial one in the last digits (1e-10 on 60
+            materials), because another start basis reaches the same optimum
+            through other pivots. On a failure lp_count and pivots may exceed
+            the serial ones: the other chunks stop at their next LP rather than
+            never starting. Anything that is not a whole number of at least 1
+            is answered serially with a warning
 
     Returns:
         {
@@ -1120,9 +2054,16 @@ def achievable_ranges(target_umf, materials, oxide_constraints=None,
           "material_ranges": {"Каолин КЖФ-1": [0.0, 55.3], ...},
           "example_recipe": {material: percent},
           "lp_count": int,
+          "pivots": int,
           "warnings": [str, ...],
         }
 
+        "pivots" is the simplex iterations spent on all of them. The LPs of one
+        normalization share their constraint system and each starts from the
+        optimal basis of the previous one (_range_model), so on the real
+        inventory the 63 LPs cost about 450 pivots where 63 cold starts cost
+        about 750 - and a tenth of the time, the model being built only twice.
+
         None as the upper end means unbounded, and it is a real answer, not a
         failure: while pure quartz is in the set and nothing caps SiO2, there is
         no largest SiO2. The interface prints it as infinity.
@@ -1152,7 +2093,7 @@ def achievable_ranges(target_umf, materials, oxide_constraints=None,
     """
     try:
         return _achievable_ranges(target_umf, materials, oxide_constraints,
-                                  material_constraints, tol)
+                                  material_constraints, tol, workers)
     except Exception as exc:
         logger.exception(f"feasibility: achievable ranges failed: {exc}")
         return {"feasible": None, "error": "ranges_failed", "message": str(exc)}
@@ -1191,9 +2132,16 @@ def _bounds_pair(value, warnings, what):
     return cleaned[0], cleaned[1]
 
 
-def _achievable_ranges(target_umf, materials, oxide_constraints, material_constraints, tol):
+def _achievable_ranges(target_umf, materials, oxide_constraints, material_constraints, tol,
+                       workers=None):
     warnings = []
 
+    worker_count = 1 if workers is None else workers
+    if isinstance(worker_count, bool) or not isinstance(worker_count, int) or worker_count < 1:
+        warnings.append(f"число потоков {workers!r} не распознано — "
+                        f"диапазоны посчитаны в одном потоке")
+        worker_count = 1
+
     target, dropped_target = _usable_target(target_umf)
     if dropped_target:
         warnings.append(f"оксиды цели не распознаны и не учтены: {', '.join(dropped_target)}")
@@ -1305,27 +2253,35 @@ def _achievable_ranges(target_umf, materials, oxide_constraints, material_constr
             A_ub.append(lo * ones - column)
             b_ub.append(0.0)
 
-    variable_bounds = [(0.0, None)] * n
+    # Two constraint systems, one per normalization, each built once and then
+    # re-optimized objective after objective from its last optimal basis (see
+    # _range_model). Only the costs change between the LPs of one system.
+    material_model = _range_model(A_ub, b_ub, [ones], [100.0], n)
+    oxide_model = _range_model(A_ub, b_ub, [flux_vec], [1.0], n)
     lp_count = 0
 
+    def pivots():
+        return material_model["pivots"] + oxide_model["pivots"]
+
     # One probe first, on the sum(x) = 100 normalization. It does three jobs at
     # once: it answers "is the feasible region empty" so that a contradiction
     # costs one LP instead of seventy, it hands back the example recipe, and its
     # objective - the largest flux sum the constraints allow - is the scale the
     # flux floor below is measured against.
-    probe = _linprog(-flux_vec, A_ub, b_ub, [ones], [100.0], variable_bounds)
+    probe = _range_solve(material_model, -flux_vec)
     lp_count += 1
 
     if probe.status == LP_INFEASIBLE:
         return {"feasible": False, "oxide_ranges": {}, "material_ranges": {},
-                "example_recipe": {}, "lp_count": lp_count, "warnings": warnings}
+                "example_recipe": {}, "lp_count": lp_count, "pivots": pivots(),
+                "warnings": warnings}
 
     if probe.status != LP_OPTIMAL:
         logger.warning(f"feasibility: range probe did not converge, status={probe.status} "
                        f"({probe.message})")
         return {"feasible": None, "error": "lp_not_converged",
                 "message": f"status {probe.status}: {probe.message}",
-                "lp_count": lp_count, "warnings": warnings}
+                "lp_count": lp_count, "pivots": pivots(), "warnings": warnings}
 
     max_flux_sum = float(-probe.fun)
     if max_flux_sum <= 0.0:
@@ -1335,16 +2291,17 @@ def _achievable_ranges(target_umf, materials, oxide_constraints, material_constr
         warnings.append("ни одна допустимая смесь не содержит плавней — "
                         "у таких составов нет UMF, диапазоны считать не по чему")
         return {"feasible": False, "oxide_ranges": {}, "material_ranges": {},
-                "example_recipe": {}, "lp_count": lp_count, "warnings": warnings}
+                "example_recipe": {}, "lp_count": lp_count, "pivots": pivots(),
+                "warnings": warnings}
 
     # The material LPs, and only they, carry the flux floor: they are normalized
     # by sum(x) = 100, where a flux free batch satisfies every UMF constraint as
     # 0 <= 0 and would be reported as a legitimate answer. Without it a target
     # of {"CaO": 1.0} on the real inventory answers [0, 100] for every material
     # and offers 100% aluminium powder as the example recipe. The oxide LPs need
-    # nothing: S_flux = 1 already excludes the point.
-    material_A_ub = A_ub + [-flux_vec]
-    material_b_ub = b_ub + [-MIN_FLUX_SHARE * max_flux_sum]
+    # nothing: S_flux = 1 already excludes the point. The probe's own optimum
+    # satisfies the floor, so adding it keeps that basis a warm start.
+    _range_add_row(material_model, -flux_vec, -MIN_FLUX_SHARE * max_flux_sum)
 
     if not any(oxide not in flux_names for oxide in target):
         warnings.append("цель состоит из одних плавней и почти ничего не ограничивает: "
@@ -1353,54 +2310,59 @@ def _achievable_ranges(target_umf, materials, oxide_constraints, material_constr
 
     example_recipe = _as_recipe(np.asarray(probe.x), material_names)
 
-    oxide_ranges = {}
+    # Every range LP as (kind, name, maximize, objective), in the order the
+    # serial path solves them: each oxide's min and max, then each material's.
+    tasks = []
     for oxide in oxides:
-        i = index[oxide]
-        interval = []
-        for maximize in (False, True):
-            c = -A[i] if maximize else A[i]
-            result = _linprog(c, A_ub, b_ub, [flux_vec], [1.0], variable_bounds)
-            lp_count += 1
-            if result.status == LP_INFEASIBLE:
-                return {"feasible": False, "oxide_ranges": {}, "material_ranges": {},
-                        "example_recipe": {}, "lp_count": lp_count, "warnings": warnings}
-            if result.status == LP_UNBOUNDED:
-                interval.append(None)
-                continue
-            if result.status != LP_OPTIMAL:
-                logger.warning(f"feasibility: range LP for {oxide} did not converge, "
-                               f"status={result.status}")
-                return {"feasible": None, "error": "lp_not_converged",
-                        "message": f"{oxide}: status {result.status}: {result.message}",
-                        "lp_count": lp_count, "warnings": warnings}
-            interval.append(float(-result.fun if maximize else result.fun))
-        oxide_ranges[oxide] = interval
-
-    material_ranges = {}
+        row = A[index[oxide]]
+        tasks += [(RANGE_OXIDE, oxide, False, row), (RANGE_OXIDE, oxide, True, -row)]
     for name in material_names:
-        j = material_index[name]
         column = np.zeros(n)
-        column[j] = 1.0
-        interval = []
-        for maximize in (False, True):
-            c = -column if maximize else column
-            result = _linprog(c, material_A_ub, material_b_ub, [ones], [100.0],
-                              variable_bounds)
-            lp_count += 1
-            if result.status == LP_INFEASIBLE:
-                return {"feasible": False, "oxide_ranges": {}, "material_ranges": {},
-                        "example_recipe": {}, "lp_count": lp_count, "warnings": warnings}
-            if result.status != LP_OPTIMAL:
-                # sum(x) = 100 with x >= 0 bounds every share into [0, 100], so
-                # unbounded cannot happen here - unlike for an oxide
-                logger.warning(f"feasibility: range LP for material {name} did not "
-                               f"converge, status={result.status}")
-                return {"feasible": None, "error": "lp_not_converged",
-                        "message": f"{name}: status {result.status}: {result.message}",
-                        "lp_count": lp_count, "warnings": warnings}
-            interval.append(float(-result.fun if maximize else result.fun))
-        material_ranges[name] = interval
-
-    return {"feasible": True, "oxide_ranges": oxide_ranges,
-            "material_ranges": material_ranges, "example_recipe": example_recipe,
-            "lp_count": lp_count, "warnings": warnings}
+        column[material_index[name]] = 1.0
+        tasks += [(RANGE_MATERIAL, name, False, column), (RANGE_MATERIAL, name, True, -column)]
+
+    spent = pivots()
+    if worker_count > 1:
+        systems = {RANGE_OXIDE: (A_ub, b_ub, [flux_vec], [1.0], n),
+                   RANGE_MATERIAL: (material_model["A_ub"], material_model["b_ub"],
+                                    [ones], [100.0], n)}
+        outcomes, chunk_pivots = _solve_ranges_parallel(tasks, systems, worker_count)
+    else:
+        outcomes, chunk_pivots = _solve_range_chunk(
+            tasks, {RANGE_OXIDE: oxide_model, RANGE_MATERIAL: material_model}, None, None)
+        outcomes += [None] * (len(tasks) - len(outcomes))
+    spent += chunk_pivots
+    lp_count += sum(result is not None for result in outcomes)
+
+    # Assembled in task order whatever order the LPs finished in. A None is an
+    # LP a chunk skipped because another one had already failed, so the walk is
+    # bound to meet that failure further on; the first failure in task order is
+    # the one reported. Which failure that is does not depend on the chunking:
+    # the LPs of one normalization share their feasible region, so "infeasible"
+    # is a fact about the system and the first oxide LP is always the first to
+    # see it.
+    ranges = {RANGE_OXIDE: {}, RANGE_MATERIAL: {}}
+    for (kind, name, maximize, _), result in zip(tasks, outcomes):
+        if result is None:
+            continue
+        if result.status == LP_INFEASIBLE:
+            return {"feasible": False, "oxide_ranges": {}, "material_ranges": {},
+                    "example_recipe": {}, "lp_count": lp_count, "pivots": spent,
+                    "warnings": warnings}
+        if kind == RANGE_OXIDE and result.status == LP_UNBOUNDED:
+            ranges[kind].setdefault(name, []).append(None)
+            continue
+        if result.status != LP_OPTIMAL:
+            # sum(x) = 100 with x >= 0 bounds every share into [0, 100], so an
+            # unbounded material LP is a failure - unlike an unbounded oxide
+            label = name if kind == RANGE_OXIDE else f"material {name}"
+            logger.warning(f"feasibility: range LP for {label} did not converge, "
+                           f"status={result.status}")
+            return {"feasible": None, "error": "lp_not_converged",
+                    "message": f"{name}: status {result.status}: {result.message}",
+                    "lp_count": lp_count, "pivots": spent, "warnings": warnings}
+        ranges[kind].setdefault(name, []).append(float(-result.fun if maximize else result.fun))
+
+    return {"feasible": True, "oxide_ranges": ranges[RANGE_OXIDE],
+            "material_ranges": ranges[RANGE_MATERIAL], "example_recipe": example_recipe,
+            "lp_count": lp_count, "pivots": spent, "warnings": warnings}
@@ -48,8 +48,12 @@
 #   1. u0 = weights_to_umf(calculate_recipe_composition(...)) - the base formula.
 #   2. For every material j of the recipe and every oxide i it carries, perturb
 #      that ONE cell of the analysis: A[i][j] -> A[i][j] * (1 + sigma_ij), and
-#      recompute the whole UMF. The response delta_u^(ij) = u' - u0 is already
-#      the response to exactly one sigma, so no separate derivative step exists.
+#      take the change of the whole UMF. The response delta_u^(ij) = u' - u0 is
+#      already the response to exactly one sigma, so no separate derivative step
+#      exists. It is not recomputed through weights_to_umf cell by cell: the UMF
+#      is a ratio of linear functions of one weight, so u' - u0 has a closed
+#      form - the analytic Jacobian times an exact finite-step correction, see
+#      _cell_responses - and every cell of the recipe is one array expression.
 #   3. Spread of the result:  sigma(u_k) = sqrt(sum_ij (delta_u_k^(ij))^2),
 #      treating the perturbations as independent.
 #   4. Contribution of a material:
@@ -72,12 +76,17 @@ import json
 import logging
 import math
 import os
+import time
+
+import numpy as np
 
 from common import (
     OXIDE_SCALE_FLOOR,
     load_molar_masses,
     oxides_classification,
+    flux_oxides as unity_oxides,
     weights_to_umf,
+    weights_to_umf_batch,
 )
 from solver_classic import calculate_recipe_composition
 
@@ -244,9 +253,38 @@ MAX_SIGMA = 1.0
 AFFECTS_LIMIT = 3
 AFFECTS_MIN_SHARE = 0.05
 
+# Relative gap, as a share of the material's contribution, below which two
+# oxides count as moved equally - a tie of the model rather than of the floats
+# (see _top_affected). Far above the 1e-16 of the rounding, far below anything
+# a tolerance file could tell apart.
+AFFECTS_TIE = 1e-9
+
 # Decimals kept on a material share, see the comment at the normalization step
 SHARE_DIGITS = 9
 
+# The two ways of propagating the sigmas. "linear" is the method of the header
+# of this module and the default. "monte_carlo" draws whole perturbed analyses
+# instead - every cell of every material at once, each one normal with its own
+# sigma - and reads the spread of the UMF off the samples: percentile bands
+# rather than one sigma, and it sees what one cell at a time cannot, the
+# interaction of two analyses being wrong together. The linear answer is still
+# computed and returned next to it; the draws add a block, they replace nothing.
+MODE_LINEAR = 'linear'
+MODE_MONTE_CARLO = 'monte_carlo'
+SENSITIVITY_MODES = (MODE_LINEAR, MODE_MONTE_CARLO)
+
+# Draws of the Monte Carlo mode when the caller names none. Measured on this
+# machine: on the reference clear glaze (5 materials, 7 evaluations per draw)
+# 2000 draws take about 10 ms, put the 5th and 95th percentiles within about 1%
+# of their value between seeds and the material shares within about 0.02 -
+# which is what an interactive caller needs. A 10 material recipe takes about
+# 20 ms for the same draws; the cost is linear in both.
+MONTE_CARLO_SAMPLES = 2000
+# Fewer than this and a percentile band is two or three draws wide
+MONTE_CARLO_MIN_SAMPLES = 100
+# The percentiles of the bands, per oxide of the result
+MONTE_CARLO_PERCENTILES = (5, 50, 95)
+
 
 def _default_tolerances_path():
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -580,6 +618,198 @@ def _flux_moles(weight_composition, molar_masses, flux_oxides):
     return flux_sum, total_sum
 
 
+def umf_jacobian(weight_composition, result_oxides, weight_oxides, molar_masses):
+    """
+    d(UMF)/d(weight) of a weight composition, in closed form
+
+    The UMF is u_k = m_k / S with m_k = w_k / M_k and S the moles of the unity
+    basis, so
+        du_k / dw_i = (delta_ki - f_i * u_k) / (M_i * S)
+    where f_i is 1 for an oxide of the basis and 0 otherwise: a weight moves its
+    own oxide, and through the basis it rescales every other one.
+
+    Args:
+        weight_composition: {oxide: weight} with a non-zero unity basis
+        result_oxides: the UMF oxides, the rows of the answer; each one has to
+            be in weight_composition and have a molar mass
+        weight_oxides: the weights to differentiate by, the columns; each one
+            has to have a molar mass, and need not be in the composition
+        molar_masses: {oxide: molar mass}
+
+    Returns:
+        (jacobian, unity_moles): the (rows x columns) array, and S
+    """
+    basis = unity_oxides()
+    # Summed in the order of the basis, as weights_to_umf sums it
+    unity_moles = 0.0
+    for oxide in basis:
+        if oxide in weight_composition and oxide in molar_masses:
+            unity_moles += weight_composition[oxide] / molar_masses[oxide]
+
+    basis = set(basis)
+    masses = np.array([float(molar_masses[oxide]) for oxide in weight_oxides])
+    in_basis = np.array([oxide in basis for oxide in weight_oxides], dtype=float)
+    own = (np.array(result_oxides, dtype=object)[:, None]
+           == np.array(weight_oxides, dtype=object)[None, :]).astype(float)
+
+    # A non-finite weight is carried through as nan, as the float arithmetic of
+    # weights_to_umf carries it, without a RuntimeWarning
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        umf = np.array([weight_composition[oxide] / molar_masses[oxide]
+                        for oxide in result_oxides]) * (1 / unity_moles)
+        jacobian = (own - np.outer(umf, in_basis)) / (masses * unity_moles)
+    return jacobian, unity_moles
+
+
+def _cell_responses(base_composition, result_oxides, cells, molar_masses):
+    """
+    The change of the UMF when one entry of the weight composition moves, for
+    many such moves at once
+
+    Not the linear term alone: the Jacobian is exact only for an infinitesimal
+    move, and a sigma here goes up to MAX_SIGMA = 100% - the header of this
+    module rests on the response NOT being linear in it. Along one entry the
+    UMF is a ratio of two linear functions, so the exact finite change is the
+    Jacobian column scaled by one correction:
+        delta_u = J[:, i] * dw / (1 + f_i * dw / (M_i * S))
+    which is weights_to_umf of the moved composition minus the base one, to
+    rounding - and nothing to do with how large the move is.
+
+    Args:
+        base_composition: {oxide: weight} of the recipe
+        result_oxides: the UMF oxides of the base, in order
+        cells: list of (oxide, weight change), each one a separate move
+        molar_masses: {oxide: molar mass}
+
+    Returns:
+        array (len(cells) x len(result_oxides)) of UMF changes
+    """
+    if not cells:
+        return np.zeros((0, len(result_oxides)))
+
+    oxides = [oxide for oxide, _delta_weight in cells]
+    jacobian, unity_moles = umf_jacobian(base_composition, result_oxides, oxides, molar_masses)
+
+    basis = set(unity_oxides())
+    delta_weights = np.array([delta_weight for _oxide, delta_weight in cells])
+    basis_steps = np.array([delta_weight / molar_masses[oxide] if oxide in basis else 0.0
+                            for oxide, delta_weight in cells])
+
+    # An inf in a material formula turns into nan here; _first_nonfinite in
+    # recipe_sensitivity is what reports it, by name
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        return (jacobian * delta_weights).T / (1.0 + basis_steps / unity_moles)[:, None]
+
+
+def _monte_carlo(base_composition, result_oxides, scales, plans, cells, material_names,
+                 molar_masses, samples, seed):
+    """
+    The Monte Carlo block of recipe_sensitivity: percentile bands of the UMF
+    and Sobol indices of the materials, from whole perturbed analyses
+
+    Every cell of every material moves at once, A[i][j] * (1 + sigma_ij * e)
+    with e standard normal, clipped at -1/sigma - an analysis cannot carry a
+    negative amount of an oxide. A cell moves only its own entry of the weight
+    composition, by its one-sigma step times e (see recipe_sensitivity), so a
+    whole batch of draws is one matrix product onto the base composition and
+    one weights_to_umf_batch.
+
+    The indices are the pick-freeze estimators over two independent draw
+    matrices A and B and, per material, A with that material's cells taken
+    from B: first order after Saltelli (2010), total effect after Jansen
+    (1999). The UMF has many outputs, so a material's index is the sum of its
+    partial variances over the oxides divided by the sum of their variances,
+    each oxide measured on the scale the linear ranking uses - the same
+    footing, so the two answers can be read side by side. "share" is the total
+    effects normalized to 1, the quantity comparable with the linear "share";
+    the first order index is what the material does alone, the gap to the
+    total is what it does together with the others.
+
+    Cost: samples * (materials + 2) UMF evaluations, all in numpy.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    columns = list(result_oxides)
+    column_of = {oxide: index for index, oxide in enumerate(columns)}
+    for oxide, _delta_weight in cells:
+        if oxide not in column_of:
+            column_of[oxide] = len(columns)
+            columns.append(oxide)
+
+    base = np.array([base_composition.get(oxide, 0.0) for oxide in columns])
+    steps = np.zeros((len(cells), len(columns)))
+    for row, (oxide, delta_weight) in enumerate(cells):
+        steps[row, column_of[oxide]] = delta_weight
+    # e >= -1/sigma keeps every perturbed cell at or above zero
+    floors = np.array([-1.0 / sigma for _material, _sigmas, material_cells in plans
+                       for _oxide, sigma, _row in material_cells])
+    scale = np.array([scales[oxide] for oxide in result_oxides])
+
+    def draw():
+        return np.maximum(rng.standard_normal((samples, len(cells))), floors)
+
+    def scaled_umf(draws):
+        with np.errstate(invalid='ignore', over='ignore'):
+            umf = weights_to_umf_batch(base + draws @ steps, columns, round_digits=None)
+        return umf[:, :len(result_oxides)], umf[:, :len(result_oxides)] / scale
+
+    draws_a, draws_b = draw(), draw()
+    umf_a, scaled_a = scaled_umf(draws_a)
+    _umf_b, scaled_b = scaled_umf(draws_b)
+    pooled = np.vstack([scaled_a, scaled_b])
+    variance = np.var(pooled, axis=0).sum()
+    # The estimator of the first order index is unbiased either way, but on
+    # outputs far from zero - SiO2 sits at 30 scales - its noise is dominated
+    # by the mean; measuring from the mean of the draws is what makes 2000 of
+    # them enough
+    centre = pooled.mean(axis=0)
+
+    material_rows = []
+    for name, (_material_name, _sigmas, material_cells) in zip(material_names, plans):
+        rows = [row for _oxide, _sigma, row in material_cells]
+        if not rows or not variance > 0:
+            first_order = total = 0.0
+        else:
+            mixed = draws_a.copy()
+            mixed[:, rows] = draws_b[:, rows]
+            _umf_mixed, scaled_mixed = scaled_umf(mixed)
+            first_order = float(((scaled_b - centre) * (scaled_mixed - scaled_a)).mean(axis=0).sum()
+                                / variance)
+            total = float(0.5 * ((scaled_a - scaled_mixed) ** 2).mean(axis=0).sum() / variance)
+        material_rows.append({"material": name, "first_order": first_order, "total": total})
+
+    total_effects = sum(row["total"] for row in material_rows)
+    for row in material_rows:
+        row["share"] = round(row["total"] / total_effects, 4) if total_effects > 0 else 0.0
+        row["first_order"] = round(row["first_order"], 4)
+        row["total"] = round(row["total"], 4)
+    material_rows.sort(key=lambda row: row["share"], reverse=True)
+
+    bands = {}
+    percentiles = np.percentile(umf_a, MONTE_CARLO_PERCENTILES, axis=0)
+    for position, oxide in enumerate(result_oxides):
+        band = {f"p{percentile}": round(float(percentiles[index, position]), 5)
+                for index, percentile in enumerate(MONTE_CARLO_PERCENTILES)}
+        band["mean"] = round(float(umf_a[:, position].mean()), 5)
+        band["std"] = round(float(umf_a[:, position].std()), 5)
+        bands[oxide] = band
+
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": samples,
+        "seed": seed,
+        "evaluations": samples * (len(material_names) + 2),
+        "percentiles": list(MONTE_CARLO_PERCENTILES),
+        "bands": bands,
+        "by_material": material_rows,
+        # Draws of the caller's count per second, Sobol evaluations included,
+        # which is what sizing "samples" for an interactive caller needs
+        "samples_per_second": round(samples / elapsed, 1) if elapsed > 0 else None,
+        "elapsed_ms": round(elapsed * 1000.0, 2),
+    }
+
+
 def _empty_result(warnings, error, message):
     return {
         "umf": {},
@@ -591,7 +821,8 @@ def _empty_result(warnings, error, message):
     }
 
 
-def recipe_sensitivity(recipe, materials, tolerances=None):
+def recipe_sensitivity(recipe, materials, tolerances=None, mode=MODE_LINEAR,
+                       samples=MONTE_CARLO_SAMPLES, seed=0):
     """
     Rank materials by their contribution to the spread of the recipe UMF
 
@@ -604,6 +835,11 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
             answer, so a hand built dictionary carrying none is taken at face
             value on that point. Whether the sigmas actually did anything is not
             taken on trust from anybody: it is read off the rows below.
+        mode: one of SENSITIVITY_MODES. "monte_carlo" adds the "monte_carlo"
+            block below to the linear answer
+        samples: draws of the Monte Carlo mode, at least MONTE_CARLO_MIN_SAMPLES
+        seed: seed of the Monte Carlo generator; the same seed gives the same
+            block, None draws a fresh one
 
     Returns:
         {
@@ -622,12 +858,35 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
         finite range (NONFINITE_CONTRIBUTION_WARNING). Every number of the
         result is finite: an overflow anywhere is answered with the
         "nonfinite_result" error instead.
+
+        mode="monte_carlo" adds, see _monte_carlo:
+          "monte_carlo": {
+            "samples", "seed", "evaluations",
+            "percentiles": [5, 50, 95],
+            "bands": {oxide: {"p5", "p50", "p95", "mean", "std"}},
+            "by_material": [{"material", "first_order", "total", "share"}, ...],
+            "samples_per_second", "elapsed_ms"
+          }
+        A mode or a sample count that is not one is the "invalid_parameter"
+        error.
     """
+    warnings = []
+
+    if mode not in SENSITIVITY_MODES:
+        return _empty_result(warnings, "invalid_parameter",
+                             f"unknown mode '{mode}', expected one of: {', '.join(SENSITIVITY_MODES)}")
+    if mode == MODE_MONTE_CARLO and (isinstance(samples, bool) or not isinstance(samples, int)
+                                     or samples < MONTE_CARLO_MIN_SAMPLES):
+        return _empty_result(warnings, "invalid_parameter",
+                             f"samples must be an integer of at least {MONTE_CARLO_MIN_SAMPLES}, "
+                             f"got {samples!r}")
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+        return _empty_result(warnings, "invalid_parameter",
+                             f"seed must be a non-negative integer or null, got {seed!r}")
+
     if tolerances is None:
         tolerances = load_tolerances()
 
-    warnings = []
-
     # What the file dropped on the way in. Not a verdict on the answer - most of
     # the ranking usually still stands - but the dropped part changed the numbers
     # and cannot stay silent
@@ -735,9 +994,6 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
     result_oxides = list(base_umf.keys())
     scales = {oxide: max(base_umf[oxide], OXIDE_SCALE_FLOOR) for oxide in result_oxides}
 
-    # Accumulated squared response per result oxide, over every perturbation
-    variance = {oxide: 0.0 for oxide in result_oxides}
-
     # Every sigma that actually entered the variance. Not "does the file contain
     # a sigma" - that question was asked three times and answered wrongly three
     # times - but "what got used", which is the thing the answer rests on and
@@ -758,11 +1014,40 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
     # replaces - equality to default_relative - saw 11 of those 103.
     applied_sigmas = set()
 
-    material_rows = []
+    # Every (material, oxide) cell of the recipe moves one entry of the weight
+    # composition, and the UMF is a ratio of linear functions of that entry, so
+    # the response to each cell has a closed form (see _cell_responses) - one
+    # array expression for all of them instead of one weights_to_umf per cell.
+    plans = []
+    cells = []
     for material_name, material, amount in used:
         sigmas = material_sigma(material, tolerances)
         formula = material.get('formula') or {}
+        material_cells = []
+        for oxide, sigma in sigmas.items():
+            if oxide not in molar_masses:
+                # An oxide missing from molar_masses.json never reaches the UMF,
+                # so perturbing it provably changes nothing
+                continue
+
+            # Only one cell of the analysis moves, so only one entry of the
+            # weight composition changes: A[i][j] * sigma * (percent / 100).
+            delta_weight = float(formula[oxide]) * sigma * (amount / 100.0)
+            material_cells.append((oxide, sigma, len(cells)))
+            cells.append((oxide, delta_weight))
+        plans.append((material_name, sigmas, material_cells))
+
+    deltas = _cell_responses(base_composition, result_oxides, cells, molar_masses)
+
+    # The squared responses, raw for the spread of each oxide and scaled for the
+    # ranking, over every cell at once
+    with np.errstate(invalid='ignore', over='ignore'):
+        variance = dict(zip(result_oxides, (deltas * deltas).sum(axis=0).tolist()))
+        scaled_squares = (deltas / np.array([scales[oxide] for oxide in result_oxides])) ** 2
+        cell_contributions = scaled_squares.sum(axis=1)
 
+    material_rows = []
+    for material_name, sigmas, material_cells in plans:
         if not sigmas:
             # An empty formula is a legal record in this database (pigments,
             # SiC, CMC, water, gypsum): it carries no oxides, so it cannot move
@@ -776,42 +1061,15 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
             })
             continue
 
-        total_contribution = 0.0
-        best_oxide = None
-        best_oxide_contribution = -1.0
-        best_oxide_sigma = None
-        per_result_oxide = {oxide: 0.0 for oxide in result_oxides}
-
-        for oxide, sigma in sigmas.items():
-            if oxide not in molar_masses:
-                # An oxide missing from molar_masses.json never reaches the UMF,
-                # so perturbing it provably changes nothing
-                continue
-
-            applied_sigmas.add(sigma)
+        rows = [row for _oxide, _sigma, row in material_cells]
+        applied_sigmas.update(sigma for _oxide, sigma, _row in material_cells)
 
-            # Only one cell of the analysis moves, so only one entry of the
-            # weight composition changes: A[i][j] * sigma * (percent / 100).
-            delta_weight = float(formula[oxide]) * sigma * (amount / 100.0)
-            perturbed_composition = dict(base_composition)
-            perturbed_composition[oxide] = perturbed_composition.get(oxide, 0.0) + delta_weight
-
-            perturbed_umf = weights_to_umf(perturbed_composition, round_digits=None)
-
-            oxide_contribution = 0.0
-            for result_oxide in result_oxides:
-                delta = perturbed_umf.get(result_oxide, 0.0) - base_umf[result_oxide]
-                variance[result_oxide] += delta * delta
-                scaled = delta / scales[result_oxide]
-                oxide_contribution += scaled * scaled
-                per_result_oxide[result_oxide] += scaled * scaled
-
-            total_contribution += oxide_contribution
-
-            if oxide_contribution > best_oxide_contribution:
-                best_oxide_contribution = oxide_contribution
-                best_oxide = oxide
-                best_oxide_sigma = sigma
+        per_result_oxide = dict(zip(result_oxides, scaled_squares[rows].sum(axis=0).tolist()))
+        total_contribution = float(cell_contributions[rows].sum()) if rows else 0.0
+        # The first strongest cell, as a strict ">" over them in order picks it
+        best_oxide, best_oxide_sigma = (None, None)
+        if rows:
+            best_oxide, best_oxide_sigma, _row = material_cells[int(np.argmax(cell_contributions[rows]))]
 
         material_rows.append({
             "material": material_name,
@@ -872,6 +1130,11 @@ def recipe_sensitivity(recipe, materials, tolerances=None):
         "error": None,
     }
 
+    if mode == MODE_MONTE_CARLO:
+        result["monte_carlo"] = _monte_carlo(base_composition, result_oxides, scales, plans, cells,
+                                             [name for name, _material, _amount in used],
+                                             molar_masses, samples, seed)
+
     # The invariant, checked where it can actually be checked. Every guard above
     # sits on an input and none of them can promise this one: the response is
     # squared, summed, divided and rooted on the way here, and any of those steps
@@ -1029,7 +1292,20 @@ def _top_affected(per_result_oxide, total_contribution):
         # is 0.0 and its via_oxide is null
         return []
 
-    ranked = sorted(per_result_oxide.items(), key=lambda item: item[1], reverse=True)
+    # A material of the unity basis rescales every oxide above the floor by the
+    # same factor, so their contributions tie EXACTLY in the arithmetic of the
+    # model and only the rounding of the floats told them apart - which oxide
+    # was named then depended on the order the sums happened to be taken in.
+    # Contributions within AFFECTS_TIE of the leader of their run are one tie,
+    # and a tie keeps the order of the formula.
+    order = {oxide: index for index, oxide in enumerate(per_result_oxide)}
+    ranked = []
+    for oxide, contribution in sorted(per_result_oxide.items(), key=lambda item: item[1], reverse=True):
+        if ranked and ranked[-1][0][1] - contribution <= AFFECTS_TIE * total_contribution:
+            ranked[-1].append((oxide, contribution))
+        else:
+            ranked.append([(oxide, contribution)])
+    ranked = [item for run in ranked for item in sorted(run, key=lambda item: order[item[0]])]
 
     affected = []
     for oxide, contribution in ranked[:AFFECTS_LIMIT]:
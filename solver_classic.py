@@ -11,12 +11,18 @@
 
 import json
 import argparse
+import itertools
 import logging
+import math
 import numpy as np
 from scipy.optimize import nnls
 
 from common import (
+    NNLS_TOLERANCE_FACTOR,
     ClassificationError,
+    SearchCancelled,
+    nnls_active_set,
+    nnls_batch,
     umf_to_weights,
     weights_to_umf,
     resolve_material_pool,
@@ -47,6 +53,62 @@ def create_oxide_matrix(materials, target_oxides):
     
     return oxide_matrix, material_names
 
+# Smallest pivot of the QR factorization, relative to the largest column, at
+# which a material matrix still counts as having full column rank. A warm start
+# is only taken below this line; see solve_recipe(warm_start=...)
+FULL_RANK_PIVOT = 1e-8
+
+# The same test for handing a matrix to common.nnls_batch, which is stricter
+# because the batch works on the normal equations and so squares the condition
+# number: a pivot of 1e-8 lets through a matrix whose Gram matrix is singular to
+# machine precision, and on near-collinear sets (two columns 1e-7 apart, the
+# target in their cone) the batch was measured returning recipes tens of
+# percent away from scipy's. At 1e-4 the Gram matrix keeps about eight digits,
+# and the same sets just above the line agreed with scipy to 1e-7 of the
+# largest weight, below the 1e-6 nnls_recipe reads as a material at all
+BATCH_RANK_PIVOT = 1e-4
+
+
+def _full_column_rank(matrix):
+    """
+    Whether the NNLS problem over this matrix has exactly one optimum
+
+    With full column rank the least squares objective is strictly convex and
+    every NNLS algorithm, whatever it starts from, ends on the same recipe. Below
+    full rank a whole face of recipes fits equally well, and which vertex of it
+    comes back depends on the path - a warm start from the parent's recipe would
+    return a different, equally good recipe than a cold start, and the search
+    would branch differently for no reason but the route taken.
+    """
+    n_rows, n_columns = matrix.shape
+    if n_columns == 0 or n_columns > n_rows:
+        return False
+    diagonal = np.abs(np.diagonal(np.linalg.qr(matrix, mode='r')))
+    return bool(diagonal.min() > FULL_RANK_PIVOT * np.linalg.norm(matrix, axis=0).max())
+
+
+def full_column_ranks(matrices, pivot=FULL_RANK_PIVOT):
+    """
+    _full_column_rank of every matrix of a list, one stacked QR per shape;
+    pivot is the line of FULL_RANK_PIVOT, BATCH_RANK_PIVOT for a stack bound
+    for common.nnls_batch
+
+    Returns a boolean array, one entry per matrix
+    """
+    ranks = np.zeros(len(matrices), dtype=bool)
+    by_shape = {}
+    for position, matrix in enumerate(matrices):
+        by_shape.setdefault(matrix.shape, []).append(position)
+
+    for (n_rows, n_columns), positions in by_shape.items():
+        if n_columns == 0 or n_columns > n_rows:
+            continue
+        stack = np.stack([matrices[position] for position in positions])
+        diagonal = np.abs(np.diagonal(np.linalg.qr(stack, mode='r'), axis1=1, axis2=2))
+        ranks[positions] = diagonal.min(axis=1) > pivot * np.linalg.norm(stack, axis=1).max(axis=1)
+    return ranks
+
+
 # Error between the target and the actual UMF
 def calculate_umf_error(target_umf, actual_umf):
     # Only oxides present in the target UMF are taken into account
@@ -59,18 +121,45 @@ def calculate_umf_error(target_umf, actual_umf):
     
     return np.sqrt(squared_error)
 
+def material_index(materials):
+    """
+    {name: material} over a list of material records
+
+    The first record of a name wins, which is the one the linear scan that used
+    to live in calculate_recipe_composition found. Build it once and hand it to
+    every call that resolves recipes against the same list.
+    """
+    index = {}
+    for material in materials:
+        index.setdefault(material['name'], material)
+    return index
+
+
 # Actual composition in weight percent, derived from the recipe
-def calculate_recipe_composition(materials, recipe):
+def calculate_recipe_composition(materials, recipe, index=None):
+    """
+    Weight composition of a recipe: the sum of every material's formula scaled
+    by its percentage
+
+    Args:
+        materials: list of material records the recipe names are resolved in
+        recipe: {material name: percent}; a name missing from materials is
+            skipped
+        index: optional material_index(materials), for a caller resolving many
+            recipes against one list. Without it the index is built here, which
+            is one pass over the list instead of one pass per recipe entry
+
+    Returns:
+        {oxide: weight}, oxides in the order they first appear in the recipe's
+        formulas
+    """
+    if index is None:
+        index = material_index(materials)
+
     composition = {}
 
     for material_name, percentage in recipe.items():
-        # Look the material up by name
-        material = None
-        for m in materials:
-            if m['name'] == material_name:
-                material = m
-                break
-        
+        material = index.get(material_name)
         if material is None:
             continue
         
@@ -82,9 +171,135 @@ def calculate_recipe_composition(materials, recipe):
     
     return composition
 
+
+def compile_compositions(materials):
+    """
+    The materials as one matrix, for recipe_compositions()
+
+    Compile once and reuse it: the compile is a pass over every formula (0.36 ms
+    on the 216-material catalogue) and is what a batch pays back. Against a
+    material_index built once per batch, a precompiled matrix over 100 recipes
+    was measured at 0.42 ms on the catalogue and 0.20 ms on the inventory,
+    where the scalar loop takes 0.78 and 0.65. One recipe at a time over a
+    wide list stays cheaper through calculate_recipe_composition, which only
+    touches the materials the recipe names - the solvers and the API formatter
+    use it
+
+    Args:
+        materials: list of material records
+
+    Returns:
+        dictionary:
+            matrix   (oxides x materials) array of formula values
+            oxides   row names, every key any formula carries
+            columns  {name: column}, first record of a name wins
+            rows     per column, the row of each of its formula keys in the
+                     formula's own order - which keys a composition carries,
+                     and in which order, is read from here
+    """
+    oxides = []
+    oxide_rows = {}
+    columns = {}
+    rows = []
+    values = []
+    for material in materials:
+        if material['name'] in columns:
+            continue
+        columns[material['name']] = len(rows)
+        material_rows = []
+        for oxide, content in (material.get('formula') or {}).items():
+            if oxide not in oxide_rows:
+                oxide_rows[oxide] = len(oxides)
+                oxides.append(oxide)
+            material_rows.append(oxide_rows[oxide])
+            values.append((oxide_rows[oxide], len(rows), content))
+        rows.append(tuple(material_rows))
+
+    matrix = np.zeros((len(oxides), len(rows)))
+    for row, column, content in values:
+        matrix[row, column] = content
+
+    return {'matrix': matrix, 'oxides': tuple(oxides), 'columns': columns, 'rows': rows}
+
+
+def recipe_compositions(compiled, recipes):
+    """
+    calculate_recipe_composition for many recipes at once: one matrix product
+
+    Args:
+        compiled: compile_compositions() of the materials the recipes name
+        recipes: list of {material name: percent}
+
+    Returns:
+        list of {oxide: weight}, one per recipe, with the keys and the key order
+        calculate_recipe_composition gives. The values agree with it to the
+        rounding of the summation order, about 1e-15 relative: the product adds
+        the materials up in whatever order the BLAS kernel picks, the loop adds
+        them in recipe order
+    """
+    columns = compiled['columns']
+    weights = np.zeros((len(recipes), len(compiled['rows'])))
+    for position, recipe in enumerate(recipes):
+        for name, percentage in recipe.items():
+            column = columns.get(name)
+            if column is not None:
+                weights[position, column] += percentage / 100.0
+
+    products = weights @ compiled['matrix'].T
+
+    compositions = []
+    for position, recipe in enumerate(recipes):
+        order = {}
+        for name in recipe:
+            column = columns.get(name)
+            if column is not None:
+                for row in compiled['rows'][column]:
+                    order.setdefault(row, None)
+        compositions.append({compiled['oxides'][row]: float(products[position, row]) for row in order})
+
+    return compositions
+
+
+# Raw NNLS weights to a recipe
+def nnls_recipe(x, material_names):
+    """
+    Turn the raw NNLS weights of one fit into a recipe
+
+    The one place that says what a fit's numbers mean as a recipe: weights below
+    1e-6 are solver noise, the rest is normalized to 100% and a material under
+    0.1% is left out. solve_recipe uses it, and so does every caller that gets
+    its weights some other way (solver_iterative's batched leave-one-out fits),
+    so that the same weights cannot become two different recipes.
+
+    Args:
+        x: NNLS solution, one entry per material name
+        material_names: names of the matrix columns, in the order of x
+
+    Returns:
+        (x, recipe): the normalized weights, a new array, and the recipe as
+        {material: percent} in column order
+    """
+    x = np.array(x, dtype=float)
+
+    # A solution too close to zero means the material is not used
+    x[x < 1e-6] = 0
+
+    # Normalize to 100%
+    if np.sum(x) > 0:
+        x = 100 * x / np.sum(x)
+
+    # Build the recipe as a {material: percent} dictionary
+    recipe = {}
+    for i, name in enumerate(material_names):
+        if x[i] > 0.1:  # Ignore materials weighing less than 0.1%
+            recipe[name] = round(x[i], 2)
+
+    return x, recipe
+
+
 # Non-negative least squares solution
 def solve_recipe(oxide_matrix, target_umf, material_names, available_materials=None,
-                 target_weights=None, row_weights=None):
+                 target_weights=None, row_weights=None, warm_start=None, fitted=None):
     """
     Solve one NNLS problem for a target UMF over the given oxide matrix
 
@@ -118,6 +333,21 @@ def solve_recipe(oxide_matrix, target_umf, material_names, available_materials=N
             Only the NNLS fit is weighted. The composition estimate below reads
             the UNSCALED oxide_matrix, because it answers "what does this recipe
             contain", a question the weighting has nothing to do with.
+        warm_start: names of the columns expected to be positive in the answer,
+            typically the recipe of a material set this one differs from by a
+            single column. Given, the fit runs common.nnls_active_set seeded
+            with them instead of scipy.optimize.nnls from zero; names that are
+            not columns of the matrix are ignored. The seed only shortens the
+            way to the optimum, it does not change which optimum is reached:
+            a matrix without full column rank, where it could, is solved cold
+            regardless. None, the default, is the plain cold solve. When a
+            seed was given the result carries 'warm_started', saying which of
+            the two actually ran
+        fitted: the raw NNLS weights of this very fit when the caller already
+            has them - find_multiple_solutions fits a whole chunk of subsets
+            in one common.nnls_batch call while NNLS_BATCHED is on (see
+            _batched_fits). The fit is skipped and everything after it runs
+            as usual; warm_start is ignored
 
     Returns:
         dictionary describing the solution, or {'error': ..., 'recipe': {}} when
@@ -158,20 +388,17 @@ def solve_recipe(oxide_matrix, target_umf, material_names, available_materials=N
 
     try:
         # Solve the NNLS problem
-        x, _residual = nnls(fit_matrix, fit_weights)
-
-        # A solution too close to zero means the material is not used
-        x[x < 1e-6] = 0
-
-        # Normalize to 100%
-        if np.sum(x) > 0:
-            x = 100 * x / np.sum(x)
+        warm_started = fitted is None and warm_start is not None and _full_column_rank(fit_matrix)
+        if fitted is not None:
+            x = np.asarray(fitted, dtype=float)
+        elif warm_started:
+            columns = {name: index for index, name in enumerate(material_names)}
+            passive = [columns[name] for name in warm_start if name in columns]
+            x, _residual, _pivots = nnls_active_set(fit_matrix, fit_weights, passive)
+        else:
+            x, _residual = nnls(fit_matrix, fit_weights)
 
-        # Build the recipe as a {material: percent} dictionary
-        recipe = {}
-        for i, name in enumerate(material_names):
-            if x[i] > 0.1:  # Ignore materials weighing less than 0.1%
-                recipe[name] = round(x[i], 2)
+        x, recipe = nnls_recipe(x, material_names)
 
         # Without a material list the actual composition cannot be computed exactly
         if not available_materials:
@@ -195,7 +422,7 @@ def solve_recipe(oxide_matrix, target_umf, material_names, available_materials=N
         # Error between the target and the actual UMF
         error = calculate_umf_error(target_umf, actual_umf)
         
-        return {
+        solution = {
             'recipe': recipe,
             'error': round(error, 4),
             'target_composition': target_umf,
@@ -203,6 +430,10 @@ def solve_recipe(oxide_matrix, target_umf, material_names, available_materials=N
             'weight_composition': {oxide: round(value, 2) for oxide, value in composition.items()},
             'materials_count': len(recipe)  # Number of materials in the solution
         }
+        # Only a caller that asked for a warm start is told whether it got one
+        if warm_start is not None:
+            solution['warm_started'] = warm_started
+        return solution
 
     except ClassificationError:
         # Corrupt reference data, not a degenerate material set. The broad
@@ -294,8 +525,244 @@ def solve_glaze_recipe(target_umf, inventory_data=None, materials=None):
     return solution
 
 
+# find_multiple_solutions() enumerates its material subsets out of this many of
+# the most relevant materials (see _enumeration_order), which is the whole of
+# any inventory the size of the workshop one. The subsets of a pool are walked in
+# a fixed order that spreads them over the pool the way random draws used to,
+# see _covering_subsets. Spread over a 216 material catalogue, that is exactly
+# what the random search did and why it did poorly there: 6 of 12 synthetic
+# catalogue recipes came back exact from it, 9 of 12 from a pool of 20.
+SUBSET_POOL_SIZE = 20
+
+# The stride of that order, as a fraction of the number of subsets: the step
+# that keeps consecutive subsets furthest apart
+GOLDEN_RATIO = (1 + 5 ** 0.5) / 2
+
+# Candidates looked at per subset size before the enumeration of that size
+# gives up. A candidate that fails the tests of _covering_subsets costs an
+# unranking and a few bit operations, a few microseconds, but on the catalogue
+# most of them fail: 310 thousand candidates for 13 thousand subsets solved over
+# 12 recipes, some 3 thousand per size. The cap keeps a target nothing in the
+# pool can cover from walking all 185 thousand subsets of a size.
+SUBSET_SCAN_LIMIT = 20000
+
+# Whether find_multiple_solutions fits each chunk of subsets - one subset size
+# of one pass, up to 200 of them - in one common.nnls_batch call instead of one
+# scipy.optimize.nnls call per subset. Same answers either way.
+#
+# OFF, BECAUSE IT WAS MEASURED. A chunk is 57 subsets on the 19 material
+# inventory and 30 to 200 on the catalogue, and at that size the batch does
+# 20 to 45 thousand fits a second where scipy does about 60 thousand (see
+# bench/nnls.py; the batch only catches up around a thousand problems a stack).
+# And the fit is the small part of a subset here: solve_recipe still builds the
+# composition and the UMF of every one of them. Over the 11 reference recipes
+# the switch moved the inventory searches from 1.26 s to 1.40 s and the
+# catalogue ones from 4.81 s to 4.79 s, same answers. Kept for a pool large
+# enough to fill the stacks.
+NNLS_BATCHED = False
+
+
+def _batched_fits(oxide_matrix, subsets, target_umf, target_weights):
+    """
+    The NNLS weights solve_recipe would compute for each column subset of
+    oxide_matrix, all in one common.nnls_batch call
+
+    The subsets of a chunk all have the same size, so the stack is the matrix
+    indexed by all of them at once and nothing needs padding. Only a subset
+    clear of BATCH_RANK_PIVOT is batched: there the optimum is unique and the
+    normal equations of the batch still land on scipy's recipe, while below
+    full rank a face of recipes fits equally well and the two algorithms may
+    return different vertices of it, and near it the squared condition number
+    of the batch does the same.
+
+    Returns:
+        one entry per subset: its weights in column order, or None where the
+        subset is left to solve_recipe's own fit
+    """
+    weights_array = np.array([target_weights.get(oxide, 0.0) for oxide in target_umf])
+    stack = oxide_matrix[:, np.asarray(subsets, dtype=int)].transpose(1, 0, 2)
+    batched = np.flatnonzero(full_column_ranks(stack, BATCH_RANK_PIVOT))
+
+    fits = [None] * len(subsets)
+    if batched.size:
+        x, _residuals = nnls_batch(stack[batched], weights_array)
+        for position, weights in zip(batched, x):
+            fits[position] = weights
+    return fits
+
+
+def _enumeration_order(oxide_matrix, material_names, target_weights, target_oxides, base_solution):
+    """
+    Columns by relevance to the target: the materials of the whole inventory
+    solution by decreasing share, then the rest by how closely their analysis
+    points the way of the target's, ties in inventory order
+
+    The closeness is the cosine between a material's column and the target's
+    weight composition, both over the target oxides. Only a sort of the
+    columns, so the order is still fixed for a given inventory and target.
+    """
+    shares = base_solution.get('recipe') or {}
+    target_vector = np.array([target_weights.get(oxide, 0.0) for oxide in target_oxides])
+    norms = np.linalg.norm(oxide_matrix, axis=0) * np.linalg.norm(target_vector)
+    closeness = (oxide_matrix.T @ target_vector) / np.where(norms > 0.0, norms, 1.0)
+    return sorted(range(len(material_names)),
+                  key=lambda column: (-shares.get(material_names[column], 0.0), -closeness[column], column))
+
+
+def _subset_at(rank, n_items, size):
+    """The subset of range(n_items) at this rank of the lexicographic order of all subsets of size"""
+    subset = []
+    item = 0
+    while size:
+        below = math.comb(n_items - item - 1, size - 1)
+        if rank < below:
+            subset.append(item)
+            size -= 1
+        else:
+            rank -= below
+        item += 1
+    return subset
+
+
+def _covering_subsets(oxide_matrix, pool, size, required):
+    """
+    The subsets of one size of pool that are worth an NNLS, each exactly once,
+    in a fixed order spread over the whole pool
+
+    The order visits the lexicographic ranks 0, s, 2s, ... modulo the number of
+    subsets, with s coprime to it and close to that number over the golden
+    ratio, so it is a permutation of all of them: exhaustive when the budget of
+    the caller allows, and otherwise as evenly spread over the pool as random
+    draws, without drawing the same subset twice. Walking the subsets
+    lexicographically instead, the budget went on the corner of them sharing the
+    first few materials: on the workshop inventory the best error found got
+    worse than the random search's on 32 of 40 unreachable targets.
+
+    One test comes before any solve, and it drops no subset the caller would
+    keep: each oxide of required that the pool carries at all has to be
+    carried by a material of the subset. Without one the oxide stays at zero
+    and the error is at least its target value, which the caller only requires
+    of oxides above its acceptance threshold.
+
+    A subset holding every material of the base solution is NOT skipped. The
+    NNLS minimizes the weight-space residual while the caller ranks by the UMF
+    error, and over more columns than rank the optimum is not even unique, so
+    such a subset can return a different recipe with a lower error - on
+    targets mixed from the workshop inventory most of them did. Where its fit
+    provably is a solved one's, the lattice of _lattice_masks answers it
+    without a solve.
+
+    At most SUBSET_SCAN_LIMIT candidates are looked at.
+
+    Args:
+        oxide_matrix: full oxide matrix, oxides by materials
+        pool: columns to build the subsets from, see _enumeration_order()
+        size: number of materials in a subset
+        required: row indices of the oxides every subset has to carry
+
+    Yields:
+        lists of column indices, in the order of pool
+    """
+    carried = oxide_matrix[required, :] > 0.0
+    masks = {column: sum(1 << bit for bit in np.flatnonzero(carried[:, column])) for column in pool}
+    need = 0
+    for mask in masks.values():
+        need |= mask
+
+    total = math.comb(len(pool), size)
+    stride = max(1, round(total / GOLDEN_RATIO))
+    while math.gcd(stride, total) != 1:
+        stride += 1
+
+    for step in range(min(total, SUBSET_SCAN_LIMIT)):
+        subset = [pool[position] for position in _subset_at(step * stride % total, len(pool), size)]
+        covered = 0
+        for column in subset:
+            covered |= masks[column]
+        if covered != need:
+            continue
+        yield subset
+
+
+# The bit of each position of the pool in the masks of _lattice_masks
+POOL_BITS = np.left_shift(1, np.arange(SUBSET_POOL_SIZE, dtype=np.int64))
+
+# Whether find_multiple_solutions answers a subset from the subsets it has
+# already solved when their fit provably is its fit (see _lattice_masks), instead
+# of running the NNLS and the composition again. Same answers either way; the
+# switch is there to measure the saving and to check that claim.
+#
+# ON, AND IT IS A TRADE. Looking a subset up costs about 10 us and recording a
+# solved one about 20 us, against some 320 us for the NNLS and the composition
+# a hit saves, so the lattice pays once more than about one subset in ten is
+# answered from it. Over the 11 reference recipes of the tests that is the
+# catalogue and not the workshop inventory: on the 216 material catalogue 2133
+# of 11239 subsets were answered (19%), 0.3 s of bookkeeping for 0.7 s of fits,
+# so a search of 410 ms loses some 35 ms; on the 19 material inventory only 76
+# of 3085 (2.5%), and a search of 128 ms gains some 7 ms. Wall clock agrees
+# within its noise here, which is about 10%. Over 25 more synthetic targets the
+# shares were 14% and 2.7%, with the same answers on all 36 as with the
+# switch off.
+SKIP_DOMINATED = True
+
+
+def _lattice_masks(pool_matrix, bits, subset_matrix, weights_array, x, dual_tolerance):
+    """
+    What the fit of one solved subset proves about the other subsets of the
+    pool, as two bitmasks over it (bit i stands for the column pool[i]):
+
+    - support: the columns the fit x uses
+    - allowed: the support and every column of the pool whose dual
+      a_j^T (b - A x) is not above dual_tolerance, i.e. that cannot lower the
+      residual any further
+
+    x is then the NNLS optimum of every subset U with support <= U <= allowed:
+    it is feasible there, and each column of U it leaves at zero has a
+    non-positive dual, which is all the KKT conditions of U ask. Over a U of
+    full column rank that optimum is unique, so U's own NNLS would return x and
+    the recipe of U is the recipe of the subset that was solved. It covers both
+    cases that are worth an NNLS call: a subset of a solved set missing only
+    columns its fit zeroed, and a superset of a set that hit the target
+    exactly - with no residual left every dual is zero.
+
+    Args:
+        pool_matrix: the columns of the pool, in pool order
+        bits: the bit of each column of the subset, in its order
+        subset_matrix, x: the matrix of the subset and its fit
+    """
+    support = 0
+    for bit, weight in zip(bits, x):
+        if weight > 0.0:
+            support |= bit
+    dual = pool_matrix.T @ (weights_array - subset_matrix @ x)
+    allowed = support | int((dual <= dual_tolerance) @ POOL_BITS[:len(dual)])
+    return support, allowed
+
+
+def _dominating_solution(lattice, mask):
+    """The solution of a solved subset whose fit is optimal for the subset mask, or None"""
+    count = len(lattice['solutions'])
+    if not count:
+        return None
+    # The columns of the support outside the mask and those of the mask outside
+    # allowed ('excluded' is the complement of allowed); both empty is a hit
+    outside = (lattice['support'][:count] & ~mask) | (lattice['excluded'][:count] & mask)
+    first = int(outside.argmin())
+    return lattice['solutions'][first] if outside[first] == 0 else None
+
+
+def _record_solution(lattice, support, allowed, solution):
+    count = len(lattice['solutions'])
+    if count == len(lattice['support']):
+        for key in ('support', 'excluded'):
+            lattice[key] = np.concatenate((lattice[key], np.zeros_like(lattice[key])))
+    lattice['support'][count] = support
+    lattice['excluded'][count] = ~allowed
+    lattice['solutions'].append(solution)
+
+
 # Search for several solutions built from different material subsets
-def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, error_tolerance=1, logging=True, inventory_data=None, seed: int | None = 0, materials=None):
+def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, error_tolerance=1, logging=True, inventory_data=None, seed: int | None = 0, materials=None, cancel=None):
     """
     Find several solutions for a given target UMF formula
 
@@ -319,21 +786,29 @@ def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, err
         error_tolerance: acceptable error increase for solutions with fewer materials
         logging: enable logging of the search process
         inventory_data: optional inventory data instead of the default inventory
-        seed: seed of the random generator drawing the material subsets; the
-            default makes the search reproducible, seed=None makes it
-            non-deterministic
+        seed: no longer used. The material subsets used to be drawn from a
+            generator seeded with it; they are enumerated in a fixed order now
+            (see _covering_subsets), so the answer does not depend on it. Still
+            accepted so that the callers passing it keep working
         materials: optional material records to use as the database, same shape
             as database/materials.json entries. Meant for the tests and for
             callers carrying their own catalogue; when it is given together with
             inventory_data=None it bypasses the inventory resolution and every
             injected material is available. See common.resolve_material_pool()
+        cancel: optional threading.Event (anything with is_set()); once it is
+            set the search stops at the next material subset and raises
+            common.SearchCancelled. For /api/jobs, which cancels on DELETE
 
     Returns:
-        List of solutions sorted by preference
+        List of solutions sorted by preference. Every solution carries
+        'nnls_solves', {'solved': n, 'avoided': n}, the same on all of them:
+        the NNLS fits the search ran, the base solution's included, and the
+        subsets it answered from the ones already solved instead (see
+        SKIP_DOMINATED)
     """
-    # A private generator, not the global numpy one: pinning np.random from the
-    # outside must not be able to change what this search does
-    rng = np.random.default_rng(seed)
+    def check_cancelled():
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled(f"search cancelled after {tried} subsets")
 
     materials, inventory = resolve_material_pool(materials, inventory_data)
 
@@ -364,11 +839,99 @@ def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, err
 
     # Look for alternative solutions by varying the set of materials used
     n_materials = len(available_materials)
-    used_combinations = set()
 
     # Minimum number of materials worth trying
     min_required = max(3, len(target_oxides) - 3)  # Leave some room when choosing the minimum
 
+    # The subsets are enumerated rather than drawn at random. Random draws spent
+    # the attempts below on subsets already tried and on subsets that could not
+    # be kept whatever the NNLS made of them, more of them the larger the
+    # inventory. Now every attempt is an NNLS on a distinct subset of the most
+    # relevant materials, and the answer is the same on every run without a
+    # seed. One enumeration per size, shared by both passes below, so the second
+    # one carries on where the first stopped.
+    #
+    # Which subsets cannot be kept is exact and not a heuristic: a subset with no
+    # material carrying an oxide leaves it at zero, so its error is at least the
+    # target value of that oxide. An oxide whose target is at or above the most
+    # lenient acceptance threshold below - 3x the base error in the second pass,
+    # 1 + the widest tolerance in the first - therefore has to be carried by
+    # every subset worth solving. Trace oxides under that line are not required,
+    # the old search kept subsets without them and so does this one.
+    pool = _enumeration_order(full_oxide_matrix, material_names, target_weights, target_oxides,
+                              base_solution)[:SUBSET_POOL_SIZE]
+    base_error = base_solution.get('error')
+    if isinstance(base_error, (int, float)) and np.isfinite(base_error) and base_solution['recipe']:
+        loosest_factor = 3.0
+        if min_materials:
+            loosest_factor = max(loosest_factor,
+                                 1 + error_tolerance * (1 + (max(6, n_materials) - min_required) * 0.05))
+        required = [row for row, oxide in enumerate(target_oxides)
+                    if target_umf[oxide] >= base_error * loosest_factor]
+    else:
+        required = []
+    enumerations = {}
+    tried = 0
+
+    # The lattice of the subsets solved so far, see _lattice_masks: per solved
+    # subset the bitmasks of what its fit proves, and its solution. 'solved'
+    # counts the NNLS calls made, the base solution's included, 'avoided' the
+    # subsets answered from the lattice instead
+    weights_array = np.array([target_weights.get(oxide, 0.0) for oxide in target_oxides])
+    dual_tolerance = (NNLS_TOLERANCE_FACTOR * np.finfo(float).eps * max(full_oxide_matrix.shape)
+                      * np.abs(full_oxide_matrix).sum(axis=0).max(initial=0.0)
+                      * max(np.linalg.norm(weights_array), 1.0))
+    lattice = {'support': np.zeros(64, dtype=np.int64), 'excluded': np.zeros(64, dtype=np.int64),
+               'solutions': []}
+    counts = {'solved': 1, 'avoided': 0}
+    pool_bits = {column: 1 << position for position, column in enumerate(pool)}
+    pool_matrix = full_oxide_matrix[:, pool]
+
+    def solve_subset(subset_indices, fitted, full_rank=None):
+        if SKIP_DOMINATED:
+            bits = [pool_bits[column] for column in subset_indices]
+            mask = sum(bits)
+            known = _dominating_solution(lattice, mask)
+            if known is not None:
+                if full_rank is None:
+                    full_rank = np.linalg.matrix_rank(full_oxide_matrix[:, subset_indices]) == len(subset_indices)
+                if full_rank:
+                    counts['avoided'] += 1
+                    return dict(known)
+
+        # Build the submatrix for the selected materials
+        subset_matrix = full_oxide_matrix[:, subset_indices]
+        subset_names = [material_names[i] for i in subset_indices]
+        subset_materials = [available_materials[i] for i in subset_indices]
+
+        # The fit is made here rather than inside solve_recipe because the
+        # lattice needs its raw weights; a fit that fails is left to
+        # solve_recipe, which reports it as a subset without a solution
+        if fitted is None:
+            try:
+                fitted, _residual = nnls(subset_matrix, weights_array)
+            except (RuntimeError, ValueError):
+                fitted = None
+        counts['solved'] += 1
+
+        solution = solve_recipe(subset_matrix, target_umf, subset_names, subset_materials,
+                                target_weights, fitted=fitted)
+        if SKIP_DOMINATED and fitted is not None and 'actual_composition' in solution:
+            _record_solution(lattice, *_lattice_masks(pool_matrix, bits, subset_matrix, weights_array,
+                                                      fitted, dual_tolerance),
+                             solution)
+        return solution
+
+    def subsets(size, limit):
+        if size not in enumerations:
+            enumerations[size] = _covering_subsets(full_oxide_matrix, pool, size, required)
+        return itertools.islice(enumerations[size], limit)
+
+    # Allow a small slack on the rank, and never ask a subset for more rank than
+    # the whole inventory has: a target with oxides the inventory does not carry
+    # used to have every subset of the first pass rejected here
+    min_rank = min(min_required - 1, np.linalg.matrix_rank(full_oxide_matrix))
+
     # Start with the SMALLEST material counts
     if min_materials:
         # Begin with very few materials and increase gradually
@@ -381,27 +944,21 @@ def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, err
             if logging:
                 print(f"Ищем решения с {subset_size} материалами...")
             
-            for _attempt in range(attempts):
-                subset_indices = rng.choice(n_materials, subset_size, replace=False)
-                subset_key = tuple(sorted(subset_indices))
-                
-                if subset_key in used_combinations:
-                    continue
-                
-                used_combinations.add(subset_key)
-                
-                # Build the submatrix for the selected materials
-                subset_matrix = full_oxide_matrix[:, subset_indices]
-                subset_names = [material_names[i] for i in subset_indices]
-                subset_materials = [available_materials[i] for i in subset_indices]
-                
+            chunk = list(subsets(subset_size, attempts))
+            fits = _batched_fits(full_oxide_matrix, chunk, target_umf, target_weights) \
+                if NNLS_BATCHED and chunk else [None] * len(chunk)
+
+            for position, subset_indices in enumerate(chunk):
+                check_cancelled()
+                tried += 1
+
                 # Check the matrix rank (it must not be too low)
-                rank = np.linalg.matrix_rank(subset_matrix)
-                if rank < min_required - 1:  # Allow a small slack on the rank
+                rank = np.linalg.matrix_rank(full_oxide_matrix[:, subset_indices])
+                if rank < min_rank:
                     continue
 
-                solution = solve_recipe(subset_matrix, target_umf, subset_names, subset_materials,
-                                        target_weights)
+                solution = solve_subset(subset_indices, fits[position],
+                                        full_rank=rank == len(subset_indices))
 
                 # Allow a larger error for solutions built from fewer materials:
                 # the fewer the materials, the wider the tolerance
@@ -417,23 +974,16 @@ def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, err
     # If more solutions are still needed, search across varying material counts
     if len(solutions) < max_solutions:
         for subset_size in range(min_required, min(n_materials, 12)):
-            # Plain search over random material subsets
-            for _attempt in range(min(30, n_materials)):
-                subset_indices = rng.choice(n_materials, subset_size, replace=False)
-                subset_key = tuple(sorted(subset_indices))
-                
-                if subset_key in used_combinations:
-                    continue
-                
-                used_combinations.add(subset_key)
-                
-                # Build the submatrix for the selected materials
-                subset_matrix = full_oxide_matrix[:, subset_indices]
-                subset_names = [material_names[i] for i in subset_indices]
-                subset_materials = [available_materials[i] for i in subset_indices]
-                
-                solution = solve_recipe(subset_matrix, target_umf, subset_names, subset_materials,
-                                        target_weights)
+            # Plain search over the next subsets of the enumeration
+            chunk = list(subsets(subset_size, min(30, n_materials)))
+            fits = _batched_fits(full_oxide_matrix, chunk, target_umf, target_weights) \
+                if NNLS_BATCHED and chunk else [None] * len(chunk)
+
+            for position, subset_indices in enumerate(chunk):
+                check_cancelled()
+                tried += 1
+
+                solution = solve_subset(subset_indices, fits[position])
                 
                 # Store the solution if it is acceptable
                 if solution['recipe'] and solution['error'] < base_solution['error'] * 3:
@@ -487,6 +1037,11 @@ def find_multiple_solutions(target_umf, max_solutions=5, min_materials=True, err
             if len(unique_solutions) >= max_solutions:
                 break
 
+    # The same counts on every solution, as the iterative engine reports its own
+    for solution in unique_solutions:
+        solution['nnls_solves'] = dict(counts)
+    logger.debug(f"{counts['solved']} NNLS fits, {counts['avoided']} subsets answered from the lattice")
+
     # Return the requested number of best solutions
     return unique_solutions
 
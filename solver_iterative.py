@@ -71,10 +71,18 @@ artefact apart from half a percent of cobalt carbonate.
 """
 
 import argparse
+import itertools
 import json
 import logging
 import math
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 
@@ -82,19 +90,25 @@ from common import (
     DEFAULT_PRIORITY,
     NON_OXIDE_KEYS,
     OXIDE_SCALE_FLOOR,
+    SearchCancelled,
     filter_materials_by_inventory,
     filter_materials_with_formula,
     flux_oxides,
     load_molar_masses,
+    nnls_batch,
     resolve_inventory,
     resolve_material_pool,
     umf_to_weights,
     weights_to_umf,
 )
 from solver_classic import (
+    BATCH_RANK_PIVOT,
+    FULL_RANK_PIVOT,
     calculate_recipe_composition,
     calculate_umf_error,
     create_oxide_matrix,
+    full_column_ranks,
+    nnls_recipe,
     solve_recipe,
 )
 
@@ -520,6 +534,70 @@ MATCHED_DISTURBANCE_WEIGHT = 0.5
 # drift with the number of candidates the way a min-max normalization does.
 PRIORITY_WEIGHT = 0.25
 
+# Whether the fits of the search start from the active set of the state they
+# were derived from (common.nnls_active_set) instead of from zero
+# (scipy.optimize.nnls). Every child of the beam differs from its parent by one
+# column and every leave-one-out fit of _prune_solution from the pruned state by
+# one column, so the answer's support is known almost exactly in advance.
+#
+# OFF, BECAUSE IT WAS MEASURED. The saving a warm start buys is pivots, and at
+# the size of this problem - 12 to 20 oxide rows, 3 to 10 material columns -
+# there are hardly any pivots to save: scipy's compiled cold solve takes about
+# 18 us, the warm engine about 120 us with an exact seed, all of it Python and
+# LAPACK call overhead rather than arithmetic. The NNLS kernel is 3% of a
+# find_best_recipe call to begin with (the rest is composition, UMF conversion
+# and rounding), so on the FULL_TARGET reference of the tests the switch moved
+# one call from 20 ms to about 35 ms on the 19 material inventory and from 288
+# ms to about 450 ms on the 216 material catalogue, for the same recipes. It is kept, and
+# counted (the nnls_solves field of every solution), for a problem large enough
+# to have pivots worth skipping, and so that the claim can be re-measured on
+# the bench corpus rather than argued.
+#
+# Turning it on does not change the answers: solve_recipe only warm-starts a
+# matrix of full column rank, where the optimum is unique whatever the route.
+NNLS_WARM_START = False
+
+# Whether the first fits of the material sets of one step - the children of a
+# state, one material added each - are computed in one common.nnls_batch call
+# and handed to _solve_material_set as fitted=, instead of one scipy call per
+# set. Counted as 'batched' in nnls_solves; the answers are the same.
+#
+# ON, BECAUSE IT WAS MEASURED - and not for the reason in its name. The kernel
+# itself is slower than scipy at the size of a step (20 to 45 thousand fits a
+# second against 60 thousand, bench/nnls.py). What pays is everything the batch
+# does NOT do: a first fit handed over as fitted= skips solve_recipe, which
+# builds the composition, the UMF and the error of a fit whose recipe is all
+# _solve_material_set keeps, and computes them again itself. Over the 11
+# reference recipes of the tests the searches went from 564 ms to 538 ms on
+# the 19 material inventory and from 5.09 s to 3.75 s on the 216 material
+# catalogue, where a step has some 200 children, with the same recipes. A set
+# below full column rank, or near enough to it for the normal equations of the
+# batch to lose the answer, is not batched (solver_classic.BATCH_RANK_PIVOT),
+# so the answers cannot move.
+NNLS_BATCHED = True
+
+# Processes of the one worker pool of find_best_recipe(workers=...). A call
+# cuts a step into as many chunks as it asked workers for, whatever this is,
+# and chunks beyond it queue; the pool is what stays behind for the life of the
+# process, so it is one pool of this size whatever the calls asked, and a pool
+# wider than the machine buys nothing. api_server caps its "workers" by it.
+MAX_WORKERS = os.cpu_count() or 1
+
+# That pool, started by the first call that needs it, and the serial numbers
+# that tell the workers one call's problem from the next one's. The lock is
+# there because the API calls find_best_recipe from several threads at once: it
+# guards starting the pool, and it hands out a token no other call can hold
+_WORKER_POOL: Dict[str, Optional[ProcessPoolExecutor]] = {'executor': None}
+_WORKER_POOL_LOCK = threading.Lock()
+_FANOUT_TOKENS = itertools.count(1)
+
+# Worker side: the problems of the last few calls served, {token: problem},
+# oldest first. More than one, because the calls of several API threads share
+# the pool and take turns on its workers; one per call would have every turn
+# ship the problem again
+_WORKER_PROBLEMS: OrderedDict = OrderedDict()
+WORKER_PROBLEM_CACHE = 4
+
 # Candidate search modes
 SEARCH_HEURISTIC = 'heuristic'
 SEARCH_EXHAUSTIVE = 'exhaustive'
@@ -819,6 +897,27 @@ def _normalize_unlisted_weight(penalize_unlisted: Any) -> float:
     return weight
 
 
+def _time_budget_argument(value: Any) -> Optional[float]:
+    """
+    Coerce time_budget_ms into seconds, None standing for "no budget".
+
+    A boolean is refused rather than read as 0 or 1 ms, and so is anything that
+    is not a finite positive number: a budget of zero would return the starting
+    set on every call, which is never what the caller meant.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"time_budget_ms must be a positive number of milliseconds, got {value!r}")
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"time_budget_ms must be a positive number of milliseconds, got {value!r}")
+    if not math.isfinite(budget) or budget <= 0.0:
+        raise ValueError(f"time_budget_ms must be a positive number of milliseconds, got {value!r}")
+    return budget / 1000.0
+
+
 def _int_argument(value: Any, name: str) -> int:
     """
     Coerce one of the integer arguments, refusing what cannot be one.
@@ -910,6 +1009,8 @@ def _build_problem(target_umf: Dict[str, float], materials: Sequence[Dict],
         penalty = 1.0 if oxide in target_umf else unlisted_weight
         row_weights[index] = penalty / (molar_masses[oxide] * _oxide_scale(full_target[oxide]))
 
+    matrix, column_index = _compile_matrix(materials, oxides)
+
     return {
         'target_umf': dict(target_umf),
         'full_target': full_target,
@@ -921,9 +1022,80 @@ def _build_problem(target_umf: Dict[str, float], materials: Sequence[Dict],
         'unlisted_weight': unlisted_weight,
         'row_weights': row_weights,
         'target_weights': umf_to_weights(full_target),
+        # The oxides x materials matrix of the whole pool, built once; every
+        # subset solve slices its columns (see _subset_matrix)
+        'matrix': matrix,
+        'column_index': column_index,
+        'materials': tuple(materials),
+        # How many fits started from a known active set, how many from zero and
+        # how many came out of a batched leave-one-out pass; the search reports
+        # the totals, see find_best_recipe
+        'nnls_counts': {'warm': 0, 'cold': 0, 'batched': 0},
+        # Rounds of backward elimination the pruning passes ran, see
+        # _prune_solution; reported next to the fits
+        'prune_rounds': 0,
     }
 
 
+def _compile_matrix(materials: Sequence[Dict], oxides: Sequence[str]) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Build the oxides x materials matrix of the whole pool once, plus the column
+    of every material name.
+
+    The exhaustive search solves one material set per inventory material per
+    beam state, and every one of those solves used to rebuild its matrix with
+    create_oxide_matrix - a Python loop doing one dict lookup per cell, for the
+    same columns, thousands of times per call. The formulas do not change while
+    a search runs, so the columns are read once here and a subset solve only
+    fancy-indexes them.
+
+    The matrix is built BY create_oxide_matrix, not by a second loop written to
+    look like it, so the sliced columns are the very numbers a per-subset build
+    would produce and the fit cannot tell the two apart.
+
+    A name that occurs twice in the pool is left out of the index rather than
+    mapped to either of its rows: two entries under one name may carry two
+    different analyses, and picking one would silently solve with the other's
+    formula. Sets holding such a name fall back to the per-subset build.
+    """
+    matrix, names = create_oxide_matrix(list(materials), list(oxides))
+
+    column_index: Dict[str, int] = {}
+    duplicated = set()
+    for column, name in enumerate(names):
+        if name in column_index:
+            duplicated.add(name)
+        column_index[name] = column
+    for name in duplicated:
+        del column_index[name]
+
+    return np.ascontiguousarray(matrix, dtype=float), column_index
+
+
+def _subset_matrix(active: Sequence[Dict], problem: Dict[str, Any]) -> Tuple[np.ndarray, List[str]]:
+    """
+    The oxide matrix of one material set: the columns of problem['matrix'] when
+    every material of the set is indexed, create_oxide_matrix otherwise.
+
+    A column is only taken for the very dict it was built from: a set composed
+    by hand may reuse a pool name for an edited formula, and the name alone
+    would hand it the old one. The fallback is for such sets - tests and callers
+    composing states themselves - and for duplicated names; the search itself
+    never reaches it.
+    """
+    column_index = problem.get('column_index')
+    names = [material['name'] for material in active]
+
+    if column_index is not None:
+        pool = problem['materials']
+        columns = [column_index.get(name) for name in names]
+        if None not in columns and all(pool[column] is material
+                                       for column, material in zip(columns, active)):
+            return problem['matrix'][:, columns], names
+
+    return create_oxide_matrix(active, problem['oxides'])
+
+
 def _objective_error(problem: Dict[str, Any], result_umf: Dict[str, float]) -> float:
     """
     The quantity the search minimizes: the L2 norm of the RELATIVE per-oxide
@@ -1029,7 +1201,9 @@ def _priority_start_set(materials: Sequence[Dict], min_count: int) -> List[Dict]
     return start_set
 
 
-def _solve_material_set(material_set: Sequence[Dict], problem: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def _solve_material_set(material_set: Sequence[Dict], problem: Dict[str, Any],
+                        warm_start: Optional[Sequence[str]] = None,
+                        fitted: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
     """
     Solve one material set with NNLS, dropping the materials weighing less than
     MIN_MATERIAL_WEIGHT and re-solving until the recipe is stable.
@@ -1038,29 +1212,51 @@ def _solve_material_set(material_set: Sequence[Dict], problem: Dict[str, Any]) -
     use all of it: a material that is useless now may become useful once
     another one joins the set on a later iteration.
 
+    warm_start names the materials expected to carry the answer - the recipe of
+    the state this set was derived from by adding or removing one material - and
+    seeds the active set of the fit with them (see solver_classic.solve_recipe).
+    Every re-solve after a drop is seeded with the recipe that survived it,
+    since it differs from the previous fit by exactly the dropped columns. Both
+    only while NNLS_WARM_START is on; problem['nnls_counts'] counts the fits of
+    either kind whatever it is set to.
+
+    fitted is the recipe of the first fit when the caller already has it - the
+    batched leave-one-out fits of _prune_solution, the stacked fits of a step
+    (_batched_fits) - and replaces that one call
+    to solve_recipe; it is counted as 'batched'. Everything after the first fit
+    runs as usual.
+
     Returns a state dictionary with the recipe, the resulting UMF and both error
     numbers, or None when no recipe could be built.
     """
     full_target = problem['full_target']
-    oxides = problem['oxides']
     row_weights = problem['row_weights']
+    counts = problem['nnls_counts']
 
     active = list(material_set)
     recipe: Dict[str, float] = {}
+    seed = list(warm_start) if warm_start and NNLS_WARM_START else None
 
     try:
         # Dropping a material changes the optimum, so re-solve until the set settles
         for _ in range(len(material_set)):
-            oxide_matrix, material_names = create_oxide_matrix(active, oxides)
-
-            # The weighting is done INSIDE solve_recipe, which scales the matrix
-            # and the right hand side together. It used to be done here, on the
-            # matrix alone, which was exact only while every weighted row had a
-            # zero right hand side (see _build_problem and solve_recipe)
-            solution = solve_recipe(oxide_matrix, full_target, material_names, active,
-                                    row_weights=row_weights)
+            if fitted is not None:
+                recipe = fitted
+                fitted = None
+                counts['batched'] += 1
+            else:
+                oxide_matrix, material_names = _subset_matrix(active, problem)
+
+                # The weighting is done INSIDE solve_recipe, which scales the
+                # matrix and the right hand side together. It used to be done
+                # here, on the matrix alone, which was exact only while every
+                # weighted row had a zero right hand side (see _build_problem
+                # and solve_recipe)
+                solution = solve_recipe(oxide_matrix, full_target, material_names, active,
+                                        row_weights=row_weights, warm_start=seed)
+                counts['warm' if solution.get('warm_started') else 'cold'] += 1
+                recipe = solution.get('recipe') or {}
 
-            recipe = solution.get('recipe') or {}
             recipe = {name: weight for name, weight in recipe.items() if weight >= MIN_MATERIAL_WEIGHT}
             if not recipe:
                 return None
@@ -1069,11 +1265,17 @@ def _solve_material_set(material_set: Sequence[Dict], problem: Dict[str, Any]) -
             if len(used) == len(active):
                 break
             active = used
+            if NNLS_WARM_START:
+                seed = list(recipe)
 
         recipe = _recipe_to_exactly_100(recipe)
         if not recipe:
             return None
 
+        # Over the few materials of the set, not the pool: a matrix product over
+        # the problem's compiled columns was measured slower per state (19 us
+        # against 12 us on the catalogue), the pool being 20 to 40 times wider
+        # than the recipe
         composition = calculate_recipe_composition(active, recipe)
         recipe_umf = {oxide: float(value) for oxide, value in weights_to_umf(composition).items()}
 
@@ -1126,7 +1328,8 @@ def _shrink_to_limit(state: Dict[str, Any], problem: Dict[str, Any],
         if not reduced:
             break
 
-        smaller = _solve_material_set(reduced, problem)
+        smaller = _solve_material_set(reduced, problem,
+                                      [name for name in state['recipe'] if name != lightest])
         if smaller is None:
             break
         smaller['iterations'] = state['iterations']
@@ -1162,6 +1365,68 @@ def _sole_carriers(used: Sequence[Dict], target_umf: Dict[str, float]) -> set:
     return {names[0] for names in carriers.values() if len(names) == 1}
 
 
+def _leave_one_out_fits(used: Sequence[Dict], problem: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    The first fit of every leave-one-out subproblem of a pruning round, in one
+    factorization instead of one NNLS per material.
+
+    Removing column j from a least squares problem has a closed form. With
+    A = QR factorized once and G^-1 = R^-1 R^-T the inverse Gram matrix, the
+    unconstrained solution without column j is
+
+        x(-j) = x - (x_j / G^-1_jj) * G^-1[:, j]
+
+    so all k of them are one outer update of the full solution - the stacked
+    right hand sides of k subproblems sharing one factorization. Where x(-j) is
+    strictly positive it IS the NNLS optimum of the reduced set: every column is
+    free, the gradient is zero on all of them, and the KKT conditions hold.
+    Where it is not, a bound is active and only a real NNLS can say which, so
+    that material gets no entry and _prune_solution solves it as it always did.
+
+    The shortcut is only taken on a matrix of full column rank
+    (solver_classic.FULL_RANK_PIVOT): there every reduced set has exactly one
+    optimum, so the recipe built here is the one scipy's NNLS would return, and
+    the removal decisions cannot move. Below full rank nothing is returned and
+    the round falls back to one solve per material.
+
+    Returns:
+        {name of the dropped material: recipe of the first fit without it},
+        built by solver_classic.nnls_recipe exactly as solve_recipe builds its
+        own; a material missing from it has to be solved the usual way
+    """
+    if len(used) < 2:
+        return {}
+
+    oxide_matrix, names = _subset_matrix(used, problem)
+    row_weights = problem['row_weights']
+    fit_matrix = oxide_matrix * row_weights[:, None]
+    fit_weights = np.array([problem['target_weights'].get(oxide, 0.0) for oxide in problem['oxides']]) * row_weights
+
+    n_rows, n_columns = fit_matrix.shape
+    if n_columns > n_rows:
+        return {}
+
+    q_factor, r_factor = np.linalg.qr(fit_matrix)
+    pivots = np.abs(np.diagonal(r_factor))
+    if pivots.min() <= FULL_RANK_PIVOT * np.linalg.norm(fit_matrix, axis=0).max():
+        return {}
+
+    r_inverse = np.linalg.inv(r_factor)
+    gram_inverse = r_inverse @ r_inverse.T
+    x = r_inverse @ (q_factor.T @ fit_weights)
+
+    # Column j holds the least squares solution without material j
+    fits = x[:, None] - gram_inverse * (x / np.diagonal(gram_inverse))[None, :]
+
+    recipes: Dict[str, Dict[str, float]] = {}
+    for column, name in enumerate(names):
+        weights = np.delete(fits[:, column], column)
+        if np.all(weights > 0.0):
+            recipes[name] = nnls_recipe(weights, names[:column] + names[column + 1:])[1]
+
+    return recipes
+
+
 def _prune_solution(state: Dict[str, Any], problem: Dict[str, Any],
                     min_materials: int) -> Dict[str, Any]:
     """
@@ -1170,7 +1435,10 @@ def _prune_solution(state: Dict[str, Any], problem: Dict[str, Any],
     Greedy backward elimination: each round re-solves the recipe once per
     removable material with that material taken out, keeps the removals that
     pass the test below, applies the one that ends up with the lowest objective
-    and starts again. It stops when no single removal qualifies any more.
+    and starts again. It stops when no single removal qualifies any more. The
+    first fit of every one of those re-solves comes out of one shared
+    factorization where the algebra allows it (_leave_one_out_fits); the
+    decisions are the ones the per-material NNLS would have made.
 
     A removal has to clear TWO gates, and they answer different questions.
 
@@ -1240,6 +1508,7 @@ def _prune_solution(state: Dict[str, Any], problem: Dict[str, Any],
     target_umf = problem['target_umf']
 
     while current['materials_count'] > floor:
+        problem['prune_rounds'] += 1
         used = [material for material in current['materials']
                 if material['name'] in current['recipe']]
         protected = _sole_carriers(used, target_umf)
@@ -1247,6 +1516,7 @@ def _prune_solution(state: Dict[str, Any], problem: Dict[str, Any],
         objective_limit = current['objective_error'] + PRUNE_OBJECTIVE_TOLERANCE
         error_limit = current['error'] + PRUNE_ERROR_TOLERANCE
         best: Optional[Dict[str, Any]] = None
+        fits = _leave_one_out_fits(used, problem)
 
         # sorted() so that two equally good removals always resolve the same
         # way, whatever order the material set happens to be in
@@ -1258,7 +1528,9 @@ def _prune_solution(state: Dict[str, Any], problem: Dict[str, Any],
             if not reduced:
                 continue
 
-            candidate = _solve_material_set(reduced, problem)
+            candidate = _solve_material_set(reduced, problem,
+                                            [name for name in current['recipe'] if name != dropped['name']],
+                                            fitted=fits.get(dropped['name']))
             if candidate is None or candidate['materials_count'] < floor:
                 continue
             if candidate['objective_error'] > objective_limit or candidate['error'] > error_limit:
@@ -1517,9 +1789,193 @@ def _rank_candidates(candidates: Sequence[Dict], residual: Dict[str, float],
     return scored
 
 
+def _worker_pool() -> ProcessPoolExecutor:
+    """
+    The process pool of find_best_recipe(workers=...), MAX_WORKERS processes
+    and kept for the life of the process. Called with _WORKER_POOL_LOCK held.
+
+    Starting a worker means importing numpy and scipy, which costs more than a
+    whole search on the shelf inventory, so a pool per call would eat the gain
+    it exists for. 'spawn' rather than the platform default, because the API
+    serves requests on threads and forking a threaded process copies whatever
+    lock another thread held at that moment. The processes themselves are
+    started as the tasks arrive, so a server that only ever sees workers=2
+    runs two of them.
+    """
+    if _WORKER_POOL['executor'] is None:
+        _WORKER_POOL['executor'] = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                                       mp_context=multiprocessing.get_context('spawn'))
+    return _WORKER_POOL['executor']
+
+
+def _open_fanout(problem: Dict[str, Any], workers: int) -> Optional[Dict[str, Any]]:
+    """
+    Everything _solve_sets needs to hand a step to the pool, or None for one
+    worker. The problem is pickled HERE, once per call, and shipped once per
+    worker: with every chunk of the first step, which is one chunk per worker,
+    and after that only to a worker that answers it has never seen the token
+    (see _solve_sets). "shipped" counts the copies sent.
+
+    The token is drawn before anything else is done, and under the lock: two
+    calls holding the same one would have a worker solve the tasks of one
+    against the cached problem of the other, without a word.
+    """
+    if workers <= 1:
+        return None
+
+    with _WORKER_POOL_LOCK:
+        token = (os.getpid(), next(_FANOUT_TOKENS))
+        executor = _worker_pool()
+
+    # The counters start from zero on the worker side, whatever the search has
+    # spent so far; the workers report how much THEY added
+    shipped = dict(problem, nnls_counts={key: 0 for key in problem['nnls_counts']})
+    return {
+        'executor': executor,
+        'workers': workers,
+        'token': token,
+        'payload': pickle.dumps(shipped, protocol=pickle.HIGHEST_PROTOCOL),
+        'shipped': 0,
+    }
+
+
+def _batched_fits(material_sets: Sequence[Sequence[Dict]],
+                  problem: Dict[str, Any]) -> List[Optional[Dict[str, float]]]:
+    """
+    The first fit of every material set of a step in one common.nnls_batch
+    call, as the recipes solve_recipe would build from scipy's fits (see
+    solver_classic.nnls_recipe), for _solve_material_set(fitted=...).
+
+    Only while NNLS_BATCHED is on and there are at least two sets, and only
+    for a set clear of solver_classic.BATCH_RANK_PIVOT, where the optimum is
+    unique and the batch lands on scipy's recipe (see
+    solver_classic._batched_fits). Every other
+    entry is None, which is the usual one solve per set.
+    """
+    if not NNLS_BATCHED or len(material_sets) < 2:
+        return [None] * len(material_sets)
+
+    row_weights = problem['row_weights']
+    fit_weights = np.array([problem['target_weights'].get(oxide, 0.0) for oxide in problem['oxides']]) * row_weights
+    matrices = []
+    names = []
+    for material_set in material_sets:
+        oxide_matrix, material_names = _subset_matrix(material_set, problem)
+        matrices.append(oxide_matrix * row_weights[:, None])
+        names.append(material_names)
+
+    fits: List[Optional[Dict[str, float]]] = [None] * len(material_sets)
+    batched = np.flatnonzero(full_column_ranks(matrices, BATCH_RANK_PIVOT))
+    if not batched.size:
+        return fits
+
+    try:
+        x, _residuals = nnls_batch([matrices[position] for position in batched], fit_weights)
+    except RuntimeError as exc:
+        logger.debug(f"batched NNLS gave up, solving the sets one by one: {exc}")
+        return fits
+
+    for position, weights in zip(batched, x):
+        fits[position] = nnls_recipe(weights[:len(names[position])], names[position])[1]
+    return fits
+
+
+def _solve_chunk(token: Tuple[int, int], payload: Optional[bytes],
+                 tasks: Sequence[Tuple[List[int], List[str]]]) -> Optional[Tuple[List[Optional[Dict[str, Any]]], Dict[str, int]]]:
+    """
+    Worker side of _solve_sets: solve material sets given as columns of the
+    problem's pool. The states go back without their 'materials', which the
+    caller re-attaches from its own records - the copies made by pickling
+    would fail the identity test of _subset_matrix on every later solve.
+
+    payload is the pickled problem, or None when the caller expects this worker
+    to hold it already; None comes back when it does not, and the caller sends
+    the chunk again with the payload.
+    """
+    if payload is not None and token not in _WORKER_PROBLEMS:
+        _WORKER_PROBLEMS[token] = pickle.loads(payload)
+        while len(_WORKER_PROBLEMS) > WORKER_PROBLEM_CACHE:
+            _WORKER_PROBLEMS.popitem(last=False)
+    problem = _WORKER_PROBLEMS.get(token)
+    if problem is None:
+        return None
+
+    counts = problem['nnls_counts']
+    before = dict(counts)
+    pool = problem['materials']
+
+    material_sets = [[pool[column] for column in columns] for columns, _seed in tasks]
+    fits = _batched_fits(material_sets, problem)
+
+    states: List[Optional[Dict[str, Any]]] = []
+    for material_set, (_columns, seed), fitted in zip(material_sets, tasks, fits):
+        state = _solve_material_set(material_set, problem, seed, fitted)
+        if state is not None:
+            del state['materials']
+        states.append(state)
+
+    return states, {key: counts[key] - before[key] for key in counts}
+
+
+def _solve_sets(material_sets: Sequence[List[Dict]], seed: List[str], problem: Dict[str, Any],
+                fanout: Optional[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    _solve_material_set over several sets, in their order.
+
+    With a fanout the sets are cut into one contiguous chunk per worker and
+    solved in the pool; the answers come back in the order the sets went out,
+    and a worker runs the very code this process would, so what the caller
+    sorts afterwards is bit for bit what the serial path produces. A set that
+    holds a material the pool's column index does not know - never the case
+    for a search, only for a hand-built problem - is solved here instead.
+    """
+    if fanout is None or len(material_sets) < 2:
+        return [_solve_material_set(material_set, problem, seed, fitted)
+                for material_set, fitted in zip(material_sets, _batched_fits(material_sets, problem))]
+
+    column_index = problem['column_index']
+    pool = problem['materials']
+    tasks = []
+    for material_set in material_sets:
+        columns = [column_index.get(material['name']) for material in material_set]
+        if None in columns or any(pool[column] is not material
+                                  for column, material in zip(columns, material_set)):
+            return [_solve_material_set(material_set, problem, seed, fitted)
+                    for material_set, fitted in zip(material_sets, _batched_fits(material_sets, problem))]
+        tasks.append((columns, seed))
+
+    # The first step ships the problem with every chunk; later ones count on
+    # the workers holding it and pay for a second trip where one does not
+    payload = fanout['payload'] if not fanout['shipped'] else None
+    chunk = -(-len(tasks) // fanout['workers'])
+    chunks = [tasks[start:start + chunk] for start in range(0, len(tasks), chunk)]
+    futures = [fanout['executor'].submit(_solve_chunk, fanout['token'], payload, chunk_tasks)
+               for chunk_tasks in chunks]
+    if payload is not None:
+        fanout['shipped'] += len(futures)
+
+    states: List[Optional[Dict[str, Any]]] = []
+    for future, chunk_tasks in zip(futures, chunks):
+        result = future.result()
+        if result is None:
+            fanout['shipped'] += 1
+            result = fanout['executor'].submit(_solve_chunk, fanout['token'], fanout['payload'],
+                                               chunk_tasks).result()
+        chunk_states, counts = result
+        states.extend(chunk_states)
+        for key, value in counts.items():
+            problem['nnls_counts'][key] += value
+
+    for material_set, state in zip(material_sets, states):
+        if state is not None:
+            state['materials'] = list(material_set)
+
+    return states
+
+
 def _expand_state(state: Dict[str, Any], available_materials: Sequence[Dict],
                   problem: Dict[str, Any], seen_sets: set, candidate_limit: Optional[int],
-                  verbose: bool) -> List[Dict[str, Any]]:
+                  verbose: bool, fanout: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
     Try to add one material to the set of a state.
 
@@ -1533,6 +1989,9 @@ def _expand_state(state: Dict[str, Any], available_materials: Sequence[Dict],
     spending one of the candidate_limit slots on them, so a step always costs at
     most candidate_limit NNLS runs of new work.
 
+    fanout is the worker pool of find_best_recipe(workers=...), None to solve
+    in this process; the result is the same either way.
+
     Returns the resulting states ordered from best to worst.
     """
     used_names = {material['name'] for material in state['materials']}
@@ -1548,11 +2007,13 @@ def _expand_state(state: Dict[str, Any], available_materials: Sequence[Dict],
         logger.info(f"worst oxide {focus}, best candidates by heuristic: "
                     f"{[material['name'] for _, material in ranked[:TOP_CANDIDATES]]}")
 
-    trials: List[Tuple[float, int, Dict[str, Any]]] = []
-    solved = 0
+    # Which sets get solved depends on the ranking and on seen_sets only, never
+    # on the result of a solve, so the whole step is planned first and solved
+    # afterwards - serially, or on the worker pool (see _solve_sets)
+    planned: List[Tuple[int, Dict, List[Dict], frozenset]] = []
 
     for rank, (_score, candidate) in enumerate(ranked):
-        if candidate_limit is not None and solved >= candidate_limit:
+        if candidate_limit is not None and len(planned) >= candidate_limit:
             break
 
         new_set = list(state['materials']) + [candidate]
@@ -1560,9 +2021,16 @@ def _expand_state(state: Dict[str, Any], available_materials: Sequence[Dict],
         if set_names in seen_sets:
             continue
         seen_sets.add(set_names)
+        planned.append((rank, candidate, new_set, set_names))
+
+    # The child differs from its parent by one column, so the parent's recipe is
+    # where its fit starts
+    seed = list(state['recipe'])
+    solved_states = _solve_sets([new_set for _, _, new_set, _ in planned], seed, problem, fanout)
+
+    trials: List[Tuple[float, int, Dict[str, Any]]] = []
 
-        solved += 1
-        new_state = _solve_material_set(new_set, problem)
+    for (rank, candidate, _new_set, set_names), new_state in zip(planned, solved_states):
         if new_state is None:
             continue
 
@@ -1687,11 +2155,35 @@ def _solution_sort_key(solution: Dict[str, Any], best_error: float):
             _recipe_priority(solution))
 
 
+def _solution_record(solution: Dict[str, Any], problem: Dict[str, Any], unlisted_weight: float,
+                     merged_variants: int, truncated: bool, levels_completed: int) -> Dict[str, Any]:
+    """One entry of the list find_best_recipe returns, from a (pruned) state"""
+    return {
+        'recipe': solution['recipe'],
+        'error': solution['error'],
+        'objective_error': solution['objective_error'],
+        'result_umf': solution['result_umf'],
+        'unity_scale': solution['unity_scale'],
+        'target_umf': dict(problem['target_umf']),
+        'effective_target_umf': dict(problem['full_target']),
+        'unlisted_weight': unlisted_weight,
+        'materials_count': solution['materials_count'],
+        'merged_variants': merged_variants,
+        'iterations': solution['iterations'],
+        'nnls_solves': dict(problem['nnls_counts']),
+        'prune_rounds': problem['prune_rounds'],
+        'truncated': truncated,
+        'levels_completed': levels_completed,
+    }
+
+
 def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
                      max_solutions=5, verbose=False, error_threshold=0.1,
                      penalize_unlisted=1.0,
                      candidate_search=SEARCH_EXHAUSTIVE,
-                     materials=None) -> List[Dict[str, Any]]:
+                     materials=None, workers=None,
+                     progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     time_budget_ms=None, cancel=None) -> List[Dict[str, Any]]:
     """
     Find glaze recipes for a target UMF by adding materials one at a time.
 
@@ -1815,11 +2307,64 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
             DEFAULT_PRIORITY, which puts every injected material in one group -
             so _priority_start_set() starts from the whole catalogue at once
             unless the records carry explicit priorities.
+        workers: number of processes the candidate solves of a search step are
+            spread over; None or 1 (the default) solves everything in this
+            process. Opt-in, because it only pays where a step has many
+            candidates - the exhaustive search over a large catalogue - and a
+            step of a dozen solves on the shelf inventory costs less than
+            shipping it. The pool is started on first use and kept for the life
+            of the process, one pool of MAX_WORKERS processes whatever the
+            calls ask for; a call asking for more cuts its steps into that many
+            chunks and they queue. The problem is pickled once per call. The answer is
+            bit for bit the serial one: a worker runs the same code on the same
+            numbers, and the results are put back in the order they went out
+            before anything sorts them.
+        progress: optional callable, handed one event dictionary at a time
+            while the search runs, for a caller that shows the search rather
+            than waiting for its end (/api/solve/stream). Two kinds:
+            {"event": "iteration", "iteration", "beam", "pool", "acceptable",
+             "best_objective_error", "nnls_solves"} after the starting set
+            and after every step - "beam" lists the states the next step
+            expands, as {"materials_count", "objective_error", "added"}; and
+            {"event": "recipe", "iteration", "solution"} for every new recipe
+            that reached error_threshold, PRUNED and shaped like one entry of
+            the returned list (merged_variants is 0 there, it is only known at
+            the end). Pruning early costs NNLS runs the silent search would
+            spend only on the recipes it returns, so it happens only when
+            progress is given; the final pass reuses what was pruned here, and
+            the returned list is the one the silent call returns - nnls_solves
+            aside, which counts the extra runs. An exception raised by progress
+            stops the search and propagates to the caller.
+        time_budget_ms: optional wall-clock budget of the whole call, for a
+            caller with a deadline to keep (/api/solve). None (the default) is
+            no budget. When it runs out the search stops expanding, the states
+            it already solved stay in the pool, and the pruning pass takes the
+            candidates it has not reached yet as they are instead of pruning
+            them - the answer is the best of what was found by then, flagged
+            with "truncated" (see Returns). It is checked between beam states
+            and between pruned candidates, so it is overrun by at most one of
+            those. Measured over FULL and PARTIAL targets at max_solutions=5:
+            on the 216 material catalogue one state takes 157 to 212 ms to
+            expand exhaustively and one candidate up to 7 ms to prune; on the
+            19 material shelf 6 to 58 ms and up to 11 ms. A budget below one
+            expansion on the catalogue therefore still costs one, and
+            candidate_search='heuristic' is what shrinks it. A call that
+            finishes inside its budget returns exactly what the call without
+            one returns.
+        cancel: optional threading.Event (anything with is_set()) the caller
+            sets to abandon the search. It is checked where time_budget_ms is,
+            and unlike the budget it does not return what was found so far:
+            common.SearchCancelled is raised, because a caller that cancelled
+            does not want an answer - a partial one is what progress is for.
+            /api/jobs cancels through it on DELETE.
 
     Raises:
         ValueError: candidate_search is not one of CANDIDATE_SEARCH_MODES,
-            penalize_unlisted is not a number or a boolean, or one of
-            min_materials / max_materials / max_solutions is not an integer.
+            penalize_unlisted is not a number or a boolean, one of
+            min_materials / max_materials / max_solutions / workers is not an
+            integer, workers is below 1, or time_budget_ms is not a positive
+            number.
+        common.SearchCancelled: cancel was set while the search ran.
 
     Returns:
         list of solutions, best first, where "best" is the order documented in
@@ -1861,10 +2406,41 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
                             exhaustive census of the pool
             iterations      how many search steps the recipe took; the pruning
                             pass is not a step and does not raise it
+            nnls_solves     {'warm': n, 'cold': n, 'batched': n}, the fits
+                            of the WHOLE call - the same numbers on every
+                            solution. 'warm' and 'cold' are NNLS runs, split by
+                            whether they started from the active set of the
+                            state they were derived from or from zero; all of
+                            them are cold unless NNLS_WARM_START is on, and even
+                            then the starting set and every rank deficient
+                            material set are. 'batched' are the first fits
+                            that needed no NNLS run of their own: the
+                            leave-one-out fits of the pruning pass that came out
+                            of a shared factorization, and while NNLS_BATCHED is
+                            on the first fits of each step's material sets,
+                            solved together in one common.nnls_batch call
+            prune_rounds    the rounds of backward elimination the pruning
+                            of the whole call ran, each one a leave-one-out
+                            pass over a recipe (see _prune_solution); the same
+                            on every solution
+            truncated       True when time_budget_ms ran out before the search
+                            and the pruning pass were done, the same on every
+                            solution
+            levels_completed how many levels of the beam were fully expanded,
+                            the starting set being level 1; the last level
+                            the search reached when it stopped on its own, the
+                            one before the interrupted one when the budget
+                            stopped it
     """
+    started = time.perf_counter()
     solution_limit = _int_argument(max_solutions, 'max_solutions')
     material_limit = _int_argument(max_materials, 'max_materials')
     material_floor = _int_argument(min_materials, 'min_materials')
+    worker_count = 1 if workers is None else _int_argument(workers, 'workers')
+    if worker_count < 1:
+        raise ValueError(f"workers must be at least 1, got {workers!r}")
+    budget = _time_budget_argument(time_budget_ms)
+    deadline = None if budget is None else started + budget
 
     if solution_limit <= 0:
         return []
@@ -1913,6 +2489,7 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
         return []
 
     problem = _build_problem(clean_target, available_materials, unlisted_weight)
+    fanout = _open_fanout(problem, worker_count)
 
     candidate_limit = None if candidate_search == SEARCH_EXHAUSTIVE else TOP_CANDIDATES
     beam_width = 1 if solution_limit <= 1 else min(MAX_BEAM_WIDTH, solution_limit)
@@ -1942,13 +2519,67 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
     seen_sets = {start_state['set_names']}
     # Different recipes that already meet the requested quality
     found_recipes = set()
+    # {recipe key: (state, pruned state)} of the recipes pruned for progress,
+    # and the pruned recipes already reported to it
+    early_prunes: Dict[Tuple, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    reported_recipes = set()
+    # Set once the budget has run out; nothing is expanded or pruned after that
+    truncated = False
+    levels_completed = 1
+
+    # Checked between beam states and between pruned candidates, never inside
+    # one: an expansion is planned whole and then solved whole, on the worker
+    # pool when there is one, and cutting it in half would leave a state whose
+    # children were ranked on part of the candidates
+    def out_of_time() -> bool:
+        nonlocal truncated
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled(f"search cancelled after {levels_completed} levels, "
+                                  f"{len(pool)} states solved")
+        if not truncated and deadline is not None and time.perf_counter() >= deadline:
+            truncated = True
+            logger.warning(f"time_budget_ms={time_budget_ms} ran out after {levels_completed} "
+                           f"search levels, {len(pool)} states solved")
+        return truncated
+
+    def found(state: Dict[str, Any], iteration: int) -> None:
+        key = _recipe_key(state['recipe'])
+        if key in found_recipes:
+            return
+        found_recipes.add(key)
+        if progress is None or not material_floor <= state['materials_count'] <= material_limit:
+            return
+        pruned_state = _prune_solution(state, problem, material_floor)
+        early_prunes[key] = (state, pruned_state)
+        pruned_key = _recipe_key(pruned_state['recipe'])
+        if pruned_key not in reported_recipes:
+            reported_recipes.add(pruned_key)
+            progress({'event': 'recipe', 'iteration': iteration,
+                      'solution': _solution_record(pruned_state, problem, unlisted_weight, 0,
+                                                   False, iteration - 1)})
+
+    def report_iteration(iteration: int) -> None:
+        if progress is None:
+            return
+        progress({'event': 'iteration', 'iteration': iteration,
+                  'beam': [{'materials_count': state['materials_count'],
+                            'objective_error': state['objective_error'],
+                            'added': state.get('added')} for state in beam],
+                  'pool': len(pool), 'acceptable': len(found_recipes),
+                  'best_objective_error': min(state['objective_error'] for state in pool),
+                  'nnls_solves': dict(problem['nnls_counts'])})
+
     if start_state['objective_error'] <= error_threshold:
-        found_recipes.add(_recipe_key(start_state['recipe']))
+        found(start_state, 1)
+    report_iteration(1)
 
     for iteration in range(2, DEFAULT_MAX_ITERATIONS + 1):
         next_beam: List[Dict[str, Any]] = []
 
         for state in beam:
+            if out_of_time():
+                break
+
             # A branch that is good enough is dropped, but only once the pool
             # holds as many different recipes as the caller asked for
             if state['objective_error'] <= error_threshold and len(found_recipes) >= solution_limit:
@@ -1960,13 +2591,13 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
                 continue
 
             children = _expand_state(state, available_materials, problem, seen_sets,
-                                     candidate_limit, verbose)
+                                     candidate_limit, verbose, fanout)
 
             for child in children:
                 child['iterations'] = iteration
                 pool.append(child)
                 if child['objective_error'] <= error_threshold:
-                    found_recipes.add(_recipe_key(child['recipe']))
+                    found(child, iteration)
 
             # Only the best branches are kept alive; a branch that stops
             # improving is abandoned and the pool keeps whatever it already found
@@ -1983,11 +2614,22 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
 
                 next_beam.append(child)
 
+        if truncated:
+            # The children of the interrupted level are solved states like any
+            # other and stay in the pool; the level itself was not completed
+            beam = []
+            report_iteration(iteration)
+            break
+
+        levels_completed = iteration
         if not next_beam:
+            beam = []
+            report_iteration(iteration)
             break
 
         next_beam.sort(key=lambda s: (s['objective_error'], s['materials_count']))
         beam = next_beam[:beam_width]
+        report_iteration(iteration)
 
     # Keep only recipes that respect the material limits. An empty result here
     # means the limits are unreachable with this inventory - the caller is told
@@ -2051,7 +2693,13 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
         if key in seen_before_pruning:
             continue
         seen_before_pruning.add(key)
-        pruned_state = _prune_solution(solution, problem, material_floor)
+        early = early_prunes.get(key)
+        if early is not None and early[0] is solution:
+            pruned_state = early[1]
+        elif out_of_time():
+            pruned_state = solution
+        else:
+            pruned_state = _prune_solution(solution, problem, material_floor)
         pruned.append(pruned_state)
         distinct_pruned.add(_recipe_key(pruned_state['recipe']))
 
@@ -2087,20 +2735,8 @@ def find_best_recipe(inventory, target_umf, min_materials=1, max_materials=10,
         if key in seen_recipes:
             continue
         seen_recipes.add(key)
-
-        unique.append({
-            'recipe': solution['recipe'],
-            'error': solution['error'],
-            'objective_error': solution['objective_error'],
-            'result_umf': solution['result_umf'],
-            'unity_scale': solution['unity_scale'],
-            'target_umf': dict(problem['target_umf']),
-            'effective_target_umf': dict(problem['full_target']),
-            'unlisted_weight': unlisted_weight,
-            'materials_count': solution['materials_count'],
-            'merged_variants': merged_counts[key] - 1,
-            'iterations': solution['iterations'],
-        })
+        unique.append(_solution_record(solution, problem, unlisted_weight,
+                                       merged_counts[key] - 1, truncated, levels_completed))
 
     if verbose and unique:
         logger.info(f"returning {len(unique)} solutions, best error {unique[0]['error']:.4f}")
@@ -2123,6 +2759,9 @@ def main():
                         help='How hard an oxide missing from the target is pushed to zero, 0.0..1.0 (default: 1.0)')
     parser.add_argument('--candidate-search', choices=CANDIDATE_SEARCH_MODES, default=SEARCH_EXHAUSTIVE,
                         help=f'Candidate search mode (default: {SEARCH_EXHAUSTIVE})')
+    parser.add_argument('--time-budget-ms', type=float, default=None,
+                        help='Wall-clock budget of the search in milliseconds; the best recipes found '
+                             'by then are returned when it runs out (default: no budget)')
     parser.add_argument('--quiet', action='store_true', help='Do not log the search process')
     args = parser.parse_args()
 
@@ -2173,6 +2812,7 @@ def main():
         error_threshold=args.error_threshold,
         penalize_unlisted=args.penalize_unlisted,
         candidate_search=args.candidate_search,
+        time_budget_ms=args.time_budget_ms,
     )
 
     if not solutions:
@@ -2180,6 +2820,8 @@ def main():
         return
 
     print(f"\nFound {len(solutions)} solutions!")
+    if solutions[0]['truncated']:
+        print(f"The time budget ran out after {solutions[0]['levels_completed']} search levels")
     for index, solution in enumerate(solutions):
         print(f"\nSolution {index + 1}")
         print(f"Error: {solution['error']:.4f} | objective: {solution['objective_error']:.4f} "
@@ -10,6 +10,9 @@
 
 import contextlib
 import io
+import json
+import threading
+import time
 import unittest
 import sys
 import os
@@ -50,6 +53,9 @@ class TestSolveEndpointSolverSelection(unittest.TestCase):
     def setUp(self):
         api_server.app.config['TESTING'] = True
         self.client = api_server.app.test_client()
+        # Every test here is about what the engine is handed, and a cached
+        # answer would skip the engine
+        api_server.solve_cache_clear()
 
     def post_solve(self, **overrides):
         # The classic engine reports its search on stdout; that is not part of
@@ -142,6 +148,22 @@ class TestSolveEndpointSolverSelection(unittest.TestCase):
         self.assertEqual(body['error'], 'unknown_solver')
         self.assertIn('magic', body['message'])
 
+    def test_workers_reach_the_iterative_engine_capped(self):
+        iterative_patch, classic_patch = self.dispatch_spies()
+        with iterative_patch as iterative_spy, classic_patch, \
+                patch.object(api_server, 'MAX_SOLVE_WORKERS', 2):
+            response = self.post_solve(workers=64)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(iterative_spy.call_args.kwargs['workers'], 2)
+
+    def test_workers_that_are_not_a_count_are_a_bad_request(self):
+        for workers in (0, -3, 'many'):
+            with self.subTest(workers=workers):
+                response = self.post_solve(workers=workers)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], 'invalid_parameter')
+
     def test_empty_solver_value_is_not_silently_defaulted(self):
         # An empty string is a value, not an absent parameter: falling back to
         # the default here would hide a broken caller
@@ -151,6 +173,330 @@ class TestSolveEndpointSolverSelection(unittest.TestCase):
         self.assertEqual(response.get_json()['error'], 'unknown_solver')
 
 
+class TestSolveCache(unittest.TestCase):
+    """A repeated /api/solve is answered from memory, and only a true repeat is"""
+
+    def setUp(self):
+        api_server.app.config['TESTING'] = True
+        self.client = api_server.app.test_client()
+        api_server.solve_cache_clear()
+        self.addCleanup(api_server.solve_cache_clear)
+
+    def post_solve(self, **overrides):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.post('/api/solve', json=solve_payload(**overrides))
+
+    def engine_spy(self):
+        return patch.object(api_server, 'find_best_recipe',
+                            MagicMock(wraps=api_server.find_best_recipe))
+
+    def test_a_repeat_skips_the_engine_and_answers_the_same(self):
+        with self.engine_spy() as spy:
+            first = self.post_solve()
+            second = self.post_solve(inventory=list(reversed(TEST_INVENTORY)))
+
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual(first.get_json(), second.get_json())
+        stats = self.client.get('/api/health').get_json()['solve_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_any_field_the_engine_reads_is_a_different_entry(self):
+        with self.engine_spy() as spy:
+            self.post_solve()
+            self.post_solve(max_solutions=1)
+            self.post_solve(penalize_unlisted=0.5)
+            self.post_solve(inventory=TEST_INVENTORY[:-1])
+
+        self.assertEqual(spy.call_count, 4)
+
+    def test_warnings_belong_to_the_request_not_to_the_entry(self):
+        self.post_solve()
+        response = self.post_solve(umf=dict(TEST_UMF, Unobtainium=0.2))
+
+        self.assertEqual(api_server.solve_cache_stats()['hits'], 1)
+        self.assertEqual(len(response.get_json()['warnings']), 1)
+
+    def test_an_edit_of_the_database_retires_the_entries(self):
+        with self.engine_spy() as spy:
+            self.post_solve()
+            with patch.object(api_server, '_database_fingerprint', return_value='edited'):
+                self.post_solve()
+
+        self.assertEqual(spy.call_count, 2)
+
+    def test_an_expired_entry_is_solved_again(self):
+        with self.engine_spy() as spy:
+            self.post_solve()
+            with patch.object(api_server, 'SOLVE_CACHE_TTL_SECONDS', -1.0):
+                self.post_solve()
+
+        self.assertEqual(spy.call_count, 2)
+
+    def test_the_least_recently_used_entry_is_evicted(self):
+        with patch.object(api_server, 'SOLVE_CACHE_SIZE', 2):
+            self.post_solve(max_solutions=1)
+            self.post_solve(max_solutions=2)
+            self.post_solve(max_solutions=1)
+            self.post_solve(max_solutions=3)
+            with self.engine_spy() as spy:
+                self.post_solve(max_solutions=1)
+                self.post_solve(max_solutions=2)
+
+        self.assertEqual(spy.call_count, 1)
+
+    def test_a_refused_request_is_not_stored(self):
+        self.assertEqual(self.post_solve(workers=0).status_code, 400)
+        self.assertEqual(self.post_solve(workers=0).status_code, 400)
+        self.assertEqual(api_server.solve_cache_stats()['entries'], 0)
+
+    def test_an_answer_cut_short_by_the_budget_is_not_stored(self):
+        response = self.post_solve(time_budget_ms=1e-6)
+        body = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body['solutions'][0]['truncated'])
+        self.assertEqual(body['solutions'][0]['levels_completed'], 1)
+        self.assertEqual(len(body['warnings']), 1)
+        self.assertEqual(api_server.solve_cache_stats()['entries'], 0)
+
+    def test_an_invalid_budget_is_refused(self):
+        response = self.post_solve(time_budget_ms=-1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'invalid_parameter')
+
+
+class TestSolveStream(unittest.TestCase):
+    """POST /api/solve/stream shows the iterative search and ends on the /api/solve answer"""
+
+    def setUp(self):
+        api_server.app.config['TESTING'] = True
+        self.client = api_server.app.test_client()
+        api_server.solve_cache_clear()
+        self.addCleanup(api_server.solve_cache_clear)
+
+    def stream(self, **overrides):
+        response = self.client.post('/api/solve/stream', json=solve_payload(**overrides))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_the_last_line_is_the_answer_of_the_plain_endpoint(self):
+        lines = self.stream(max_solutions=3)
+        self.assertEqual(lines[0]['type'], 'start')
+        self.assertEqual(lines[-1]['type'], 'done')
+        self.assertIn('iteration', {line['type'] for line in lines})
+
+        api_server.solve_cache_clear()
+        plain = self.client.post('/api/solve', json=solve_payload(max_solutions=3)).get_json()
+        self.assertEqual(lines[-1]['solutions'], plain['solutions'])
+
+    def test_recipes_are_shaped_like_the_solutions_of_the_answer(self):
+        # A reference recipe on the default stock: TEST_UMF has no recipe
+        # within the acceptance threshold on TEST_INVENTORY
+        reference = {"Al2O3": 0.379, "B2O3": 0.266, "CaO": 0.718, "Fe2O3": 0.002, "K2O": 0.086,
+                     "MgO": 0.048, "Na2O": 0.143, "SiO2": 3.151, "SrO": 0.005, "TiO2": 0.003}
+        lines = self.stream(umf=reference, inventory=None, max_solutions=3)
+        recipes = [line['solution'] for line in lines if line['type'] == 'recipe']
+        self.assertTrue(recipes)
+        for solution in recipes:
+            self.assertEqual(set(solution), set(lines[-1]['solutions'][0]))
+
+    def test_a_repeat_is_answered_from_the_shared_cache(self):
+        self.client.post('/api/solve', json=solve_payload())
+        with patch.object(api_server, 'find_best_recipe') as engine:
+            lines = self.stream()
+        engine.assert_not_called()
+        self.assertEqual([line['type'] for line in lines], ['start', 'done'])
+
+    def test_refusals_keep_their_status(self):
+        for overrides, status, error in (({'umf': {}}, 400, 'missing_umf'),
+                                         ({'solver': 'classic'}, 400, 'invalid_parameter'),
+                                         ({'workers': 0}, 400, 'invalid_parameter'),
+                                         ({'umf': {'Unobtainium': 1}}, 422, 'empty_target')):
+            with self.subTest(overrides=overrides):
+                response = self.client.post('/api/solve/stream', json=solve_payload(**overrides))
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.get_json()['error'], error)
+                self.assertIn('warnings', response.get_json())
+
+
+class TestHeavyEndpointAdmission(unittest.TestCase):
+    """
+    /api/solve, /api/feasibility and /api/sensitivity are admitted through a cap
+    each, and a request beyond cap and queue is told when to come back
+    """
+
+    def setUp(self):
+        api_server.app.config['TESTING'] = True
+        self.client = api_server.app.test_client()
+        api_server.solve_cache_clear()
+        self.addCleanup(api_server.solve_cache_clear)
+        limits = {endpoint: {'concurrency': 1, 'queue': 0} for endpoint in api_server.HEAVY_ENDPOINT_LIMITS}
+        patcher = patch.dict(api_server.HEAVY_ENDPOINT_LIMITS, limits)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def hold(self, endpoint):
+        """Take the one slot of an endpoint, as a request computing would"""
+        api_server._heavy_acquire(endpoint)
+        self.addCleanup(api_server._heavy_release, endpoint, 0.0)
+
+    def test_a_request_beyond_the_cap_is_answered_429_with_retry_after(self):
+        requests = {'solve': ('/api/solve', solve_payload()),
+                    'feasibility': ('/api/feasibility', {"umf": TEST_UMF}),
+                    'sensitivity': ('/api/sensitivity', {"recipe": {"Каолин КЖФ-1": 100}})}
+        for endpoint, (url, body) in requests.items():
+            with self.subTest(endpoint=endpoint):
+                self.hold(endpoint)
+                response = self.client.post(url, json=body)
+
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response.get_json()['error'], 'overloaded')
+                self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+    def test_a_feasibility_batch_holds_a_feasibility_slot_for_its_whole_stream(self):
+        body = {"targets": [TEST_UMF, TEST_UMF]}
+        completed = api_server.heavy_endpoints_stats()['endpoints']['feasibility']['completed']
+        response = self.client.post('/api/feasibility/batch', json=body)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        response.close()
+
+        self.assertEqual(lines[-1]['type'], 'done')
+        stats = api_server.heavy_endpoints_stats()['endpoints']['feasibility']
+        self.assertEqual(stats['running'], 0)
+        # Released once, although both the generator and the close release it
+        self.assertEqual(stats['completed'], completed + 1)
+
+        self.hold('feasibility')
+        refused = self.client.post('/api/feasibility/batch', json=body)
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused.get_json()['error'], 'overloaded')
+
+    def test_cheap_endpoints_and_cached_answers_do_not_queue(self):
+        self.client.post('/api/solve', json=solve_payload())
+        self.hold('solve')
+
+        self.assertEqual(self.client.get('/api/molar_masses').status_code, 200)
+        self.assertEqual(self.client.post('/api/solve', json=solve_payload()).status_code, 200)
+        self.assertEqual(self.client.post('/api/solve', json=solve_payload(max_solutions=1)).status_code, 429)
+
+    def test_a_request_in_the_queue_is_served_when_the_slot_frees(self):
+        api_server.HEAVY_ENDPOINT_LIMITS['solve'] = {'concurrency': 1, 'queue': 1}
+        api_server._heavy_acquire('solve')
+        answers = []
+        waiting = threading.Thread(target=lambda: answers.append(
+            api_server.app.test_client().post('/api/solve', json=solve_payload())))
+        waiting.start()
+        while api_server.heavy_endpoints_stats()['endpoints']['solve']['waiting'] == 0:
+            time.sleep(0.01)
+
+        refused = self.client.post('/api/solve', json=solve_payload(max_solutions=1))
+        api_server._heavy_release('solve', 0.0)
+        waiting.join()
+
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(answers[0].status_code, 200)
+
+    def test_the_pool_answers_what_the_request_thread_answers(self):
+        body = solve_payload(workers=2)
+        inline = self.client.post('/api/solve', json=body).get_json()
+        api_server.solve_cache_clear()
+
+        api_server.start_solver_pool(1)
+        self.addCleanup(api_server.stop_solver_pool)
+        pooled = self.client.post('/api/solve', json=body).get_json()
+
+        self.assertEqual(pooled['solutions'], inline['solutions'])
+        self.assertEqual(api_server.heavy_endpoints_stats()['pool_processes'], 1)
+        # The pool solves in one process, and says so about the workers asked for
+        self.assertEqual(inline['warnings'], [])
+        self.assertEqual(pooled['warnings'], [api_server.WORKERS_IGNORED_WARNING.format(workers=2)])
+
+
+class TestSolveJobs(unittest.TestCase):
+    """POST /api/jobs runs a solve in the background, GET polls it, DELETE cancels it"""
+
+    def setUp(self):
+        api_server.app.config['TESTING'] = True
+        self.client = api_server.app.test_client()
+        api_server.jobs_clear()
+        api_server.solve_cache_clear()
+        self.addCleanup(api_server.jobs_clear)
+        self.addCleanup(api_server.solve_cache_clear)
+
+    def submit(self, **overrides):
+        response = self.client.post('/api/jobs', json=solve_payload(**overrides))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.headers['Location'], response.get_json()['poll'])
+        return response.get_json()['job_id']
+
+    def wait(self, job_id, pending=api_server.JOB_PENDING_STATUSES):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            view = self.client.get(f'/api/jobs/{job_id}').get_json()
+            if view['status'] not in pending:
+                return view
+            time.sleep(0.01)
+        self.fail(f'job {job_id} is still {view["status"]}')
+
+    def test_a_finished_job_holds_the_answer_of_the_plain_endpoint(self):
+        for solver in ('iterative', 'classic'):
+            with self.subTest(solver=solver):
+                view = self.wait(self.submit(solver=solver))
+                self.assertEqual(view['status'], 'done')
+
+                api_server.solve_cache_clear()
+                plain = self.client.post('/api/solve', json=solve_payload(solver=solver)).get_json()
+                self.assertEqual(view['solutions'], plain['solutions'])
+
+    def test_a_repeat_is_done_on_submission(self):
+        self.wait(self.submit())
+        with patch.object(api_server, 'find_best_recipe') as engine:
+            response = self.client.post('/api/jobs', json=solve_payload())
+        engine.assert_not_called()
+        self.assertEqual(response.get_json()['status'], 'done')
+
+    def test_refusals_are_answered_at_submission(self):
+        response = self.client.post('/api/jobs', json=solve_payload(umf={}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'missing_umf')
+        self.assertEqual(self.client.get('/api/jobs/no-such-job').status_code, 404)
+
+    def test_a_running_job_stops_at_the_next_check_when_cancelled(self):
+        real = api_server.find_best_recipe
+        started = threading.Event()
+
+        def held(*args, cancel=None, **kwargs):
+            started.set()
+            cancel.wait(5)
+            return real(*args, cancel=cancel, **kwargs)
+
+        with patch.object(api_server, 'find_best_recipe', side_effect=held):
+            job_id = self.submit()
+            self.assertTrue(started.wait(5))
+            response = self.client.delete(f'/api/jobs/{job_id}')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()['status'], 'cancelling')
+            view = self.wait(job_id)
+
+        self.assertEqual(view['status'], 'cancelled')
+        self.assertNotIn('solutions', view)
+        self.assertEqual(api_server.solve_cache_stats()['entries'], 0)
+
+    def test_a_finished_job_is_deleted(self):
+        job_id = self.submit()
+        self.wait(job_id)
+        self.assertEqual(self.client.delete(f'/api/jobs/{job_id}').get_json(), {"deleted": job_id})
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}').status_code, 404)
+
+    def test_submissions_beyond_the_pending_cap_are_refused(self):
+        with patch.object(api_server, 'MAX_PENDING_JOBS', 0):
+            response = self.client.post('/api/jobs', json=solve_payload())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.get_json()['error'], 'too_many_jobs')
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+
 class TestSolveWarnsAboutOxidesItRefused(unittest.TestCase):
     """
     An oxide the request asked for and the answer does not fit is SAID
@@ -172,6 +518,9 @@ class TestSolveWarnsAboutOxidesItRefused(unittest.TestCase):
     def setUp(self):
         api_server.app.config['TESTING'] = True
         self.client = api_server.app.test_client()
+        # Every test here is about what the engine is handed, and a cached
+        # answer would skip the engine
+        api_server.solve_cache_clear()
 
     def post_solve(self, umf, **overrides):
         payload = solve_payload(**overrides)
@@ -564,6 +913,25 @@ class TestSensitivityEndpoint(unittest.TestCase):
         self.assertIsNone(body['error'])
         self.assertEqual(body['by_material'][0]['material'], "Улексит (Химпэк)")
 
+    def test_monte_carlo_mode_adds_its_block(self):
+        response = self.client.post('/api/sensitivity', json={
+            "recipe": self.RECIPE, "mode": "monte_carlo", "samples": 500, "seed": 3})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['by_material'][0]['material'], "Улексит (Химпэк)")
+        self.assertEqual(body['monte_carlo']['samples'], 500)
+        self.assertEqual(set(body['monte_carlo']['bands']), set(body['umf']))
+
+    def test_invalid_monte_carlo_parameters_are_a_bad_request(self):
+        for extra in ({"mode": "guess"}, {"mode": "monte_carlo", "samples": 10},
+                      {"mode": "monte_carlo", "samples": api_server.MAX_SENSITIVITY_SAMPLES + 1},
+                      {"mode": "monte_carlo", "seed": "x"}):
+            with self.subTest(extra=extra):
+                response = self.client.post('/api/sensitivity', json=dict(recipe=self.RECIPE, **extra))
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], 'invalid_parameter')
+
     def test_missing_recipe_returns_400(self):
         response = self.client.post('/api/sensitivity', json={})
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylint: disable=multiple-statements, logging-fstring-interpolation, trailing-whitespace, line-too-long
+# pylint: disable=broad-exception-caught, missing-function-docstring, missing-class-docstring
+# pylint: disable=f-string-without-interpolation
+# pylance: disable=reportMissingImports, reportMissingModuleSource
+
+"""
+The corpus runner of bench/corpus.py without the corpus
+
+tests/test_inverse_corpus.py runs the real sample and needs the Glazy dump;
+what is pinned here needs nothing but a few hand-built cases of the same shape
+build_cases() produces: that the rows of a run in several processes are the
+rows of a serial run, in the same order, and that every row carries its clocks.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Fix imports by adding parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import corpus as bench_corpus
+from bench import diff_baseline
+from common import weights_to_umf
+from solver_classic import calculate_recipe_composition
+
+MATERIALS = [
+    {'name': 'Кремнезём (тест)', 'formula': {'SiO2': 100.0}, 'priority': 1},
+    {'name': 'Волластонит (тест)', 'formula': {'SiO2': 51.7, 'CaO': 48.3}, 'priority': 2},
+    {'name': 'Каолин (тест)', 'formula': {'SiO2': 46.5, 'Al2O3': 39.5}, 'priority': 3},
+    {'name': 'Кальцит (тест)', 'formula': {'CaO': 56.0}, 'priority': 4},
+]
+ORIGINALS = [
+    {'Кремнезём (тест)': 30.0, 'Волластонит (тест)': 40.0, 'Каолин (тест)': 30.0},
+    {'Волластонит (тест)': 60.0, 'Каолин (тест)': 40.0},
+    {'Кремнезём (тест)': 35.0, 'Каолин (тест)': 25.0, 'Кальцит (тест)': 40.0},
+]
+
+# Whatever the run measured about time; everything else has to be equal
+CLOCKS = ('seconds', 'cpu_seconds')
+
+
+def case(glazy_id, original):
+    return {
+        'glazy_id': glazy_id,
+        'name': f'Тест {glazy_id}',
+        'size': len(original),
+        'bucket': bench_corpus.size_bucket(len(original)),
+        'original': dict(original),
+        'materials': [dict(record) for record in MATERIALS],
+        'target_umf': weights_to_umf(calculate_recipe_composition(MATERIALS, original)),
+        'unanalysed': 0,
+    }
+
+
+def without_clocks(rows):
+    return [{key: value for key, value in row.items() if key not in CLOCKS} for row in rows]
+
+
+class TheParallelRunner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sample = [case(100 + index, original) for index, original in enumerate(ORIGINALS)]
+        cls.tasks = ([(item, bench_corpus.ENGINE_ITERATIVE, bench_corpus.SCENARIO_A) for item in cls.sample]
+                     + [(item, bench_corpus.ENGINE_CLASSIC, bench_corpus.SCENARIO_A) for item in cls.sample])
+        cls.serial = bench_corpus.run_cases(cls.tasks)
+
+    def test_every_row_carries_both_clocks(self):
+        for row in self.serial:
+            self.assertEqual(row['status'], 'solved')
+            self.assertGreater(row['seconds'], 0.0)
+            self.assertGreater(row['cpu_seconds'], 0.0)
+
+    def test_every_row_counts_what_its_search_did(self):
+        for row in self.serial:
+            self.assertGreater(row['nnls_calls'], 0)
+            self.assertGreaterEqual(row['nnls_spared'], 0)
+            # Scenario A asks no LP anything
+            self.assertEqual(row['lp_calls'], 0)
+            if row['engine'] == bench_corpus.ENGINE_ITERATIVE:
+                self.assertGreaterEqual(row['beam_levels'], 1)
+                self.assertGreaterEqual(row['prune_rounds'], 0)
+            else:
+                self.assertIsNone(row['beam_levels'])
+                self.assertIsNone(row['prune_rounds'])
+
+    def test_both_engines_count_only_the_fits_that_ran_nnls(self):
+        iterative = bench_corpus._search_counts({'nnls_solves': {'warm': 3, 'cold': 5, 'batched': 40},
+                                                 'levels_completed': 2, 'prune_rounds': 1},
+                                                bench_corpus.ENGINE_ITERATIVE)
+        classic = bench_corpus._search_counts({'nnls_solves': {'solved': 8, 'avoided': 40}},
+                                              bench_corpus.ENGINE_CLASSIC)
+        self.assertEqual((iterative['nnls_calls'], iterative['nnls_spared']), (8, 40))
+        self.assertEqual((classic['nnls_calls'], classic['nnls_spared']), (8, 40))
+
+    def test_scenario_b_counts_the_lps_of_its_verdict(self):
+        row = bench_corpus.run_case(self.sample[0], bench_corpus.ENGINE_ITERATIVE, bench_corpus.SCENARIO_B)
+        self.assertIsNotNone(row['feasible'])
+        # The minimax and the polish at least
+        self.assertGreaterEqual(row['lp_calls'], 2)
+
+    def test_the_profile_of_an_engine_holds_its_costs(self):
+        costs = bench_corpus.engine_profile(self.serial, bench_corpus.ENGINE_CLASSIC)['costs']
+        self.assertEqual(set(costs), set(bench_corpus.COST_METRICS))
+        self.assertEqual(costs['seconds']['n'], len(self.sample))
+        self.assertIsNone(costs['beam_levels'])
+
+    def test_several_processes_give_the_serial_rows_in_the_serial_order(self):
+        parallel = bench_corpus.run_cases(self.tasks, jobs=2)
+
+        self.assertEqual([(row['glazy_id'], row['engine']) for row in parallel],
+                         [(item['glazy_id'], engine) for item, engine, _scenario in self.tasks])
+        self.assertEqual(without_clocks(parallel), without_clocks(self.serial))
+
+    def test_run_sample_is_the_runner_over_one_pass(self):
+        rows = bench_corpus.run_sample(self.sample, bench_corpus.ENGINE_ITERATIVE)
+        self.assertEqual(without_clocks(rows), without_clocks(self.serial[:len(self.sample)]))
+
+    def test_progress_is_reported_by_the_row(self):
+        calls = []
+        with mock.patch.object(bench_corpus, 'run_case', side_effect=lambda *args: {'glazy_id': 1}):
+            bench_corpus.run_cases([self.tasks[0]] * 50, progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(calls, [(25, 50), (50, 50)])
+
+    def test_the_snapshot_records_the_processes_and_the_clocks(self):
+        corpus = {'stats': {}}
+        timings = {'dump': 'test.yaml.gz', 'dump_size': 0, 'source': 'slim', 'seconds': 0.0}
+        with mock.patch.object(bench_corpus, 'load_corpus', return_value=(corpus, timings)), \
+                mock.patch.object(bench_corpus, 'build_cases', return_value=(list(self.sample), {})), \
+                mock.patch.object(bench_corpus, 'stratified_sample', side_effect=lambda cases, **_kw: list(cases)), \
+                contextlib.redirect_stdout(io.StringIO()):
+            snapshot = diff_baseline.run_corpus(bench_corpus.DEFAULT_SEED, 3, 2, 1, jobs=2)
+
+        run = snapshot['run']
+        self.assertEqual(run['jobs'], 2)
+        self.assertEqual(len(snapshot['cases']), 3 + 2 + 1)
+        self.assertAlmostEqual(run['cpu_seconds'], sum(row['cpu_seconds'] for row in snapshot['cases']))
+        # The rows follow the passes: A / iterative, A / classic, B / iterative
+        self.assertEqual([(row['scenario'], row['engine']) for row in snapshot['cases']],
+                         [('A', 'iterative')] * 3 + [('A', 'classic')] * 2 + [('B', 'iterative')])
+        self.assertEqual([row['glazy_id'] for row in snapshot['cases'][:3]], run['sampled_ids']['iterative'])
+
+
+if __name__ == '__main__':
+    unittest.main()
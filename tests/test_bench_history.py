@@ -927,6 +927,110 @@ class TheChemistryGate(unittest.TestCase):
             history.build_record(snapshot(), recorded_at=PINNED)))
 
 
+class TheLatencyGate(unittest.TestCase):
+    """p50 / p95 of the wall clock per case, one rule for the diff and the log"""
+
+    @staticmethod
+    def _timed(seconds, jobs=None, cases=12):
+        rows = []
+        for glazy_id in range(1, cases + 1):
+            row = case(glazy_id)
+            row.update({'seconds': seconds, 'cpu_seconds': seconds, 'nnls_calls': 40,
+                        'lp_calls': 0, 'beam_levels': 3, 'prune_rounds': 2})
+            rows.append(row)
+        run = snapshot(rows, sample_size=cases)
+        if jobs is not None:
+            run['run']['jobs'] = jobs
+        return run
+
+    def _diff(self, before, after):
+        _lines, comparison = diff_baseline.build_report(before, after)
+        problems = diff_baseline.check_regressions(comparison)
+        return problems, comparison['provenance']['ungated']
+
+    def test_the_rule(self):
+        fast = bench_corpus.profile([0.1] * 12)
+        problems, skipped = bench_corpus.latency_regressions(fast, bench_corpus.profile([0.2] * 12))
+        self.assertIsNone(skipped)
+        self.assertEqual(2, len(problems), problems)
+
+        # Inside the band, and below the floor whatever the ratio
+        self.assertEqual(([], None), bench_corpus.latency_regressions(
+            fast, bench_corpus.profile([0.12] * 12)))
+        self.assertEqual(([], None), bench_corpus.latency_regressions(
+            bench_corpus.profile([0.002] * 12), bench_corpus.profile([0.004] * 12)))
+
+        # Faster is never a problem
+        self.assertEqual(([], None), bench_corpus.latency_regressions(
+            bench_corpus.profile([0.2] * 12), fast))
+
+    def test_a_gate_that_cannot_run_says_why(self):
+        fast = bench_corpus.profile([0.1] * 12)
+        slow = bench_corpus.profile([0.2] * 12)
+        for before, after, jobs in ((None, slow, (1, 1)),
+                                    (bench_corpus.profile([0.1] * 3), bench_corpus.profile([0.2] * 3), (1, 1)),
+                                    (fast, slow, (1, 4))):
+            with self.subTest(jobs=jobs):
+                problems, skipped = bench_corpus.latency_regressions(before, after, *jobs)
+                self.assertEqual([], problems)
+                self.assertTrue(skipped)
+
+        # A run from before the parallel runner was serial
+        self.assertIsNone(bench_corpus.latency_regressions(fast, slow, None, 1)[1])
+
+    def test_the_diff_fails_a_slower_run(self):
+        problems, _skipped = self._diff(self._timed(0.1), self._timed(0.2))
+        self.assertTrue(any('latency median grew' in problem for problem in problems), problems)
+        self.assertTrue(any('latency p95 grew' in problem for problem in problems), problems)
+
+        problems, skipped = self._diff(self._timed(0.1), self._timed(0.105))
+        self.assertEqual([], [problem for problem in problems if 'latency' in problem])
+        self.assertEqual([], [note for note in skipped if 'latency' in note])
+
+    def test_the_diff_says_when_it_did_not_gate(self):
+        # The committed baseline predates the timings
+        problems, skipped = self._diff(snapshot(), self._timed(0.2, cases=3))
+        self.assertEqual([], [problem for problem in problems if 'latency' in problem])
+        self.assertTrue(any('latency was not gated' in note for note in skipped), skipped)
+
+        problems, skipped = self._diff(self._timed(0.1), self._timed(0.2, jobs=4))
+        self.assertEqual([], [problem for problem in problems if 'latency' in problem])
+        self.assertTrue(any('processes' in note for note in skipped), skipped)
+
+    def test_the_report_prints_the_costs(self):
+        lines, _comparison = diff_baseline.build_report(self._timed(0.1), self._timed(0.2))
+        text = '\n'.join(lines)
+        self.assertIn('costs over the 12 cases of both runs', text)
+        self.assertRegex(text, r'nnls_calls +n=12')
+
+    def test_the_log_carries_the_costs_and_gates_its_last_run(self):
+        before = history.build_record(self._timed(0.1), recorded_at=PINNED)
+        after = history.build_record(self._timed(0.2), recorded_at=PINNED)
+
+        costs = after['engines']['iterative']['costs']
+        self.assertEqual(0.2, costs['seconds']['p95'])
+        self.assertEqual(40, costs['nnls_calls']['median'])
+        self.assertEqual(2, len(history.check_latency([before, after])))
+        # Only the last step of a series fails --check; the older one is history
+        self.assertEqual([], history.check_latency([before, after, after]))
+
+        text = '\n'.join(history.render([before, after], [], 'bench/history.jsonl'))
+        self.assertIn('cost per case: wall p50 200.0 ms', text)
+        self.assertIn('!! SLOWER vs #1', text)
+
+    def test_history_check_exits_1_on_a_slower_last_run(self):
+        directory = tempfile.mkdtemp(prefix='glazy_history_')
+        self.addCleanup(shutil.rmtree, directory, True)
+        log = os.path.join(directory, 'history.jsonl')
+        for seconds in (0.1, 0.2):
+            history.append_record(log, history.build_record(self._timed(seconds), recorded_at=PINNED))
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(1, history.main(['--log', log, '--check']))
+            self.assertEqual(0, history.main(['--log', log]))
+        self.assertIn('LATENCY REGRESSIONS', out.getvalue())
+
+
 class TheCommittedLog(unittest.TestCase):
     """The real bench/history.jsonl has to stay readable"""
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylint: disable=multiple-statements, logging-fstring-interpolation, trailing-whitespace, line-too-long
+# pylint: disable=broad-exception-caught, missing-function-docstring, missing-class-docstring
+# pylint: disable=f-string-without-interpolation
+# pylance: disable=reportMissingImports, reportMissingModuleSource
+
+"""
+The calls per second of scipy NNLS against the batched kernel (bench/nnls.py)
+
+As for bench/ranges.py the timings are the machine's business and are not
+pinned. What is pinned is that both sides solve the same stack and that an
+answer other than scipy's is caught rather than timed.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Fix imports by adding parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import nnls as bench_nnls
+
+SILICA = {"name": "Кремнезём (тест)", "formula": {"SiO2": 100.0}}
+CHALK = {"name": "Кальцит (тест)", "formula": {"CaO": 100.0}}
+ALUMINA = {"name": "Глинозём (тест)", "formula": {"Al2O3": 100.0}}
+WOLLASTONITE = {"name": "Волластонит (тест)", "formula": {"SiO2": 51.7, "CaO": 48.3}}
+TARGET = {"SiO2": 3.0, "Al2O3": 0.3, "CaO": 1.0}
+
+
+class TestNnlsBenchmark(unittest.TestCase):
+
+    def test_every_stack_size_gets_a_row_that_agrees_with_scipy(self):
+        rows = bench_nnls.measure(TARGET, [SILICA, CHALK, ALUMINA, WOLLASTONITE],
+                                  batches=(3, 7), size=2, repeats=2)
+
+        self.assertEqual([row['batch'] for row in rows], [3, 7])
+        for row in rows:
+            self.assertGreater(row['scipy_per_second'], 0.0)
+            self.assertAlmostEqual(row['speedup'],
+                                   row['batch_per_second'] / row['scipy_per_second'])
+            self.assertLess(row['max_difference'], bench_nnls.MAX_RELATIVE_DIFFERENCE)
+
+    def test_the_problems_are_drawn_from_the_pool(self):
+        stack, b = bench_nnls.problems(TARGET, [SILICA, CHALK, ALUMINA], count=5, size=2)
+
+        self.assertEqual(stack.shape, (5, 3, 2))
+        self.assertEqual(b.shape, (3,))
+        # Every column is one of the three unit formulas
+        for matrix in stack:
+            self.assertTrue(np.all(np.count_nonzero(matrix, axis=0) == 1))
+
+    def test_a_wrong_answer_is_measured(self):
+        stack, b = bench_nnls.problems(TARGET, [SILICA, CHALK, ALUMINA], count=2, size=3)
+        self.assertGreater(bench_nnls._largest_difference(stack, b, np.zeros((2, 3))), 0.1)
+
+    def test_the_report_has_a_line_per_stack_size(self):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            status = bench_nnls.main(['--batch', '2', '5', '--repeats', '1'])
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(out.getvalue().strip().splitlines()), 2 + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
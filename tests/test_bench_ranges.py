@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylint: disable=multiple-statements, logging-fstring-interpolation, trailing-whitespace, line-too-long
+# pylint: disable=broad-exception-caught, missing-function-docstring, missing-class-docstring
+# pylint: disable=f-string-without-interpolation
+# pylance: disable=reportMissingImports, reportMissingModuleSource
+
+"""
+The serial against parallel timing of the achievable ranges (bench/ranges.py)
+
+The timings themselves are the machine's business and are not pinned. What is
+pinned is what makes them worth reading: every width is measured on the same
+question, its answer is compared with the serial one, and an answer of another
+shape is flagged rather than averaged in.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+# Fix imports by adding parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import ranges as bench_ranges
+
+SILICA = {"name": "Кремнезём (тест)", "formula": {"SiO2": 100.0}}
+CHALK = {"name": "Кальцит (тест)", "formula": {"CaO": 100.0}}
+ALUMINA = {"name": "Глинозём (тест)", "formula": {"Al2O3": 100.0}}
+
+
+class TestRangesBenchmark(unittest.TestCase):
+
+    def test_every_width_gets_a_row_measured_against_the_serial_answer(self):
+        rows = bench_ranges.measure({"SiO2": 3.0, "Al2O3": 0.3, "CaO": 1.0},
+                                    [SILICA, CHALK, ALUMINA], workers=(1, 2), repeats=2)
+
+        self.assertEqual([row['workers'] for row in rows], [1, 2])
+        self.assertEqual(rows[0]['speedup'], 1.0)
+        for row in rows:
+            self.assertEqual(row['lp_count'], 1 + 2 * (3 + 3))
+            self.assertLess(row['max_difference'], 1e-9)
+            self.assertLessEqual(row['best_ms'], row['median_ms'])
+
+    def test_an_answer_of_another_shape_is_flagged(self):
+        serial = {"oxide_ranges": {"SiO2": [2.9, 3.1]}, "material_ranges": {}}
+        unbounded = {"oxide_ranges": {"SiO2": [2.9, None]}, "material_ranges": {}}
+
+        self.assertIsNone(bench_ranges._largest_difference(serial, unbounded))
+        self.assertIsNone(bench_ranges._largest_difference(serial, {}))
+        self.assertAlmostEqual(bench_ranges._largest_difference(
+            serial, {"oxide_ranges": {"SiO2": [2.9, 3.1 + 1e-12]}, "material_ranges": {}}),
+            1e-12, places=15)
+
+    def test_the_reference_target_is_the_fixture_recipe(self):
+        self.assertIn('SiO2', bench_ranges.reference_target())
+
+    def test_the_report_has_a_line_per_width(self):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            status = bench_ranges.main(['--workers', '1', '2', '--repeats', '1'])
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(out.getvalue().strip().splitlines()), 2 + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,11 +10,15 @@
 
 import json
 import math
+import pickle
 import unittest
 import sys
 import os
 from unittest import mock
 
+import numpy as np
+from scipy.optimize import nnls
+
 # Fix imports by adding parent directory to path
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_DIR)
@@ -22,7 +26,9 @@ import common
 from common import (
     OXIDE_SCALE_FLOOR,
     weights_to_umf,
+    weights_to_umf_batch,
     umf_to_weights,
+    umf_to_weights_batch,
     umf_deviation,
     calc_ratios_umf,
     calculate_umf_from_recipe,
@@ -30,10 +36,14 @@ from common import (
     make_json_safe,
     load_materials,
     load_molar_masses,
+    material_by_name,
+    material_records,
     oxides_classification,
     resolve_inventory,
     filter_materials_by_inventory,
     filter_materials_with_formula,
+    nnls_active_set,
+    nnls_batch,
 )
 from solver_classic import calculate_recipe_composition, calculate_umf_error
 from solver_iterative import _flux_sum
@@ -554,6 +564,67 @@ class TestUmfConversions(unittest.TestCase):
         self.assertAlmostEqual(sum(weights.values()), 100.0, delta=0.05)
 
 
+class TestBatchUmfConversions(unittest.TestCase):
+    """The array conversions are the dictionary ones, row by row"""
+
+    OXIDES = ['SiO2', 'Al2O3', 'B2O3', 'CaO', 'Na2O', 'K2O', 'MgO', 'Fe2O3', 'TiO2', 'LOI']
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.rows = rng.uniform(0.0, 60.0, size=(50, len(self.OXIDES)))
+        # Rows where whole groups are absent, including every flux
+        self.rows[1, 3:7] = 0.0
+        self.rows[2, :] = 0.0
+        self.rows[2, 0] = 10.0
+
+    def test_unrounded_weights_to_umf_is_bit_for_bit_the_dictionary_one(self):
+        for convention in (None, 'glazy', 'segerlab'):
+            batch = weights_to_umf_batch(self.rows, self.OXIDES, convention=convention,
+                                         round_digits=None)
+            for row, converted in zip(self.rows, batch):
+                expected = weights_to_umf(dict(zip(self.OXIDES, row)), convention=convention,
+                                          round_digits=None)
+                actual = {oxide: value for oxide, value in zip(self.OXIDES, converted)
+                          if oxide in expected}
+                self.assertEqual(actual, expected)
+                self.assertEqual(converted[self.OXIDES.index('LOI')], 0.0)
+
+    def test_rounded_weights_to_umf_keeps_the_default_digits(self):
+        batch = weights_to_umf_batch(self.rows[:5], self.OXIDES)
+        for row, converted in zip(self.rows[:5], batch):
+            expected = weights_to_umf(dict(zip(self.OXIDES, row)))
+            for oxide, value in expected.items():
+                self.assertAlmostEqual(converted[self.OXIDES.index(oxide)], value, places=9)
+
+    def test_umf_to_weights_matches_row_by_row(self):
+        batch = umf_to_weights_batch(self.rows, self.OXIDES)
+        for row, converted in zip(self.rows, batch):
+            expected = umf_to_weights(dict(zip(self.OXIDES, row)))
+            for oxide, value in expected.items():
+                self.assertAlmostEqual(converted[self.OXIDES.index(oxide)], value, places=9)
+
+    def test_a_single_row_keeps_its_shape(self):
+        converted = weights_to_umf_batch(self.rows[0], self.OXIDES, round_digits=None)
+        self.assertEqual(converted.shape, (len(self.OXIDES),))
+        np.testing.assert_array_equal(
+            converted, weights_to_umf_batch(self.rows[:1], self.OXIDES, round_digits=None)[0])
+
+    def test_a_row_with_nothing_to_convert_is_nan_not_an_exception(self):
+        rows = np.array([[0.0, 0.0], [5.0, 0.0]])
+        umf = weights_to_umf_batch(rows, ['SiO2', 'CaO'], round_digits=None)
+        self.assertTrue(np.isnan(umf[0]).all())
+        # Normalized on its only oxide, as weights_to_umf falls back to
+        self.assertAlmostEqual(umf[1, 0], 1.0, places=12)
+        self.assertEqual(umf[1, 1], 0.0)
+        self.assertTrue(np.isnan(umf_to_weights_batch(rows[:1], ['SiO2', 'CaO'])).all())
+
+    def test_an_oxide_without_a_molar_mass_is_zero_and_warned_about(self):
+        with self.assertLogs('common', level='WARNING') as logs:
+            umf = weights_to_umf_batch([[60.0, 10.0, 1.0]], ['SiO2', 'CaO', 'Unobtainium'])
+        self.assertEqual(umf[0, 2], 0.0)
+        self.assertIn('Unobtainium', logs.output[0])
+
+
 class TestCalculateUmfFromRecipe(unittest.TestCase):
 
     def weight_composition_of(self, recipe):
@@ -768,6 +839,55 @@ class TestMaterialPriorities(unittest.TestCase):
         self.assertGreater(materials["Карбонат цинка, ZnCO3"], materials["Нефелин-сиенит VR13"])
 
 
+class TestMaterialStore(unittest.TestCase):
+    """The database is parsed once per process and handed out read-only"""
+
+    def test_the_records_are_the_same_objects_every_call(self):
+        self.assertIs(material_records(), material_records())
+
+    def test_a_record_cannot_be_changed_through_the_store(self):
+        record = material_records()[0]
+
+        with self.assertRaises(TypeError):
+            record['priority'] = 0
+        with self.assertRaises(TypeError):
+            record['formula']['SiO2'] = 100.0
+        with self.assertRaises(TypeError):
+            record.update(name='other')
+
+    def test_load_materials_still_hands_out_private_copies(self):
+        materials = load_materials(only_inventory=False, priority=True)
+        materials[0]['priority'] = -1
+        materials[0]['formula']['SiO2'] = -1.0
+
+        self.assertNotEqual(material_records()[0]['priority'], -1)
+        self.assertNotEqual(material_records()[0]['formula'].get('SiO2'), -1.0)
+        self.assertEqual(load_materials(only_inventory=False, priority=True),
+                         list(material_records()))
+
+    def test_lookup_by_name_agrees_with_the_list(self):
+        for priority in (True, False):
+            with self.subTest(priority=priority):
+                for record in material_records(priority=priority):
+                    self.assertIs(material_by_name(record['name'], priority=priority), record)
+        self.assertIsNone(material_by_name('Unobtainium'))
+        self.assertNotIn('priority', material_by_name('Каолин КЖФ-1', priority=False))
+
+    def test_a_changed_file_is_read_again(self):
+        before = material_records()
+        with mock.patch.object(common, '_MATERIAL_STORE', dict(common._MATERIAL_STORE, signature=None)):
+            after = material_records()
+
+        self.assertIsNot(after, before)
+        self.assertEqual(after, before)
+
+    def test_a_record_survives_pickle_and_json(self):
+        record = material_records()[0]
+
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+        self.assertEqual(json.loads(json.dumps(record)), record)
+
+
 class TestUmfDeviation(unittest.TestCase):
     """
     The one scale the whole system judges a formula on (TZ_SOLVER_V2.md 10.18)
@@ -993,5 +1113,118 @@ class TestUmfDeviation(unittest.TestCase):
         self.assertGreaterEqual(checked, 10)
 
 
+class TestNnlsActiveSet(unittest.TestCase):
+    """
+    The warm-startable NNLS has to land where scipy's cold one does, from any
+    seed: a seed is a starting point, never an assumption about the answer.
+    """
+
+    @staticmethod
+    def problems(count, seed):
+        """Sparse non-negative problems, a third of them with dependent columns"""
+        rng = np.random.default_rng(seed)
+        for index in range(count):
+            m, n = int(rng.integers(2, 20)), int(rng.integers(1, 14))
+            a = np.abs(rng.normal(size=(m, n))) * (rng.random((m, n)) < 0.5) * 50
+            if n > 2 and index % 3 == 0:
+                a[:, 1] = a[:, 0]
+                a[:, 2] = a[:, 0] + 0.5 * a[:, 1]
+            b = np.abs(rng.normal(size=m)) * 10
+            passive = rng.choice(n, size=int(rng.integers(0, n + 1)), replace=False)
+            yield a, b, passive
+
+    def test_the_residual_matches_scipy_cold_and_seeded(self):
+        for a, b, passive in self.problems(400, seed=1):
+            _x, expected = nnls(a, b)
+            for start in ((), passive):
+                x, residual, _pivots = nnls_active_set(a, b, start)
+                self.assertTrue(np.all(x >= 0.0))
+                self.assertAlmostEqual(residual, expected, delta=1e-9 * (1.0 + expected))
+
+    def test_a_full_rank_problem_has_the_same_solution(self):
+        rng = np.random.default_rng(7)
+        for _ in range(100):
+            a = np.abs(rng.normal(size=(12, 6)))
+            b = np.abs(rng.normal(size=12))
+            expected, _residual = nnls(a, b)
+            x, _residual, _pivots = nnls_active_set(a, b, np.flatnonzero(expected > 0))
+            np.testing.assert_allclose(x, expected, atol=1e-10)
+
+    def test_an_exact_seed_needs_no_pivot_beyond_the_seed(self):
+        rng = np.random.default_rng(3)
+        a = np.abs(rng.normal(size=(12, 6)))
+        b = a @ np.array([1.0, 0.0, 2.0, 0.0, 0.5, 0.0])
+        support = [0, 2, 4]
+
+        _cold_x, _residual, cold = nnls_active_set(a, b)
+        x, _residual, warm = nnls_active_set(a, b, support)
+
+        self.assertEqual(warm, len(support))
+        self.assertLessEqual(warm, cold)
+        np.testing.assert_allclose(x, [1.0, 0.0, 2.0, 0.0, 0.5, 0.0], atol=1e-10)
+
+    def test_seed_entries_outside_the_matrix_are_ignored(self):
+        a = np.eye(3)
+        b = np.array([1.0, -1.0, 2.0])
+        x, _residual, _pivots = nnls_active_set(a, b, [7, -1, 1, 1])
+        np.testing.assert_allclose(x, [1.0, 0.0, 2.0])
+
+
+
+class TestNnlsBatch(unittest.TestCase):
+    """
+    The batched NNLS has to answer every problem of a stack the way scipy
+    answers it alone: the same residual always, the same weights wherever the
+    optimum is unique.
+    """
+
+    @staticmethod
+    def stack(count, m, n, seed, dependent=False):
+        """Sparse non-negative problems of one shape sharing one right hand side"""
+        rng = np.random.default_rng(seed)
+        a = np.abs(rng.normal(size=(count, m, n))) * (rng.random((count, m, n)) < 0.5) * 50
+        if dependent:
+            a[::3, :, 1] = a[::3, :, 0]
+            a[::3, :, 2] = a[::3, :, 0] + 0.5 * a[::3, :, 1]
+        return a, np.abs(rng.normal(size=m)) * 10
+
+    def test_the_residual_matches_scipy(self):
+        for seed, (m, n) in enumerate(((12, 6), (12, 10), (20, 10), (4, 8), (12, 1))):
+            a, b = self.stack(150, m, n, seed, dependent=n > 2)
+            x, residuals = nnls_batch(a, b)
+            for matrix, weights, residual in zip(a, x, residuals):
+                _expected, expected = nnls(matrix, b)
+                self.assertTrue(np.all(weights >= 0.0))
+                self.assertAlmostEqual(residual, expected, delta=1e-9 * (1.0 + expected))
+
+    def test_a_full_rank_problem_has_the_same_solution(self):
+        rng = np.random.default_rng(7)
+        a = np.abs(rng.normal(size=(100, 12, 6)))
+        b = np.abs(rng.normal(size=12))
+        x, _residuals = nnls_batch(a, b)
+        for matrix, weights in zip(a, x):
+            np.testing.assert_allclose(weights, nnls(matrix, b)[0], atol=1e-10)
+
+    def test_narrower_matrices_are_padded_with_zero_weights(self):
+        rng = np.random.default_rng(5)
+        b = np.abs(rng.normal(size=12))
+        matrices = [np.abs(rng.normal(size=(12, n))) for n in (3, 6, 1, 5)]
+        x, _residuals = nnls_batch(matrices, b)
+
+        self.assertEqual(x.shape, (4, 6))
+        for matrix, weights in zip(matrices, x):
+            n = matrix.shape[1]
+            np.testing.assert_allclose(weights[:n], nnls(matrix, b)[0], atol=1e-10)
+            self.assertTrue(np.all(weights[n:] == 0.0))
+
+    def test_a_right_hand_side_nothing_reaches_gives_zero(self):
+        a = np.zeros((2, 3, 2))
+        a[0, 0, 0] = 1.0
+        a[1, 0, 1] = 1.0
+        x, residuals = nnls_batch(a, np.array([-1.0, 0.0, 0.0]))
+        np.testing.assert_array_equal(x, np.zeros((2, 2)))
+        np.testing.assert_allclose(residuals, [1.0, 1.0])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -12,18 +12,22 @@ import json
 import math
 import os
 import sys
+import time
 import unittest
 import warnings
+from unittest import mock
 
 import numpy as np
 
 # Fix imports by adding parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import feasibility
 from common import flux_oxides, load_materials, load_molar_masses
 from feasibility import (DEFAULT_FEASIBILITY_TOL, MAX_CONDITION_NUMBER, MIN_FLUX_SHARE,
                          OXIDE_SCALE_FLOOR, achievable_ranges, build_molar_matrix,
-                         check_feasibility, flux_row, matrix_diagnostics,
-                         projected_range_lps, usable_oxides)
+                         check_feasibility, check_feasibility_batch, check_session, flux_row,
+                         matrix_diagnostics, open_feasibility_session, projected_range_lps,
+                         reachable_region, screen_targets, session_stats, usable_oxides)
 
 FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
 
@@ -165,6 +169,12 @@ class TestCheckFeasibility(unittest.TestCase):
             self.assertTrue(row['reachable'], f"{oxide} unexpectedly out of reach")
             self.assertAlmostEqual(row['delta'], row['closest'] - row['target'])
 
+    def test_every_lp_of_a_check_is_counted(self):
+        before = feasibility.lp_calls()
+        check_feasibility(recipe_01()['umf'], inventory_materials())
+        # The minimax and the polish at least
+        self.assertGreaterEqual(feasibility.lp_calls() - before, 2)
+
     def test_closest_recipe_sums_to_100(self):
         result = check_feasibility(recipe_01()['umf'], inventory_materials())
         total = sum(result['closest_recipe'].values())
@@ -651,6 +661,92 @@ class TestAchievableRanges(unittest.TestCase):
         self.assertTrue(result['feasible'])
         self.assertEqual(len(result['warnings']), 2)
 
+    def test_the_warm_started_model_answers_what_cold_starts_answer(self):
+        cases = ((recipe_01()['umf'], {}),
+                 ({"CaO": 1.0}, {"oxide_constraints": {"SiO2": [None, None]}}),
+                 (recipe_01()['umf'], {"material_constraints": {"Улексит (Химпэк)": [10, 12]}}))
+        for target, constraints in cases:
+            with self.subTest(target=target, constraints=constraints):
+                warm = achievable_ranges(target, inventory_materials(), **constraints)
+                with mock.patch.object(feasibility, '_highs_core', None):
+                    cold = achievable_ranges(target, inventory_materials(), **constraints)
+
+                self.assertEqual(warm['lp_count'], cold['lp_count'])
+                for key in ('oxide_ranges', 'material_ranges'):
+                    self.assertEqual(set(warm[key]), set(cold[key]))
+                    for name, (low, high) in warm[key].items():
+                        self.assertAlmostEqual(low, cold[key][name][0], places=7)
+                        if high is None:
+                            self.assertIsNone(cold[key][name][1])
+                        else:
+                            self.assertAlmostEqual(high, cold[key][name][1], places=7)
+
+    @unittest.skipIf(feasibility._highs_core is None, "scipy ships no HiGHS model object")
+    def test_the_warm_start_spends_fewer_pivots_than_cold_starts(self):
+        warm = achievable_ranges(recipe_01()['umf'], inventory_materials())
+        with mock.patch.object(feasibility, '_highs_core', None):
+            cold = achievable_ranges(recipe_01()['umf'], inventory_materials())
+
+        self.assertGreater(warm['pivots'], 0)
+        self.assertLess(warm['pivots'], cold['pivots'])
+
+    @unittest.skipIf(feasibility._highs_core is None, "scipy ships no HiGHS model object")
+    def test_the_import_probe_passes_on_this_scipy_and_fails_on_a_renamed_one(self):
+        self.assertTrue(feasibility._highs_works())
+        with mock.patch.object(feasibility._highs_core, '_Highs', None):
+            with self.assertRaises(Exception):
+                feasibility._highs_works()
+
+    def test_a_bail_out_reports_its_pivots_too(self):
+        result = achievable_ranges({"CaO": 1.0}, inventory_materials(),
+                                   oxide_constraints={"SiO2": [3.0, 2.0]})
+
+        self.assertFalse(result['feasible'])
+        self.assertIsInstance(result['pivots'], int)
+
+    def test_a_thread_pool_answers_what_the_serial_path_answers(self):
+        target = recipe_01()['umf']
+        serial = achievable_ranges(target, inventory_materials())
+        for workers in (2, 3, 5):
+            with self.subTest(workers=workers):
+                parallel = achievable_ranges(target, inventory_materials(), workers=workers)
+
+                self.assertTrue(parallel['feasible'])
+                self.assertEqual(parallel['lp_count'], serial['lp_count'])
+                self.assertEqual(parallel['example_recipe'], serial['example_recipe'])
+                for key in ('oxide_ranges', 'material_ranges'):
+                    # Same names in the same order: assembled as the serial path
+                    self.assertEqual(list(parallel[key]), list(serial[key]))
+                    for name, (low, high) in parallel[key].items():
+                        self.assertAlmostEqual(low, serial[key][name][0], places=7)
+                        self.assertAlmostEqual(high, serial[key][name][1], places=7)
+
+    def test_every_worker_count_shares_the_one_thread_pool(self):
+        target = recipe_01()['umf']
+        for workers in (2, 3, 5):
+            achievable_ranges(target, inventory_materials(), workers=workers)
+        executor = feasibility._RANGE_POOL['executor']
+        self.assertIsNotNone(executor)
+        self.assertEqual(executor._max_workers, feasibility.MAX_RANGE_WORKERS)
+
+    def test_a_thread_pool_still_stops_on_a_contradiction(self):
+        # A contradiction that only bites once S_flux is pinned to 1: every
+        # oxide LP is infeasible, and the chunks stop at their next LP
+        result = achievable_ranges({"CaO": 1.0}, inventory_materials(),
+                                   oxide_constraints={"SiO2": [3.0, 2.0]}, workers=4)
+
+        self.assertFalse(result['feasible'])
+        self.assertEqual(result['oxide_ranges'], {})
+        self.assertLessEqual(result['lp_count'], 1 + 4)
+
+    def test_a_worker_count_that_is_not_one_is_answered_serially(self):
+        for workers in (0, -2, 1.5, True, "2"):
+            with self.subTest(workers=workers):
+                result = achievable_ranges({"CaO": 1.0, "SiO2": 3.0}, SYNTHETIC, workers=workers)
+
+                self.assertTrue(result['feasible'])
+                self.assertTrue(any('потоков' in warning for warning in result['warnings']))
+
     def test_nothing_raises_out_of_the_range_machinery(self):
         for target, materials in (({"CaO": 1.0}, []),
                                   ({}, SYNTHETIC),
@@ -660,6 +756,163 @@ class TestAchievableRanges(unittest.TestCase):
             self.assertIn('feasible', result)
 
 
+class TestFeasibilitySession(unittest.TestCase):
+    """open_feasibility_session / check_session: the verdict of check_feasibility,
+    on models kept resident while the target is edited"""
+
+    def assertSameVerdict(self, cold, warm):
+        self.assertEqual(warm['feasible'], cold['feasible'])
+        self.assertAlmostEqual(warm['max_relative_deviation'], cold['max_relative_deviation'],
+                               places=9)
+        self.assertEqual(warm['unreachable_oxides'], cold['unreachable_oxides'])
+        self.assertEqual(warm['why'], cold['why'])
+        self.assertEqual(warm['warnings'], cold['warnings'])
+        closest = {row['oxide']: row['closest'] for row in cold['per_oxide']}
+        for row in warm['per_oxide']:
+            self.assertAlmostEqual(row['closest'], closest.get(row['oxide'], 0.0), places=7)
+
+    def test_an_edited_target_gets_the_verdict_check_feasibility_gives(self):
+        reference = recipe_01()['umf']
+        targets = [reference,
+                   dict(reference, SiO2=reference['SiO2'] * 1.2),
+                   dict(reference, Li2O=0.5),
+                   {"SiO2": 3.0, "Al2O3": 0.3, "CaO": 0.7, "K2O": 0.3},
+                   dict(reference, ZrO2=0.2),
+                   reference]
+        for passengers in (None, {"Fe2O3": 0.03}):
+            session = open_feasibility_session(inventory_materials(), passengers)
+            for target in targets:
+                with self.subTest(passengers=passengers, target=target):
+                    self.assertSameVerdict(
+                        check_feasibility(target, inventory_materials(), passengers=passengers),
+                        check_session(session, target))
+
+            stats = session_stats(session)
+            self.assertEqual(stats['checks'], len(targets))
+            # Li2O and ZrO2 are carried by nothing on the shelf: one rebuild each,
+            # and the last target, back to the reference, needs none
+            self.assertEqual(stats['rebuilds'], 2)
+            self.assertGreater(stats['pivots'], 0)
+
+    def test_the_tolerance_is_per_check(self):
+        session = open_feasibility_session(inventory_materials())
+        target = dict(recipe_01()['umf'], Li2O=0.5)
+
+        strict = check_session(session, target, tol=DEFAULT_FEASIBILITY_TOL)
+        loose = check_session(session, target, tol=strict['max_relative_deviation'] + 0.01)
+
+        self.assertFalse(strict['feasible'])
+        self.assertTrue(loose['feasible'])
+
+    def test_a_bad_target_is_refused_like_check_feasibility_refuses_it(self):
+        session = open_feasibility_session(inventory_materials())
+        for target in ({}, {"SiO2": 3.0}, {"Unobtainium": 1.0}):
+            with self.subTest(target=target):
+                self.assertEqual(check_session(session, target)['error'],
+                                 check_feasibility(target, inventory_materials())['error'])
+
+    def test_an_inventory_with_nothing_to_solve_opens_no_session(self):
+        self.assertEqual(open_feasibility_session([WATER])['error'], 'no_usable_materials')
+        self.assertEqual(open_feasibility_session([SILICA])['error'], 'no_fluxes')
+
+    def test_without_a_highs_model_the_session_answers_through_check_feasibility(self):
+        with mock.patch.object(feasibility, '_highs_core', None):
+            session = open_feasibility_session(SYNTHETIC, {"Fe2O3": 0.01})
+        target = {"CaO": 1.0, "SiO2": 3.0, "Al2O3": 0.3}
+
+        self.assertEqual(check_session(session, target),
+                         check_feasibility(target, SYNTHETIC, passengers={"Fe2O3": 0.01}))
+
+
+class TestReachableRegion(unittest.TestCase):
+    """reachable_region / screen_targets / check_feasibility_batch: the verdict
+    of check_feasibility from the facets of the inventory's cone, and the LP only
+    where they cannot tell"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.region = reachable_region(inventory_materials())
+
+    def targets(self):
+        reference = recipe_01()['umf']
+        return ([recipe['umf'] for recipe in reference_recipes()]
+                + [dict(reference, SiO2=reference['SiO2'] * 1.2),
+                   dict(reference, Li2O=0.5),
+                   dict(reference, ZrO2=0.2),
+                   {"SiO2": 3.0, "Al2O3": 0.3, "CaO": 0.7, "K2O": 0.3},
+                   {"SiO2": 30.0, "Al2O3": 0.3, "CaO": 0.7, "K2O": 0.3}])
+
+    def test_every_material_of_the_inventory_is_inside_every_facet(self):
+        oxides = self.region['oxides']
+        A, _ = build_molar_matrix(inventory_materials(), oxides)
+
+        self.assertEqual(self.region['dimension'], 11)
+        self.assertLessEqual(float((self.region['facets'] @ A).max()), 1e-12)
+
+    def test_a_decided_target_gets_the_verdict_the_lp_gives(self):
+        for passengers in (None, {"Fe2O3": 0.03}):
+            answers = check_feasibility_batch(self.targets(), inventory_materials(),
+                                              passengers=passengers, region=self.region)
+            for target, answer in zip(self.targets(), answers):
+                with self.subTest(passengers=passengers, target=target):
+                    expected = check_feasibility(target, inventory_materials(),
+                                                 passengers=passengers)
+                    self.assertEqual(answer['feasible'], expected['feasible'])
+                    if answer['decided_by'] == 'hull':
+                        self.assertLessEqual(answer['deviation_lower_bound'],
+                                             expected['max_relative_deviation'] + 1e-9)
+                    else:
+                        self.assertAlmostEqual(answer['max_relative_deviation'],
+                                               expected['max_relative_deviation'], places=9)
+                        self.assertEqual(answer['unreachable_oxides'],
+                                         expected['unreachable_oxides'])
+
+    def test_a_mix_of_the_shelf_is_reachable_without_an_lp(self):
+        # Half and half of two real materials is in the cone by construction
+        A, _ = build_molar_matrix(inventory_materials()[:2], self.region['oxides'])
+        mix = A.sum(axis=1) / (flux_row(self.region['oxides']) @ A.sum(axis=1))
+        target = {oxide: float(value) for oxide, value in zip(self.region['oxides'], mix) if value > 0}
+
+        [screen] = screen_targets(self.region, [target], tol=0.0)
+
+        self.assertEqual(screen['verdict'], 'reachable')
+
+    def test_an_oxide_nobody_carries_blocks_on_its_own(self):
+        [screen] = screen_targets(self.region, [dict(recipe_01()['umf'], Li2O=0.5)])
+
+        self.assertEqual(screen['verdict'], 'unreachable')
+        self.assertIn('Li2O', screen['blocking_oxides'])
+        self.assertGreater(screen['deviation_lower_bound'], DEFAULT_FEASIBILITY_TOL)
+
+    def test_a_segment_and_a_point_are_regions_too(self):
+        segment = reachable_region([CHALK, SILICA])
+        point = reachable_region([CHALK])
+        self.assertEqual((segment['dimension'], point['dimension']), (1, 0))
+
+        self.assertEqual([screen['verdict'] for screen in screen_targets(
+            segment, [{"CaO": 1.0, "SiO2": 2.0}, {"CaO": 1.0, "Al2O3": 0.3}])],
+            ['reachable', 'unreachable'])
+        self.assertEqual([screen['verdict'] for screen in screen_targets(
+            point, [{"CaO": 1.0}, {"CaO": 1.0, "SiO2": 2.0}])],
+            ['reachable', 'unreachable'])
+
+    def test_a_refused_target_is_refused_like_check_feasibility_refuses_it(self):
+        targets = [{}, {"SiO2": 3.0}, {"Unobtainium": 1.0}]
+        answers = check_feasibility_batch(targets, inventory_materials(), region=self.region)
+        for target, answer in zip(targets, answers):
+            with self.subTest(target=target):
+                self.assertEqual(answer, check_feasibility(target, inventory_materials()))
+
+    def test_without_a_region_every_target_goes_to_the_lp(self):
+        with mock.patch.object(feasibility, 'HULL_MAX_DIMENSION', 3):
+            region = reachable_region(inventory_materials())
+            answers = check_feasibility_batch(self.targets()[:3], inventory_materials())
+
+        self.assertEqual(region['error'], 'region_too_large')
+        self.assertEqual({answer['decided_by'] for answer in answers}, {'lp'})
+        self.assertEqual(reachable_region([SILICA])['error'], 'no_fluxes')
+
+
 class TestFeasibilityEndpoint(unittest.TestCase):
     """
     POST /api/feasibility
@@ -749,6 +1002,24 @@ class TestFeasibilityEndpoint(unittest.TestCase):
         self.assertEqual(verdict.status_code, 200)
         self.assertTrue(verdict.get_json()['feasible'])
 
+    def test_the_ranges_can_be_spread_over_threads(self):
+        serial = self.client.post('/api/feasibility', json={"umf": recipe_01()['umf']})
+        parallel = self.client.post('/api/feasibility', json={"umf": recipe_01()['umf'],
+                                                              "workers": 2})
+
+        self.assertEqual(parallel.status_code, 200)
+        self.assertEqual(parallel.get_json()['achievable_ranges']['lp_count'], 63)
+        self.assertEqual(list(parallel.get_json()['achievable_ranges']['material_ranges']),
+                         list(serial.get_json()['achievable_ranges']['material_ranges']))
+
+    def test_a_worker_count_that_is_not_one_is_a_bad_request(self):
+        for workers in (0, 1.5, True, "2"):
+            with self.subTest(workers=workers):
+                response = self.client.post('/api/feasibility', json={
+                    "umf": recipe_01()['umf'], "workers": workers})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], 'invalid_parameter')
+
     def test_the_projection_matches_what_the_ranges_actually_solve(self):
         materials = inventory_materials()
         target = recipe_01()['umf']
@@ -781,6 +1052,175 @@ class TestFeasibilityEndpoint(unittest.TestCase):
         self.assertEqual(no_flux.status_code, 422)
         self.assertEqual(no_flux.get_json()['error'], 'no_target_fluxes')
 
+    def test_the_diagnostics_of_a_shelf_are_computed_once(self):
+        import api_server
+        api_server.diagnostics_cache_clear()
+        self.addCleanup(api_server.diagnostics_cache_clear)
+        inventory = [material['name'] for material in inventory_materials()]
+        payload = {"umf": recipe_01()['umf'], "ranges": False}
+
+        with mock.patch.object(api_server, 'matrix_diagnostics',
+                               wraps=api_server.matrix_diagnostics) as spy:
+            first = self.client.post('/api/feasibility', json=dict(payload, inventory=inventory))
+            again = self.client.post('/api/feasibility',
+                                     json=dict(payload, inventory=list(reversed(inventory)),
+                                               umf=dict(recipe_01()['umf'], CaO=0.6)))
+            self.client.post('/api/feasibility', json=dict(payload, inventory=inventory[:-1]))
+            with mock.patch.object(api_server, '_database_fingerprint', return_value='edited'):
+                self.client.post('/api/feasibility', json=dict(payload, inventory=inventory))
+
+        self.assertEqual(spy.call_count, 3)
+        self.assertEqual(first.get_json()['diagnostics'], again.get_json()['diagnostics'])
+        stats = self.client.get('/api/health').get_json()['diagnostics_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 3, 3))
+
+
+class TestFeasibilitySessionEndpoint(unittest.TestCase):
+    """POST / PATCH / DELETE /api/feasibility/sessions"""
+
+    @classmethod
+    def setUpClass(cls):
+        import api_server
+        cls.api_server = api_server
+        cls.client = api_server.app.test_client()
+
+    def setUp(self):
+        self.api_server.feasibility_sessions_clear()
+
+    def open_session(self, **fields):
+        response = self.client.post('/api/feasibility/sessions', json=fields)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()
+
+    def test_a_patched_target_is_answered_like_the_stateless_endpoint(self):
+        session_id = self.open_session()['session_id']
+        for target in (recipe_01()['umf'], dict(recipe_01()['umf'], Li2O=0.5)):
+            with self.subTest(target=target):
+                patched = self.client.patch(f'/api/feasibility/sessions/{session_id}',
+                                            json={"umf": target})
+                stateless = self.client.post('/api/feasibility',
+                                             json={"umf": target, "ranges": False})
+
+                self.assertEqual(patched.status_code, 200)
+                body, expected = patched.get_json(), stateless.get_json()
+                self.assertEqual(body['feasible'], expected['feasible'])
+                self.assertEqual(body['unreachable_oxides'], expected['unreachable_oxides'])
+                self.assertEqual(body['diagnostics'], expected['diagnostics'])
+                self.assertEqual(body['session']['session_id'], session_id)
+        self.assertEqual(body['session']['checks'], 2)
+
+    def test_a_first_target_can_come_with_the_opening(self):
+        body = self.open_session(umf=recipe_01()['umf'], passengers={"Fe2O3": 0.03})
+
+        self.assertTrue(body['feasible'])
+        self.assertEqual(body['materials'], len(inventory_materials()))
+        self.assertEqual([row['oxide'] for row in body['passengers']], ['Fe2O3'])
+        self.assertIn('session_id', body)
+
+    def test_a_closed_or_unknown_session_is_404(self):
+        session_id = self.open_session()['session_id']
+
+        closed = self.client.delete(f'/api/feasibility/sessions/{session_id}')
+        self.assertEqual(closed.status_code, 200)
+        for method in (self.client.patch, self.client.delete):
+            response = method(f'/api/feasibility/sessions/{session_id}',
+                              json={"umf": recipe_01()['umf']})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.get_json()['error'], 'unknown_session')
+
+    def test_an_idle_session_is_evicted(self):
+        session_id = self.open_session()['session_id']
+        self.assertEqual(self.client.get('/api/health').get_json()
+                         ['feasibility_sessions']['open'], 1)
+
+        later = time.monotonic() + self.api_server.FEASIBILITY_SESSION_IDLE_SECONDS + 1.0
+        with mock.patch.object(self.api_server.time, 'monotonic', return_value=later):
+            response = self.client.patch(f'/api/feasibility/sessions/{session_id}',
+                                         json={"umf": recipe_01()['umf']})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/health').get_json()
+                         ['feasibility_sessions']['open'], 0)
+
+    def test_the_oldest_session_goes_beyond_the_capacity(self):
+        with mock.patch.object(self.api_server, 'MAX_FEASIBILITY_SESSIONS', 2):
+            first = self.open_session()['session_id']
+            self.open_session()
+            self.open_session()
+            response = self.client.patch(f'/api/feasibility/sessions/{first}',
+                                         json={"umf": recipe_01()['umf']})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_bad_requests(self):
+        session_id = self.open_session()['session_id']
+        url = f'/api/feasibility/sessions/{session_id}'
+
+        self.assertEqual(self.client.patch(url, json={}).get_json()['error'], 'missing_umf')
+        self.assertEqual(self.client.patch(url, json={"umf": {"CaO": 1.0}, "tol": -1})
+                         .get_json()['error'], 'invalid_parameter')
+        self.assertEqual(self.client.patch(url, json={"umf": {"SiO2": 3.0}}).status_code, 422)
+        self.assertEqual(self.client.post('/api/feasibility/sessions',
+                                          json={"passengers": [1]}).status_code, 400)
+        self.assertEqual(self.client.post('/api/feasibility/sessions',
+                                          json={"inventory": ["Вода"]}).status_code, 422)
+
+class TestFeasibilityBatchEndpoint(unittest.TestCase):
+    """POST /api/feasibility/batch, an NDJSON stream of verdicts"""
+
+    @classmethod
+    def setUpClass(cls):
+        import api_server
+        cls.api_server = api_server
+        cls.client = api_server.app.test_client()
+
+    def post_batch(self, **payload):
+        response = self.client.post('/api/feasibility/batch', json=payload)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return response, lines
+
+    def test_every_target_gets_the_verdict_of_the_single_endpoint(self):
+        reference = recipe_01()['umf']
+        targets = [reference, dict(reference, Li2O=0.5), dict(reference, SiO2=30.0),
+                   {"SiO2": 3.0, "Al2O3": 0.3, "CaO": 0.7, "K2O": 0.3}]
+        response, lines = self.post_batch(targets=targets)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        start, verdicts, done = lines[0], lines[1:-1], lines[-1]
+        self.assertEqual((start['type'], start['targets']), ('start', len(targets)))
+        self.assertIn('diagnostics', start)
+        self.assertEqual(sorted(verdict['index'] for verdict in verdicts), list(range(len(targets))))
+        for verdict in verdicts:
+            with self.subTest(index=verdict['index']):
+                single = self.client.post('/api/feasibility', json={
+                    "umf": targets[verdict['index']], "ranges": False}).get_json()
+                self.assertEqual(verdict['feasible'], single['feasible'])
+                self.assertEqual(verdict['lp_ms'] > 0.0, verdict['decided_by'] == 'lp')
+
+        self.assertEqual(done['type'], 'done')
+        self.assertEqual(done['decided_by_hull'] + done['decided_by_lp'], len(targets))
+        self.assertGreater(done['decided_by_hull'], 0)
+        self.assertAlmostEqual(done['lp_ms'], sum(verdict['lp_ms'] for verdict in verdicts))
+
+    def test_ids_are_echoed_and_a_refused_target_does_not_stop_the_batch(self):
+        _, lines = self.post_batch(targets=[{"id": "glazy-1", "umf": recipe_01()['umf']},
+                                            {"SiO2": 3.0}])
+        verdicts = {verdict['index']: verdict for verdict in lines[1:-1]}
+
+        self.assertEqual((verdicts[0]['id'], verdicts[1]['id']), ("glazy-1", 1))
+        self.assertEqual(verdicts[1]['error'], 'no_target_fluxes')
+        self.assertEqual(lines[-1]['errors'], 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post_batch()[0].get_json()['error'], 'missing_targets')
+        self.assertEqual(self.post_batch(targets=[recipe_01()['umf'], [1, 2]])[0]
+                         .get_json()['error'], 'invalid_target')
+        self.assertEqual(self.post_batch(targets=[recipe_01()['umf']], tol="скоро")[0]
+                         .status_code, 400)
+        with mock.patch.object(self.api_server, 'MAX_FEASIBILITY_BATCH_TARGETS', 1):
+            self.assertEqual(self.post_batch(targets=[{"CaO": 1.0}] * 2)[0].status_code, 413)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -140,15 +140,17 @@ CORPUS_ENV = 'GLAZY_CORPUS'
 #     999            100.00%          100.00%
 #     20260101       100.00%          100.00%
 #
-# so 0.93 leaves the classic series 2 cases (49 of 50 today, and 47 of 50 is the
+# so 0.93 left the classic series 2 cases (49 of 50 then, and 47 of 50 is the
 # last passing value) against the iterative series' 15. The previous 0.78 left
 # classic 10. Two is thin but it is not fragile: both series are deterministic -
-# the sample seed is hard-wired and the classic engine runs on the pinned
-# CLASSIC_SEED - so the margin absorbs deliberate change rather than noise, and
-# this change does not touch the classic engine at all (bench/diff_baseline.py
-# reports 0 cases moved on every classic metric). Splitting the constant per
-# series would buy nothing but a second number to keep in step. If a future
-# change does move classic, split it then, with the measurement in hand.
+# the sample seed is hard-wired and the classic engine enumerates its subsets
+# in a fixed order - so the margin absorbs deliberate change rather than noise.
+# That table was measured on the random subset search the classic engine had
+# then; the fixed-order enumerator that replaced it changes which subsets are
+# solved, and the classic series has NOT been re-measured since. Until it is,
+# the 49 of 50 is a figure of the old engine, not a margin of this one. If the
+# re-measurement moves classic, split the constant per series then, with the
+# measurement in hand.
 #
 # It does NOT have to absorb solver changes: those are what
 # bench/diff_baseline.py measures, case by case, against a committed snapshot.
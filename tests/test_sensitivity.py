@@ -21,10 +21,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from common import load_materials, load_molar_masses, weights_to_umf
 from solver_classic import calculate_recipe_composition
 from sensitivity import (FALLBACK_RELATIVE, FLAT_SIGMA_WARNING, MAX_PERCENTAGE, MAX_SIGMA,
+                         MONTE_CARLO_PERCENTILES,
                          NONFINITE_CONTRIBUTION_WARNING, UNREADABLE_TOLERANCES_ISSUE,
                          ZERO_CONTRIBUTION_WARNING, ZERO_FLUX_MOLES, _all_finite,
-                         _first_nonfinite, _material_shares, _top_affected,
-                         load_tolerances, material_sigma, recipe_sensitivity)
+                         _cell_responses, _first_nonfinite, _material_shares, _top_affected,
+                         load_tolerances, material_sigma, recipe_sensitivity, umf_jacobian)
 
 # A path that cannot exist, to stand in for an unreadable tolerance database
 MISSING_TOLERANCES = os.path.join(tempfile.gettempdir(), 'no_such_material_tolerance.json')
@@ -1603,6 +1604,121 @@ class TestIncrementalComposition(unittest.TestCase):
         self.assertGreater(checked, 10, "the reference recipe should cover many pairs")
 
 
+class TestClosedFormResponse(unittest.TestCase):
+    """
+    The response of one cell is computed in closed form, not by converting the
+    moved composition - and it has to be the same number, large sigma included
+    """
+
+    def setUp(self):
+        materials = all_materials()
+        by_name = {material["name"]: material for material in materials}
+        used = [by_name[name] for name in TRANSPARENT_RECIPE]
+        self.base = calculate_recipe_composition(used, TRANSPARENT_RECIPE)
+        self.molar_masses = load_molar_masses()
+        self.base_umf = weights_to_umf(self.base, round_digits=None)
+        self.result_oxides = list(self.base_umf)
+
+    def converted_response(self, oxide, delta_weight):
+        moved = dict(self.base)
+        moved[oxide] = moved.get(oxide, 0.0) + delta_weight
+        moved_umf = weights_to_umf(moved, round_digits=None)
+        return [moved_umf.get(result, 0.0) - self.base_umf[result] for result in self.result_oxides]
+
+    def test_the_finite_response_is_the_converted_one_up_to_a_whole_sigma(self):
+        # Flux and non-flux oxides, present in the recipe and not, moved by a
+        # sliver and by as much as the oxide itself weighs
+        cells = [(oxide, self.base.get(oxide, 1.0) * fraction)
+                 for oxide in ("SiO2", "CaO", "B2O3", "Na2O", "Fe2O3", "Li2O", "ZnO")
+                 for fraction in (1e-4, 0.05, 1.0)]
+
+        responses = _cell_responses(self.base, self.result_oxides, cells, self.molar_masses)
+
+        for (oxide, delta_weight), response in zip(cells, responses):
+            for result, actual, expected in zip(self.result_oxides, response,
+                                                self.converted_response(oxide, delta_weight)):
+                self.assertAlmostEqual(actual, expected, delta=1e-12,
+                                       msg=f"{oxide} +{delta_weight} -> {result}")
+
+    def test_the_jacobian_is_the_derivative(self):
+        oxides = ["SiO2", "CaO", "K2O", "Li2O"]
+        jacobian, _unity = umf_jacobian(self.base, self.result_oxides, oxides, self.molar_masses)
+
+        step = 1e-6
+        for column, oxide in enumerate(oxides):
+            forward = self.converted_response(oxide, step)
+            backward = self.converted_response(oxide, -step) if oxide in self.base else \
+                [-value for value in forward]
+            for row, result in enumerate(self.result_oxides):
+                derivative = (forward[row] - backward[row]) / (2 * step)
+                self.assertAlmostEqual(jacobian[row, column], derivative, delta=1e-7,
+                                       msg=f"d {result} / d {oxide}")
+
+    def test_an_exact_tie_keeps_the_order_of_the_formula(self):
+        # Equal contributions apart from the last bits, listed in formula order
+        affected = _top_affected({"SiO2": 1.0, "Al2O3": 1.0 + 4e-16, "CaO": 0.5}, 2.5)
+
+        self.assertEqual(affected, ["SiO2", "Al2O3", "CaO"])
+
+
+class TestMonteCarloMode(unittest.TestCase):
+    """mode="monte_carlo": sampled bands and Sobol shares next to the linear answer"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.materials = all_materials()
+        cls.linear = recipe_sensitivity(TRANSPARENT_RECIPE, cls.materials)
+        cls.result = recipe_sensitivity(TRANSPARENT_RECIPE, cls.materials,
+                                        mode="monte_carlo", samples=4000, seed=11)
+
+    def test_the_linear_answer_is_untouched(self):
+        for key in ("umf", "per_oxide", "by_material", "warnings", "error"):
+            self.assertEqual(self.result[key], self.linear[key])
+        self.assertNotIn("monte_carlo", self.linear)
+
+    def test_the_same_seed_draws_the_same_block(self):
+        again = recipe_sensitivity(TRANSPARENT_RECIPE, self.materials,
+                                   mode="monte_carlo", samples=4000, seed=11)
+        for key in ("bands", "by_material", "evaluations"):
+            self.assertEqual(again["monte_carlo"][key], self.result["monte_carlo"][key])
+
+    def test_the_bands_bracket_the_formula_and_match_the_linear_spread(self):
+        block = self.result["monte_carlo"]
+        self.assertEqual(block["percentiles"], list(MONTE_CARLO_PERCENTILES))
+        linear_sigma = {row["oxide"]: row["sigma"] for row in self.linear["per_oxide"]}
+        for oxide, band in block["bands"].items():
+            self.assertLessEqual(band["p5"], band["p50"])
+            self.assertLessEqual(band["p50"], band["p95"])
+            self.assertAlmostEqual(band["p50"], self.result["umf"][oxide],
+                                   delta=0.05 * max(self.result["umf"][oxide], 0.01))
+            # One sigma per cell either way: the sampled spread is the linear
+            # one within the noise of the draws and the curvature of the UMF
+            self.assertAlmostEqual(band["std"], linear_sigma[oxide],
+                                   delta=0.15 * linear_sigma[oxide] + 1e-5)
+
+    def test_the_shares_rank_the_materials_as_the_linear_answer_does(self):
+        sampled = {row["material"]: row for row in self.result["monte_carlo"]["by_material"]}
+        self.assertAlmostEqual(sum(row["share"] for row in sampled.values()), 1.0, delta=1e-3)
+        for row in self.linear["by_material"]:
+            self.assertAlmostEqual(sampled[row["material"]]["share"], row["share"], delta=0.04)
+            self.assertLessEqual(sampled[row["material"]]["first_order"],
+                                 sampled[row["material"]]["total"] + 0.05)
+        self.assertEqual(self.result["monte_carlo"]["by_material"][0]["material"], "Улексит (Химпэк)")
+
+    def test_the_throughput_is_reported(self):
+        block = self.result["monte_carlo"]
+        self.assertEqual(block["evaluations"], 4000 * (len(TRANSPARENT_RECIPE) + 2))
+        self.assertGreater(block["samples_per_second"], 0)
+        self.assertGreater(block["elapsed_ms"], 0)
+
+    def test_a_mode_or_a_count_that_is_not_one_is_refused(self):
+        for kwargs in ({"mode": "exact"}, {"mode": "monte_carlo", "samples": 5},
+                       {"mode": "monte_carlo", "samples": 2000.0}, {"mode": "monte_carlo", "seed": -1}):
+            with self.subTest(kwargs=kwargs):
+                result = recipe_sensitivity(TRANSPARENT_RECIPE, self.materials, **kwargs)
+                self.assertEqual(result["error"], "invalid_parameter")
+
+
 class TestWeightsToUmfSignature(unittest.TestCase):
     """
     Regression: weights_to_umf grew a round_digits parameter for this module
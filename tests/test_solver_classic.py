@@ -10,6 +10,8 @@
 
 import contextlib
 import io
+import itertools
+import math
 import unittest
 import sys
 import os
@@ -23,11 +25,17 @@ import common
 from common import load_materials, weights_to_umf
 import numpy as np
 
+import solver_classic
 from solver_classic import (
+    _covering_subsets,
+    _lattice_masks,
     calculate_recipe_composition,
+    compile_compositions,
     create_oxide_matrix,
     find_multiple_solutions,
     main as solver_classic_main,
+    material_index,
+    recipe_compositions,
     solve_glaze_recipe,
     solve_recipe,
 )
@@ -61,6 +69,62 @@ EXPECTED_MATERIALS = [
 TOTAL_DELTA = 0.5
 
 
+class TestRecipeComposition(unittest.TestCase):
+    """The indexed and the bulk composition are the scan they replaced"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.materials = load_materials(only_inventory=False, priority=False)
+        names = [material['name'] for material in cls.materials]
+        # Recipes of every size over the whole catalogue, with a name the
+        # catalogue does not know in the middle of one
+        cls.recipes = [{name: 10.0 + 7 * i for i, name in enumerate(names[start:start + size])}
+                       for start, size in ((0, 1), (3, 4), (40, 7), (100, 12), (200, 16))]
+        cls.recipes[2] = dict(list(cls.recipes[2].items())[:3] + [('Unobtainium', 5.0)]
+                              + list(cls.recipes[2].items())[3:])
+        cls.recipes.append({})
+
+    @staticmethod
+    def scanned(materials, recipe):
+        """The linear scan calculate_recipe_composition used to be"""
+        composition = {}
+        for name, percentage in recipe.items():
+            material = next((m for m in materials if m['name'] == name), None)
+            if material is None:
+                continue
+            for oxide, content in material.get('formula', {}).items():
+                composition[oxide] = composition.get(oxide, 0.0) + content * (percentage / 100.0)
+        return composition
+
+    def test_the_indexed_composition_is_the_scan_exactly(self):
+        index = material_index(self.materials)
+        for recipe in self.recipes:
+            expected = self.scanned(self.materials, recipe)
+            for composition in (calculate_recipe_composition(self.materials, recipe),
+                                calculate_recipe_composition(self.materials, recipe, index=index)):
+                self.assertEqual(list(composition.items()), list(expected.items()))
+
+    def test_the_bulk_composition_agrees_key_for_key(self):
+        compositions = recipe_compositions(compile_compositions(self.materials), self.recipes)
+
+        self.assertEqual(len(compositions), len(self.recipes))
+        for recipe, composition in zip(self.recipes, compositions):
+            expected = self.scanned(self.materials, recipe)
+            self.assertEqual(list(composition), list(expected))
+            for oxide, value in expected.items():
+                self.assertAlmostEqual(composition[oxide], value, delta=1e-12 * max(1.0, abs(value)))
+
+    def test_the_first_record_of_a_name_wins(self):
+        first = {'name': 'Twin', 'formula': {'SiO2': 100.0}}
+        second = {'name': 'Twin', 'formula': {'Al2O3': 100.0}}
+        materials = [first, second]
+
+        self.assertIs(material_index(materials)['Twin'], first)
+        self.assertEqual(calculate_recipe_composition(materials, {'Twin': 50.0}), {'SiO2': 50.0})
+        self.assertEqual(recipe_compositions(compile_compositions(materials), [{'Twin': 50.0}]),
+                         [{'SiO2': 50.0}])
+
+
 class TestSolveGlazeRecipe(unittest.TestCase):
     """Integration test of the classic solver against the real material database"""
 
@@ -154,7 +218,7 @@ class TestSolveGlazeRecipe(unittest.TestCase):
 
 
 class TestFindMultipleSolutions(unittest.TestCase):
-    """The search used by the API. It is randomized, so only structure is checked"""
+    """The search used by the API. Only structure is checked, the recipes themselves are not pinned"""
 
     def test_returns_usable_solutions(self):
         solutions = find_multiple_solutions(
@@ -185,8 +249,8 @@ class TestFindMultipleSolutions(unittest.TestCase):
         self.assertIsInstance(result, dict)
         self.assertIn('error', result)
 
-    def test_same_seed_gives_the_same_solutions(self):
-        """Один и тот же seed — побитово тот же список решений"""
+    def test_same_call_gives_the_same_solutions(self):
+        """Один и тот же запрос — побитово тот же список решений"""
         first = find_multiple_solutions(
             TEST_UMF, max_solutions=3, error_tolerance=0.01, logging=False, seed=1234)
         second = find_multiple_solutions(
@@ -197,24 +261,152 @@ class TestFindMultipleSolutions(unittest.TestCase):
         self.assertEqual([solution['error'] for solution in first],
                          [solution['error'] for solution in second])
 
-    def test_another_seed_also_gives_valid_solutions(self):
-        """Другой seed вправе дать другие решения, но они обязаны быть валидными.
-
-        Совпадение списков не запрещено — поиск случайный, и разные seed'ы
-        вполне могут сойтись к одному набору, — поэтому проверяется только
-        качество, а не различие.
-        """
-        solutions = find_multiple_solutions(
+    def test_the_seed_no_longer_changes_the_answer(self):
+        """Подмножества перебираются, а не тянутся случайно: seed принимается, но ни на что не влияет"""
+        first = find_multiple_solutions(
+            TEST_UMF, max_solutions=3, error_tolerance=0.01, logging=False, seed=1234)
+        second = find_multiple_solutions(
             TEST_UMF, max_solutions=3, error_tolerance=0.01, logging=False, seed=99)
 
-        self.assertIsInstance(solutions, list)
-        self.assertGreater(len(solutions), 0)
-
-        for solution in solutions:
+        self.assertEqual(first, second)
+        for solution in second:
             self.assertGreater(len(solution['recipe']), 0)
             self.assertAlmostEqual(sum(solution['recipe'].values()), 100.0, delta=TOTAL_DELTA)
             self.assertLess(solution['error'], 0.1)
 
+    def test_batched_fits_give_the_same_solutions(self):
+        """NNLS_BATCHED меняет только путь к весам, но не ответ"""
+        plain = find_multiple_solutions(
+            TEST_UMF, max_solutions=5, error_tolerance=0.01, logging=False)
+        with mock.patch('solver_classic.NNLS_BATCHED', True), \
+                mock.patch('solver_classic.nnls_batch', wraps=common.nnls_batch) as batch:
+            batched = find_multiple_solutions(
+                TEST_UMF, max_solutions=5, error_tolerance=0.01, logging=False)
+
+        self.assertGreater(batch.call_count, 0)
+        self.assertEqual(plain, batched)
+
+    def test_near_collinear_subsets_are_left_to_scipy(self):
+        """
+        Два материала, отличающиеся на 1e-7, проходят FULL_RANK_PIVOT, но
+        нормальные уравнения пакета на них уже неверны: такие подмножества
+        решает scipy, а всё, что ушло в пакет, совпадает с scipy
+        """
+        rng = np.random.default_rng(3)
+        oxides = [f'Oxide{row}' for row in range(12)]
+        subsets = list(itertools.combinations(range(6), 5))
+        for relative in (1e-7, 1e-6, 1e-3):
+            for _ in range(20):
+                oxide_matrix = rng.uniform(0.0, 1.0, (12, 6))
+                oxide_matrix[:, 1] = oxide_matrix[:, 0] * (1.0 + relative * rng.uniform(-1.0, 1.0, 12))
+                b = oxide_matrix[:, :3] @ rng.uniform(0.0, 50.0, 3)
+                target_weights = dict(zip(oxides, b))
+                target_umf = dict.fromkeys(oxides, 1.0)
+
+                fits = solver_classic._batched_fits(oxide_matrix, subsets, target_umf, target_weights)
+                for subset, fit in zip(subsets, fits):
+                    matrix = oxide_matrix[:, list(subset)]
+                    # The case this is about: full rank by the warm start's line
+                    self.assertTrue(solver_classic.full_column_ranks([matrix])[0])
+                    if fit is not None:
+                        expected = nnls(matrix, b)[0]
+                        self.assertLess(np.abs(fit - expected).max() / expected.max(), 1e-6)
+                # Far from collinear the batch is still used
+                if relative >= 1e-3:
+                    self.assertTrue(all(fit is not None for fit in fits))
+
+
+class TestSubsetEnumeration(unittest.TestCase):
+    """_covering_subsets: every subset at most once, and none that could not be kept"""
+
+    # Four oxides, six materials; material 5 is the only carrier of oxide 3
+    MATRIX = np.array([[60.0, 0.0, 40.0, 0.0, 50.0, 0.0],
+                       [20.0, 30.0, 0.0, 0.0, 0.0, 0.0],
+                       [0.0, 50.0, 10.0, 70.0, 0.0, 0.0],
+                       [0.0, 0.0, 0.0, 0.0, 0.0, 90.0]])
+
+    def subsets(self, size, required=()):
+        return [tuple(sorted(subset)) for subset in
+                _covering_subsets(self.MATRIX, list(range(6)), size, list(required))]
+
+    def test_a_small_pool_is_walked_exhaustively_without_repeats(self):
+        for size in range(1, 7):
+            with self.subTest(size=size):
+                subsets = self.subsets(size)
+                self.assertEqual(len(subsets), len(set(subsets)))
+                self.assertEqual(set(subsets), set(itertools.combinations(range(6), size)))
+
+    def test_a_required_oxide_is_carried_by_every_subset(self):
+        subsets = self.subsets(3, required=[3])
+        self.assertTrue(subsets)
+        self.assertTrue(all(5 in subset for subset in subsets))
+        self.assertEqual(len(subsets), math.comb(5, 2))
+
+    def test_the_order_is_spread_over_the_pool(self):
+        # Lexicographically the first four subsets of 3 out of 6 all hold
+        # materials 0 and 1; the enumeration reaches past them at once
+        first = self.subsets(3)[:4]
+        self.assertGreater(len(set().union(*first)), 4)
+
+
+class TestDominatedSubsets(unittest.TestCase):
+    """
+    A subset whose NNLS optimum is provably the fit of a solved one is answered
+    from it: the masks say which subsets those are, and the search returns what
+    it returned solving every one of them
+    """
+
+    # Three oxides, four materials: one per oxide and one carrying the first two
+    MATRIX = np.array([[1.0, 0.0, 0.0, 1.0],
+                       [0.0, 1.0, 0.0, 1.0],
+                       [0.0, 0.0, 1.0, 0.0]])
+
+    def masks(self, subset, b):
+        matrix = self.MATRIX[:, subset]
+        x, _residual = nnls(matrix, b)
+        return _lattice_masks(self.MATRIX, [1 << column for column in subset], matrix, b, x, 1e-12)
+
+    def test_an_exact_fit_allows_every_column(self):
+        support, allowed = self.masks([0, 1, 2], np.array([1.0, 1.0, 0.0]))
+        self.assertEqual(support, 0b0011)
+        # Nothing is left to fit, so no column can improve on it: the column
+        # the fit zeroed and the one the subset did not have alike
+        self.assertEqual(allowed, 0b1111)
+
+    def test_a_column_that_would_lower_the_residual_is_not_allowed(self):
+        support, allowed = self.masks([0, 1], np.array([1.0, 1.0, 1.0]))
+        self.assertEqual(support, 0b0011)
+        # The third oxide is left unfitted and material 2 carries it
+        self.assertEqual(allowed, 0b1011)
+
+    def search(self, target, skip, **kwargs):
+        with mock.patch.object(solver_classic, 'SKIP_DOMINATED', skip):
+            return find_multiple_solutions(target, max_solutions=5, logging=False, **kwargs)
+
+    @staticmethod
+    def comparable(solutions):
+        return [{key: value for key, value in solution.items() if key != 'nnls_solves'}
+                for solution in solutions]
+
+    def test_the_answers_do_not_depend_on_the_switch(self):
+        catalogue = load_materials(only_inventory=False)
+        for materials in (None, catalogue):
+            with self.subTest(materials='inventory' if materials is None else 'catalogue'):
+                solved = self.search(TEST_UMF, False, materials=materials)
+                skipped = self.search(TEST_UMF, True, materials=materials)
+                self.assertEqual(self.comparable(solved), self.comparable(skipped))
+
+                plain, counted = solved[0]['nnls_solves'], skipped[0]['nnls_solves']
+                self.assertEqual(plain['avoided'], 0)
+                self.assertEqual(plain['solved'], counted['solved'] + counted['avoided'])
+                if materials is not None:
+                    self.assertGreater(counted['avoided'], 0)
+
+    def test_every_solution_carries_the_same_counts(self):
+        solutions = self.search(TEST_UMF, True)
+        self.assertEqual(len({tuple(sorted(s['nnls_solves'].items())) for s in solutions}), 1)
+        self.assertGreater(solutions[0]['nnls_solves']['solved'], 1)
+
 
 class TestCorruptClassificationIsNotAnEmptyAnswer(unittest.TestCase):
     """Битая классификация обязана долетать до вызывающего, а не превращаться в «решений нет».
@@ -28,6 +28,7 @@ import math
 import os
 import sys
 import unittest
+from unittest import mock
 
 # Fix imports by adding parent directory to path
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,13 +38,17 @@ from quality_metrics import MAX_CONDITION_NUMBER, solution_quality
 from solver_classic import (
     calculate_recipe_composition,
     calculate_umf_error,
+    create_oxide_matrix,
     find_multiple_solutions,
     solve_glaze_recipe,
+    solve_recipe,
 )
+import solver_iterative
 from solver_iterative import (
     PRUNE_ERROR_TOLERANCE,
     PRUNE_OBJECTIVE_TOLERANCE,
     _build_problem,
+    _leave_one_out_fits,
     _prune_solution,
     _sole_carriers,
     _solve_material_set,
@@ -677,5 +682,75 @@ class TestPruningChecksBothErrors(unittest.TestCase):
                              self.state['error'] + PRUNE_ERROR_TOLERANCE * removals + 1e-12)
 
 
+class TestBatchedLeaveOneOut(unittest.TestCase):
+    """
+    The leave-one-out fits of a pruning round come out of one factorization;
+    the removals they lead to have to be the ones one NNLS per material made
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.references = load_fixture('reference_recipes.json')
+        cls.inventory = resolve_inventory(None)
+        cls.catalogue = [m['name'] for m in load_materials(only_inventory=False, priority=False)]
+
+    @staticmethod
+    def sequential(search):
+        """The pass as it was: every leave-one-out fit a separate NNLS"""
+        original = solver_iterative._leave_one_out_fits
+        solver_iterative._leave_one_out_fits = lambda used, problem: {}
+        try:
+            return search()
+        finally:
+            solver_iterative._leave_one_out_fits = original
+
+    @staticmethod
+    def comparable(solutions):
+        return [{key: value for key, value in solution.items() if key != 'nnls_solves'}
+                for solution in solutions]
+
+    def test_every_batched_fit_is_the_recipe_nnls_returns(self):
+        checked = 0
+        for entry in self.references:
+            materials, available = resolve_material_pool(None, list(entry['recipe']))
+            used = [m for m in materials if m['name'] in available]
+            problem = _build_problem(usable_target(entry['umf'])[0], used, 1.0)
+
+            for dropped, fitted in _leave_one_out_fits(used, problem).items():
+                reduced = [m for m in used if m['name'] != dropped]
+                matrix, names = create_oxide_matrix(reduced, problem['oxides'])
+                solution = solve_recipe(matrix, problem['full_target'], names, reduced,
+                                        row_weights=problem['row_weights'])
+                with self.subTest(recipe=entry['id'], dropped=dropped):
+                    self.assertEqual(fitted, solution['recipe'])
+                checked += 1
+
+        self.assertGreater(checked, 10, "no leave-one-out fit was ever batched")
+
+    def test_the_search_prunes_exactly_as_before(self):
+        # Every reference on the shelf, the first three on the whole catalogue:
+        # a catalogue search costs a quarter of a second twice over
+        runs = [(entry, self.inventory) for entry in self.references]
+        runs += [(entry, self.catalogue) for entry in self.references[:3]]
+        for entry, inventory in runs:
+            search = lambda: find_best_recipe(inventory, entry['umf'], max_solutions=5)
+            with self.subTest(recipe=entry['id'], materials=len(inventory)):
+                self.assertEqual(self.comparable(search()),
+                                 self.comparable(self.sequential(search)))
+
+    # The steps batch their first fits too (NNLS_BATCHED) and count them under
+    # the same key; this test is about the pruning pass alone
+    @mock.patch.object(solver_iterative, 'NNLS_BATCHED', False)
+    def test_the_pass_says_how_many_fits_it_batched(self):
+        batched = find_best_recipe(self.catalogue, self.references[0]['umf'], max_solutions=5)
+        plain = self.sequential(lambda: find_best_recipe(self.catalogue, self.references[0]['umf'],
+                                                         max_solutions=5))
+
+        self.assertGreater(batched[0]['nnls_solves']['batched'], 0)
+        self.assertEqual(plain[0]['nnls_solves']['batched'], 0)
+        self.assertEqual(plain[0]['nnls_solves']['cold'],
+                         batched[0]['nnls_solves']['cold'] + batched[0]['nnls_solves']['batched'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -21,19 +21,25 @@ import json
 import math
 import os
 import sys
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common import (
     OXIDE_SCALE_FLOOR,
+    SearchCancelled,
     load_materials,
     load_molar_masses,
     umf_deviation,
     weights_to_umf,
 )
 from feasibility import DEFAULT_FEASIBILITY_TOL as CHEMISTRY_TOLERANCE
-from solver_classic import calculate_recipe_composition, calculate_umf_error
+from solver_classic import calculate_recipe_composition, calculate_umf_error, create_oxide_matrix
 from solver_iterative import (
     OBJECTIVE_DEADBAND,
     SEARCH_EXHAUSTIVE,
@@ -43,6 +49,7 @@ from solver_iterative import (
     _known_oxide,
     _score_candidate,
     _solve_material_set,
+    _subset_matrix,
     _weight_residual,
     find_best_recipe,
     usable_target,
@@ -217,7 +224,7 @@ class TestSolutionShape(SolverTestCase):
 
     REQUIRED_KEYS = ('recipe', 'error', 'objective_error', 'result_umf', 'target_umf',
                      'effective_target_umf', 'unlisted_weight', 'materials_count',
-                     'merged_variants', 'iterations')
+                     'merged_variants', 'iterations', 'nnls_solves', 'prune_rounds')
 
     def test_every_documented_key_is_present(self):
         for solution in find_best_recipe(self.inventory, FULL_TARGET, max_solutions=3):
@@ -279,6 +286,14 @@ class TestSolutionShape(SolverTestCase):
             self.assertGreaterEqual(solution['iterations'], 1)
             self.assertLessEqual(solution['iterations'], 8)
 
+    def test_prune_rounds_is_one_count_of_the_whole_search(self):
+        solutions = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5)
+        rounds = {solution['prune_rounds'] for solution in solutions}
+        self.assertEqual(len(rounds), 1)
+        # Every returned recipe went through the pruning at least once
+        self.assertIsInstance(rounds.pop(), int)
+        self.assertGreaterEqual(solutions[0]['prune_rounds'], 1)
+
 
 class TestErrorSelfConsistency(SolverTestCase):
     """A consumer must be able to recompute the reported error from the result"""
@@ -1020,5 +1035,286 @@ class TestCandidateHeuristic(SolverTestCase):
         self.assertLess(heuristic, exhaustive)
 
 
+class TestPrecompiledMatrix(SolverTestCase):
+    """
+    The pool's oxide matrix is built once per search and sliced per subset; the
+    slice has to be the matrix a per-subset build would have produced.
+    """
+
+    def setUp(self):
+        self.materials = load_materials(only_inventory=True, priority=True)
+        self.problem = _build_problem(usable_target(FULL_TARGET)[0], self.materials, 1.0)
+
+    def test_a_slice_is_the_matrix_of_the_subset(self):
+        subset = [self.materials[index] for index in (5, 0, 3, 11)]
+
+        sliced, names = _subset_matrix(subset, self.problem)
+        built, built_names = create_oxide_matrix(subset, self.problem['oxides'])
+
+        self.assertEqual(names, built_names)
+        self.assertTrue(np.array_equal(sliced, built))
+
+    def test_an_edited_copy_is_not_given_the_pool_column(self):
+        """Same name, different formula: the name alone would hand it the old one"""
+        edited = dict(self.materials[0], formula={'SiO2': 100.0})
+
+        sliced, _names = _subset_matrix([edited], self.problem)
+
+        self.assertTrue(np.array_equal(sliced, create_oxide_matrix([edited], self.problem['oxides'])[0]))
+
+    def test_a_duplicated_name_is_not_indexed(self):
+        twins = [{'name': 'Twin', 'formula': {'SiO2': 100.0}},
+                 {'name': 'Twin', 'formula': {'CaO': 56.1}}]
+        problem = _build_problem(usable_target({'SiO2': 3.0, 'CaO': 0.7})[0], twins, 1.0)
+
+        self.assertNotIn('Twin', problem['column_index'])
+
+    def test_the_search_builds_the_matrix_once(self):
+        import solver_iterative
+
+        calls = {'n': 0}
+        original = solver_iterative.create_oxide_matrix
+
+        def counting_build(*args, **kwargs):
+            calls['n'] += 1
+            return original(*args, **kwargs)
+
+        solver_iterative.create_oxide_matrix = counting_build
+        try:
+            find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                             candidate_search=SEARCH_EXHAUSTIVE)
+        finally:
+            solver_iterative.create_oxide_matrix = original
+
+        self.assertEqual(calls['n'], 1)
+
+
+class TestWarmStartedFits(SolverTestCase):
+    """
+    NNLS_WARM_START changes the route to each fit and nothing else: the switch
+    is off for speed reasons only, so turning it on must return the same answers
+    """
+
+    def search(self, target, warm, **kwargs):
+        import solver_iterative
+
+        original = solver_iterative.NNLS_WARM_START
+        solver_iterative.NNLS_WARM_START = warm
+        try:
+            return find_best_recipe(self.inventory, target, max_solutions=5, **kwargs)
+        finally:
+            solver_iterative.NNLS_WARM_START = original
+
+    def test_the_answers_do_not_depend_on_the_route(self):
+        for target, weight in ((FULL_TARGET, 1.0), (PARTIAL_TARGET, 0.0), (PARTIAL_TARGET, 0.3)):
+            with self.subTest(target=sorted(target), penalize_unlisted=weight):
+                cold = self.search(target, False, penalize_unlisted=weight)
+                warm = self.search(target, True, penalize_unlisted=weight)
+                self.assertEqual([s['recipe'] for s in cold], [s['recipe'] for s in warm])
+                self.assertEqual([round(s['objective_error'], 9) for s in cold],
+                                 [round(s['objective_error'], 9) for s in warm])
+
+    def test_the_counters_say_which_route_was_taken(self):
+        cold = self.search(FULL_TARGET, False)[0]['nnls_solves']
+        warm = self.search(FULL_TARGET, True)[0]['nnls_solves']
+
+        self.assertEqual(cold['warm'], 0)
+        self.assertGreater(cold['cold'], 0)
+        # Only the starting set and the rank deficient sets are solved cold
+        self.assertGreater(warm['warm'], warm['cold'])
+        self.assertEqual(warm['warm'] + warm['cold'], cold['cold'])
+
+
+
+class TestBatchedFits(SolverTestCase):
+    """
+    NNLS_BATCHED stacks the first fits of a step into one common.nnls_batch
+    call; like the warm start it changes the route to each fit and nothing else
+    """
+
+    def search(self, target, batched, **kwargs):
+        import solver_iterative
+
+        original = solver_iterative.NNLS_BATCHED
+        solver_iterative.NNLS_BATCHED = batched
+        try:
+            return find_best_recipe(self.inventory, target, max_solutions=5, **kwargs)
+        finally:
+            solver_iterative.NNLS_BATCHED = original
+
+    def test_the_answers_do_not_depend_on_the_route(self):
+        for target, weight in ((FULL_TARGET, 1.0), (PARTIAL_TARGET, 0.0), (PARTIAL_TARGET, 0.3)):
+            with self.subTest(target=sorted(target), penalize_unlisted=weight):
+                plain = self.search(target, False, penalize_unlisted=weight)
+                batched = self.search(target, True, penalize_unlisted=weight)
+                self.assertEqual([s['recipe'] for s in plain], [s['recipe'] for s in batched])
+                self.assertEqual([s['objective_error'] for s in plain],
+                                 [s['objective_error'] for s in batched])
+
+    def test_the_batched_fits_are_counted_in_place_of_the_runs(self):
+        plain = self.search(FULL_TARGET, False)[0]['nnls_solves']
+        batched = self.search(FULL_TARGET, True)[0]['nnls_solves']
+
+        self.assertGreater(batched['batched'], plain['batched'])
+        self.assertLess(batched['cold'], plain['cold'])
+        self.assertEqual(sum(batched.values()), sum(plain.values()))
+
+
+class TestWorkerPool(SolverTestCase):
+    """
+    find_best_recipe(workers=...) spreads the candidate solves of a step over a
+    process pool; the answer has to be the serial one to the last bit
+    """
+
+    def test_the_pool_returns_the_serial_answer_bit_for_bit(self):
+        catalogue = [m['name'] for m in material_records()]
+        for inventory, target in ((self.inventory, FULL_TARGET), (catalogue, PARTIAL_TARGET)):
+            with self.subTest(materials=len(inventory)):
+                serial = find_best_recipe(inventory, target, max_solutions=5)
+                pooled = find_best_recipe(inventory, target, max_solutions=5, workers=2)
+                self.assertEqual(json.dumps(serial, sort_keys=True, ensure_ascii=False),
+                                 json.dumps(pooled, sort_keys=True, ensure_ascii=False))
+
+    def test_the_heuristic_search_can_use_the_pool_too(self):
+        serial = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                                  candidate_search=SEARCH_HEURISTIC)
+        pooled = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                                  candidate_search=SEARCH_HEURISTIC, workers=2)
+        self.assertEqual([s['recipe'] for s in serial], [s['recipe'] for s in pooled])
+
+    def test_every_worker_count_shares_the_one_pool(self):
+        import solver_iterative
+
+        for workers in (2, 3, 5):
+            find_best_recipe(self.inventory, FULL_TARGET, max_solutions=1, workers=workers)
+        executor = solver_iterative._WORKER_POOL['executor']
+        self.assertIsNotNone(executor)
+        self.assertEqual(executor._max_workers, solver_iterative.MAX_WORKERS)
+
+    def test_the_problem_is_shipped_once_per_worker_not_once_per_step(self):
+        import solver_iterative
+
+        opened = []
+        fanned_steps = []
+
+        def recording(problem, workers):
+            fanout = open_fanout(problem, workers)
+            opened.append(fanout)
+            return fanout
+
+        def counting(material_sets, seed, problem, fanout):
+            if fanout is not None and len(material_sets) > 1:
+                fanned_steps.append(len(material_sets))
+            return solve_sets(material_sets, seed, problem, fanout)
+
+        open_fanout, solve_sets = solver_iterative._open_fanout, solver_iterative._solve_sets
+        with mock.patch.object(solver_iterative, '_open_fanout', side_effect=recording), \
+                mock.patch.object(solver_iterative, '_solve_sets', side_effect=counting):
+            find_best_recipe(self.inventory, PARTIAL_TARGET, max_solutions=5, workers=2,
+                             candidate_search=SEARCH_EXHAUSTIVE)
+
+        # Shipping with every chunk would be two copies a step. It is the first
+        # step's chunks, plus at most one second trip per process of the pool
+        # that had not served this call yet
+        self.assertGreater(len(fanned_steps), 3)
+        self.assertLessEqual(opened[0]['shipped'], 2 + solver_iterative.MAX_WORKERS)
+
+    def test_concurrent_calls_never_share_a_token(self):
+        import solver_iterative
+
+        problem = {'nnls_counts': {'warm': 0, 'cold': 0, 'batched': 0}}
+        tokens = []
+        with ThreadPoolExecutor(max_workers=8) as threads:
+            for fanout in threads.map(lambda _: solver_iterative._open_fanout(problem, 2), range(64)):
+                tokens.append(fanout['token'])
+        self.assertEqual(len(set(tokens)), len(tokens))
+
+    def test_a_worker_count_below_one_is_refused(self):
+        for workers in (0, -1, 'two'):
+            with self.subTest(workers=workers):
+                with self.assertRaises(ValueError):
+                    find_best_recipe(self.inventory, FULL_TARGET, workers=workers)
+
+
+class TestProgressEvents(SolverTestCase):
+    """
+    find_best_recipe(progress=...) reports the search while it runs; the
+    answer it returns must not depend on whether anybody was listening
+    """
+
+    @staticmethod
+    def without_counters(solutions):
+        return [{k: v for k, v in s.items() if k != 'nnls_solves'} for s in solutions]
+
+    def test_the_answer_is_the_silent_one(self):
+        for target in (FULL_TARGET, PARTIAL_TARGET):
+            with self.subTest(target=target):
+                events = []
+                reported = find_best_recipe(self.inventory, target, max_solutions=5,
+                                            progress=events.append)
+                silent = find_best_recipe(self.inventory, target, max_solutions=5)
+                self.assertEqual(self.without_counters(reported), self.without_counters(silent))
+
+    def test_every_step_is_reported_and_every_returned_recipe_was_announced(self):
+        events = []
+        solutions = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                                     progress=events.append)
+        steps = [e for e in events if e['event'] == 'iteration']
+        self.assertEqual([e['iteration'] for e in steps], list(range(1, len(steps) + 1)))
+        for step in steps:
+            self.assertGreaterEqual(step['pool'], 1)
+            self.assertTrue(math.isfinite(step['best_objective_error']))
+        announced = [e['solution']['recipe'] for e in events if e['event'] == 'recipe']
+        self.assertEqual(len(announced), len({tuple(sorted(r.items())) for r in announced}))
+        for solution in solutions:
+            self.assertIn(solution['recipe'], announced)
+
+    def test_an_exception_of_the_callback_stops_the_search(self):
+        class Stop(Exception):
+            pass
+
+        def progress(event):
+            raise Stop()
+
+        with self.assertRaises(Stop):
+            find_best_recipe(self.inventory, FULL_TARGET, progress=progress)
+
+
+class TestTimeBudget(SolverTestCase):
+    """find_best_recipe(time_budget_ms=...) answers with what it has when the time is up"""
+
+    def test_a_budget_that_is_not_reached_changes_nothing(self):
+        budgeted = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                                    time_budget_ms=600000)
+        unbudgeted = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5)
+        self.assertEqual(budgeted, unbudgeted)
+        for solution in budgeted:
+            self.assertFalse(solution['truncated'])
+            self.assertGreater(solution['levels_completed'], 1)
+
+    def test_an_exhausted_budget_returns_the_starting_set(self):
+        # Solving the starting set alone outlasts a nanosecond, so the budget is
+        # gone before the first state is expanded
+        solutions = find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5,
+                                     time_budget_ms=1e-6)
+        self.assertEqual(len(solutions), 1)
+        self.assertTrue(solutions[0]['truncated'])
+        self.assertEqual(solutions[0]['levels_completed'], 1)
+        self.assertEqual(solutions[0]['iterations'], 1)
+        self.assertAlmostEqual(sum(solutions[0]['recipe'].values()), 100.0, places=6)
+
+    def test_an_invalid_budget_is_refused(self):
+        for budget in (0, -5, float('nan'), float('inf'), True, 'soon'):
+            with self.subTest(budget=budget):
+                with self.assertRaises(ValueError):
+                    find_best_recipe(self.inventory, FULL_TARGET, time_budget_ms=budget)
+
+    def test_a_cancelled_search_raises_instead_of_answering(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(SearchCancelled):
+            find_best_recipe(self.inventory, FULL_TARGET, max_solutions=5, cancel=cancel)
+
+
 if __name__ == "__main__":
     unittest.main()